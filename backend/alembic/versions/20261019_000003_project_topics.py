@@ -0,0 +1,62 @@
+"""add per-project topic maps
+
+Revision ID: 20261019_000003
+Revises: 20260304_000002
+Create Date: 2026-10-19 00:00:03
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261019_000003"
+down_revision: Union[str, Sequence[str], None] = "20260304_000002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(bind, table_name: str) -> bool:
+    return sa.inspect(bind).has_table(table_name)
+
+
+def _has_index(bind, table_name: str, index_name: str) -> bool:
+    indexes = sa.inspect(bind).get_indexes(table_name)
+    return any(index["name"] == index_name for index in indexes)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if not _has_table(bind, "project_topics"):
+        op.create_table(
+            "project_topics",
+            sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("project_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("topic_index", sa.Integer(), nullable=False),
+            sa.Column("label", sa.String(), nullable=False),
+            sa.Column("keywords", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+            sa.Column("chunk_count", sa.Integer(), nullable=False),
+            sa.Column("centroid", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+            sa.Column("representative_chunk_ids", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+            sa.Column("document_signature", sa.String(), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(), nullable=False),
+            sa.ForeignKeyConstraint(["project_id"], ["projects.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("project_id", "topic_index", name="uq_project_topic"),
+        )
+    if not _has_index(bind, "project_topics", "ix_project_topics_project_id"):
+        op.create_index("ix_project_topics_project_id", "project_topics", ["project_id"], unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if _has_table(bind, "project_topics") and _has_index(bind, "project_topics", "ix_project_topics_project_id"):
+        op.drop_index("ix_project_topics_project_id", table_name="project_topics")
+
+    if _has_table(bind, "project_topics"):
+        op.drop_table("project_topics")
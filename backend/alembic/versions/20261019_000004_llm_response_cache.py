@@ -0,0 +1,61 @@
+"""add the LLM response cache
+
+Revision ID: 20261019_000004
+Revises: 20261019_000003
+Create Date: 2026-10-19 00:00:04
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261019_000004"
+down_revision: Union[str, Sequence[str], None] = "20261019_000003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(bind, table_name: str) -> bool:
+    return sa.inspect(bind).has_table(table_name)
+
+
+def _has_index(bind, table_name: str, index_name: str) -> bool:
+    indexes = sa.inspect(bind).get_indexes(table_name)
+    return any(index["name"] == index_name for index in indexes)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if not _has_table(bind, "llm_response_cache"):
+        op.create_table(
+            "llm_response_cache",
+            sa.Column("key", sa.String(length=64), nullable=False),
+            sa.Column("model", sa.String(), nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("version", sa.String(), nullable=False),
+            sa.Column("response", sa.Text(), nullable=False),
+            sa.Column("input_tokens", sa.Integer(), nullable=False),
+            sa.Column("output_tokens", sa.Integer(), nullable=False),
+            sa.Column("hit_count", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(), nullable=False),
+            sa.Column("last_used_at", sa.TIMESTAMP(), nullable=False),
+            sa.PrimaryKeyConstraint("key"),
+        )
+    if not _has_index(bind, "llm_response_cache", "ix_llm_response_cache_last_used_at"):
+        op.create_index("ix_llm_response_cache_last_used_at", "llm_response_cache", ["last_used_at"], unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if _has_table(bind, "llm_response_cache") and _has_index(
+        bind, "llm_response_cache", "ix_llm_response_cache_last_used_at"
+    ):
+        op.drop_index("ix_llm_response_cache_last_used_at", table_name="llm_response_cache")
+
+    if _has_table(bind, "llm_response_cache"):
+        op.drop_table("llm_response_cache")
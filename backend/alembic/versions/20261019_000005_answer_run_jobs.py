@@ -0,0 +1,55 @@
+"""queue answer runs as processing jobs
+
+Revision ID: 20261019_000005
+Revises: 20261019_000004
+Create Date: 2026-10-19 00:00:05
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261019_000005"
+down_revision: Union[str, Sequence[str], None] = "20261019_000004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(bind, table_name: str, column_name: str) -> bool:
+    return any(column["name"] == column_name for column in sa.inspect(bind).get_columns(table_name))
+
+
+def _has_index(bind, table_name: str, index_name: str) -> bool:
+    indexes = sa.inspect(bind).get_indexes(table_name)
+    return any(index["name"] == index_name for index in indexes)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # Answer-run jobs belong to a session, not a document.
+    op.alter_column("processing_jobs", "document_id", existing_type=postgresql.UUID(as_uuid=True), nullable=True)
+    if not _has_column(bind, "processing_jobs", "lease_expires_at"):
+        op.add_column("processing_jobs", sa.Column("lease_expires_at", sa.TIMESTAMP(), nullable=True))
+    if not _has_index(bind, "processing_jobs", "ix_processing_jobs_type_status_created"):
+        op.create_index(
+            "ix_processing_jobs_type_status_created",
+            "processing_jobs",
+            ["job_type", "status", "created_at"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if _has_index(bind, "processing_jobs", "ix_processing_jobs_type_status_created"):
+        op.drop_index("ix_processing_jobs_type_status_created", table_name="processing_jobs")
+    if _has_column(bind, "processing_jobs", "lease_expires_at"):
+        op.drop_column("processing_jobs", "lease_expires_at")
+    op.execute("DELETE FROM processing_jobs WHERE document_id IS NULL")
+    op.alter_column("processing_jobs", "document_id", existing_type=postgresql.UUID(as_uuid=True), nullable=False)
@@ -0,0 +1,157 @@
+"""move answer-run state from sessions.tree into answer_runs
+
+Revision ID: 20261019_000006
+Revises: 20261019_000005
+Create Date: 2026-10-19 00:00:06
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261019_000006"
+down_revision: Union[str, Sequence[str], None] = "20261019_000005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(bind, table_name: str) -> bool:
+    return sa.inspect(bind).has_table(table_name)
+
+
+def _has_index(bind, table_name: str, index_name: str) -> bool:
+    indexes = sa.inspect(bind).get_indexes(table_name)
+    return any(index["name"] == index_name for index in indexes)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    answer_run_status_enum = postgresql.ENUM(
+        "pending",
+        "running",
+        "completed",
+        "failed",
+        name="answerrunstatus",
+        create_type=False,
+    )
+    answer_run_status_enum.create(bind, checkfirst=True)
+
+    if not _has_table(bind, "answer_runs"):
+        op.create_table(
+            "answer_runs",
+            sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("session_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("job_id", postgresql.UUID(as_uuid=True), nullable=True),
+            sa.Column("query", sa.Text(), nullable=False),
+            sa.Column("scope", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+            sa.Column("status", answer_run_status_enum, nullable=False),
+            sa.Column("stage", sa.String(), nullable=False),
+            sa.Column("failed_stage", sa.String(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("result", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+            sa.Column("metrics", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+            sa.Column("requested_at", sa.TIMESTAMP(), nullable=False),
+            sa.Column("started_at", sa.TIMESTAMP(), nullable=True),
+            sa.Column("finished_at", sa.TIMESTAMP(), nullable=True),
+            sa.Column("updated_at", sa.TIMESTAMP(), nullable=False),
+            sa.ForeignKeyConstraint(["session_id"], ["sessions.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if not _has_index(bind, "answer_runs", "ix_answer_runs_session_id"):
+        op.create_index("ix_answer_runs_session_id", "answer_runs", ["session_id"], unique=False)
+    if not _has_index(bind, "answer_runs", "ix_answer_runs_status_requested_at"):
+        op.create_index("ix_answer_runs_status_requested_at", "answer_runs", ["status", "requested_at"], unique=False)
+
+    if not _has_table(bind, "answer_run_events"):
+        op.create_table(
+            "answer_run_events",
+            sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+            sa.Column("run_id", postgresql.UUID(as_uuid=True), nullable=False),
+            sa.Column("status", answer_run_status_enum, nullable=False),
+            sa.Column("stage", sa.String(), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(), nullable=False),
+            sa.ForeignKeyConstraint(["run_id"], ["answer_runs.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if not _has_index(bind, "answer_run_events", "ix_answer_run_events_run_id"):
+        op.create_index("ix_answer_run_events_run_id", "answer_run_events", ["run_id"], unique=False)
+
+    # Carry existing runs over from the sessions.tree blob, then drop them from it.
+    op.execute(
+        """
+        INSERT INTO answer_runs (
+            id, session_id, job_id, query, scope, status, stage, failed_stage, error, result, metrics,
+            requested_at, started_at, finished_at, updated_at
+        )
+        SELECT
+            gen_random_uuid(),
+            s.id,
+            NULLIF(s.tree->'answer_run'->>'job_id', '')::uuid,
+            s.query,
+            COALESCE(s.tree->'scope', '{}'::jsonb),
+            COALESCE(s.tree->'answer_run'->>'status', 'failed')::answerrunstatus,
+            COALESCE(s.tree->'answer_run'->>'stage', 'Queued'),
+            s.tree->'answer_run'->>'failed_stage',
+            s.tree->'answer_run'->>'error',
+            NULLIF(s.tree->'answer_run'->'result', 'null'::jsonb),
+            NULLIF(s.tree->'answer_run'->'metrics', 'null'::jsonb),
+            COALESCE((s.tree->'answer_run'->>'requested_at')::timestamp, s.created_at, now()),
+            (s.tree->'answer_run'->>'started_at')::timestamp,
+            (s.tree->'answer_run'->>'finished_at')::timestamp,
+            COALESCE((s.tree->'answer_run'->>'updated_at')::timestamp, s.created_at, now())
+        FROM sessions s
+        WHERE s.tree ? 'answer_run'
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO answer_run_events (run_id, status, stage, created_at)
+        SELECT id, status, stage, updated_at FROM answer_runs
+        """
+    )
+    op.execute("UPDATE sessions SET tree = tree - 'answer_run' WHERE tree ? 'answer_run'")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    # Run state moves back into sessions.tree (without the event log).
+    if _has_table(bind, "answer_runs"):
+        op.execute(
+            """
+            UPDATE sessions s
+            SET tree = s.tree || jsonb_build_object(
+                'answer_run',
+                jsonb_build_object(
+                    'status', r.status::text,
+                    'stage', r.stage,
+                    'job_id', r.job_id::text,
+                    'failed_stage', r.failed_stage,
+                    'requested_at', r.requested_at,
+                    'started_at', r.started_at,
+                    'finished_at', r.finished_at,
+                    'updated_at', r.updated_at,
+                    'error', r.error,
+                    'result', r.result,
+                    'metrics', r.metrics
+                )
+            )
+            FROM (
+                SELECT DISTINCT ON (session_id) * FROM answer_runs ORDER BY session_id, requested_at DESC
+            ) r
+            WHERE r.session_id = s.id
+            """
+        )
+
+    if _has_table(bind, "answer_run_events"):
+        op.drop_table("answer_run_events")
+    if _has_table(bind, "answer_runs"):
+        op.drop_table("answer_runs")
+
+    answer_run_status_enum = postgresql.ENUM(name="answerrunstatus")
+    answer_run_status_enum.drop(bind, checkfirst=True)
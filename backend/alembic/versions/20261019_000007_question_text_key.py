@@ -0,0 +1,75 @@
+"""add the normalized question text key
+
+Revision ID: 20261019_000007
+Revises: 20261019_000006
+Create Date: 2026-10-19 00:00:07
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261019_000007"
+down_revision: Union[str, Sequence[str], None] = "20261019_000006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(bind, table_name: str, column_name: str) -> bool:
+    return any(column["name"] == column_name for column in sa.inspect(bind).get_columns(table_name))
+
+
+def _has_index(bind, table_name: str, index_name: str) -> bool:
+    indexes = sa.inspect(bind).get_indexes(table_name)
+    return any(index["name"] == index_name for index in indexes)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if not _has_column(bind, "questions", "text_key"):
+        op.add_column("questions", sa.Column("text_key", sa.String(), nullable=True))
+
+    # Same normalization as question_text_key(): collapse whitespace, lowercase.
+    op.execute("UPDATE questions SET text_key = lower(btrim(regexp_replace(text, '\\s+', ' ', 'g')))")
+
+    # Questions that only differ in case/whitespace collapse onto one row; their node links move along.
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE question_key_merge ON COMMIT DROP AS
+        SELECT q.id AS duplicate_id, k.keep_id
+        FROM questions q
+        JOIN (
+            SELECT DISTINCT ON (text_key) text_key, id AS keep_id
+            FROM questions
+            ORDER BY text_key, id
+        ) k ON k.text_key = q.text_key
+        WHERE q.id <> k.keep_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO node_questions (node_id, question_id)
+        SELECT nq.node_id, m.keep_id
+        FROM node_questions nq
+        JOIN question_key_merge m ON m.duplicate_id = nq.question_id
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.execute("DELETE FROM questions WHERE id IN (SELECT duplicate_id FROM question_key_merge)")
+
+    op.alter_column("questions", "text_key", existing_type=sa.String(), nullable=False)
+    if not _has_index(bind, "questions", "ix_questions_text_key"):
+        op.create_index("ix_questions_text_key", "questions", ["text_key"], unique=True)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+
+    if _has_index(bind, "questions", "ix_questions_text_key"):
+        op.drop_index("ix_questions_text_key", table_name="questions")
+    if _has_column(bind, "questions", "text_key"):
+        op.drop_column("questions", "text_key")
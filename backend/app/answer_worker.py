@@ -0,0 +1,175 @@
+"""Executes queued answer runs (processing_jobs with job_type "answer_run").
+
+Run as its own service: `python -m app.answer_worker`. Each process executes
+up to ANSWER_RUN_CONCURRENCY runs at once; more processes can share the queue,
+claims use SELECT ... FOR UPDATE SKIP LOCKED like the PDF jobs.
+
+A claimed job holds a lease of ANSWER_RUN_LEASE_SECONDS that a heartbeat
+thread renews. When a worker dies the lease lapses and the job becomes
+claimable again; the next attempt discards the partial research tree and starts
+over, up to ANSWER_RUN_MAX_ATTEMPTS attempts. A worker that finds its lease
+lost (e.g. after a long stall) stops the run at the next stage boundary.
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+from typing import Any
+from uuid import UUID
+
+from app.db.db import SessionLocal
+from app.db.models.research_node_orm import ResearchNodeORM
+from app.repositories.job_repo import (
+    claim_next_processing_job,
+    get_processing_job,
+    mark_processing_job_completed,
+    mark_processing_job_failed,
+    renew_processing_job_leases,
+)
+from app.routers.agent import AgentQueryRequest, AnswerRunAborted, _run_answer_job
+from app.utils.agent.answer_runs import ANSWER_RUN_JOB_TYPE, update_answer_run
+
+
+logger = logging.getLogger(__name__)
+
+WORKER_NAME = os.getenv("ANSWER_WORKER_NAME") or f"answer_worker@{socket.gethostname()}"
+CONCURRENCY = max(1, int(os.getenv("ANSWER_RUN_CONCURRENCY", "2")))
+POLL_INTERVAL_SECONDS = float(os.getenv("ANSWER_RUN_POLL_INTERVAL_SECONDS", "2"))
+LEASE_SECONDS = float(os.getenv("ANSWER_RUN_LEASE_SECONDS", "120"))
+MAX_ATTEMPTS = max(1, int(os.getenv("ANSWER_RUN_MAX_ATTEMPTS", "2")))
+
+_stop_event = threading.Event()
+# Leases are renewed until the last running job has finished, also after SIGTERM.
+_heartbeat_stop = threading.Event()
+# Running job -> set once the heartbeat finds its lease held by someone else.
+_active_jobs: dict[UUID, threading.Event] = {}
+_active_lock = threading.Lock()
+
+
+def _claim() -> tuple[UUID, dict[str, Any], int] | None:
+    with SessionLocal() as db:
+        job = claim_next_processing_job(
+            db,
+            worker_name=WORKER_NAME,
+            job_type=ANSWER_RUN_JOB_TYPE,
+            lease_seconds=LEASE_SECONDS,
+        )
+        claimed = (job.id, dict(job.payload or {}), job.attempt_count) if job else None
+        db.commit()
+        return claimed
+
+
+def _finish(job_id: UUID, *, error: str | None = None) -> None:
+    with SessionLocal() as db:
+        job = get_processing_job(db, job_id)
+        if job is None or job.worker_name != WORKER_NAME:
+            # Our lease lapsed and another worker owns the job now.
+            logger.warning("Answer-run job %s is no longer held by %s", job_id, WORKER_NAME)
+            return
+        if error is None:
+            mark_processing_job_completed(db, job)
+        else:
+            mark_processing_job_failed(db, job, error_message=error[:2000])
+        db.commit()
+
+
+def _discard_partial_tree(session_id: str) -> None:
+    with SessionLocal() as db:
+        # One statement, so the parent_id self-reference is checked only after all rows are gone.
+        deleted = db.query(ResearchNodeORM).filter(ResearchNodeORM.session_id == session_id).delete(synchronize_session=False)
+        db.commit()
+    logger.info("[answer-run %s] Discarded %s nodes of the interrupted attempt", session_id, deleted)
+
+
+def _execute(job_id: UUID, payload: dict[str, Any], attempt: int, lease_lost: threading.Event) -> None:
+    session_id = payload["session_id"]
+    if attempt > MAX_ATTEMPTS:
+        error = f"Answer run was interrupted {attempt - 1} times; giving up"
+        update_answer_run(session_id, status="failed", stage="Interrupted", failed_stage="Interrupted", error=error)
+        _finish(job_id, error=error)
+        return
+    if attempt > 1:
+        logger.warning("[answer-run %s] Resuming after an interrupted attempt (attempt %s)", session_id, attempt)
+        _discard_partial_tree(session_id)
+
+    try:
+        _run_answer_job(session_id, AgentQueryRequest(**payload["request"]), should_abort=lease_lost.is_set)
+    except AnswerRunAborted:
+        logger.warning("[answer-run %s] Stopped: the lease of job %s was lost", session_id, job_id)
+        return
+    except Exception as exc:
+        _finish(job_id, error=str(exc))
+        return
+    _finish(job_id)
+
+
+def _slot_loop() -> None:
+    while not _stop_event.is_set():
+        try:
+            claimed = _claim()
+        except Exception:
+            logger.exception("Claiming an answer run failed")
+            _stop_event.wait(POLL_INTERVAL_SECONDS)
+            continue
+        if claimed is None:
+            _stop_event.wait(POLL_INTERVAL_SECONDS)
+            continue
+
+        job_id, payload, attempt = claimed
+        lease_lost = threading.Event()
+        with _active_lock:
+            _active_jobs[job_id] = lease_lost
+        try:
+            _execute(job_id, payload, attempt, lease_lost)
+        except Exception:
+            logger.exception("Answer-run job %s failed outside the pipeline", job_id)
+        finally:
+            with _active_lock:
+                _active_jobs.pop(job_id, None)
+
+
+def _heartbeat_loop() -> None:
+    while not _heartbeat_stop.wait(LEASE_SECONDS / 3):
+        with _active_lock:
+            job_ids = list(_active_jobs)
+        if not job_ids:
+            continue
+        try:
+            with SessionLocal() as db:
+                held = renew_processing_job_leases(db, job_ids, worker_name=WORKER_NAME, lease_seconds=LEASE_SECONDS)
+                db.commit()
+            lost = [job_id for job_id in job_ids if job_id not in held]
+            if lost:
+                logger.warning("%s of %s answer-run leases were lost", len(lost), len(job_ids))
+            with _active_lock:
+                for job_id in lost:
+                    if job_id in _active_jobs:
+                        _active_jobs[job_id].set()
+        except Exception:
+            logger.exception("Renewing answer-run leases failed")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGTERM, lambda *_: _stop_event.set())
+
+    threading.Thread(target=_heartbeat_loop, name="answer-run-heartbeat", daemon=True).start()
+    slots = [
+        threading.Thread(target=_slot_loop, name=f"answer-run-{index}")
+        for index in range(CONCURRENCY)
+    ]
+    for slot in slots:
+        slot.start()
+    logger.info("%s running up to %s answer runs at once", WORKER_NAME, CONCURRENCY)
+    try:
+        for slot in slots:
+            slot.join()
+    except KeyboardInterrupt:
+        _stop_event.set()
+    finally:
+        _heartbeat_stop.set()
+
+
+if __name__ == "__main__":
+    main()
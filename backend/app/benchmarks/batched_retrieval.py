@@ -0,0 +1,56 @@
+"""Compare per-question retrieval loops with the batched `search_chunks_many` path.
+
+Usage:
+    python -m app.benchmarks.batched_retrieval [--sizes 4 8 16] [--top-k 5] [--queries-file FILE]
+"""
+from __future__ import annotations
+
+import argparse
+
+from app.benchmarks.common import load_queries, print_table, summarize_ms, time_call
+from app.utils.vectorstore import CAPTION_INDEX, get_caption_store, get_vectorstore
+
+
+def _loop(queries: list[str], top_k: int, *, include_captions: bool) -> None:
+    vectorstore = get_vectorstore()
+    caption_store = get_caption_store()
+    for query in queries:
+        vectorstore.similarity_search_with_score(query, k=top_k)
+        if include_captions:
+            caption_store.similarity_search_with_score(query, k=top_k)
+
+
+def _batched(queries: list[str], top_k: int, *, include_captions: bool) -> None:
+    get_vectorstore().search_chunks_many(
+        queries,
+        top_k=top_k,
+        caption_index=CAPTION_INDEX if include_captions else None,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--queries-file", default=None)
+    parser.add_argument("--include-captions", action="store_true")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries_file)
+    rows = []
+    for size in args.sizes:
+        # Repeat the pool if the file holds fewer queries than requested.
+        selected = [queries[i % len(queries)] for i in range(size)]
+        for label, fn in (("loop", _loop), ("batched", _batched)):
+            timings = time_call(
+                lambda: fn(selected, args.top_k, include_captions=args.include_captions),
+                repeats=args.repeats,
+            )
+            rows.append({"questions": size, "mode": label, **summarize_ms(timings)})
+
+    print_table(rows, ["questions", "mode", "mean_ms", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Shared helpers for the offline benchmark scripts in this package.
+
+The benchmarks talk to the live services (Elasticsearch, OpenAI, Postgres), so
+run them inside the backend container, e.g.
+`docker compose exec backend python -m app.benchmarks.batched_retrieval`.
+"""
+from __future__ import annotations
+
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Callable
+
+
+DEFAULT_QUERIES = [
+    "What is the main argument of the text?",
+    "Which methods are used to collect the data?",
+    "How is the central concept defined?",
+    "What are the historical origins of the topic?",
+    "Which limitations do the authors mention?",
+    "What evidence supports the main conclusion?",
+    "How do the results compare with earlier work?",
+    "Which key figures or authors are discussed?",
+    "What are the practical applications?",
+    "Which open questions remain for future research?",
+    "How is the problem formulated mathematically?",
+    "What role does the social context play?",
+    "Which terminology is introduced in the first chapter?",
+    "What are the risks or side effects described?",
+    "How did the approach evolve over time?",
+    "What alternatives to the main approach are considered?",
+]
+
+
+def load_queries(path: str | None, *, limit: int | None = None) -> list[str]:
+    """Load queries from a text file (one per line) or a JSONL file with a `query` field."""
+    if not path:
+        queries = list(DEFAULT_QUERIES)
+    else:
+        queries = []
+        for line in Path(path).read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                queries.append(str(json.loads(line)["query"]))
+            else:
+                queries.append(line)
+    return queries[:limit] if limit else queries
+
+
+def time_call(fn: Callable[[], object], *, repeats: int = 3, warmup: int = 1) -> list[float]:
+    """Return wall-clock timings in milliseconds for `repeats` calls of `fn`."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return timings
+
+
+def summarize_ms(timings: list[float]) -> dict[str, float]:
+    ordered = sorted(timings)
+    p95_index = max(0, min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1)))))
+    return {
+        "mean_ms": statistics.fmean(ordered) if ordered else 0.0,
+        "p50_ms": statistics.median(ordered) if ordered else 0.0,
+        "p95_ms": ordered[p95_index] if ordered else 0.0,
+    }
+
+
+def print_table(rows: list[dict], columns: list[str]) -> None:
+    widths = {
+        column: max(len(column), *(len(_format_cell(row.get(column))) for row in rows)) if rows else len(column)
+        for column in columns
+    }
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    print("  ".join("-" * widths[column] for column in columns))
+    for row in rows:
+        print("  ".join(_format_cell(row.get(column)).ljust(widths[column]) for column in columns))
+
+
+def _format_cell(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}" if abs(value) < 10 else f"{value:.1f}"
+    return "" if value is None else str(value)
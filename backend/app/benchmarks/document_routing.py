@@ -0,0 +1,135 @@
+"""Latency and recall of two-stage document routing vs. flat chunk kNN as the library grows.
+
+For each corpus size, a random subset of the routed documents stands in for a
+library of that size (the full library runs unfiltered). Every sample query is
+answered three ways over that subset:
+    exact   brute-force cosine `script_score` over all chunks (ground truth)
+    flat    the production kNN over all chunks (`num_candidates = max(25, k*5)`)
+    routed  top-N documents from the `documents` index, then kNN over their chunks
+and recall@k of flat and routed is measured against exact.
+
+Usage:
+    python -m app.benchmarks.document_routing [--queries queries.txt] [--sizes 25,50,100,all] \
+        [--route-top-n 3,5,10] [--k 10]
+Needs the `documents` index populated (ingest, or `python -m app.utils.document_vectors` in pdf_worker).
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from app.benchmarks.common import load_queries, print_table, summarize_ms
+from app.utils.document_routing import DOCUMENT_INDEX, route_documents, routed_filters
+from app.utils.search_index import build_filter_clauses
+from app.utils.vectorstore import TEXT_INDEX, get_vectorstore
+
+
+def _routed_sources(es) -> list[str]:
+    response = es.search(
+        index=DOCUMENT_INDEX,
+        size=0,
+        aggs={"sources": {"terms": {"field": "source_pdf", "size": 65536}}},
+    )
+    return sorted(bucket["key"] for bucket in response["aggregations"]["sources"]["buckets"])
+
+
+def _exact_ids(es, vector: list[float], k: int, filters: dict | None) -> set[str]:
+    clauses = build_filter_clauses(filters)
+    response = es.search(
+        index=TEXT_INDEX,
+        size=k,
+        source=False,
+        query={
+            "script_score": {
+                "query": {"bool": {"filter": clauses}} if clauses else {"match_all": {}},
+                "script": {
+                    "source": "cosineSimilarity(params.query_vector, 'vector') + 1.0",
+                    "params": {"query_vector": vector},
+                },
+            }
+        },
+    )
+    return {hit["_id"] for hit in response["hits"]["hits"]}
+
+
+def _timed_ids(fn) -> tuple[float, set[str]]:
+    started = time.perf_counter()
+    hits = fn()
+    elapsed = (time.perf_counter() - started) * 1000.0
+    return elapsed, {str(doc.metadata.get("id")) for doc, _score in hits}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", default=None)
+    parser.add_argument("--sizes", default="25,50,100,all")
+    parser.add_argument("--route-top-n", default="3,5,10")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    vectorstore = get_vectorstore(TEXT_INDEX)
+    es = vectorstore.es
+    sources = _routed_sources(es)
+    if not sources:
+        raise SystemExit(f"No documents in {DOCUMENT_INDEX}; backfill routing vectors first")
+    queries = load_queries(args.queries)
+    vectors = vectorstore.embed_queries(queries)
+    top_ns = [int(value) for value in args.route_top_n.split(",")]
+    print(f"{len(sources)} routed documents, {len(queries)} queries, k={args.k}")
+
+    rng = random.Random(args.seed)
+    rows = []
+    for size in args.sizes.split(","):
+        corpus = sources if size == "all" else rng.sample(sources, min(int(size), len(sources)))
+        subset = None if size == "all" or len(corpus) == len(sources) else {"source_pdf": corpus}
+        truth = [_exact_ids(es, vector, args.k, subset) for vector in vectors]
+
+        flat_ms, flat_recall = [], []
+        for query, vector, expected in zip(queries, vectors, truth):
+            elapsed, found = _timed_ids(
+                lambda: vectorstore.similarity_search_with_score(query, k=args.k, filters=subset, query_vector=vector)
+            )
+            flat_ms.append(elapsed)
+            flat_recall.append(len(found & expected) / len(expected) if expected else 0.0)
+        rows.append(
+            {
+                "documents": len(corpus),
+                "strategy": "flat",
+                f"recall@{args.k}": sum(flat_recall) / len(flat_recall),
+                **summarize_ms(flat_ms),
+            }
+        )
+
+        for top_n in top_ns:
+            if top_n >= len(corpus):
+                continue
+            routed_ms, routed_recall = [], []
+            for query, vector, expected in zip(queries, vectors, truth):
+                def _routed_search():
+                    routed = route_documents([query], [vector], top_n, filters=subset)
+                    return vectorstore.similarity_search_with_score(
+                        query,
+                        k=args.k,
+                        filters=routed_filters(subset, routed),
+                        query_vector=vector,
+                    )
+
+                elapsed, found = _timed_ids(_routed_search)
+                routed_ms.append(elapsed)
+                routed_recall.append(len(found & expected) / len(expected) if expected else 0.0)
+            rows.append(
+                {
+                    "documents": len(corpus),
+                    "strategy": f"routed top-{top_n}",
+                    f"recall@{args.k}": sum(routed_recall) / len(routed_recall),
+                    **summarize_ms(routed_ms),
+                }
+            )
+
+    print_table(rows, ["documents", "strategy", f"recall@{args.k}", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
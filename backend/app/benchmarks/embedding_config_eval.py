@@ -0,0 +1,167 @@
+"""Offline recall-vs-latency comparison of embedding dims and vector quantization.
+
+Samples chunks (with their stored vectors) from `pdf_chunks`, then for every
+(dims, index type) combination builds a temporary index holding the vectors
+truncated to `dims` and re-normalized (text-embedding-3 vectors are trained to
+survive this), and runs the sample queries against it. Recall@k is measured
+against exact cosine search over the full-size sample vectors, so it captures
+both the truncation and the quantization loss.
+
+Usage:
+    python -m app.benchmarks.embedding_config_eval [--queries queries.txt] \
+        [--dims 1536,1024,512,256] [--index-types int8_hnsw,int4_hnsw,bbq_hnsw] [--sample-size 5000]
+Index types the cluster does not support (int4 needs 8.15+, bbq 8.16+) are skipped.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+
+from app.benchmarks.common import load_queries, print_table, summarize_ms
+from app.utils.embedding_config import EMBEDDING_CONFIG, INDEX_TYPE_MIN_VERSION, EmbeddingConfig, parse_es_version
+from app.utils.vectorstore import TEXT_INDEX, get_vectorstore
+
+
+TEMP_INDEX_PREFIX = "bench_embedding_"
+
+
+def _sample_vectors(es: Elasticsearch, index: str, size: int) -> tuple[list[str], np.ndarray]:
+    ids: list[str] = []
+    vectors: list[list[float]] = []
+    for hit in helpers.scan(
+        es,
+        index=index,
+        query={"query": {"exists": {"field": "vector"}}, "_source": ["vector"]},
+        size=min(size, 1000),
+    ):
+        ids.append(hit["_id"])
+        vectors.append(hit["_source"]["vector"])
+        if len(ids) >= size:
+            break
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def _truncate(matrix: np.ndarray, dims: int) -> np.ndarray:
+    head = matrix[:, :dims]
+    norms = np.linalg.norm(head, axis=1, keepdims=True)
+    return head / np.maximum(norms, 1e-12)
+
+
+def _exact_top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = _truncate(query_vectors, query_vectors.shape[1]) @ _truncate(doc_vectors, doc_vectors.shape[1]).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def _build_index(es: Elasticsearch, name: str, config: EmbeddingConfig, ids: list[str], vectors: np.ndarray) -> None:
+    es.options(ignore_status=404).indices.delete(index=name)
+    es.indices.create(
+        index=name,
+        mappings={"properties": {"vector": config.vector_mapping()}},
+        settings={"number_of_shards": 1, "number_of_replicas": 0, "refresh_interval": "-1"},
+    )
+    helpers.bulk(
+        es,
+        ({"_index": name, "_id": doc_id, "_source": {"vector": vector.tolist()}} for doc_id, vector in zip(ids, vectors)),
+        chunk_size=500,
+        request_timeout=120,
+    )
+    es.indices.refresh(index=name)
+    # One segment per index keeps latencies comparable across configurations.
+    es.indices.forcemerge(index=name, max_num_segments=1, request_timeout=600)
+
+
+def _store_size_mb(es: Elasticsearch, name: str) -> float:
+    stats = es.indices.stats(index=name, metric="store")
+    return stats["indices"][name]["primaries"]["store"]["size_in_bytes"] / (1024 * 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", default=None)
+    parser.add_argument("--index", default=TEXT_INDEX)
+    parser.add_argument("--sample-size", type=int, default=5000)
+    parser.add_argument("--dims", default="1536,1024,768,512,256")
+    parser.add_argument("--index-types", default="hnsw,int8_hnsw,int4_hnsw,bbq_hnsw")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-candidates", type=int, default=100)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary indices")
+    args = parser.parse_args()
+
+    vectorstore = get_vectorstore(args.index)
+    es = vectorstore.es
+    version = parse_es_version(es.info()["version"]["number"])
+
+    ids, doc_vectors = _sample_vectors(es, args.index, args.sample_size)
+    if not ids:
+        raise SystemExit(f"No vectors found in {args.index}")
+    queries = load_queries(args.queries)
+    query_vectors = np.asarray(vectorstore.embed_queries(queries), dtype=np.float32)
+    full_dims = doc_vectors.shape[1]
+    if query_vectors.shape[1] != full_dims:
+        raise SystemExit(f"Queries embed to {query_vectors.shape[1]} dims but {args.index} stores {full_dims}")
+    truth = _exact_top_k(doc_vectors, query_vectors, args.k)
+    print(f"{len(ids)} sampled vectors ({full_dims} dims), {len(queries)} queries, ES {'.'.join(map(str, version))}")
+
+    rows = []
+    for dims in sorted({int(value) for value in args.dims.split(",")}, reverse=True):
+        if dims > full_dims:
+            continue
+        docs_at_dims = _truncate(doc_vectors, dims)
+        queries_at_dims = _truncate(query_vectors, dims)
+        for index_type in [value.strip() for value in args.index_types.split(",") if value.strip()]:
+            required = INDEX_TYPE_MIN_VERSION.get(index_type)
+            if required is None or version < required:
+                rows.append({"dims": dims, "index_type": index_type, "note": "unsupported by cluster"})
+                continue
+            config = EmbeddingConfig(
+                model=EMBEDDING_CONFIG.model,
+                dims=dims,
+                index_type=index_type,
+                hnsw_m=EMBEDDING_CONFIG.hnsw_m,
+                hnsw_ef_construction=EMBEDDING_CONFIG.hnsw_ef_construction,
+            )
+            name = f"{TEMP_INDEX_PREFIX}{dims}_{index_type}"
+            started = time.perf_counter()
+            _build_index(es, name, config, ids, docs_at_dims)
+            build_s = time.perf_counter() - started
+
+            timings: list[float] = []
+            recalls: list[float] = []
+            for query_vector, expected in zip(queries_at_dims, truth):
+                started = time.perf_counter()
+                response = es.search(
+                    index=name,
+                    knn={
+                        "field": "vector",
+                        "query_vector": query_vector.tolist(),
+                        "k": args.k,
+                        "num_candidates": max(args.k, args.num_candidates),
+                    },
+                    size=args.k,
+                    source=False,
+                )
+                timings.append((time.perf_counter() - started) * 1000.0)
+                found = {hit["_id"] for hit in response["hits"]["hits"]}
+                recalls.append(len(found.intersection(ids[i] for i in expected)) / len(expected))
+
+            rows.append(
+                {
+                    "dims": dims,
+                    "index_type": index_type,
+                    f"recall@{args.k}": sum(recalls) / len(recalls),
+                    "size_mb": _store_size_mb(es, name),
+                    "build_s": build_s,
+                    **summarize_ms(timings),
+                }
+            )
+            if not args.keep:
+                es.indices.delete(index=name)
+
+    print_table(rows, ["dims", "index_type", f"recall@{args.k}", "size_mb", "build_s", "p50_ms", "p95_ms", "note"])
+
+
+if __name__ == "__main__":
+    main()
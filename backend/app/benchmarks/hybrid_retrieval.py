@@ -0,0 +1,128 @@
+"""Offline relevance and latency harness for kNN vs hybrid (BM25 + kNN) retrieval.
+
+The judgments file is JSONL, one query per line:
+    {"query": "...", "relevant_ids": ["<pdf_chunks id>", ...], "document_id": "...", "project_id": "..."}
+`relevant_ids` and the scope keys are optional; without judgments only latency is reported.
+
+Usage:
+    python -m app.benchmarks.hybrid_retrieval --judgments judgments.jsonl [--k 10]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.benchmarks.common import DEFAULT_QUERIES, print_table, summarize_ms
+from app.db.db import SessionLocal
+from app.utils.document_scope import resolve_research_scope
+from app.utils.vectorstore import get_vectorstore
+
+
+CONFIGURATIONS = [
+    ("knn", "rrf"),
+    ("hybrid", "rrf"),
+    ("hybrid", "weighted"),
+]
+
+
+def _load_judgments(path: str | None) -> list[dict]:
+    if not path:
+        return [{"query": query, "relevant_ids": []} for query in DEFAULT_QUERIES]
+    rows = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            rows.append(json.loads(line))
+    return rows
+
+
+def _scope_filters(row: dict) -> dict | None:
+    if not row.get("document_id") and not row.get("project_id"):
+        return None
+    with SessionLocal() as db:
+        scope = resolve_research_scope(
+            db,
+            document_id=row.get("document_id"),
+            project_id=row.get("project_id"),
+        )
+    return scope.search_filters()
+
+
+def _recall_and_rr(ranked_ids: list[str], relevant: set[str]) -> tuple[float, float]:
+    if not relevant:
+        return 0.0, 0.0
+    recall = len(relevant.intersection(ranked_ids)) / len(relevant)
+    reciprocal_rank = 0.0
+    for rank, doc_id in enumerate(ranked_ids, start=1):
+        if doc_id in relevant:
+            reciprocal_rank = 1.0 / rank
+            break
+    return recall, reciprocal_rank
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--judgments", default=None)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--bm25-weight", type=float, default=0.3)
+    args = parser.parse_args()
+
+    judgments = _load_judgments(args.judgments)
+    filters_by_row = [_scope_filters(row) for row in judgments]
+    vectorstore = get_vectorstore()
+    # Embed once up front so the comparison measures retrieval, not the embeddings API.
+    vectors = dict(zip((row["query"] for row in judgments), vectorstore.embed_queries([row["query"] for row in judgments])))
+    vectorstore._embeddings = _CachedEmbeddings(vectors)
+
+    rows = []
+    for mode, fusion in CONFIGURATIONS:
+        timings: list[float] = []
+        recalls: list[float] = []
+        reciprocal_ranks: list[float] = []
+        judged = 0
+        for row, filters in zip(judgments, filters_by_row):
+            started = time.perf_counter()
+            hits = vectorstore.similarity_search_with_score(
+                row["query"],
+                k=args.k,
+                filters=filters,
+                mode=mode,
+                fusion=fusion,
+                bm25_weight=args.bm25_weight,
+            )
+            timings.append((time.perf_counter() - started) * 1000.0)
+
+            relevant = set(row.get("relevant_ids") or [])
+            if relevant:
+                judged += 1
+                recall, reciprocal_rank = _recall_and_rr([str(doc.metadata.get("id")) for doc, _ in hits], relevant)
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+
+        rows.append(
+            {
+                "mode": mode if mode == "knn" else f"{mode}/{fusion}",
+                "judged": judged,
+                f"recall@{args.k}": sum(recalls) / len(recalls) if recalls else None,
+                "mrr": sum(reciprocal_ranks) / len(reciprocal_ranks) if reciprocal_ranks else None,
+                **summarize_ms(timings),
+            }
+        )
+
+    print_table(rows, ["mode", "judged", f"recall@{args.k}", "mrr", "mean_ms", "p50_ms", "p95_ms"])
+
+
+class _CachedEmbeddings:
+    def __init__(self, vectors: dict[str, list[float]]):
+        self._vectors = vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vectors[text]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vectors[text] for text in texts]
+
+
+if __name__ == "__main__":
+    main()
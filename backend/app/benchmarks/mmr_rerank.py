@@ -0,0 +1,123 @@
+"""Latency of the vectorized MMR reranker on 100 candidate hits.
+
+Compares `app.utils.mmr.mmr_select` against a straightforward per-pair Python
+implementation on the same inputs (and checks both pick the same hits). With
+`--live`, candidates are real hits and stored vectors from `pdf_chunks` for the
+sample queries instead of random vectors.
+
+Usage:
+    python -m app.benchmarks.mmr_rerank [--candidates 100] [--dims 1536] [--live] [--queries queries.txt]
+"""
+from __future__ import annotations
+
+import argparse
+
+import numpy as np
+
+from app.benchmarks.common import load_queries, print_table, summarize_ms, time_call
+from app.utils.mmr import DEFAULT_MMR_LAMBDA, mmr_select
+
+
+def _naive_mmr(query: list[float], docs: list[list[float]], *, k: int, lambda_mult: float) -> list[int]:
+    def cosine(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+        return dot / norm if norm else 0.0
+
+    relevance = [cosine(query, doc) for doc in docs]
+    selected: list[int] = []
+    while len(selected) < min(k, len(docs)):
+        best, best_score = -1, float("-inf")
+        for index, doc in enumerate(docs):
+            if index in selected:
+                continue
+            if selected:
+                redundancy = max(cosine(doc, docs[other]) for other in selected)
+                score = lambda_mult * relevance[index] - (1.0 - lambda_mult) * redundancy
+            else:
+                score = relevance[index]
+            if score > best_score:
+                best, best_score = index, score
+        selected.append(best)
+    return selected
+
+
+def _synthetic_inputs(candidates: int, dims: int, seed: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    rng = np.random.default_rng(seed)
+    query = rng.normal(size=dims).astype(np.float32)
+    # Clusters of near-duplicates around a few topics, like overlapping chunk windows.
+    centers = rng.normal(size=(max(1, candidates // 5), dims)).astype(np.float32)
+    docs = centers[rng.integers(0, len(centers), size=candidates)]
+    docs = docs + 0.1 * rng.normal(size=docs.shape).astype(np.float32)
+    return [(query, docs)]
+
+
+def _live_inputs(queries: list[str], candidates: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    from app.utils.vectorstore import get_vectorstore
+
+    inputs = []
+    for batch in get_vectorstore().search_chunks_many(queries, top_k=candidates):
+        vectors = [doc.vector for doc, _score in batch.text_hits if doc.vector is not None]
+        if vectors and batch.query_vector is not None:
+            inputs.append((np.asarray(batch.query_vector, dtype=np.float32), np.asarray(vectors, dtype=np.float32)))
+    return inputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--k", default="10,20,50")
+    parser.add_argument("--lambda-mult", type=float, default=DEFAULT_MMR_LAMBDA)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--naive-repeats", type=int, default=2)
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--queries", default=None)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.live:
+        inputs = _live_inputs(load_queries(args.queries), args.candidates)
+        if not inputs:
+            raise SystemExit("No hits with stored vectors returned")
+    else:
+        inputs = _synthetic_inputs(args.candidates, args.dims, args.seed)
+
+    rows = []
+    for k in (int(value) for value in args.k.split(",")):
+        vectorized: list[float] = []
+        naive: list[float] = []
+        agree = 0
+        for query, docs in inputs:
+            vectorized.extend(
+                time_call(lambda: mmr_select([query], docs, k=k, lambda_mult=args.lambda_mult), repeats=args.repeats)
+            )
+            query_list, docs_list = query.tolist(), docs.tolist()
+            naive.extend(
+                time_call(
+                    lambda: _naive_mmr(query_list, docs_list, k=k, lambda_mult=args.lambda_mult),
+                    repeats=args.naive_repeats,
+                    warmup=0,
+                )
+            )
+            fast_pick = mmr_select([query], docs, k=k, lambda_mult=args.lambda_mult)
+            agree += int(fast_pick == _naive_mmr(query_list, docs_list, k=k, lambda_mult=args.lambda_mult))
+
+        fast, slow = summarize_ms(vectorized), summarize_ms(naive)
+        rows.append(
+            {
+                "k": k,
+                "candidates": int(np.mean([len(docs) for _query, docs in inputs])),
+                "numpy_p50_ms": fast["p50_ms"],
+                "numpy_p95_ms": fast["p95_ms"],
+                "python_p50_ms": slow["p50_ms"],
+                "speedup": slow["p50_ms"] / fast["p50_ms"] if fast["p50_ms"] else None,
+                "same_picks": f"{agree}/{len(inputs)}",
+            }
+        )
+
+    print_table(rows, ["k", "candidates", "numpy_p50_ms", "numpy_p95_ms", "python_p50_ms", "speedup", "same_picks"])
+
+
+if __name__ == "__main__":
+    main()
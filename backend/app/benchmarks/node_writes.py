@@ -0,0 +1,135 @@
+"""SQL statements and time per node for attaching evidence (chunks + questions).
+
+Compares the previous per-row writers (existence queries, ORM rows per link,
+a flush per new question) with `attach_evidence_to_node` for nodes with a
+growing number of chunks. Statements are counted through the engine
+instrumentation of `app.utils.run_metrics`. The bulk path must use the same
+number of statements for every chunk count; the script exits with status 1
+when it does not. Everything runs in rolled-back transactions.
+
+Usage:
+    python -m app.benchmarks.node_writes [--chunks 5 50 500] [--questions 6] [--repeats 3]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from uuid import uuid4
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.benchmarks.common import print_table, summarize_ms
+from app.db.db import SessionLocal
+from app.db.models.chunk_orm import ChunkORM
+from app.db.models.node_chunk_orm import NodeChunkORM
+from app.db.models.node_question_orm import NodeQuestionORM
+from app.db.models.question_orm import QuestionORM, QuestionStatus
+from app.models.research_tree import ResearchNode, ResearchTree
+from app.repositories.research_tree_repo import ResearchTreeRepository
+from app.utils.agent.repo import attach_evidence_to_node
+from app.utils.run_metrics import run_metrics
+
+
+def _per_row(db, node_id, chunks: list[dict], questions: list[str]) -> None:
+    # The writers as they were before the set-based rewrite.
+    by_id = {}
+    for chunk in chunks:
+        by_id.setdefault(chunk["id"], chunk)
+    ids = sorted(by_id)
+    existing_ids = {cid for (cid,) in db.query(ChunkORM.id).filter(ChunkORM.id.in_(ids)).all()}
+    to_insert = [by_id[cid] for cid in ids if cid not in existing_ids]
+    if to_insert:
+        db.execute(pg_insert(ChunkORM.__table__).values(to_insert).on_conflict_do_nothing(index_elements=["id"]))
+    db.flush()
+    linked = {
+        cid
+        for (cid,) in db.query(NodeChunkORM.chunk_id)
+        .filter(NodeChunkORM.node_id == node_id, NodeChunkORM.chunk_id.in_(ids))
+        .all()
+    }
+    for cid in ids:
+        if cid not in linked:
+            db.add(NodeChunkORM(node_id=node_id, chunk_id=cid))
+    db.flush()
+
+    norm = [question.strip().lower() for question in questions]
+    existing = {q.text.lower(): q.id for q in db.query(QuestionORM).filter(func.lower(QuestionORM.text).in_(norm)).all()}
+    question_ids = []
+    for question in questions:
+        qid = existing.get(question.strip().lower())
+        if qid is None:
+            row = QuestionORM(text=question.strip(), source="benchmark", status=QuestionStatus.PROPOSED)
+            db.add(row)
+            db.flush()
+            qid = row.id
+        question_ids.append(qid)
+    linked_questions = {
+        qid
+        for (qid,) in db.query(NodeQuestionORM.question_id)
+        .filter(NodeQuestionORM.node_id == node_id, NodeQuestionORM.question_id.in_(question_ids))
+        .all()
+    }
+    for qid in question_ids:
+        if qid not in linked_questions:
+            db.add(NodeQuestionORM(node_id=node_id, question_id=qid))
+    db.query(QuestionORM).filter(
+        QuestionORM.id.in_(question_ids),
+        QuestionORM.status == QuestionStatus.PROPOSED,
+    ).update({QuestionORM.status: QuestionStatus.ASSIGNED}, synchronize_session=False)
+    db.flush()
+
+
+def _bulk(db, node_id, chunks: list[dict], questions: list[str]) -> None:
+    attach_evidence_to_node(db, node_id, chunks=chunks, questions=questions, question_source="benchmark")
+
+
+def _run(writer, chunk_count: int, question_count: int) -> tuple[int, float]:
+    """(statements, ms) of one node's writes, with fresh chunks and questions."""
+    db = SessionLocal()
+    try:
+        tree = ResearchTree(query="benchmark node writes", root_node=ResearchNode(title="Benchmark node"))
+        ResearchTreeRepository(db).save(tree, str(uuid4()))
+        tag = uuid4().hex
+        chunks = [
+            {"id": f"bench-{tag}-{index}", "text": f"Benchmark chunk {index}. " * 20, "page": index, "source": "bench.pdf"}
+            for index in range(chunk_count)
+        ]
+        questions = [f"Benchmark question {index} {tag}?" for index in range(question_count)]
+        with run_metrics() as metrics:
+            started = time.perf_counter()
+            writer(db, tree.root_node.id, chunks, questions)
+            elapsed = (time.perf_counter() - started) * 1000.0
+        return metrics.to_dict()["totals"]["db"]["calls"], elapsed
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--questions", type=int, default=6)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    bulk_statements = set()
+    for chunk_count in args.chunks:
+        for label, writer in (("per_row", _per_row), ("bulk", _bulk)):
+            runs = [_run(writer, chunk_count, args.questions) for _ in range(args.repeats)]
+            statements = max(count for count, _ in runs)
+            if label == "bulk":
+                bulk_statements.add(statements)
+            rows.append({"chunks": chunk_count, "mode": label, "statements": statements, **summarize_ms([ms for _, ms in runs])})
+
+    print_table(rows, ["chunks", "mode", "statements", "mean_ms", "p50_ms", "p95_ms"])
+    if len(bulk_statements) != 1:
+        print(f"bulk statement count depends on the chunk count: {sorted(bulk_statements)}")
+        sys.exit(1)
+    print(f"bulk: {bulk_statements.pop()} statements per node for every chunk count")
+
+
+if __name__ == "__main__":
+    main()
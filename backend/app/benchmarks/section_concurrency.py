@@ -0,0 +1,150 @@
+"""Wall-clock of the section expander with serial vs concurrent sibling processing.
+
+Runs `process_node_recursively` over synthetic outlines of 4-9 top-level
+sections (each with `--subsections` children) with the retrieval, LLM and
+database steps replaced by sleeps of typical latencies, so only scheduling is
+measured. LLM stubs hold `llm_slot()`, so the LLM_CONCURRENCY cap applies as
+in a real run. Every configuration must produce the same tree (titles, ranks,
+content) as the serial run.
+
+Usage:
+    python -m app.benchmarks.section_concurrency [--sections 4,5,6,7,8,9] [--subsections 2] \
+        [--concurrency 4] [--llm-concurrency 6] [--scale 0.1]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from types import SimpleNamespace
+
+from app.benchmarks.common import print_table
+from app.models.research_tree import ResearchNode, ResearchTree
+from app.utils import llm_gateway
+from app.utils.agent import concurrency, expander
+from app.utils.llm_gateway import llm_slot
+
+# Typical per-node latencies in seconds, scaled by --scale.
+RETRIEVAL_SECONDS = 0.3
+SUBQUESTION_LLM_SECONDS = 1.5
+ALIGNMENT_LLM_SECONDS = 0.8
+WRITE_LLM_SECONDS = 4.0
+DB_SECONDS = 0.02
+
+
+class _StubSession:
+    def commit(self) -> None:
+        time.sleep(DB_SECONDS * _scale)
+
+    def close(self) -> None:
+        pass
+
+
+_scale = 0.1
+
+
+def _llm(seconds: float) -> None:
+    with llm_slot():
+        time.sleep(seconds * _scale)
+
+
+def _enrich(node, tree, top_k=None):
+    time.sleep(RETRIEVAL_SECONDS * _scale)
+    _llm(SUBQUESTION_LLM_SECONDS)
+    time.sleep(RETRIEVAL_SECONDS * _scale)
+    plan = SimpleNamespace(
+        context_chunk_limit=8,
+        context_token_budget=2000,
+        alignment_token_budget=1000,
+        should_attempt_depth=False,
+        evidence_density="stub",
+        section_length_hint="stub",
+        retrieval_top_k=8,
+        min_novel_questions_to_deepen=1,
+    )
+    return SimpleNamespace(), plan
+
+
+def _aligned(node, *, root_query, context_chunk_limit=8, context_token_budget=None):
+    _llm(ALIGNMENT_LLM_SECONDS)
+    return True, "stub"
+
+
+def _write(node, *, root_query, output_style, context_chunk_limit, length_hint, context_token_budget=None):
+    _llm(WRITE_LLM_SECONDS)
+    node.content = f"{node.title} ({node.rank})"
+    node.mark_final()
+    return node
+
+
+def _install_stubs() -> None:
+    expander.enrich_node_with_chunks_and_subquestions = _enrich
+    expander.is_section_aligned_with_query = _aligned
+    expander.write_section = _write
+    expander.SessionLocal = _StubSession
+    expander.update_node_fields = lambda db, node_id, **fields: None
+
+
+def _build_tree(sections: int, subsections: int) -> ResearchTree:
+    root = ResearchNode(title="Benchmark question")
+    for index in range(sections):
+        section = ResearchNode(title=f"Section {index + 1}")
+        for child in range(subsections):
+            section.add_subnode(ResearchNode(title=f"Section {index + 1}.{child + 1}"))
+        root.add_subnode(section)
+    tree = ResearchTree(query="Benchmark question", root_node=root)
+    tree.assign_rank_and_level()
+    return tree
+
+
+def _run(sections: int, subsections: int, section_concurrency: int) -> tuple[float, list]:
+    concurrency.SECTION_CONCURRENCY = section_concurrency
+    tree = _build_tree(sections, subsections)
+    started = time.perf_counter()
+    concurrency.map_concurrent(
+        lambda node: expander.process_node_recursively(node, tree),
+        list(tree.root_node.subnodes),
+    )
+    elapsed = time.perf_counter() - started
+    shape = [(node.title, node.rank, node.level, node.content) for node in tree.root_node.walk()]
+    return elapsed, shape
+
+
+def main() -> None:
+    global _scale
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sections", default="4,5,6,7,8,9")
+    parser.add_argument("--subsections", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=concurrency.SECTION_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, default=llm_gateway.LLM_CONCURRENCY)
+    parser.add_argument("--scale", type=float, default=0.1, help="multiplier on the stub latencies")
+    args = parser.parse_args()
+
+    _scale = args.scale
+    _install_stubs()
+    llm_gateway.set_llm_concurrency(args.llm_concurrency)
+
+    rows = []
+    for sections in [int(value) for value in args.sections.split(",")]:
+        serial_s, serial_shape = _run(sections, args.subsections, 1)
+        concurrent_s, concurrent_shape = _run(sections, args.subsections, args.concurrency)
+        if concurrent_shape != serial_shape:
+            raise SystemExit(f"{sections} sections: concurrent run produced a different tree than the serial run")
+        rows.append(
+            {
+                "sections": sections,
+                "nodes": sections * (1 + args.subsections),
+                "serial_s": serial_s,
+                "concurrent_s": concurrent_s,
+                "speedup": serial_s / concurrent_s if concurrent_s else 0.0,
+            }
+        )
+
+    print(
+        f"section concurrency {args.concurrency}, LLM concurrency {args.llm_concurrency}, "
+        f"latency scale {args.scale}"
+    )
+    print_table(rows, ["sections", "nodes", "serial_s", "concurrent_s", "speedup"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Latency of document-scoped kNN searches with and without custom routing as the shard count grows.
+
+For each shard count, a sample of `pdf_chunks` (all chunks of `--documents`
+documents) is copied into two scratch indices with the live mapping:
+    default  `_id` routing; a document-scoped search fans out to every shard
+    routed   routed by `--field`; the search passes the document as `routing`
+Every sample query is then run once per sampled document, filtered to that
+document, against both indices. The table reports the shards each search
+touched, latency, and how often both layouts returned the same top-k ids.
+
+Usage:
+    python -m app.benchmarks.shard_routing [--shards 1,2,4,8] [--documents 20] [--field document_id] \
+        [--queries queries.txt] [--k 10] [--keep]
+Scratch indices are named `bench_routing_*` and deleted afterwards unless --keep is given.
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import random
+
+from app.benchmarks.common import load_queries, print_table, summarize_ms
+from app.utils.search_index import es
+from app.utils.vectorstore import TEXT_INDEX, get_vectorstore
+
+_ROUTING_SCRIPT = "ctx._routing = ctx._source[params.field] == null ? null : ctx._source[params.field].toString();"
+
+
+def _sample_documents(field: str, count: int, seed: int) -> list[str]:
+    response = es.search(
+        index=TEXT_INDEX,
+        size=0,
+        aggs={"documents": {"terms": {"field": field, "size": 65536}}},
+    )
+    values = sorted(bucket["key"] for bucket in response["aggregations"]["documents"]["buckets"])
+    return random.Random(seed).sample(values, min(count, len(values)))
+
+
+def _live_mapping() -> dict:
+    mappings = es.indices.get_mapping(index=TEXT_INDEX)
+    mapping = copy.deepcopy(next(iter(mappings.values()))["mappings"])
+    mapping.pop("_routing", None)
+    mapping.pop("_meta", None)
+    return mapping
+
+
+def _build_index(name: str, *, shards: int, mapping: dict, field: str, documents: list[str], routed: bool) -> int:
+    if es.indices.exists(index=name):
+        es.indices.delete(index=name)
+    if routed:
+        mapping = {**mapping, "_routing": {"required": True}, "_meta": {"routing_field": field}}
+    es.indices.create(
+        index=name,
+        mappings=mapping,
+        settings={"number_of_shards": shards, "number_of_replicas": 0},
+    )
+    es.reindex(
+        source={"index": TEXT_INDEX, "query": {"terms": {field: documents}}},
+        dest={"index": name},
+        script={"source": _ROUTING_SCRIPT, "lang": "painless", "params": {"field": field}} if routed else None,
+        wait_for_completion=True,
+        refresh=True,
+    )
+    es.indices.forcemerge(index=name, max_num_segments=1)
+    return int(es.count(index=name)["count"])
+
+
+def _search(index: str, vector: list[float], k: int, field: str, document: str, routing: str | None) -> dict:
+    return es.search(
+        index=index,
+        size=k,
+        source=False,
+        routing=routing,
+        knn={
+            "field": "vector",
+            "query_vector": vector,
+            "k": k,
+            "num_candidates": max(50, k * 5),
+            "filter": {"term": {field: document}},
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", default="1,2,4,8")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--field", default="document_id", choices=["document_id", "source_pdf", "book_id"])
+    parser.add_argument("--queries", default=None)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    documents = _sample_documents(args.field, args.documents, args.seed)
+    if not documents:
+        raise SystemExit(f"No chunks with {args.field} in {TEXT_INDEX}")
+    queries = load_queries(args.queries)
+    vectors = get_vectorstore(TEXT_INDEX).embed_queries(queries)
+    mapping = _live_mapping()
+    print(f"{len(documents)} documents x {len(queries)} queries per layout, k={args.k}")
+
+    rows = []
+    created = []
+    try:
+        for shards in [int(value) for value in args.shards.split(",")]:
+            indices = {}
+            for layout in ("default", "routed"):
+                name = f"bench_routing_{layout}_{shards}"
+                created.append(name)
+                chunks = _build_index(
+                    name,
+                    shards=shards,
+                    mapping=mapping,
+                    field=args.field,
+                    documents=documents,
+                    routed=layout == "routed",
+                )
+                indices[layout] = name
+            results: dict[str, dict] = {layout: {"ms": [], "shards": [], "ids": []} for layout in indices}
+            for document in documents:
+                for vector in vectors:
+                    for layout, name in indices.items():
+                        routing = document if layout == "routed" else None
+                        # Warm-up per (document, query) keeps first-touch segment loads out of the timings.
+                        _search(name, vector, args.k, args.field, document, routing)
+                        response = _search(name, vector, args.k, args.field, document, routing)
+                        results[layout]["ms"].append(float(response["took"]))
+                        results[layout]["shards"].append(response["_shards"]["total"])
+                        results[layout]["ids"].append([hit["_id"] for hit in response["hits"]["hits"]])
+
+            same = sum(a == b for a, b in zip(results["default"]["ids"], results["routed"]["ids"]))
+            for layout, data in results.items():
+                rows.append(
+                    {
+                        "shards": shards,
+                        "layout": layout,
+                        "chunks": chunks,
+                        "shards_searched": sum(data["shards"]) / len(data["shards"]),
+                        "same_top_k": same / len(data["ids"]),
+                        **summarize_ms(data["ms"]),
+                    }
+                )
+    finally:
+        if not args.keep:
+            for name in created:
+                es.indices.delete(index=name, ignore_unavailable=True)
+
+    print("latency = Elasticsearch `took` (server side)")
+    print_table(rows, ["shards", "layout", "chunks", "shards_searched", "same_top_k", "mean_ms", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
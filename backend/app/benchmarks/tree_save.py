@@ -0,0 +1,147 @@
+"""Save time of `ResearchTreeRepository.save` for synthetic research trees.
+
+Compares, per tree size:
+- per_node: the previous save path (SELECT by id, insert or update, flush per node),
+- bulk_first: the bulk upsert writing every node of a new tree,
+- bulk_unchanged: a second save of the same tree (dirty hashes skip every node),
+- bulk_10pct: a save after the content of 10% of the nodes changed.
+per_node and bulk_first include building the tree (same cost for both).
+Every save runs in a transaction that is rolled back, so nothing is left behind.
+
+Usage:
+    python -m app.benchmarks.tree_save [--sizes 10 100 1000] [--repeats 5]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from uuid import UUID, uuid4
+
+from app.benchmarks.common import print_table, summarize_ms, time_call
+from app.db.db import Session as SessionModel, SessionLocal
+from app.db.models.research_node_orm import ResearchNodeORM
+from app.models.research_tree import ResearchNode, ResearchTree
+from app.repositories.research_tree_repo import ResearchTreeRepository
+
+
+def _build_tree(size: int) -> ResearchTree:
+    """Root plus `size - 1` nodes, breadth-first with up to 8 children per node."""
+    root = ResearchNode(title="Benchmark root")
+    tree = ResearchTree(query="benchmark tree save", root_node=root)
+    frontier = [root]
+    created = 1
+    while created < size:
+        parent = frontier.pop(0)
+        for _ in range(min(8, size - created)):
+            child = ResearchNode(
+                title=f"Section {created}",
+                goals="Explain the benchmark topic.",
+                content="Lorem ipsum dolor sit amet. " * 40,
+            )
+            parent.add_subnode(child)
+            frontier.append(child)
+            created += 1
+    tree.assign_rank_and_level()
+    return tree
+
+
+def _save_per_node(db, tree: ResearchTree, session_id: str) -> None:
+    def upsert(node: ResearchNode, parent_id: UUID | None) -> None:
+        db_node = db.query(ResearchNodeORM).filter_by(id=node.id).first()
+        if db_node is None:
+            db_node = ResearchNodeORM(
+                id=node.id,
+                session_id=session_id,
+                parent_id=parent_id,
+                title=node.title,
+                goals=node.goals,
+                content=node.content,
+                summary=node.summary,
+                conclusion=node.conclusion,
+                rank=node.rank,
+                level=node.level,
+                is_final=node.is_final,
+            )
+            db.add(db_node)
+        else:
+            db_node.parent_id = parent_id
+            db_node.title = node.title
+            db_node.goals = node.goals
+            db_node.content = node.content
+            db_node.summary = node.summary
+            db_node.conclusion = node.conclusion
+            db_node.rank = node.rank
+            db_node.level = node.level
+            db_node.is_final = node.is_final
+        db.flush()
+        for child in node.subnodes:
+            upsert(child, db_node.id)
+
+    db.add(SessionModel(id=session_id, query=tree.query, tree={}))
+    db.flush()
+    upsert(tree.root_node, None)
+
+
+def _rolled_back(fn) -> None:
+    db = SessionLocal()
+    try:
+        fn(db)
+    finally:
+        db.rollback()
+        db.close()
+
+
+def _measure(size: int, repeats: int) -> list[dict]:
+    rows = []
+
+    def per_node() -> None:
+        tree = _build_tree(size)
+        _rolled_back(lambda db: _save_per_node(db, tree, str(uuid4())))
+
+    def bulk_first() -> None:
+        tree = _build_tree(size)
+        _rolled_back(lambda db: ResearchTreeRepository(db).save(tree, str(uuid4())))
+
+    def bulk_again(changed_fraction: float, timings: list[float]):
+        def run() -> None:
+            tree = _build_tree(size)
+            session_id = str(uuid4())
+
+            def saves(db) -> None:
+                repo = ResearchTreeRepository(db)
+                repo.save(tree, session_id)
+                nodes = tree.all_nodes()
+                for node in nodes[: int(len(nodes) * changed_fraction)]:
+                    node.content = (node.content or "") + " Revised."
+                started = time.perf_counter()
+                repo.save(tree, session_id)
+                timings.append((time.perf_counter() - started) * 1000.0)
+
+            _rolled_back(saves)
+
+        return run
+
+    for label, fn in (("per_node", per_node), ("bulk_first", bulk_first)):
+        rows.append({"nodes": size, "mode": label, **summarize_ms(time_call(fn, repeats=repeats))})
+    for label, fraction in (("bulk_unchanged", 0.0), ("bulk_10pct", 0.1)):
+        # Only the second save counts; building and the first save are setup.
+        second_save_ms: list[float] = []
+        time_call(bulk_again(fraction, second_save_ms), repeats=repeats, warmup=0)
+        rows.append({"nodes": size, "mode": label, **summarize_ms(second_save_ms)})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        rows.extend(_measure(size, args.repeats))
+    print_table(rows, ["nodes", "mode", "mean_ms", "p50_ms", "p95_ms"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,28 @@
+from app.db.models.answer_run_orm import AnswerRun, AnswerRunEvent
 from app.db.models.chunk_orm import ChunkORM
 from app.db.models.document_orm import Document
 from app.db.models.image_record_orm import ImageRecord
+from app.db.models.llm_response_cache_orm import LLMResponseCache
 from app.db.models.node_chunk_orm import NodeChunkORM
 from app.db.models.node_question_orm import NodeQuestionORM
 from app.db.models.processing_job_orm import ProcessingJob
 from app.db.models.project_orm import Project
+from app.db.models.project_topic_orm import ProjectTopic
 from app.db.models.question_orm import QuestionORM
 from app.db.models.research_node_orm import ResearchNodeORM
 
 __all__ = [
+    "AnswerRun",
+    "AnswerRunEvent",
     "ChunkORM",
     "Document",
     "ImageRecord",
+    "LLMResponseCache",
     "NodeChunkORM",
     "NodeQuestionORM",
     "ProcessingJob",
     "Project",
+    "ProjectTopic",
     "QuestionORM",
     "ResearchNodeORM",
 ]
@@ -0,0 +1,57 @@
+from datetime import datetime
+from enum import Enum
+from uuid import uuid4
+
+from sqlalchemy import BigInteger, Column, Enum as SqlEnum, ForeignKey, Index, String, TIMESTAMP, Text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.db.base import Base
+
+
+class AnswerRunStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+def _answer_run_status_values(enum_cls):
+    return [item.value for item in enum_cls]
+
+
+def _answer_run_status_enum():
+    return SqlEnum(AnswerRunStatus, name="answerrunstatus", values_callable=_answer_run_status_values)
+
+
+class AnswerRun(Base):
+    __tablename__ = "answer_runs"
+    __table_args__ = (Index("ix_answer_runs_status_requested_at", "status", "requested_at"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), index=True, nullable=False)
+    # processing_jobs row executing the run (no FK: finished jobs may be pruned).
+    job_id = Column(UUID(as_uuid=True), nullable=True)
+    query = Column(Text, nullable=False)
+    scope = Column(JSONB, nullable=False, default=dict)
+    status = Column(_answer_run_status_enum(), nullable=False, default=AnswerRunStatus.PENDING)
+    stage = Column(String, nullable=False, default="Queued")
+    failed_stage = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    result = Column(JSONB, nullable=True)
+    metrics = Column(JSONB, nullable=True)
+    requested_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+    started_at = Column(TIMESTAMP, nullable=True)
+    finished_at = Column(TIMESTAMP, nullable=True)
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+
+
+class AnswerRunEvent(Base):
+    """Append-only log of an answer run's status and stage changes."""
+
+    __tablename__ = "answer_run_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    run_id = Column(UUID(as_uuid=True), ForeignKey("answer_runs.id", ondelete="CASCADE"), index=True, nullable=False)
+    status = Column(_answer_run_status_enum(), nullable=False)
+    stage = Column(String, nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
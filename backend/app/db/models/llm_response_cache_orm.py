@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP
+
+from app.db.base import Base
+
+
+class LLMResponseCache(Base):
+    __tablename__ = "llm_response_cache"
+
+    # sha256 of model, temperature, call name, prompt version, parser schema and rendered prompt.
+    key = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    version = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
+    last_used_at = Column(TIMESTAMP, default=datetime.utcnow, index=True, nullable=False)
@@ -23,7 +23,7 @@ class ProcessingJob(Base):
     __tablename__ = "processing_jobs"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=True)
     job_type = Column(String, nullable=False, default="pdf_ingest")
     status = Column(
         SqlEnum(
@@ -42,3 +42,5 @@ class ProcessingJob(Base):
     created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
     started_at = Column(TIMESTAMP, nullable=True)
     finished_at = Column(TIMESTAMP, nullable=True)
+    # Set for job types whose runner renews a lease; a running job past it is claimable again.
+    lease_expires_at = Column(TIMESTAMP, nullable=True)
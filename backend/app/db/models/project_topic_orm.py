@@ -0,0 +1,28 @@
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import Column, ForeignKey, Integer, String, TIMESTAMP, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.db.base import Base
+
+
+class ProjectTopic(Base):
+    __tablename__ = "project_topics"
+    __table_args__ = (
+        UniqueConstraint("project_id", "topic_index", name="uq_project_topic"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), index=True, nullable=False)
+    topic_index = Column(Integer, nullable=False)
+    label = Column(String, nullable=False)
+    keywords = Column(JSONB, nullable=False, default=list)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    # Unit-length mean of the topic's chunk vectors.
+    centroid = Column(JSONB, nullable=False)
+    # Chunk ids closest to the centroid, best first.
+    representative_chunk_ids = Column(JSONB, nullable=False, default=list)
+    # Hash of the project's document set the map was built from (see topic_map.document_signature).
+    document_signature = Column(String, nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, nullable=False)
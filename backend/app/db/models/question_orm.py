@@ -14,11 +14,22 @@ class QuestionStatus(str, enum.Enum):
 def _question_status_values(enum_cls):
     return [item.value for item in enum_cls]
 
+
+def question_text_key(text: str) -> str:
+    """Dedup key of a question: case- and whitespace-insensitive text."""
+    return " ".join((text or "").split()).lower()
+
+
+def _default_text_key(context):
+    return question_text_key(context.get_current_parameters()["text"])
+
 class QuestionORM(Base):
     __tablename__ = "questions"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    text = Column(String, unique=True, index=True, nullable=False)  # dedup by text
+    text = Column(String, unique=True, index=True, nullable=False)
+    # dedup by normalized text (question_text_key); upserts conflict on this column
+    text_key = Column(String, unique=True, index=True, nullable=False, default=_default_text_key)
     source = Column(String, nullable=False)  # e.g. "root_subq" | "outline" | "expansion"
     status = Column(
         Enum(
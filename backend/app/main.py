@@ -1,9 +1,13 @@
+import logging
 from pathlib import Path
 
+from elasticsearch import ConnectionError as ESConnectionError
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from app.routers import agent, extract, health, jobs, library, process, query, ui, upload
+from app.utils.embedding_config import validate_against_cluster
+from app.utils.search_index import SEARCH_INDICES, es, use_local_store
 # from app.db.models import research_node_orm, question_orm, node_question_orm, chunk_orm, node_chunk_orm
 
 
@@ -15,6 +19,20 @@ app = FastAPI(
     root_path="/backend"
 )
 
+logger = logging.getLogger(__name__)
+
+
+@app.on_event("startup")
+def _validate_embedding_config():
+    # A dims/quantization mismatch with the live indices would make every kNN query fail.
+    if use_local_store():
+        return
+    try:
+        validate_against_cluster(es, SEARCH_INDICES)
+    except ESConnectionError:
+        logger.warning("Elasticsearch not reachable at startup; embedding config not validated")
+
+
 app.mount(
     "/static",
     StaticFiles(directory=Path(__file__).resolve().parent / "static"),
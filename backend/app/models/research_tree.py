@@ -1,7 +1,7 @@
 # app/models/research_tree.py
 from __future__ import annotations
 from typing import List, Optional, Set
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from uuid import uuid4, UUID
 
 class ResearchScope(BaseModel):
@@ -11,13 +11,28 @@ class ResearchScope(BaseModel):
     filenames: List[str] = Field(default_factory=list)
     label: Optional[str] = None
     document_count: int = 0
+    # "all" scope only: route each query to this many documents before the chunk search.
+    route_documents: Optional[int] = None
+
+    def routing_top_n(self) -> Optional[int]:
+        # Routing only narrows the search when the library has more documents than are routed to.
+        if self.mode == "all" and self.route_documents and self.document_count > self.route_documents:
+            return self.route_documents
+        return None
 
     def search_filters(self) -> Optional[dict]:
-        if self.mode == "all" or not self.filenames:
-            return None
-        if len(self.filenames) == 1:
-            return {"source_pdf": self.filenames[0]}
-        return {"source_pdf": list(self.filenames)}
+        # document_id/project_id are denormalized into every indexed chunk and caption,
+        # so a scope is a single term filter regardless of project size. Until older
+        # rows have been backfilled with the ids, scopes that list their files filter on those.
+        from app.utils.search_index import scope_fields_backfilled
+
+        if self.mode in ("document", "project") and self.filenames and not scope_fields_backfilled():
+            return {"source_pdf": self.filenames[0] if len(self.filenames) == 1 else list(self.filenames)}
+        if self.mode == "document" and self.document_id:
+            return {"document_id": self.document_id}
+        if self.mode == "project" and self.project_id:
+            return {"project_id": self.project_id}
+        return None
 
 
 class ResearchPlan(BaseModel):
@@ -29,6 +44,10 @@ class ResearchPlan(BaseModel):
     outline_max_subsections: int = 2
     section_top_k: int = 12
     section_context_chunks: int = 9
+    # Token budgets for the evidence packed into prompts (see app.utils.agent.context_packing).
+    root_context_tokens: int = 2250
+    section_context_tokens: int = 2250
+    alignment_context_tokens: int = 1125
     section_subquestion_target: int = 2
     summary_context_sections: int = 4
     desired_depth: int = 2
@@ -36,6 +55,10 @@ class ResearchPlan(BaseModel):
     section_length_hint: str = "2-3 focused paragraphs"
     evidence_profile: str = "narrow"
     output_style: str = "scientific_article"
+    retrieval_mode: str = "knn"
+    retrieval_fusion: str = "rrf"
+    retrieval_granularity: str = "mixed"
+    retrieval_mmr_lambda: Optional[float] = None
 
 class Chunk(BaseModel):
     id: str
@@ -59,6 +82,8 @@ class ResearchNode(BaseModel):
     subnodes: List["ResearchNode"] = Field(default_factory=list)
     rank: Optional[int] = 0
     level: Optional[int] = 0
+    # Hash of the row last written/read by ResearchTreeRepository; unchanged nodes are not rewritten.
+    _saved_hash: Optional[str] = PrivateAttr(default=None)
 
     def __str__(self): return f"{self.title} : rank {self.rank} - level {self.level}"
 
@@ -137,6 +162,7 @@ class ResearchTree(BaseModel):
     def model_dump_jsonable(self):
         def clean_node(node):
             return {
+                "id": str(node.id),
                 "title": node.title,
                 "rank": node.rank,
                 "level": node.level,
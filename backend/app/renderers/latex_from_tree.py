@@ -6,10 +6,10 @@ import json
 import re
 
 from app.models.research_tree import ResearchTree, ResearchNode
-from langchain_openai import ChatOpenAI
+from app.utils.llm_gateway import complete
 
 # Keep the LLM deterministic
-_LLM = ChatOpenAI(model="gpt-4o", temperature=0)
+_MODEL = "gpt-4o"
 
 _FORBIDDEN = [
     r'\\write18', r'\\input\{', r'\\include\{', r'\\openout', r'\\read',
@@ -97,5 +97,5 @@ def to_latex_via_llm(tree: ResearchTree) -> str:
     tree_json = json.dumps(data, ensure_ascii=False)
     prompt = _PROMPT.replace("<<<TREE_JSON>>>", tree_json)
 
-    tex = _LLM.invoke(prompt).content
+    tex = complete(prompt, model=_MODEL, temperature=0, name="latex")
     return _sanitize(tex)
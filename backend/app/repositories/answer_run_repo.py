@@ -0,0 +1,92 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, defer
+
+from app.db.models.answer_run_orm import AnswerRun, AnswerRunEvent, AnswerRunStatus
+
+
+ACTIVE_STATUSES = (AnswerRunStatus.PENDING, AnswerRunStatus.RUNNING)
+
+
+def create_answer_run_record(
+    db: Session,
+    session_id: UUID | str,
+    *,
+    query: str,
+    scope: dict,
+    job_id: UUID | None = None,
+) -> AnswerRun:
+    now = datetime.utcnow()
+    run = AnswerRun(
+        session_id=session_id,
+        job_id=job_id,
+        query=query,
+        scope=scope,
+        status=AnswerRunStatus.PENDING,
+        stage="Queued",
+        requested_at=now,
+        updated_at=now,
+    )
+    db.add(run)
+    db.flush()
+    db.add(AnswerRunEvent(run_id=run.id, status=run.status, stage=run.stage, created_at=now))
+    db.flush()
+    return run
+
+
+def get_latest_answer_run(db: Session, session_id: UUID | str, *, for_update: bool = False) -> AnswerRun | None:
+    stmt = (
+        select(AnswerRun)
+        .where(AnswerRun.session_id == session_id)
+        .order_by(AnswerRun.requested_at.desc())
+        .limit(1)
+    )
+    if for_update:
+        stmt = stmt.with_for_update()
+    return db.execute(stmt).scalars().first()
+
+
+def record_answer_run_progress(
+    db: Session,
+    run: AnswerRun,
+    *,
+    status: AnswerRunStatus | None = None,
+    stage: str | None = None,
+) -> None:
+    """Apply a status/stage change to `run`, appending it to the event log when something changed."""
+    now = datetime.utcnow()
+    changed = (status is not None and status != run.status) or (stage is not None and stage != run.stage)
+    if status is not None:
+        run.status = status
+    if stage is not None:
+        run.stage = stage
+    if status == AnswerRunStatus.RUNNING:
+        run.started_at = run.started_at or now
+        run.error = None
+        run.failed_stage = None
+    if status in (AnswerRunStatus.COMPLETED, AnswerRunStatus.FAILED):
+        run.finished_at = now
+    run.updated_at = now
+    if changed:
+        db.add(AnswerRunEvent(run_id=run.id, status=run.status, stage=run.stage, created_at=now))
+    db.flush()
+
+
+def list_answer_run_events(db: Session, run_id: UUID) -> list[AnswerRunEvent]:
+    stmt = select(AnswerRunEvent).where(AnswerRunEvent.run_id == run_id).order_by(AnswerRunEvent.id.asc())
+    return list(db.execute(stmt).scalars().all())
+
+
+def list_answer_runs(
+    db: Session,
+    *,
+    statuses: list[AnswerRunStatus] | None = None,
+    limit: int = 50,
+) -> list[AnswerRun]:
+    """Most recently requested runs first, optionally only those in `statuses`; `result` is not loaded."""
+    stmt = select(AnswerRun).options(defer(AnswerRun.result)).order_by(AnswerRun.requested_at.desc()).limit(limit)
+    if statuses:
+        stmt = stmt.where(AnswerRun.status.in_(statuses))
+    return list(db.execute(stmt).scalars().all())
@@ -1,7 +1,7 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from uuid import UUID
 
-from sqlalchemy import select
+from sqlalchemy import and_, func, or_, select, update
 from sqlalchemy.orm import Session
 
 from app.db.models.processing_job_orm import ProcessingJob, ProcessingJobStatus
@@ -9,10 +9,11 @@ from app.db.models.processing_job_orm import ProcessingJob, ProcessingJobStatus
 
 def create_processing_job(
     db: Session,
-    document_id: UUID,
+    document_id: UUID | None,
     *,
     job_type: str = "pdf_ingest",
     payload: dict | None = None,
+    job_id: UUID | None = None,
 ) -> ProcessingJob:
     job = ProcessingJob(
         document_id=document_id,
@@ -20,6 +21,8 @@ def create_processing_job(
         status=ProcessingJobStatus.PENDING,
         payload=payload or {},
     )
+    if job_id is not None:
+        job.id = job_id
     db.add(job)
     db.flush()
     return job
@@ -43,12 +46,24 @@ def claim_next_processing_job(
     *,
     worker_name: str,
     job_type: str = "pdf_ingest",
+    lease_seconds: float | None = None,
 ) -> ProcessingJob | None:
+    """Oldest pending job of `job_type`, or a running one whose lease expired (its runner died).
+
+    With `lease_seconds` the claimed job gets a lease the runner must keep renewing.
+    """
+    now = datetime.utcnow()
     stmt = (
         select(ProcessingJob)
         .where(
-            ProcessingJob.status == ProcessingJobStatus.PENDING,
             ProcessingJob.job_type == job_type,
+            or_(
+                ProcessingJob.status == ProcessingJobStatus.PENDING,
+                and_(
+                    ProcessingJob.status == ProcessingJobStatus.RUNNING,
+                    ProcessingJob.lease_expires_at < now,
+                ),
+            ),
         )
         .order_by(ProcessingJob.created_at.asc())
         .with_for_update(skip_locked=True)
@@ -60,13 +75,63 @@ def claim_next_processing_job(
     job.status = ProcessingJobStatus.RUNNING
     job.worker_name = worker_name
     job.attempt_count = (job.attempt_count or 0) + 1
-    job.started_at = datetime.utcnow()
+    job.started_at = now
     job.finished_at = None
     job.error_message = None
+    job.lease_expires_at = now + timedelta(seconds=lease_seconds) if lease_seconds else None
     db.flush()
     return job
 
 
+def renew_processing_job_leases(
+    db: Session,
+    job_ids: list[UUID],
+    *,
+    worker_name: str,
+    lease_seconds: float,
+) -> set[UUID]:
+    """Extend the leases of `worker_name`'s running jobs; returns the ids it still holds."""
+    if not job_ids:
+        return set()
+    result = db.execute(
+        update(ProcessingJob)
+        .where(
+            ProcessingJob.id.in_(job_ids),
+            ProcessingJob.worker_name == worker_name,
+            ProcessingJob.status == ProcessingJobStatus.RUNNING,
+        )
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        .returning(ProcessingJob.id)
+    )
+    held = set(result.scalars().all())
+    db.flush()
+    return held
+
+
+def queue_position(db: Session, job: ProcessingJob) -> int | None:
+    """1-based position of a pending job among pending jobs of its type; None once claimed."""
+    if job.status != ProcessingJobStatus.PENDING:
+        return None
+    ahead = db.scalar(
+        select(func.count())
+        .select_from(ProcessingJob)
+        .where(
+            ProcessingJob.job_type == job.job_type,
+            ProcessingJob.status == ProcessingJobStatus.PENDING,
+            ProcessingJob.created_at < job.created_at,
+        )
+    )
+    return (ahead or 0) + 1
+
+
+def count_running_jobs(db: Session, job_type: str) -> int:
+    return db.scalar(
+        select(func.count())
+        .select_from(ProcessingJob)
+        .where(ProcessingJob.job_type == job_type, ProcessingJob.status == ProcessingJobStatus.RUNNING)
+    ) or 0
+
+
 def mark_processing_job_completed(
     db: Session,
     job: ProcessingJob,
@@ -80,6 +145,7 @@ def mark_processing_job_completed(
     job.status = ProcessingJobStatus.COMPLETED
     job.finished_at = datetime.utcnow()
     job.error_message = None
+    job.lease_expires_at = None
     db.flush()
 
 
@@ -87,4 +153,5 @@ def mark_processing_job_failed(db: Session, job: ProcessingJob, *, error_message
     job.status = ProcessingJobStatus.FAILED
     job.finished_at = datetime.utcnow()
     job.error_message = error_message
+    job.lease_expires_at = None
     db.flush()
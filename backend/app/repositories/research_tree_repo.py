@@ -1,7 +1,10 @@
 # app/repositories/research_tree_repo.py
 from __future__ import annotations
+import hashlib
+import json
 from typing import Dict, List
 from uuid import UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 from app.models.research_tree import ResearchTree, ResearchNode, Chunk
@@ -13,48 +16,56 @@ from app.db.models.chunk_orm import ChunkORM
 from app.db.db import Session as SessionModel
 
 
+# Rows per INSERT statement; 11 parameters per row stays far below the 65535 bind-parameter limit.
+SAVE_BATCH_SIZE = 1000
+_NODE_COLUMNS = (
+    "id",
+    "session_id",
+    "parent_id",
+    "title",
+    "goals",
+    "content",
+    "summary",
+    "conclusion",
+    "rank",
+    "level",
+    "is_final",
+)
+
+
+def _node_row(node: ResearchNode, session_id: str, parent_id: UUID | None) -> dict:
+    return {
+        "id": node.id,
+        "session_id": UUID(str(session_id)),
+        "parent_id": parent_id,
+        "title": node.title,
+        "goals": node.goals,
+        "content": node.content,
+        "summary": node.summary,
+        "conclusion": node.conclusion,
+        "rank": node.rank,
+        "level": node.level,
+        "is_final": bool(node.is_final),
+    }
+
+
+def _row_hash(row: dict) -> str:
+    return hashlib.sha1(json.dumps([row[column] for column in _NODE_COLUMNS], default=str).encode("utf-8")).hexdigest()
+
+
 class ResearchTreeRepository:
     def __init__(self, db: Session):
         self.db = db
 
     # ---------- SAVE ----------
-    def save(self, tree: ResearchTree, session_id: str) -> None:
-        """Persist or update the whole tree structure under a session_id.
+    def save(self, tree: ResearchTree, session_id: str) -> int:
+        """Persist or update the whole tree structure under a session_id; returns the number of nodes written.
 
-        The caller owns the surrounding transaction and must commit explicitly.
+        Nodes whose row is unchanged since the last save or load are skipped, the
+        rest go out as multi-row INSERT ... ON CONFLICT (id) DO UPDATE statements.
+        The caller owns the surrounding transaction and must commit explicitly
+        (after a rollback, reload the tree: it still counts as saved).
         """
-        def _upsert(node: ResearchNode, parent_id: UUID | None):
-            db_node = self.db.query(ResearchNodeORM).filter_by(id=node.id).first()
-            if db_node is None:
-                db_node = ResearchNodeORM(
-                    id=node.id,
-                    session_id=session_id,
-                    parent_id=parent_id,
-                    title=node.title,
-                    goals=node.goals,
-                    content=node.content,
-                    summary=node.summary,
-                    conclusion=node.conclusion,
-                    rank=node.rank,
-                    level=node.level,
-                    is_final=node.is_final,
-                )
-                self.db.add(db_node)
-            else:
-                db_node.parent_id = parent_id
-                db_node.title = node.title
-                db_node.goals = node.goals
-                db_node.content = node.content
-                db_node.summary = node.summary
-                db_node.conclusion = node.conclusion
-                db_node.rank = node.rank
-                db_node.level = node.level
-                db_node.is_final = node.is_final
-
-            self.db.flush()
-            for child in node.subnodes:
-                _upsert(child, db_node.id)
-
         # ensure session row exists (stores query + optional snapshot if you want)
         sess = self.db.query(SessionModel).filter(SessionModel.id == session_id).first()
         if sess is None:
@@ -74,10 +85,41 @@ class ResearchTreeRepository:
             payload["plan"] = tree.plan.model_dump()
             sess.query = tree.query
             sess.tree = payload
-
-        _upsert(tree.root_node, parent_id=None)
         self.db.flush()
 
+        dirty: list[tuple[ResearchNode, dict, str]] = []
+        # Breadth-first, so parents are written before their children.
+        level: list[tuple[ResearchNode, UUID | None]] = [(tree.root_node, None)]
+        while level:
+            next_level = []
+            for node, parent_id in level:
+                row = _node_row(node, session_id, parent_id)
+                row_hash = _row_hash(row)
+                if row_hash != node._saved_hash:
+                    dirty.append((node, row, row_hash))
+                next_level.extend((child, node.id) for child in node.subnodes)
+            level = next_level
+
+        table = ResearchNodeORM.__table__
+        for start in range(0, len(dirty), SAVE_BATCH_SIZE):
+            rows = [row for _, row, _ in dirty[start:start + SAVE_BATCH_SIZE]]
+            stmt = pg_insert(table).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={column: stmt.excluded[column] for column in _NODE_COLUMNS if column != "id"},
+            )
+            self.db.execute(stmt)
+
+        if dirty:
+            written = {node.id for node, _, _ in dirty}
+            # ORM instances of these rows in this session are stale now.
+            for obj in list(self.db.identity_map.values()):
+                if isinstance(obj, ResearchNodeORM) and obj.id in written:
+                    self.db.expire(obj)
+        for node, _, row_hash in dirty:
+            node._saved_hash = row_hash
+        return len(dirty)
+
     # ---------- LOAD ----------
     def load(self, session_id: str) -> ResearchTree:
         sess = self.db.query(SessionModel).filter(SessionModel.id == session_id).first()
@@ -117,6 +159,9 @@ class ResearchTreeRepository:
                 child.parent = parent 
                 parent.subnodes.append(child)
 
+        for orm in all_orm:
+            id_map[orm.id]._saved_hash = _row_hash(_node_row(id_map[orm.id], session_id, orm.parent_id))
+
         # hydrate questions
         q_rows = (
             self.db.query(NodeQuestionORM.node_id, QuestionORM.text)
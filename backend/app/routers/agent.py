@@ -1,22 +1,32 @@
+import asyncio
+import json
 import logging
-from typing import Callable
+import time
+from typing import Callable, Literal
 from uuid import uuid4
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse, Response
-from pydantic import BaseModel
-from app.utils.agent.search_chunks import search_chunks
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from app.utils.agent.concurrency import SECTION_CONCURRENCY, map_concurrent
+from app.utils.agent.retrieval_cache import run_retrieval_cache
+from app.utils.agent.search_chunks import search_chunks, warm_search_cache
 from app.utils.agent.subquestions import generate_subquestions_from_chunks
 from app.utils.agent.outline import generate_outline_from_tree
-from app.utils.agent.writer import write_section, write_summary, write_conclusion
+from app.utils.agent.writer import awrite_conclusion, awrite_summary, write_section
+from app.utils.llm_cache import run_llm_cache_stats
+from app.utils.llm_gateway import gather
+from app.utils.run_metrics import begin_stage, run_metrics, stage as metrics_stage
 from app.utils.agent.finalizer import finalize_article_from_tree
 from app.models.research_tree import ResearchTree, ResearchNode, Chunk
 from app.utils.agent.expander import enrich_node_with_chunks_and_subquestions, create_subnodes_from_clusters
-from app.utils.agent.repo import upsert_questions, attach_questions_to_node, update_node_fields, get_node_chunks, upsert_chunks, attach_chunks_to_node, get_node_questions
+from app.utils.agent.repo import upsert_questions, attach_questions_to_node, attach_evidence_to_node, update_node_fields, get_node_chunks, upsert_chunks, attach_chunks_to_node, get_node_questions
 from app.utils.agent.router_utils import choose_best_node_for_question, get_top_level_section_or_400, _filter_structural_sections
 from app.utils.document_scope import resolve_research_scope
-from app.utils.agent.answer_runs import create_answer_run, get_answer_run, update_answer_run
-from app.utils.agent.planning import build_research_plan, refine_research_plan_from_initial_chunks
+from app.utils.topic_map import project_topic_seeds
+from app.utils.agent.answer_runs import enqueue_answer_run, get_answer_run, list_recent_answer_runs, update_answer_run
+from app.utils.agent.run_events import run_event_stream, subscription, wait_for_listener
+from app.utils.agent.planning import build_research_plan, node_retrieval_top_k, refine_research_plan_from_initial_chunks
 from app.utils.agent.overlap import persist_overlap_changes, reduce_tree_overlap
 import hashlib
 from app.db.db import SessionLocal, Session as SessionRecord
@@ -26,12 +36,27 @@ from app.mappers.outline_to_tree import node_from_outline_section
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+ANSWER_RUN_FINAL_STATUSES = {"completed", "failed"}
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 3000
+
 class AgentQueryRequest(BaseModel):
     query: str = "What is a black hole ?"
     top_k: int = 5
     document_id: str | None = None
     project_id: str | None = None
     output_style: str = "scientific_article"
+    search_mode: Literal["knn", "hybrid"] = "knn"
+    fusion: Literal["rrf", "weighted"] = "rrf"
+    granularity: Literal["mixed", "small_to_big"] = "mixed"
+    # MMR trade-off between relevance (1.0) and diversity (0.0); None keeps plain ranking.
+    mmr_lambda: float | None = Field(default=None, ge=0.0, le=1.0)
+    # "All documents" scope: search chunks of the N best-matching documents only (0 = flat search).
+    route_documents: int | None = Field(default=None, ge=0)
+    # False forces fresh LLM responses for this run instead of reusing cached ones.
+    use_llm_cache: bool = True
+    # Answer runs only: publish section text on the run's event stream while it is generated.
+    stream_tokens: bool = False
 
 
 def _resolve_scope_or_400(db, request: AgentQueryRequest):
@@ -40,13 +65,14 @@ def _resolve_scope_or_400(db, request: AgentQueryRequest):
             db,
             document_id=request.document_id,
             project_id=request.project_id,
+            route_documents=request.route_documents,
         )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     except LookupError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
 
-    if scope.mode == "project" and not scope.filenames:
+    if scope.mode == "project" and not scope.document_count:
         raise HTTPException(status_code=400, detail="Selected project has no documents")
     return scope
 
@@ -121,10 +147,37 @@ def _collect_section_outputs(node: ResearchNode) -> list[dict]:
 
 
 def _report_progress(progress_callback: Callable[[str], None] | None, stage: str) -> None:
+    begin_stage(stage)
     if progress_callback:
         progress_callback(stage)
 
 
+def _warm_outline_retrieval(tree: ResearchTree) -> int:
+    """Pre-fetch every outline node's enrichment search, one batch per distinct top_k."""
+    queries_by_k: dict[int, list[str]] = {}
+
+    def collect(node: ResearchNode) -> None:
+        query = " ".join(q for q in [node.title] + node.questions if q).strip() or node.title
+        queries_by_k.setdefault(node_retrieval_top_k(tree.plan, node), []).append(query)
+        for child in node.subnodes:
+            collect(child)
+
+    for node in tree.root_node.subnodes:
+        collect(node)
+    return sum(
+        warm_search_cache(
+            queries,
+            top_k=top_k,
+            scope=tree.scope,
+            search_mode=tree.plan.retrieval_mode,
+            fusion=tree.plan.retrieval_fusion,
+            granularity=tree.plan.retrieval_granularity,
+            mmr_lambda=tree.plan.retrieval_mmr_lambda,
+        )
+        for top_k, queries in queries_by_k.items()
+    )
+
+
 def _run_full_agent_pipeline(
     request: AgentQueryRequest,
     *,
@@ -132,6 +185,39 @@ def _run_full_agent_pipeline(
     progress_callback: Callable[[str], None] | None = None,
 ) -> dict:
     active_session_id = session_id or str(uuid4())
+    with (
+        run_metrics() as metrics,
+        run_retrieval_cache() as retrieval_cache,
+        run_llm_cache_stats(enabled=request.use_llm_cache) as llm_cache,
+    ):
+        result = _run_pipeline_stages(
+            request,
+            session_id=active_session_id,
+            progress_callback=progress_callback,
+        )
+        metrics.end_sequential()
+    stats = retrieval_cache.stats()
+    logger.info("[answer-run %s] Retrieval cache: %s", active_session_id, stats)
+    result["retrieval_stats"] = stats
+    result["llm_cache"] = llm_cache.stats()
+    logger.info("[answer-run %s] LLM cache: %s", active_session_id, result["llm_cache"])
+    result["metrics"] = metrics.to_dict()
+    logger.info(
+        "[answer-run %s] Cost estimate $%.4f over %s LLM calls",
+        active_session_id,
+        result["metrics"]["cost_usd"],
+        result["metrics"]["totals"]["llm"]["calls"],
+    )
+    return result
+
+
+def _run_pipeline_stages(
+    request: AgentQueryRequest,
+    *,
+    session_id: str,
+    progress_callback: Callable[[str], None] | None = None,
+) -> dict:
+    active_session_id = session_id
     user_query = request.query
     db = SessionLocal()
     try:
@@ -150,6 +236,10 @@ def _run_full_agent_pipeline(
             scope,
             requested_top_k=request.top_k,
             output_style=request.output_style,
+            retrieval_mode=request.search_mode,
+            retrieval_fusion=request.fusion,
+            retrieval_granularity=request.granularity,
+            retrieval_mmr_lambda=request.mmr_lambda,
         )
         logger.info(
             "[answer-run %s] Scope resolved: mode=%s label=%r document_count=%s filenames=%s",
@@ -182,12 +272,39 @@ def _run_full_agent_pipeline(
         logger.info("[answer-run %s] Root research tree initialized", active_session_id)
 
         _report_progress(progress_callback, "Searching initial evidence")
-        top_chunks = search_chunks(user_query, top_k=plan.root_top_k, return_docs=True, scope=scope)
+        # Project scope: the closest precomputed topics stand in for part of the root search.
+        topic_seeds, seeded_chunks = project_topic_seeds(
+            db,
+            scope,
+            user_query,
+            topic_limit=plan.outline_target_sections + 2,
+            chunk_limit=plan.root_top_k // 2,
+        )
+        if topic_seeds:
+            logger.info(
+                "[answer-run %s] Seeded from %s project topics (%s chunks): %s",
+                active_session_id,
+                len(topic_seeds),
+                len(seeded_chunks),
+                [topic.label for topic, _score in topic_seeds],
+            )
+        top_chunks = search_chunks(
+            user_query,
+            top_k=plan.root_top_k - len(seeded_chunks),
+            return_docs=True,
+            scope=scope,
+            search_mode=plan.retrieval_mode,
+            fusion=plan.retrieval_fusion,
+            granularity=plan.retrieval_granularity,
+            mmr_lambda=plan.retrieval_mmr_lambda,
+        )
         logger.info(
             "[answer-run %s] Initial evidence retrieval returned %s chunks",
             active_session_id,
             len(top_chunks),
         )
+        searched_ids = {doc.metadata.get("id") for doc in top_chunks}
+        top_chunks += [doc for doc in seeded_chunks if doc.metadata.get("id") not in searched_ids]
 
         chunk_dicts = _build_initial_chunk_dicts(top_chunks)
         tree.plan = refine_research_plan_from_initial_chunks(tree.plan, chunk_dicts)
@@ -203,8 +320,7 @@ def _run_full_agent_pipeline(
             tree.plan.section_subquestion_target,
             tree.plan.evidence_profile,
         )
-        upsert_chunks(db, chunk_dicts)
-        attach_chunks_to_node(db, tree.root_node.id, [chunk["id"] for chunk in chunk_dicts])
+        attach_evidence_to_node(db, tree.root_node.id, chunks=chunk_dicts)
         _mirror_chunks_on_node(tree.root_node, chunk_dicts)
 
         _report_progress(progress_callback, "Generating root questions")
@@ -213,6 +329,7 @@ def _run_full_agent_pipeline(
             user_query,
             target_count=tree.plan.root_subquestion_target,
             context_chunk_limit=tree.plan.root_context_chunks,
+            context_token_budget=tree.plan.root_context_tokens,
         )
         _attach_questions_in_memory_and_db(db, tree, subq, source="root_subq")
         logger.info(
@@ -222,7 +339,10 @@ def _run_full_agent_pipeline(
         )
 
         _report_progress(progress_callback, "Building outline")
-        outline = generate_outline_from_tree(tree)
+        outline = generate_outline_from_tree(
+            tree,
+            corpus_topics=[f"{topic.label} ({', '.join(topic.keywords[:5])})" for topic, _score in topic_seeds],
+        )
         logger.info(
             "[answer-run %s] Outline built with %s raw sections",
             active_session_id,
@@ -260,10 +380,14 @@ def _run_full_agent_pipeline(
     finally:
         db.close()
 
+    warmed = _warm_outline_retrieval(tree)
+    logger.info("[answer-run %s] Pre-fetched evidence for %s outline queries", active_session_id, warmed)
+
     from app.utils.agent.expander import process_node_recursively
     section_outputs = []
     _report_progress(progress_callback, "Writing sections")
-    for node in tree.root_node.subnodes:
+
+    def process_section(node: ResearchNode) -> None:
         logger.info(
             "[answer-run %s] Processing top-level section '%s' (%s/%s)",
             active_session_id,
@@ -271,7 +395,8 @@ def _run_full_agent_pipeline(
             node.rank,
             len(tree.root_node.subnodes),
         )
-        process_node_recursively(node, tree)
+        with metrics_stage(f"Section {node.rank}: {node.title}"):
+            process_node_recursively(node, tree)
         logger.info(
             "[answer-run %s] Finished top-level section '%s' content_len=%s",
             active_session_id,
@@ -279,12 +404,23 @@ def _run_full_agent_pipeline(
             len((node.content or "").strip()),
         )
 
+    sections_started = time.perf_counter()
+    map_concurrent(process_section, list(tree.root_node.subnodes))
+    logger.info(
+        "[answer-run %s] Wrote %s top-level sections in %.1fs (section concurrency %s)",
+        active_session_id,
+        len(tree.root_node.subnodes),
+        time.perf_counter() - sections_started,
+        SECTION_CONCURRENCY,
+    )
+
     _report_progress(progress_callback, "Consolidating overlapping sections")
     overlap_decisions, changed_nodes = reduce_tree_overlap(
         tree,
         root_query=user_query,
         output_style=tree.plan.output_style,
         length_hint=tree.plan.section_length_hint,
+        context_token_budget=tree.plan.section_context_tokens,
     )
     if overlap_decisions:
         logger.info(
@@ -313,10 +449,10 @@ def _run_full_agent_pipeline(
     for node in tree.root_node.subnodes:
         section_outputs.extend(_collect_section_outputs(node))
 
-    from app.utils.agent.writer import write_executive_summary, write_overall_conclusion
+    from app.utils.agent.writer import awrite_executive_summary, awrite_overall_conclusion
     _report_progress(progress_callback, "Synthesizing answer")
-    exec_summary = write_executive_summary(tree)
-    overall_concl = write_overall_conclusion(tree)
+    # Both read the finished sections only, so they can run together.
+    exec_summary, overall_concl = gather(awrite_executive_summary(tree), awrite_overall_conclusion(tree))
     logger.info(
         "[answer-run %s] Synthesized executive summary len=%s and overall conclusion len=%s",
         active_session_id,
@@ -362,33 +498,60 @@ def _run_full_agent_pipeline(
     }
 
 
-def _run_answer_job(session_id: str, request: AgentQueryRequest) -> None:
+class AnswerRunAborted(Exception):
+    """Raised at a stage boundary once the run's caller asked it to stop (e.g. its job lease was lost)."""
+
+
+def _run_answer_job(
+    session_id: str,
+    request: AgentQueryRequest,
+    *,
+    should_abort: Callable[[], bool] | None = None,
+) -> None:
+    """Run the full pipeline for a queued answer run, reporting progress on the run; re-raises failures.
+
+    `should_abort` is checked at every stage boundary; when it returns True the run stops
+    with AnswerRunAborted and leaves the run record to whoever now owns it.
+    """
     last_stage = "Queued"
-    try:
-        def mark(stage: str) -> None:
-            nonlocal last_stage
-            last_stage = stage
-            logger.info("[answer-run %s] Stage -> %s", session_id, stage)
-            update_answer_run(session_id, status="running", stage=stage)
-
-        mark("Starting research tree")
-        result = _run_full_agent_pipeline(
-            request,
-            session_id=session_id,
-            progress_callback=mark,
-        )
-        update_answer_run(session_id, status="completed", stage="Completed", result=result)
-        logger.info("[answer-run %s] Completed successfully", session_id)
-    except Exception as exc:
-        logger.exception("[answer-run %s] Failed during stage %s", session_id, last_stage)
-        update_answer_run(
-            session_id,
-            status="failed",
-            stage=last_stage,
-            failed_stage=last_stage,
-            error=str(exc),
-        )
-    
+
+    def check_abort() -> None:
+        if should_abort is not None and should_abort():
+            raise AnswerRunAborted(f"Answer run {session_id} aborted after stage {last_stage}")
+
+    with run_metrics() as metrics:
+        try:
+            def mark(stage: str) -> None:
+                nonlocal last_stage
+                check_abort()
+                last_stage = stage
+                logger.info("[answer-run %s] Stage -> %s", session_id, stage)
+                update_answer_run(session_id, status="running", stage=stage, metrics=metrics.to_dict())
+
+            mark("Starting research tree")
+            with run_event_stream(session_id, stream_tokens=request.stream_tokens):
+                result = _run_full_agent_pipeline(
+                    request,
+                    session_id=session_id,
+                    progress_callback=mark,
+                )
+            check_abort()
+            update_answer_run(session_id, status="completed", stage="Completed", result=result, metrics=result["metrics"])
+            logger.info("[answer-run %s] Completed successfully", session_id)
+        except AnswerRunAborted:
+            logger.warning("[answer-run %s] Aborted after stage %s", session_id, last_stage)
+            raise
+        except Exception as exc:
+            logger.exception("[answer-run %s] Failed during stage %s", session_id, last_stage)
+            update_answer_run(
+                session_id,
+                status="failed",
+                stage=last_stage,
+                failed_stage=last_stage,
+                error=str(exc),
+                metrics=metrics.to_dict(),
+            )
+            raise
 
 
 @router.post("/agent/query")
@@ -405,8 +568,20 @@ async def start_query_session(request: AgentQueryRequest):
         scope,
         requested_top_k=request.top_k,
         output_style=request.output_style,
+        retrieval_mode=request.search_mode,
+        retrieval_fusion=request.fusion,
+        retrieval_granularity=request.granularity,
+        retrieval_mmr_lambda=request.mmr_lambda,
+    )
+    top_chunks = search_chunks(
+        user_query,
+        top_k=plan.root_top_k,
+        scope=scope,
+        search_mode=plan.retrieval_mode,
+        fusion=plan.retrieval_fusion,
+        granularity=plan.retrieval_granularity,
+        mmr_lambda=plan.retrieval_mmr_lambda,
     )
-    top_chunks = search_chunks(user_query, top_k=plan.root_top_k, scope=scope)
 
     root_node = ResearchNode(title=user_query)
     tree = ResearchTree(query=user_query, root_node=root_node, scope=scope, plan=plan)
@@ -455,6 +630,7 @@ def generate_subquestions(session_id: str):
             tree.query,
             target_count=tree.plan.root_subquestion_target,
             context_chunk_limit=tree.plan.root_context_chunks,
+            context_token_budget=tree.plan.root_context_tokens,
         )
 
         qids = upsert_questions(db, subq, source="root_subq")
@@ -476,7 +652,17 @@ def create_outline(session_id: str):
     try:
         repo = ResearchTreeRepository(db)
         tree = repo.load(session_id)
-        outline = generate_outline_from_tree(tree)
+        topic_seeds, _ = project_topic_seeds(
+            db,
+            tree.scope,
+            tree.query,
+            topic_limit=tree.plan.outline_target_sections + 2,
+            chunk_limit=0,
+        )
+        outline = generate_outline_from_tree(
+            tree,
+            corpus_topics=[f"{topic.label} ({', '.join(topic.keywords[:5])})" for topic, _score in topic_seeds],
+        )
         filtered_sections = _filter_structural_sections(outline.sections)
         tree.root_node.subnodes = [node_from_outline_section(s) for s in filtered_sections]
 
@@ -555,6 +741,8 @@ def write_section_by_id(session_id: str, section_id: int):
             output_style=tree.plan.output_style,
             context_chunk_limit=tree.plan.section_context_chunks,
             length_hint=tree.plan.section_length_hint,
+            context_token_budget=tree.plan.section_context_tokens,
+            mmr_lambda=tree.plan.retrieval_mmr_lambda,
         )
 
         update_node_fields(db, node.id, content=node.content, is_final=True)
@@ -686,15 +874,21 @@ def complete_section(session_id: str, section_id: int):
 
         node = get_top_level_section_or_400(tree, section_id)
 
-        node.summary = write_summary(
-            node,
-            output_style=tree.plan.output_style,
-            context_chunk_limit=tree.plan.section_context_chunks,
-        )
-        node.conclusion = write_conclusion(
-            node,
-            output_style=tree.plan.output_style,
-            context_chunk_limit=tree.plan.section_context_chunks,
+        node.summary, node.conclusion = gather(
+            awrite_summary(
+                node,
+                output_style=tree.plan.output_style,
+                context_chunk_limit=tree.plan.section_context_chunks,
+                context_token_budget=tree.plan.section_context_tokens,
+                mmr_lambda=tree.plan.retrieval_mmr_lambda,
+            ),
+            awrite_conclusion(
+                node,
+                output_style=tree.plan.output_style,
+                context_chunk_limit=tree.plan.section_context_chunks,
+                context_token_budget=tree.plan.section_context_tokens,
+                mmr_lambda=tree.plan.retrieval_mmr_lambda,
+            ),
         )
         # save_research_tree_db(session_id, tree)
         # persist into DB so the tree is source-of-truth
@@ -758,7 +952,7 @@ def full_run(request: AgentQueryRequest):
 
 
 @router.post("/agent/answer_runs")
-def start_answer_run(request: AgentQueryRequest, background_tasks: BackgroundTasks):
+def start_answer_run(request: AgentQueryRequest):
     db = SessionLocal()
     try:
         scope = _resolve_scope_or_400(db, request)
@@ -768,19 +962,32 @@ def start_answer_run(request: AgentQueryRequest, background_tasks: BackgroundTas
     session_id = str(uuid4())
     scope_payload = scope.model_dump()
     scope_payload["output_style"] = request.output_style
-    create_answer_run(
+    # Executed by the answer worker (app.answer_worker), not in the API process.
+    job_id = enqueue_answer_run(
         session_id,
         query=request.query,
         scope=scope_payload,
+        request=request.model_dump(mode="json"),
     )
-    background_tasks.add_task(_run_answer_job, session_id, request)
+    status = get_answer_run(session_id) or {}
     return {
         "session_id": session_id,
+        "job_id": job_id,
         "status": "pending",
         "scope": scope.model_dump(),
+        "queue": status.get("queue"),
     }
 
 
+@router.get("/agent/answer_runs")
+def list_answer_runs(
+    status: Literal["active", "pending", "running", "completed", "failed"] | None = None,
+    limit: int = 50,
+):
+    """Recent answer runs (newest first) with queue and run durations."""
+    return list_recent_answer_runs(status=status, limit=max(1, min(limit, 500)))
+
+
 @router.get("/agent/answer_runs/{session_id}")
 def answer_run_status(session_id: str):
     payload = get_answer_run(session_id)
@@ -789,6 +996,46 @@ def answer_run_status(session_id: str):
     return payload
 
 
+async def _answer_run_events(session_id: str):
+    with subscription(session_id) as events:
+        # Read after subscribing (and LISTENing), so no change falls between the snapshot and the stream.
+        if not await asyncio.to_thread(wait_for_listener):
+            logger.warning("[answer-run %s] Event listener not ready; relying on status checks", session_id)
+        run = await asyncio.to_thread(get_answer_run, session_id)
+        yield f"retry: {SSE_RETRY_MS}\n" + _sse_message("snapshot", run)
+        if run is None or run.get("status") in ANSWER_RUN_FINAL_STATUSES:
+            return
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # A final event lost while the listener reconnected would leave the stream open forever.
+                run = await asyncio.to_thread(get_answer_run, session_id)
+                if run is None or run.get("status") in ANSWER_RUN_FINAL_STATUSES:
+                    yield _sse_message("snapshot", run)
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield _sse_message(event["type"], event)
+            if event["type"] == "run" and event.get("status") in ANSWER_RUN_FINAL_STATUSES:
+                return
+
+
+def _sse_message(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.get("/agent/answer_runs/{session_id}/events")
+def answer_run_events(session_id: str):
+    """Server-sent events of an answer run: a snapshot, then run, section and token events."""
+    if get_answer_run(session_id) is None:
+        raise HTTPException(status_code=404, detail="Answer run not found")
+    return StreamingResponse(
+        _answer_run_events(session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @router.get("/agent/tree/{session_id}")
 def get_tree(session_id: str):
@@ -15,7 +15,10 @@ from app.repositories.job_repo import (
     mark_processing_job_failed,
 )
 from app.schemas import ImageMetadata
+from app.utils.query_cache import invalidate_documents
 from app.utils.save_images import save_image_metadata_list
+from app.utils.search_index import sync_document_scope_fields
+from app.utils.topic_map import schedule_topic_maps
 
 
 router = APIRouter()
@@ -46,11 +49,11 @@ class FailJobRequest(BaseModel):
     error: str
 
 
-def _job_to_dict(job, document: Document) -> dict[str, Any]:
+def _job_to_dict(job, document: Document | None) -> dict[str, Any]:
     return {
         "id": str(job.id),
-        "document_id": str(document.id),
-        "filename": document.filename,
+        "document_id": str(document.id) if document else None,
+        "filename": document.filename if document else None,
         "status": job.status.value,
         "job_type": job.job_type,
         "attempt_count": job.attempt_count,
@@ -69,8 +72,9 @@ def get_job(job_id: UUID, db: Session = Depends(get_db)):
     if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    document = db.get(Document, job.document_id)
-    if document is None:
+    # Answer-run jobs have no document.
+    document = db.get(Document, job.document_id) if job.document_id else None
+    if job.document_id and document is None:
         raise HTTPException(status_code=404, detail="Document not found")
     return _job_to_dict(job, document)
 
@@ -100,10 +104,13 @@ def claim_job(request: ClaimJobRequest, db: Session = Depends(get_db)):
     if document is None:
         raise HTTPException(status_code=404, detail="Document not found")
 
+    project_id = str(document.project_id) if document.project_id else None
+    job.payload = {**dict(job.payload or {}), "project_id": project_id}
     db.commit()
     return {
         "id": str(job.id),
         "document_id": str(document.id),
+        "project_id": project_id,
         "filename": document.filename,
         "job_type": job.job_type,
         "payload": dict(job.payload or {}),
@@ -138,6 +145,23 @@ def complete_job(job_id: UUID, request: CompleteJobRequest, db: Session = Depend
     mark_processing_job_completed(db, job, payload={"stats": request.stats})
     db.commit()
 
+    # The worker stamps the project it saw at claim time; re-sync if the document moved meanwhile.
+    current_project_id = str(document.project_id) if document.project_id else None
+    sync_tasks = {}
+    if dict(job.payload or {}).get("project_id") != current_project_id:
+        sync_tasks = sync_document_scope_fields(
+            document.filename,
+            document_id=str(document.id),
+            project_id=current_project_id,
+        )
+    # The document's chunks are searchable now.
+    invalidate_documents(
+        document_ids=[str(document.id)],
+        project_ids=[current_project_id],
+        pending_tasks=sync_tasks.values(),
+    )
+    schedule_topic_maps([current_project_id])
+
     return {
         "status": "completed",
         "job_id": str(job.id),
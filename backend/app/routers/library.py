@@ -1,7 +1,10 @@
+import logging
+import threading
 from collections import Counter
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy import func
 from sqlalchemy.orm import Session
@@ -11,11 +14,23 @@ from app.db.models.document_orm import Document
 from app.db.models.image_record_orm import ImageRecord
 from app.db.models.processing_job_orm import ProcessingJob, ProcessingJobStatus
 from app.db.models.project_orm import Project
+from app.db.models.project_topic_orm import ProjectTopic
 from app.repositories.project_repo import get_or_create_project, normalize_project_name
+from app.utils.chunk_export import EXPORT_BATCH_SIZE, EXPORTABLE_INDICES, count_chunks, iter_ndjson
 from app.utils.minio_utils import get_minio_client, remove_object_if_exists
-from app.utils.search_index import delete_by_filters
+from app.utils.query_cache import QUERY_CACHE, invalidate_documents
+from app.utils.search_index import (
+    SCOPE_SYNC_BATCH_SIZE,
+    delete_by_filters,
+    scope_fields_backfilled,
+    sync_document_scope_fields,
+    sync_scope_fields_batched,
+)
+from app.utils.topic_map import TOPIC_MAP_SCHEDULER, document_signature, schedule_topic_maps
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 UPLOAD_BUCKET = "uploads"
@@ -91,6 +106,14 @@ def _serialize_document(
     }
 
 
+def _sync_search_scope(document: Document) -> dict[str, str | None]:
+    return sync_document_scope_fields(
+        document.filename,
+        document_id=str(document.id),
+        project_id=str(document.project_id) if document.project_id else None,
+    )
+
+
 def _latest_jobs_for_documents(db: Session, document_ids: list[UUID]) -> dict[UUID, ProcessingJob]:
     if not document_ids:
         return {}
@@ -146,6 +169,44 @@ def create_project(request: CreateProjectRequest, db: Session = Depends(get_db))
     }
 
 
+@router.get("/projects/{project_id}/topics")
+def get_project_topics(project_id: UUID, db: Session = Depends(get_db)):
+    project = db.get(Project, project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    topics = (
+        db.query(ProjectTopic)
+        .filter(ProjectTopic.project_id == project.id)
+        .order_by(ProjectTopic.topic_index.asc())
+        .all()
+    )
+    return {
+        "project_id": str(project.id),
+        "current": bool(topics) and topics[0].document_signature == document_signature(db, project.id),
+        "rebuild_pending": str(project.id) in TOPIC_MAP_SCHEDULER.pending(),
+        "built_at": topics[0].created_at.isoformat() if topics else None,
+        "topics": [
+            {
+                "index": topic.topic_index,
+                "label": topic.label,
+                "keywords": list(topic.keywords or []),
+                "chunk_count": topic.chunk_count,
+                "representative_chunk_ids": list(topic.representative_chunk_ids or []),
+            }
+            for topic in topics
+        ],
+    }
+
+
+@router.post("/projects/{project_id}/topics/rebuild")
+def rebuild_project_topics(project_id: UUID, db: Session = Depends(get_db)):
+    if db.get(Project, project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    TOPIC_MAP_SCHEDULER.schedule([str(project_id)], delay=0)
+    return {"status": "scheduled", "project_id": str(project_id)}
+
+
 @router.get("/documents/")
 def list_documents(project_id: UUID | None = None, db: Session = Depends(get_db)):
     query = db.query(Document)
@@ -190,6 +251,7 @@ def update_document_project(
     if request.project_id and request.project_name:
         raise HTTPException(status_code=400, detail="Choose project_id or project_name, not both")
 
+    previous_project_id = document.project_id
     project = None
     if request.project_id is not None:
         project = db.get(Project, request.project_id)
@@ -206,15 +268,98 @@ def update_document_project(
     else:
         raise HTTPException(status_code=400, detail="Provide project_id or project_name")
 
+    project_changed = previous_project_id != document.project_id
     db.commit()
     db.refresh(document)
 
     if document.project_id and project is None:
         project = db.get(Project, document.project_id)
 
+    search_sync_tasks = {}
+    if project_changed:
+        search_sync_tasks = _sync_search_scope(document)
+        changed_project_ids = [
+            str(previous_project_id) if previous_project_id else None,
+            str(document.project_id) if document.project_id else None,
+        ]
+        invalidate_documents(
+            document_ids=[str(document.id)],
+            project_ids=changed_project_ids,
+            pending_tasks=search_sync_tasks.values(),
+        )
+        schedule_topic_maps(changed_project_ids)
+
     latest_job = _latest_jobs_for_documents(db, [document.id]).get(document.id)
     return {
         "document": _serialize_document(document, project=project, latest_job=latest_job),
+        "search_sync_tasks": search_sync_tasks,
+    }
+
+
+@router.get("/documents/{document_id}/chunks")
+def export_document_chunks(
+    document_id: UUID,
+    index: str = "pdf_chunks",
+    fields: str | None = None,
+    vectors: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    db: Session = Depends(get_db),
+):
+    """Stream a document's indexed chunks (or captions) as NDJSON, one `{"id": ..., ...}` per line.
+
+    `fields` is a comma-separated source field list (default: all but the vector);
+    `vectors=true` adds the stored embedding. Rows come from the index, not the PDF.
+    """
+    document = db.get(Document, document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if index not in EXPORTABLE_INDICES:
+        raise HTTPException(status_code=400, detail=f"index must be one of {', '.join(EXPORTABLE_INDICES)}")
+
+    # Rows indexed before the scope fields were backfilled only carry source_pdf.
+    filters = (
+        {"document_id": str(document.id)} if scope_fields_backfilled() else {"source_pdf": document.filename}
+    )
+    selected = [field.strip() for field in (fields or "").split(",") if field.strip()]
+    return StreamingResponse(
+        iter_ndjson(index, filters, fields=selected, include_vectors=vectors, batch_size=batch_size),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="{document.id}_{index}.ndjson"',
+            # Lets clients tell a complete export from one cut short by a dropped connection.
+            "X-Total-Count": str(count_chunks(index, filters)),
+        },
+    )
+
+
+def _run_scope_sync(scopes: list[tuple[str, str, str | None]]) -> None:
+    try:
+        runs = sync_scope_fields_batched(scopes)
+        logger.info("Scope fields synced for %s documents (%s)", len(scopes), runs)
+    except Exception:
+        logger.exception("Scope field sync failed; POST /internal/search/sync_scope_fields again to resume")
+    finally:
+        # Answers cached while the sync ran may have missed rows it just scoped.
+        QUERY_CACHE.clear()
+
+
+@router.post("/internal/search/sync_scope_fields")
+def sync_search_scope_fields(db: Session = Depends(get_db)):
+    """Backfill document_id/project_id on indexed chunks and captions for every document.
+
+    Runs in the background, one batched `update_by_query` at a time per index.
+    """
+    documents = db.query(Document).order_by(Document.created_at.asc()).all()
+    scopes = [
+        (document.filename, str(document.id), str(document.project_id) if document.project_id else None)
+        for document in documents
+    ]
+    QUERY_CACHE.clear()
+    threading.Thread(target=_run_scope_sync, args=(scopes,), daemon=True, name="scope-field-sync").start()
+    return {
+        "documents": len(documents),
+        "batch_size": SCOPE_SYNC_BATCH_SIZE,
+        "status": "started",
     }
 
 
@@ -239,6 +384,10 @@ def delete_document(document_id: UUID, db: Session = Depends(get_db)):
         .all()
     )
 
+    cached_scope = {
+        "document_ids": [str(document.id)],
+        "project_ids": [str(document.project_id) if document.project_id else None],
+    }
     try:
         removed_upload = remove_object_if_exists(minio_client, UPLOAD_BUCKET, document.filename)
         removed_images = 0
@@ -248,6 +397,7 @@ def delete_document(document_id: UUID, db: Session = Depends(get_db)):
 
         deleted_chunks = delete_by_filters("pdf_chunks", {"source_pdf": document.filename})
         deleted_captions = delete_by_filters("captions", {"source_pdf": document.filename})
+        delete_by_filters("documents", {"source_pdf": document.filename})
 
         db.query(ImageRecord).filter(ImageRecord.source_pdf == document.filename).delete(
             synchronize_session=False
@@ -257,6 +407,8 @@ def delete_document(document_id: UUID, db: Session = Depends(get_db)):
     except Exception as exc:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Delete failed: {exc}") from exc
+    invalidate_documents(**cached_scope)
+    schedule_topic_maps(cached_scope["project_ids"])
 
     return {
         "status": "deleted",
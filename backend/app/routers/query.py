@@ -1,11 +1,16 @@
+import time
+from typing import Literal
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from app.db.db import get_db
+from app.utils.document_routing import route_documents, routed_filters
 from app.utils.document_scope import resolve_research_scope
+from app.utils.knn_tuning import recall_report
+from app.utils.query_cache import QUERY_CACHE, QUERY_CACHE_ENABLED, normalize_query, scope_cache_key
 from app.utils.vectorstore import get_vectorstore
 
 
@@ -21,6 +26,14 @@ class QueryRequest(BaseModel):
     top_k: int = 5
     document_id: UUID | None = None
     project_id: UUID | None = None
+    search_mode: Literal["knn", "hybrid"] = "knn"
+    fusion: Literal["rrf", "weighted"] = "rrf"
+    # "All documents" scope: search chunks of the N best-matching documents only (0 = flat search).
+    route_documents: int | None = Field(default=None, ge=0)
+
+
+def _cached_response(response: dict, cache_info: dict) -> dict:
+    return {**response, "cache": cache_info}
 
 
 @router.post("/query/")
@@ -31,32 +44,76 @@ async def query(request: QueryRequest, db: Session = Depends(get_db)):
                 db,
                 document_id=request.document_id,
                 project_id=request.project_id,
+                route_documents=request.route_documents,
             )
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
         except LookupError as exc:
             raise HTTPException(status_code=404, detail=str(exc)) from exc
 
-        if scope.mode == "project" and not scope.filenames:
+        if scope.mode == "project" and not scope.document_count:
             return {
                 "scope": scope.model_dump(),
                 "text_chunks": [],
                 "captions": [],
             }
 
+        cache_bucket = (
+            scope_cache_key(scope),
+            request.top_k,
+            request.search_mode,
+            request.fusion,
+            scope.routing_top_n(),
+        )
+        normalized_query = normalize_query(request.query)
+        cache_generation = QUERY_CACHE.generation
+        if QUERY_CACHE_ENABLED:
+            cached = QUERY_CACHE.lookup_exact(cache_bucket, normalized_query)
+            if cached:
+                return _cached_response(*cached)
+
+        started = time.perf_counter()
+        query_vector = vectorstore.embed_queries([request.query])[0]
+        embed_ms = (time.perf_counter() - started) * 1000.0
+        if QUERY_CACHE_ENABLED:
+            cached = QUERY_CACHE.lookup_similar(cache_bucket, query_vector)
+            if cached:
+                return _cached_response(*cached)
+
+        started = time.perf_counter()
+        filters = scope.search_filters()
+        routed = []
+        if scope.routing_top_n():
+            routed = route_documents(
+                [request.query],
+                [query_vector],
+                scope.routing_top_n(),
+                mode=request.search_mode,
+                fusion=request.fusion,
+            )
+            filters = routed_filters(filters, routed)
+
         text_results = vectorstore.similarity_search_with_score(
             query=request.query,
             k=request.top_k,
-            filters=scope.search_filters(),
+            filters=filters,
+            mode=request.search_mode,
+            fusion=request.fusion,
+            query_vector=query_vector,
         )
         caption_results = caption_store.similarity_search_with_score(
             query=request.query,
             k=request.top_k,
-            filters=scope.search_filters(),
+            filters=filters,
+            mode=request.search_mode,
+            fusion=request.fusion,
+            query_vector=query_vector,
         )
 
-        return {
+        response = {
             "scope": scope.model_dump(),
+            "search_mode": request.search_mode,
+            "routed_documents": routed,
             "text_chunks": [
                 {
                     "text": doc.page_content, 
@@ -74,9 +131,30 @@ async def query(request: QueryRequest, db: Session = Depends(get_db)):
             for (doc, score) in caption_results
             ]
         }
+        if QUERY_CACHE_ENABLED:
+            QUERY_CACHE.store(
+                cache_bucket,
+                normalized_query,
+                query_vector,
+                response,
+                embed_ms=embed_ms,
+                search_ms=(time.perf_counter() - started) * 1000.0,
+                generation=cache_generation,
+            )
+        return {**response, "cache": {"hit": None}}
     except HTTPException:
         raise
     except Exception as e:
          raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
 
 
+@router.get("/internal/search/knn_recall")
+def knn_recall():
+    """Sampled kNN recall vs. exact search, latency and candidate multiplier per scope mode."""
+    return recall_report()
+
+
+@router.get("/internal/search/query_cache")
+def query_cache_stats():
+    """Hit rate and latency saved by the /query response cache since startup."""
+    return QUERY_CACHE.report()
@@ -9,6 +9,7 @@ from app.db.models.document_orm import Document
 from app.repositories.job_repo import create_processing_job
 from app.repositories.project_repo import get_or_create_project, normalize_project_name
 from app.utils.minio_utils import ensure_bucket_exists, get_minio_client
+from app.utils.query_cache import invalidate_documents
 
 router = APIRouter()
 
@@ -59,6 +60,10 @@ async def upload_file(
             payload={"filename": unique_filename},
         )
         db.commit()
+        invalidate_documents(
+            document_ids=[str(document.id)],
+            project_ids=[str(project.id) if project else None],
+        )
 
         return {
             "document_id": str(document.id),
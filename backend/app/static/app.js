@@ -10,9 +10,9 @@ const state = {
   answerRun: null,
   answerTree: null,
   libraryTimer: null,
-  answerPollTimer: null,
-  answerPollDelay: 2500,
-  lastAnswerStage: null,
+  answerEvents: null,
+  answerSections: {},
+  answerRenderPending: false,
 };
 
 const elements = {
@@ -389,7 +389,8 @@ function renderAnswer() {
     const failureBlock =
       state.answerRun.status === "failed" && state.answerRun.error
         ? `<p class="helper">Failure during ${escapeHtml(state.answerRun.failed_stage || state.answerRun.stage || "processing")}: ${escapeHtml(state.answerRun.error)}</p>`
-        : `<p class="helper">The research tree is running in the backend. This view will update automatically.</p>`;
+        : `<p class="helper">The research tree is running in the backend. Sections appear here as they are written.</p>`;
+    const liveSections = renderLiveSections();
     elements.answerEmpty.hidden = true;
     elements.answerOutput.hidden = false;
     elements.answerOutput.innerHTML = `
@@ -407,6 +408,7 @@ function renderAnswer() {
             <span class="metadata-chip">session ${escapeHtml(state.answerRun.session_id || "")}</span>
           </div>
         </div>
+        ${liveSections}
       </article>
     `;
     renderAnswerTree();
@@ -551,24 +553,64 @@ function renderAnswerTree() {
   `;
 }
 
-function resetAnswerPollingState() {
-  state.answerPollDelay = 2500;
-  state.lastAnswerStage = null;
+function compareDisplayRank(left, right) {
+  const a = String(left.display_rank || "").split(".").map(Number);
+  const b = String(right.display_rank || "").split(".").map(Number);
+  for (let index = 0; index < Math.max(a.length, b.length); index += 1) {
+    const difference = (a[index] ?? -1) - (b[index] ?? -1);
+    if (difference !== 0) {
+      return difference;
+    }
+  }
+  return 0;
+}
+
+function renderLiveSections() {
+  const sections = Object.values(state.answerSections)
+    .filter((section) => section.content)
+    .sort(compareDisplayRank);
+  if (sections.length === 0) {
+    return "";
+  }
+  return sections
+    .map(
+      (section) => `
+        <section class="answer-live-section">
+          <p class="result-title">${escapeHtml(`${section.display_rank || ""} ${section.title || "Section"}`.trim())}${
+            section.streaming ? ` <span class="metadata-chip">writing</span>` : ""
+          }</p>
+          <pre class="answer-article">${escapeHtml(section.content)}</pre>
+        </section>
+      `,
+    )
+    .join("");
+}
+
+function scheduleAnswerRender() {
+  if (state.answerRenderPending) {
+    return;
+  }
+  state.answerRenderPending = true;
+  window.requestAnimationFrame(() => {
+    state.answerRenderPending = false;
+    renderAnswer();
+  });
 }
 
-function nextAnswerPollDelay(payload) {
-  const stage = payload?.stage || "";
-  if (payload?.status !== "running") {
-    resetAnswerPollingState();
-    return 2500;
+function findTreeNode(node, nodeId) {
+  if (!node) {
+    return null;
+  }
+  if (node.id === nodeId) {
+    return node;
   }
-  if (!stage || stage !== state.lastAnswerStage) {
-    state.lastAnswerStage = stage;
-    state.answerPollDelay = 2500;
-    return state.answerPollDelay;
+  for (const child of node.subnodes || []) {
+    const match = findTreeNode(child, nodeId);
+    if (match) {
+      return match;
+    }
   }
-  state.answerPollDelay = Math.min(state.answerPollDelay + 1500, 12000);
-  return state.answerPollDelay;
+  return null;
 }
 
 async function refreshAnswerTree(sessionId) {
@@ -583,46 +625,112 @@ async function refreshAnswerTree(sessionId) {
   }
 }
 
-function scheduleAnswerPoll(sessionId, delayMs = state.answerPollDelay) {
-  if (state.answerPollTimer) {
-    window.clearTimeout(state.answerPollTimer);
+function closeAnswerEvents() {
+  if (state.answerEvents) {
+    state.answerEvents.close();
+    state.answerEvents = null;
   }
-  state.answerPollTimer = window.setTimeout(() => {
-    pollAnswerRun(sessionId).catch(console.error);
-  }, delayMs);
 }
 
-async function pollAnswerRun(sessionId) {
-  try {
-    const [payload] = await Promise.all([
-      fetchJson(`agent/answer_runs/${sessionId}`),
-      refreshAnswerTree(sessionId),
-    ]);
-    state.answerRun = payload;
-    if (payload.status === "completed" && payload.result) {
-      state.answerResult = payload.result;
-      await refreshAnswerTree(sessionId);
-      renderAnswer();
-      elements.answerHelper.textContent = "Structured answer generated successfully.";
-      setSignal("live", "Answer built");
+async function loadAnswerRun(sessionId) {
+  const [payload] = await Promise.all([
+    fetchJson(`agent/answer_runs/${sessionId}`),
+    refreshAnswerTree(sessionId),
+  ]);
+  state.answerRun = payload;
+  if (payload.status === "completed" && payload.result) {
+    state.answerResult = payload.result;
+    renderAnswer();
+    elements.answerHelper.textContent = "Structured answer generated successfully.";
+    setSignal("live", "Answer built");
+    return;
+  }
+
+  if (payload.status === "failed") {
+    state.answerResult = null;
+    renderAnswer();
+    elements.answerHelper.textContent = payload.error || "Answer generation failed";
+    setSignal("error", payload.error || "Answer generation failed");
+    return;
+  }
+
+  renderAnswer();
+}
+
+function applyRunEvent(sessionId, event) {
+  const stageChanged = event.stage !== state.answerRun?.stage;
+  state.answerRun = { ...state.answerRun, ...event };
+  delete state.answerRun.type;
+  if (event.status === "completed" || event.status === "failed") {
+    closeAnswerEvents();
+    loadAnswerRun(sessionId).catch(console.error);
+    return;
+  }
+  if (stageChanged) {
+    // Stage changes are where the tree gains nodes (outline, deepening).
+    refreshAnswerTree(sessionId).catch(console.error);
+  }
+  scheduleAnswerRender();
+}
+
+function applySectionEvent(sessionId, event) {
+  state.answerSections[event.node_id] = { ...event, streaming: false };
+  const node = findTreeNode(state.answerTree?.root_node, event.node_id);
+  if (node) {
+    node.content = event.content;
+    node.is_final = true;
+  } else {
+    refreshAnswerTree(sessionId).catch(console.error);
+  }
+  scheduleAnswerRender();
+}
+
+function applyTokenEvent(event) {
+  const section = state.answerSections[event.node_id] || {
+    node_id: event.node_id,
+    content: "",
+    ...findTreeNode(state.answerTree?.root_node, event.node_id),
+  };
+  if (section.streaming === false) {
+    return;
+  }
+  section.content = (section.content || "").slice(0, event.offset) + event.text;
+  section.streaming = true;
+  state.answerSections[event.node_id] = section;
+  scheduleAnswerRender();
+}
+
+function watchAnswerRun(sessionId) {
+  closeAnswerEvents();
+  state.answerSections = {};
+  const source = new EventSource(apiUrl(`agent/answer_runs/${sessionId}/events`));
+  state.answerEvents = source;
+
+  source.addEventListener("snapshot", (message) => {
+    const payload = JSON.parse(message.data);
+    if (!payload) {
       return;
     }
-
-    if (payload.status === "failed") {
-      state.answerResult = null;
-      renderAnswer();
-      elements.answerHelper.textContent = payload.error || "Answer generation failed";
-      setSignal("error", payload.error || "Answer generation failed");
+    state.answerRun = payload;
+    if (payload.status === "completed" || payload.status === "failed") {
+      closeAnswerEvents();
+      loadAnswerRun(sessionId).catch(console.error);
       return;
     }
-
+    // Sections written before we subscribed come with the tree.
+    refreshAnswerTree(sessionId).catch(console.error);
     renderAnswer();
-    scheduleAnswerPoll(sessionId, nextAnswerPollDelay(payload));
-  } catch (error) {
-    console.error(error);
-    elements.answerHelper.textContent = error.message;
-    setSignal("error", error.message);
-  }
+  });
+  source.addEventListener("run", (message) => applyRunEvent(sessionId, JSON.parse(message.data)));
+  source.addEventListener("section", (message) => applySectionEvent(sessionId, JSON.parse(message.data)));
+  source.addEventListener("token", (message) => applyTokenEvent(JSON.parse(message.data)));
+  source.onerror = () => {
+    // EventSource reconnects by itself; the next snapshot brings the view up to date.
+    if (source.readyState === EventSource.CLOSED && state.answerEvents === source) {
+      state.answerEvents = null;
+      loadAnswerRun(sessionId).catch(console.error);
+    }
+  };
 }
 
 async function fetchJson(path, options = {}) {
@@ -759,9 +867,8 @@ async function handleDeleteDocument(document) {
       state.answerTree = null;
     }
     renderAnswer();
-    if (state.answerPollTimer) {
-      window.clearTimeout(state.answerPollTimer);
-      state.answerPollTimer = null;
+    if (!state.answerRun) {
+      closeAnswerEvents();
     }
     renderResults();
     await loadLibrary({ includeProjects: true });
@@ -825,6 +932,7 @@ async function runBuildAnswer() {
   const payload = {
     query,
     top_k: Number(elements.topKSelect.value),
+    stream_tokens: true,
   };
   if (scope.mode === "document") {
     payload.document_id = scope.document_id;
@@ -848,11 +956,9 @@ async function runBuildAnswer() {
     state.answerResult = null;
     state.answerRun = startPayload;
     state.answerTree = null;
-    resetAnswerPollingState();
     renderAnswer();
     setSignal("live", "Answer queued");
-    refreshAnswerTree(startPayload.session_id).catch(console.error);
-    scheduleAnswerPoll(startPayload.session_id, 1000);
+    watchAnswerRun(startPayload.session_id);
   } catch (error) {
     console.error(error);
     state.answerResult = null;
@@ -2,12 +2,34 @@ from __future__ import annotations
 
 from datetime import datetime
 from typing import Any
+from uuid import UUID, uuid4
 
 from app.db.db import Session as SessionModel, SessionLocal
+from app.db.models.answer_run_orm import AnswerRun, AnswerRunEvent, AnswerRunStatus
+from app.repositories.answer_run_repo import (
+    ACTIVE_STATUSES,
+    create_answer_run_record,
+    get_latest_answer_run,
+    list_answer_run_events,
+    list_answer_runs,
+    record_answer_run_progress,
+)
+from app.repositories.job_repo import count_running_jobs, create_processing_job, get_processing_job, queue_position
+from app.utils.agent.run_events import publish
 
 
-def _iso_now() -> str:
-    return datetime.utcnow().isoformat()
+# processing_jobs.job_type of queued answer runs; executed by app.answer_worker.
+ANSWER_RUN_JOB_TYPE = "answer_run"
+
+
+def _iso(value: datetime | None) -> str | None:
+    return value.isoformat() if value else None
+
+
+def _seconds(start: datetime | None, end: datetime | None) -> float | None:
+    if start is None:
+        return None
+    return round(((end or datetime.utcnow()) - start).total_seconds(), 3)
 
 
 def create_answer_run(
@@ -15,28 +37,21 @@ def create_answer_run(
     *,
     query: str,
     scope: dict[str, Any],
+    job_id: str | None = None,
 ) -> None:
     with SessionLocal() as db:
         session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-        payload = dict(session.tree or {}) if session else {}
-        payload["scope"] = scope
-        payload["answer_run"] = {
-            "status": "pending",
-            "stage": "Queued",
-            "failed_stage": None,
-            "requested_at": _iso_now(),
-            "started_at": None,
-            "finished_at": None,
-            "updated_at": _iso_now(),
-            "error": None,
-            "result": None,
-        }
-
         if session is None:
-            db.add(SessionModel(id=session_id, query=query, tree=payload))
-        else:
-            session.query = query
-            session.tree = payload
+            # The research tree reads its scope from the session.
+            db.add(SessionModel(id=session_id, query=query, tree={"scope": scope}))
+            db.flush()
+        create_answer_run_record(
+            db,
+            session_id,
+            query=query,
+            scope=scope,
+            job_id=UUID(job_id) if job_id else None,
+        )
         db.commit()
 
 
@@ -48,51 +63,173 @@ def update_answer_run(
     failed_stage: str | None = None,
     error: str | None = None,
     result: dict[str, Any] | None = None,
+    metrics: dict[str, Any] | None = None,
 ) -> None:
     with SessionLocal() as db:
-        session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-        if session is None:
+        run = get_latest_answer_run(db, session_id, for_update=True)
+        if run is None:
             return
 
-        payload = dict(session.tree or {})
-        run = dict(payload.get("answer_run") or {})
-        if status is not None:
-            run["status"] = status
-        if stage is not None:
-            run["stage"] = stage
+        record_answer_run_progress(
+            db,
+            run,
+            status=AnswerRunStatus(status) if status is not None else None,
+            stage=stage,
+        )
         if failed_stage is not None:
-            run["failed_stage"] = failed_stage
-        if status == "running":
-            run["started_at"] = run.get("started_at") or _iso_now()
-            run["error"] = None
-            run["failed_stage"] = None
-        if status in {"completed", "failed"}:
-            run["finished_at"] = _iso_now()
+            run.failed_stage = failed_stage
         if error is not None:
-            run["error"] = error
+            run.error = error
         if result is not None:
-            run["result"] = result
-        run["updated_at"] = _iso_now()
+            run.result = result
+        if metrics is not None:
+            run.metrics = metrics
+        event = {
+            "status": run.status.value,
+            "stage": run.stage,
+            "failed_stage": run.failed_stage,
+            "error": run.error,
+            "updated_at": _iso(run.updated_at),
+        }
+        db.commit()
+
+    publish(session_id, "run", **event)
+
 
-        payload["answer_run"] = run
-        session.tree = payload
+def enqueue_answer_run(
+    session_id: str,
+    *,
+    query: str,
+    scope: dict[str, Any],
+    request: dict[str, Any],
+) -> str:
+    """Record the answer run and queue it for the answer worker; returns the job id."""
+    job_id = uuid4()
+    # The run record exists before the job, so a worker never claims a run it cannot report on.
+    create_answer_run(session_id, query=query, scope=scope, job_id=str(job_id))
+    with SessionLocal() as db:
+        create_processing_job(
+            db,
+            None,
+            job_type=ANSWER_RUN_JOB_TYPE,
+            payload={"session_id": session_id, "request": request},
+            job_id=job_id,
+        )
         db.commit()
+    return str(job_id)
+
+
+def _queue_info(db, job_id: str | None) -> dict[str, Any] | None:
+    if not job_id:
+        return None
+    job = get_processing_job(db, UUID(job_id))
+    if job is None:
+        return None
+    return {
+        "job_id": str(job.id),
+        "status": job.status.value,
+        "position": queue_position(db, job),
+        "running": count_running_jobs(db, ANSWER_RUN_JOB_TYPE),
+        "attempt_count": job.attempt_count,
+        "worker_name": job.worker_name,
+    }
+
+
+def _run_to_dict(run: AnswerRun) -> dict[str, Any]:
+    return {
+        "session_id": str(run.session_id),
+        "query": run.query,
+        "scope": dict(run.scope or {}),
+        "status": run.status.value,
+        "stage": run.stage,
+        "job_id": str(run.job_id) if run.job_id else None,
+        "failed_stage": run.failed_stage,
+        "requested_at": _iso(run.requested_at),
+        "started_at": _iso(run.started_at),
+        "finished_at": _iso(run.finished_at),
+        "updated_at": _iso(run.updated_at),
+        "error": run.error,
+    }
+
+
+def _stage_durations(events: list[AnswerRunEvent]) -> list[dict[str, Any]]:
+    """Time spent in each logged stage; the current stage of an unfinished run runs until now."""
+    stages = []
+    for index, event in enumerate(events):
+        if index + 1 < len(events):
+            ended = events[index + 1].created_at
+        elif event.status in (AnswerRunStatus.COMPLETED, AnswerRunStatus.FAILED):
+            ended = event.created_at
+        else:
+            ended = None
+        stages.append(
+            {
+                "status": event.status.value,
+                "stage": event.stage,
+                "at": _iso(event.created_at),
+                "seconds": _seconds(event.created_at, ended),
+            }
+        )
+    return stages
 
 
 def get_answer_run(session_id: str) -> dict[str, Any] | None:
     with SessionLocal() as db:
-        session = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-        if session is None:
-            return None
-
-        payload = dict(session.tree or {})
-        run = dict(payload.get("answer_run") or {})
-        if not run:
+        run = get_latest_answer_run(db, session_id)
+        if run is None:
             return None
 
         return {
-            "session_id": str(session.id),
-            "query": session.query,
-            "scope": dict(payload.get("scope") or {}),
-            **run,
+            **_run_to_dict(run),
+            "result": run.result,
+            "metrics": run.metrics,
+            "stages": _stage_durations(list_answer_run_events(db, run.id)),
+            "queue": _queue_info(db, str(run.job_id) if run.job_id else None),
         }
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def list_recent_answer_runs(*, status: str | None = None, limit: int = 50) -> dict[str, Any]:
+    """Recent runs with queue/run durations, plus a summary for capacity planning.
+
+    `status` is a run status or "active" (pending and running).
+    """
+    if status == "active":
+        statuses = list(ACTIVE_STATUSES)
+    else:
+        statuses = [AnswerRunStatus(status)] if status else None
+
+    with SessionLocal() as db:
+        runs = list_answer_runs(db, statuses=statuses, limit=limit)
+        items = []
+        for run in runs:
+            items.append(
+                {
+                    **_run_to_dict(run),
+                    "queued_seconds": _seconds(run.requested_at, run.started_at),
+                    "running_seconds": _seconds(run.started_at, run.finished_at),
+                    "total_seconds": _seconds(run.requested_at, run.finished_at),
+                    "cost_usd": (run.metrics or {}).get("cost_usd"),
+                }
+            )
+
+    finished = [item for item in items if item["status"] == AnswerRunStatus.COMPLETED.value]
+    run_seconds = [item["running_seconds"] for item in finished if item["running_seconds"] is not None]
+    queue_seconds = [item["queued_seconds"] for item in items if item["started_at"] and item["queued_seconds"] is not None]
+    return {
+        "runs": items,
+        "summary": {
+            "count": len(items),
+            **{value.value: sum(1 for item in items if item["status"] == value.value) for value in AnswerRunStatus},
+            "p50_running_seconds": _percentile(run_seconds, 0.5),
+            "p95_running_seconds": _percentile(run_seconds, 0.95),
+            "p50_queued_seconds": _percentile(queue_seconds, 0.5),
+            "p95_queued_seconds": _percentile(queue_seconds, 0.95),
+        },
+    }
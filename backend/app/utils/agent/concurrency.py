@@ -0,0 +1,45 @@
+"""Bounded concurrency for the section expander.
+
+Sibling sections are independent until overlap consolidation, so
+`map_concurrent` processes them on a small thread pool (SECTION_CONCURRENCY
+per parent). Every task runs in a copy of the caller's context, which keeps the
+per-run retrieval cache visible in worker threads, and results come back in
+input order. Nested pools cannot multiply LLM load: every call goes through
+`app.utils.llm_gateway`, which enforces the process-wide LLM_CONCURRENCY cap.
+"""
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+SECTION_CONCURRENCY = max(1, int(os.getenv("SECTION_CONCURRENCY", "4")))
+
+
+def map_concurrent(fn: Callable[[T], R], items: Iterable[T], *, max_workers: int | None = None) -> list[R]:
+    """`[fn(item) for item in items]`, run on up to `max_workers` threads.
+
+    Waits for every task; if any failed, the first failure in input order is re-raised.
+    """
+    items = list(items)
+    workers = min(max_workers or SECTION_CONCURRENCY, len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="section") as executor:
+        # One context copy per task: a Context cannot be entered by two threads at once.
+        futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            failed = sum(error is not None for error in errors)
+            if failed > 1:
+                logger.warning("%s of %s concurrent tasks failed; raising the first", failed, len(items))
+            raise error
+    return [future.result() for future in futures]
@@ -0,0 +1,133 @@
+"""Token-budgeted evidence packing for LLM prompts.
+
+Chunks range from ~400 to ~1600 characters, so a fixed number of them gives
+prompts of very different sizes. `pack_context` takes evidence best-first and
+fills a token budget instead:
+- sentences already packed from a higher-ranked chunk are skipped, so
+  overlapping chunk windows and near-identical excerpts are not repeated,
+- a chunk that does not fit whole is cut at a sentence boundary (or a word
+  boundary when a single sentence exceeds the remaining budget),
+- the packed text, separators included, never exceeds the budget as counted
+  by the target model's tokenizer (`app.utils.tokens`).
+"""
+import re
+from dataclasses import dataclass
+from typing import Iterable
+
+from app.utils.tokens import count_tokens, truncate_to_tokens
+
+
+CONTEXT_SEPARATOR = "\n\n"
+# A truncated chunk shorter than this adds more noise than evidence.
+MIN_PIECE_TOKENS = 40
+# Normalized sentences shorter than this ("Table 2.", "See above.") are never treated as duplicates.
+MIN_DEDUPE_CHARS = 24
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])|\n{2,}")
+_NON_WORD = re.compile(r"\W+")
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    budget: int
+    pieces: int = 0
+    truncated: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in _SENTENCE_BREAK.split(text or "") if sentence and sentence.strip()]
+
+
+def _normalized(sentence: str) -> str:
+    return _NON_WORD.sub(" ", sentence.lower()).strip()
+
+
+def _fit_sentences(sentences: list[str], budget: int, model: str) -> tuple[str, int]:
+    """Leading sentences of `sentences` joined, within `budget` tokens."""
+    kept: list[str] = []
+    for sentence in sentences:
+        candidate = " ".join([*kept, sentence])
+        if count_tokens(candidate, model) > budget:
+            break
+        kept.append(sentence)
+    text = " ".join(kept)
+    return text, count_tokens(text, model)
+
+
+def pack_context(
+    texts: Iterable[str],
+    budget_tokens: int,
+    *,
+    model: str = "gpt-4o",
+    separator: str = CONTEXT_SEPARATOR,
+) -> PackedContext:
+    """Join `texts` (best first) into at most `budget_tokens` tokens of `model`."""
+    budget = max(0, int(budget_tokens))
+    separator_tokens = count_tokens(separator, model)
+    seen: set[str] = set()
+    parts: list[str] = []
+    used = 0
+    packed = PackedContext(text="", tokens=0, budget=budget)
+
+    for text in texts:
+        sentences = split_sentences(text)
+        fresh = []
+        for sentence in sentences:
+            key = _normalized(sentence)
+            if len(key) >= MIN_DEDUPE_CHARS and key in seen:
+                continue
+            fresh.append(sentence)
+        if not any(len(_normalized(sentence)) >= MIN_DEDUPE_CHARS for sentence in fresh) and len(fresh) < len(sentences):
+            packed.duplicates += 1
+            continue
+        if not fresh:
+            continue
+
+        remaining = budget - used - (separator_tokens if parts else 0)
+        # The best-ranked evidence is kept however small the budget.
+        min_piece = MIN_PIECE_TOKENS if parts else 1
+        if remaining < min_piece:
+            packed.skipped += 1
+            continue
+
+        piece = " ".join(fresh)
+        piece_tokens = count_tokens(piece, model)
+        if piece_tokens > remaining:
+            piece, piece_tokens = _fit_sentences(fresh, remaining, model)
+            if not piece and not parts:
+                # Nothing packed yet and the first sentence alone is too long.
+                piece = truncate_to_tokens(" ".join(fresh), remaining, model)
+                piece_tokens = count_tokens(piece, model)
+            if piece_tokens < min_piece:
+                packed.skipped += 1
+                continue
+            packed.truncated += 1
+
+        for sentence in split_sentences(piece):
+            seen.add(_normalized(sentence))
+        used += piece_tokens + (separator_tokens if parts else 0)
+        parts.append(piece)
+        packed.pieces += 1
+        if budget - used < MIN_PIECE_TOKENS:
+            break
+
+    text = separator.join(parts)
+    tokens = count_tokens(text, model)
+    # Token boundaries can shift at the joins; trim the tail until the budget holds.
+    while parts and tokens > budget:
+        last = parts.pop()
+        shorter = truncate_to_tokens(last, count_tokens(last, model) - (tokens - budget), model)
+        if shorter:
+            parts.append(shorter)
+        else:
+            packed.pieces -= 1
+        text = separator.join(parts)
+        tokens = count_tokens(text, model)
+
+    packed.text = text
+    packed.tokens = tokens
+    return packed
@@ -10,6 +10,7 @@ from app.db.models.research_node_orm import ResearchNodeORM
 from app.models.research_tree import ResearchNode, ResearchPlan
 from app.utils.agent.planning import (
     node_context_chunk_limit,
+    node_context_token_budget,
     node_retrieval_top_k,
     node_should_attempt_depth,
     node_subquestion_target,
@@ -33,6 +34,8 @@ class NodeEvidenceProfile:
 class NodeExecutionPlan:
     retrieval_top_k: int
     context_chunk_limit: int
+    context_token_budget: int
+    alignment_token_budget: int
     subquestion_target: int
     min_novel_questions_to_deepen: int
     section_length_hint: str
@@ -104,6 +107,7 @@ def build_node_execution_plan(
 ) -> NodeExecutionPlan:
     base_retrieval_top_k = node_retrieval_top_k(plan, node)
     base_context_limit = node_context_chunk_limit(plan, node)
+    base_token_budget = node_context_token_budget(plan, node)
     base_subquestion_target = node_subquestion_target(plan, node)
     base_should_attempt_depth = node_should_attempt_depth(plan, node)
 
@@ -133,9 +137,14 @@ def build_node_execution_plan(
             and evidence.unique_chunk_count >= 3
         )
 
+    # Evidence density moves the token budget with the chunk limit.
+    context_token_budget = _clamp(base_token_budget * context_limit // max(base_context_limit, 1), 750, 8000)
+
     return NodeExecutionPlan(
         retrieval_top_k=retrieval_top_k,
         context_chunk_limit=context_limit,
+        context_token_budget=context_token_budget,
+        alignment_token_budget=min(plan.alignment_context_tokens, context_token_budget),
         subquestion_target=subquestion_target,
         min_novel_questions_to_deepen=min_novel,
         section_length_hint=length_hint,
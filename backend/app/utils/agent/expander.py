@@ -4,9 +4,10 @@ import logging
 from sqlalchemy import select
 
 from app.db.db import SessionLocal
-from app.db.models.question_orm import QuestionORM
+from app.db.models.question_orm import question_text_key
 from app.db.models.research_node_orm import ResearchNodeORM
 from app.models.research_tree import Chunk, ResearchNode, ResearchScope, ResearchTree
+from app.utils.agent.concurrency import map_concurrent
 from app.utils.agent.controller import (
     build_node_evidence_profile,
     build_node_execution_plan,
@@ -14,13 +15,13 @@ from app.utils.agent.controller import (
 )
 from app.utils.agent.planning import node_retrieval_top_k
 from app.utils.agent.repo import (
-    attach_chunks_to_node,
+    attach_evidence_to_node,
     attach_questions_to_node,
+    get_question_ids,
     update_node_fields,
-    upsert_chunks,
-    upsert_questions,
 )
-from app.utils.agent.search_chunks import search_chunks
+from app.utils.agent.run_events import publish_section
+from app.utils.agent.search_chunks import search_chunks, search_chunks_many
 from app.utils.agent.subquestions import generate_subquestions_from_chunks
 from app.utils.agent.title_from_cluster import title_from_cluster as llm_title_from_cluster
 from app.utils.agent.topics import group_semantic
@@ -44,6 +45,10 @@ def _retrieve_question_chunks(
     retrieval_top_k: int,
     scope: ResearchScope | None,
     max_questions: int = 4,
+    search_mode: str = "knn",
+    fusion: str = "rrf",
+    granularity: str = "mixed",
+    mmr_lambda: float | None = None,
 ) -> list[dict]:
     selected_questions = [question for question in questions if question and question.strip()][:max_questions]
     if not selected_questions:
@@ -51,8 +56,17 @@ def _retrieve_question_chunks(
 
     per_question_k = max(2, min(8, retrieval_top_k // max(1, len(selected_questions))))
     chunk_dicts: list[dict] = []
-    for question in selected_questions:
-        results = search_chunks(question, top_k=per_question_k, return_docs=True, scope=scope)
+    batches = search_chunks_many(
+        selected_questions,
+        top_k=per_question_k,
+        return_docs=True,
+        scope=scope,
+        search_mode=search_mode,
+        fusion=fusion,
+        granularity=granularity,
+        mmr_lambda=mmr_lambda,
+    )
+    for results in batches:
         for doc in results:
             chunk_id = stable_chunk_id(
                 doc.page_content,
@@ -108,6 +122,10 @@ def enrich_node_with_chunks_and_subquestions(
         top_k=base_retrieval_top_k,
         return_docs=True,
         scope=tree.scope,
+        search_mode=tree.plan.retrieval_mode,
+        fusion=tree.plan.retrieval_fusion,
+        granularity=tree.plan.retrieval_granularity,
+        mmr_lambda=tree.plan.retrieval_mmr_lambda,
     )
     logger.info("Node '%s' retrieval returned %s docs", node.title, len(results))
 
@@ -131,12 +149,13 @@ def enrich_node_with_chunks_and_subquestions(
     execution_plan = build_node_execution_plan(node, tree.plan, evidence_profile)
     logger.info(
         "Node '%s' evidence density=%s unique_chunks=%s unique_sources=%s "
-        "context_limit=%s subquestion_target=%s should_attempt_depth=%s",
+        "context_limit=%s context_tokens=%s subquestion_target=%s should_attempt_depth=%s",
         node.title,
         execution_plan.evidence_density,
         evidence_profile.unique_chunk_count,
         evidence_profile.unique_source_count,
         execution_plan.context_chunk_limit,
+        execution_plan.context_token_budget,
         execution_plan.subquestion_target,
         execution_plan.should_attempt_depth,
     )
@@ -146,6 +165,7 @@ def enrich_node_with_chunks_and_subquestions(
         node.title,
         target_count=execution_plan.subquestion_target,
         context_chunk_limit=execution_plan.context_chunk_limit,
+        context_token_budget=execution_plan.context_token_budget,
     )
 
     follow_up_chunks = _retrieve_question_chunks(
@@ -153,6 +173,10 @@ def enrich_node_with_chunks_and_subquestions(
         retrieval_top_k=execution_plan.retrieval_top_k,
         scope=tree.scope,
         max_questions=max(1, min(len(subquestions), 4)),
+        search_mode=tree.plan.retrieval_mode,
+        fusion=tree.plan.retrieval_fusion,
+        granularity=tree.plan.retrieval_granularity,
+        mmr_lambda=tree.plan.retrieval_mmr_lambda,
     )
     if follow_up_chunks:
         logger.info(
@@ -166,22 +190,26 @@ def enrich_node_with_chunks_and_subquestions(
     execution_plan = build_node_execution_plan(node, tree.plan, evidence_profile)
     logger.info(
         "Node '%s' post-follow-up evidence density=%s unique_chunks=%s unique_sources=%s "
-        "context_limit=%s subquestion_target=%s should_attempt_depth=%s",
+        "context_limit=%s context_tokens=%s subquestion_target=%s should_attempt_depth=%s",
         node.title,
         execution_plan.evidence_density,
         evidence_profile.unique_chunk_count,
         evidence_profile.unique_source_count,
         execution_plan.context_chunk_limit,
+        execution_plan.context_token_budget,
         execution_plan.subquestion_target,
         execution_plan.should_attempt_depth,
     )
 
     db = SessionLocal()
     try:
-        upsert_chunks(db, merged_chunk_dicts)
-        attach_chunks_to_node(db, node.id, [chunk["id"] for chunk in merged_chunk_dicts])
-        question_ids = upsert_questions(db, subquestions, source="expansion")
-        attach_questions_to_node(db, node.id, question_ids)
+        attach_evidence_to_node(
+            db,
+            node.id,
+            chunks=merged_chunk_dicts,
+            questions=subquestions,
+            question_source="expansion",
+        )
         _hydrate_node_in_memory(node, merged_chunk_dicts, subquestions)
         logger.info(
             "Node '%s' attached %s chunks and generated %s expansion questions",
@@ -202,24 +230,38 @@ def deepen_node_with_subquestions(
     questions: list[str],
     top_k=5,
     scope: ResearchScope | None = None,
+    search_mode: str = "knn",
+    fusion: str = "rrf",
+    granularity: str = "mixed",
+    mmr_lambda: float | None = None,
 ):
+    batches = search_chunks_many(
+        questions,
+        top_k=top_k,
+        return_docs=True,
+        scope=scope,
+        search_mode=search_mode,
+        fusion=fusion,
+        granularity=granularity,
+        mmr_lambda=mmr_lambda,
+    )
+    chunk_dicts = []
+    for results in batches:
+        for doc in results:
+            chunk_id = stable_chunk_id(doc.page_content, doc.metadata.get("id"))
+            chunk_dicts.append(
+                {
+                    "id": chunk_id,
+                    "text": doc.page_content,
+                    "page": doc.metadata.get("page"),
+                    "source": doc.metadata.get("source"),
+                }
+            )
+    chunk_dicts = _dedupe_chunk_dicts(chunk_dicts)
+
     db = SessionLocal()
     try:
-        for question in questions:
-            results = search_chunks(question, top_k=top_k, return_docs=True, scope=scope)
-            chunk_dicts = []
-            for doc in results:
-                chunk_id = stable_chunk_id(doc.page_content, doc.metadata.get("id"))
-                chunk_dicts.append(
-                    {
-                        "id": chunk_id,
-                        "text": doc.page_content,
-                        "page": doc.metadata.get("page"),
-                        "source": doc.metadata.get("source"),
-                    }
-                )
-            upsert_chunks(db, chunk_dicts)
-            attach_chunks_to_node(db, node.id, [chunk["id"] for chunk in chunk_dicts])
+        attach_evidence_to_node(db, node.id, chunks=chunk_dicts)
         db.commit()
     finally:
         db.close()
@@ -242,6 +284,7 @@ def process_node_recursively(node: ResearchNode, tree: ResearchTree, top_k: int
         node,
         root_query=tree.query,
         context_chunk_limit=execution_plan.context_chunk_limit,
+        context_token_budget=execution_plan.alignment_token_budget,
     )
     logger.info(
         "Node '%s' alignment check aligned=%s reason=%s",
@@ -268,6 +311,7 @@ def process_node_recursively(node: ResearchNode, tree: ResearchTree, top_k: int
         finally:
             db.close()
         logger.info("Skipping off-topic node '%s' after alignment gate", node.title)
+        publish_section(node)
         return
 
     did_deepen = False
@@ -306,6 +350,10 @@ def process_node_recursively(node: ResearchNode, tree: ResearchTree, top_k: int
                     refinement.novel_questions,
                     top_k=execution_plan.retrieval_top_k,
                     scope=tree.scope,
+                    search_mode=tree.plan.retrieval_mode,
+                    fusion=tree.plan.retrieval_fusion,
+                    granularity=tree.plan.retrieval_granularity,
+                    mmr_lambda=tree.plan.retrieval_mmr_lambda,
                 )
                 did_deepen = True
                 logger.info(
@@ -333,6 +381,8 @@ def process_node_recursively(node: ResearchNode, tree: ResearchTree, top_k: int
         output_style=tree.plan.output_style,
         context_chunk_limit=execution_plan.context_chunk_limit,
         length_hint=execution_plan.section_length_hint,
+        context_token_budget=execution_plan.context_token_budget,
+        mmr_lambda=tree.plan.retrieval_mmr_lambda,
     )
 
     db = SessionLocal()
@@ -352,9 +402,10 @@ def process_node_recursively(node: ResearchNode, tree: ResearchTree, top_k: int
         )
     finally:
         db.close()
+    publish_section(node)
 
-    for subnode in node.subnodes:
-        process_node_recursively(subnode, tree)
+    # Siblings only share the tree through overlap consolidation, which runs after all of them.
+    map_concurrent(lambda subnode: process_node_recursively(subnode, tree), list(node.subnodes))
     logger.info("Finished node '%s'", node.title)
 
 
@@ -394,8 +445,7 @@ def create_subnodes_from_clusters(
             return created_nodes
         session_id = parent_orm.session_id
 
-        q_rows = local_db.execute(select(QuestionORM.id, QuestionORM.text)).all()
-        q_to_id = {text.lower(): qid for (qid, text) in q_rows}
+        q_to_id = get_question_ids(local_db, [question for cluster in clusters_q for question in cluster])
 
         existing_titles = {child.title.strip().lower() for child in node.subnodes}
         current_children_count = len(node.subnodes)
@@ -424,7 +474,7 @@ def create_subnodes_from_clusters(
             local_db.add(child_orm)
             local_db.flush()
 
-            question_ids = [q_to_id.get(question.strip().lower()) for question in cluster]
+            question_ids = [q_to_id.get(question_text_key(question)) for question in cluster]
             question_ids = [question_id for question_id in question_ids if question_id]
             attach_questions_to_node(local_db, child_orm.id, question_ids)
             child_node = ResearchNode(
@@ -1,9 +1,9 @@
 from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 
 from app.models.outline_model import Outline
 from app.models.research_tree import ResearchTree
+from app.utils.llm_gateway import complete
 
 
 def _outline_style_guidance(output_style: str | None) -> str:
@@ -15,8 +15,7 @@ def _outline_style_guidance(output_style: str | None) -> str:
     return "Use a formal scientific structure with precise, neutral section titles."
 
 
-def generate_outline_from_tree(tree: ResearchTree) -> Outline:
-    llm = ChatOpenAI(model="gpt-4o", temperature=0)
+def generate_outline_from_tree(tree: ResearchTree, corpus_topics: list[str] | None = None) -> Outline:
     parser = PydanticOutputParser(pydantic_object=Outline)
 
     all_chunk_texts = [c.text for n in tree.all_nodes() for c in n.chunks]
@@ -56,6 +55,8 @@ def generate_outline_from_tree(tree: ResearchTree) -> Outline:
             Treat idiomatic, literary, dialectal, archaic, or figurative expressions carefully.
             Do not build sections around an unverified literal interpretation.
             If the meaning of a phrase is ambiguous, preserve that ambiguity in the outline instead of resolving it prematurely.
+            Corpus topics, when listed, are clusters of the whole document collection closest to the question.
+            Use the relevant ones to shape and order sections; ignore topics unrelated to the question.
             Style requirement: {style_guidance}
 
             MAIN QUESTION:
@@ -67,6 +68,9 @@ def generate_outline_from_tree(tree: ResearchTree) -> Outline:
             SUBQUESTIONS:
             {subquestions}
 
+            CORPUS TOPICS:
+            {corpus_topics}
+
             CONTEXT:
             {all_chunks}
 
@@ -76,6 +80,7 @@ def generate_outline_from_tree(tree: ResearchTree) -> Outline:
             "query",
             "evidence_profile",
             "subquestions",
+            "corpus_topics",
             "all_chunks",
             "target_sections",
             "min_sections",
@@ -86,17 +91,20 @@ def generate_outline_from_tree(tree: ResearchTree) -> Outline:
         partial_variables={"format_instructions": parser.get_format_instructions()},
     )
 
-    chain = prompt | llm | parser
-    return chain.invoke(
-        {
-            "query": tree.query,
-            "evidence_profile": tree.plan.evidence_profile,
-            "subquestions": subquestions,
-            "all_chunks": all_chunk_texts,
-            "target_sections": target_sections,
-            "min_sections": min_sections,
-            "max_sections": max_sections,
-            "max_subsections": tree.plan.outline_max_subsections,
-            "style_guidance": _outline_style_guidance(tree.plan.output_style),
-        }
+    return complete(
+        prompt.format(
+            query=tree.query,
+            evidence_profile=tree.plan.evidence_profile,
+            subquestions=subquestions,
+            corpus_topics=corpus_topics or "None",
+            all_chunks=all_chunk_texts,
+            target_sections=target_sections,
+            min_sections=min_sections,
+            max_sections=max_sections,
+            max_subsections=tree.plan.outline_max_subsections,
+            style_guidance=_outline_style_guidance(tree.plan.output_style),
+        ),
+        model="gpt-4o",
+        parser=parser,
+        name="outline",
     )
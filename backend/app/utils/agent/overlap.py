@@ -8,16 +8,19 @@ from itertools import combinations
 from textwrap import dedent
 from typing import Iterable
 
-from langchain_openai import ChatOpenAI
 from sqlalchemy.orm import Session
 
 from app.db.models.research_node_orm import ResearchNodeORM
 from app.models.research_tree import ResearchNode, ResearchTree
+from app.utils.agent.context_packing import pack_context
+from app.utils.llm_gateway import complete
 
 
 logger = logging.getLogger(__name__)
 
-_OVERLAP_LLM = ChatOpenAI(model="gpt-4o-mini", temperature=0, timeout=90)
+OVERLAP_MODEL = "gpt-4o-mini"
+OVERLAP_TIMEOUT_SECONDS = 90
+OVERLAP_CONTEXT_TOKENS = 2500
 _TOKEN_RE = re.compile(r"\w+")
 _STOPWORDS = {
     "the", "a", "an", "and", "or", "of", "to", "for", "in", "on", "at", "is", "are", "was", "were", "be",
@@ -117,11 +120,16 @@ def _rewrite_secondary_to_reduce_overlap(
     length_hint: str,
     primary: ResearchNode,
     secondary: ResearchNode,
+    context_token_budget: int = OVERLAP_CONTEXT_TOKENS,
 ) -> str:
     style_key = _normalize_output_style(output_style)
     style_guidance = _STYLE_GUIDANCE.get(style_key, _STYLE_GUIDANCE["scientific_article"])
     secondary_questions = "\n".join(f"- {question}" for question in (secondary.questions or [])) or "- (none)"
-    secondary_context = "\n\n".join(chunk.text for chunk in (secondary.chunks or [])[:10])
+    secondary_context = pack_context(
+        [chunk.text for chunk in secondary.chunks or []],
+        context_token_budget,
+        model=OVERLAP_MODEL,
+    ).text
 
     prompt = dedent(
         f"""
@@ -154,8 +162,7 @@ def _rewrite_secondary_to_reduce_overlap(
         """
     ).strip()
 
-    rewritten = _OVERLAP_LLM.invoke(prompt).content.strip()
-    return rewritten
+    return complete(prompt, model=OVERLAP_MODEL, timeout=OVERLAP_TIMEOUT_SECONDS, name="overlap rewrite")
 
 
 def _prune_node_content(node: ResearchNode) -> None:
@@ -178,6 +185,7 @@ def _resolve_parent_sibling_overlap(
     root_query: str,
     output_style: str,
     length_hint: str,
+    context_token_budget: int = OVERLAP_CONTEXT_TOKENS,
 ) -> tuple[list[OverlapDecision], set[str]]:
     decisions: list[OverlapDecision] = []
     changed_node_ids: set[str] = set()
@@ -222,6 +230,7 @@ def _resolve_parent_sibling_overlap(
             length_hint=length_hint,
             primary=primary,
             secondary=secondary,
+            context_token_budget=context_token_budget,
         )
         if rewritten == "__PRUNE__" or not rewritten.strip():
             _prune_node_content(secondary)
@@ -284,6 +293,7 @@ def reduce_tree_overlap(
     root_query: str,
     output_style: str,
     length_hint: str,
+    context_token_budget: int = OVERLAP_CONTEXT_TOKENS,
 ) -> tuple[list[OverlapDecision], list[ResearchNode]]:
     decisions: list[OverlapDecision] = []
     changed_node_ids: set[str] = set()
@@ -295,6 +305,7 @@ def reduce_tree_overlap(
             root_query=root_query,
             output_style=output_style,
             length_hint=length_hint,
+            context_token_budget=context_token_budget,
         )
         decisions.extend(local_decisions)
         changed_node_ids.update(local_changed_ids)
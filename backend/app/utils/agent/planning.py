@@ -51,10 +51,23 @@ _OUTPUT_STYLE_MAP = {
 }
 
 
+# Average tokens of one retrieved chunk (400-1600 characters); turns chunk budgets into token budgets.
+CONTEXT_TOKENS_PER_CHUNK = 250
+
+
 def _clamp(value: int, lower: int, upper: int) -> int:
     return max(lower, min(value, upper))
 
 
+def _context_token_budgets(root_context_chunks: int, section_context_chunks: int) -> dict[str, int]:
+    section_context_tokens = _clamp(section_context_chunks * CONTEXT_TOKENS_PER_CHUNK, 1000, 6000)
+    return {
+        "root_context_tokens": _clamp(root_context_chunks * CONTEXT_TOKENS_PER_CHUNK, 1250, 5000),
+        "section_context_tokens": section_context_tokens,
+        "alignment_context_tokens": _clamp(section_context_tokens // 2, 750, 2000),
+    }
+
+
 def normalize_output_style(value: str | None) -> str:
     if not value:
         return "scientific_article"
@@ -95,6 +108,10 @@ def build_research_plan(
     *,
     requested_top_k: int = 5,
     output_style: str | None = None,
+    retrieval_mode: str = "knn",
+    retrieval_fusion: str = "rrf",
+    retrieval_granularity: str = "mixed",
+    retrieval_mmr_lambda: float | None = None,
 ) -> ResearchPlan:
     complexity = estimate_query_complexity(query, scope)
     document_count = max(scope.document_count, len(scope.filenames), 1)
@@ -142,6 +159,7 @@ def build_research_plan(
         outline_max_subsections=outline_max_subsections,
         section_top_k=section_top_k,
         section_context_chunks=section_context_chunks,
+        **_context_token_budgets(root_context_chunks, section_context_chunks),
         section_subquestion_target=section_subquestion_target,
         summary_context_sections=summary_context_sections,
         desired_depth=desired_depth,
@@ -149,6 +167,10 @@ def build_research_plan(
         section_length_hint=section_length_hint,
         evidence_profile=evidence_profile,
         output_style=normalized_output_style,
+        retrieval_mode=retrieval_mode,
+        retrieval_fusion=retrieval_fusion,
+        retrieval_granularity=retrieval_granularity,
+        retrieval_mmr_lambda=retrieval_mmr_lambda,
     )
 
 
@@ -248,6 +270,12 @@ def refine_research_plan_from_initial_chunks(plan: ResearchPlan, chunk_dicts: li
         updates["min_novel_questions_to_deepen"] = 1 if effective_evidence >= 6 else plan.min_novel_questions_to_deepen
         updates["evidence_profile"] = "moderate" if unique_page_count >= 3 else plan.evidence_profile
 
+    updates.update(
+        _context_token_budgets(
+            int(updates["root_context_chunks"]),
+            int(updates.get("section_context_chunks", plan.section_context_chunks)),
+        )
+    )
     return plan.model_copy(update=updates)
 
 
@@ -263,6 +291,12 @@ def node_context_chunk_limit(plan: ResearchPlan, node: ResearchNode) -> int:
     return _clamp(plan.section_context_chunks + question_bonus - depth_penalty, 4, 24)
 
 
+def node_context_token_budget(plan: ResearchPlan, node: ResearchNode) -> int:
+    """`plan.section_context_tokens` scaled like the node's chunk limit."""
+    scale = node_context_chunk_limit(plan, node) / max(plan.section_context_chunks, 1)
+    return _clamp(int(plan.section_context_tokens * scale), 750, 8000)
+
+
 def node_subquestion_target(plan: ResearchPlan, node: ResearchNode) -> int:
     depth_penalty = max((node.level or 1) - 2, 0)
     question_bonus = 1 if len(node.questions or []) >= 3 else 0
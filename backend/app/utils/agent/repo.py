@@ -1,57 +1,41 @@
 # app/utils/agent/repo.py
 from typing import List, Iterable
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from sqlalchemy.dialects.postgresql import insert as pg_insert  # <-- add this
-from uuid import UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from uuid import UUID, uuid4
 
 from app.db.models.research_node_orm import ResearchNodeORM
 from app.db.models.chunk_orm import ChunkORM
-from app.db.models.question_orm import QuestionORM, QuestionStatus
+from app.db.models.question_orm import QuestionORM, QuestionStatus, question_text_key
 from app.db.models.node_chunk_orm import NodeChunkORM
 from app.db.models.node_question_orm import NodeQuestionORM
 
 def upsert_chunks(db: Session, chunks: Iterable[dict]) -> None:
     """
     chunks: iterable of dicts with keys: id (str), text, page?, source?
-    De-dupes within this batch and inserts only missing ones.
+    De-dupes within this batch; one INSERT ... ON CONFLICT DO NOTHING skips existing ones.
     """
-    # 1) De-dupe within-batch by id (first occurrence wins)
+    # De-dupe within-batch by id (first occurrence wins)
     by_id = {}
     for c in chunks:
         cid = c["id"]
         if cid not in by_id:
             by_id[cid] = c
-    ids = list(by_id.keys())
-
-    # 2) Filter out ones that already exist in DB
-    existing_ids = {
-        cid for (cid,) in db.query(ChunkORM.id).filter(ChunkORM.id.in_(ids)).all()
-    }
-    to_insert = [by_id[cid] for cid in ids if cid not in existing_ids]
-
-    # 3) Bulk insert with ON CONFLICT DO NOTHING (protects again duplicates)
-    if to_insert:
-        stmt = pg_insert(ChunkORM.__table__).values(to_insert)
-        stmt = stmt.on_conflict_do_nothing(index_elements=["id"])
-        db.execute(stmt)
-
-    db.flush()
+    if not by_id:
+        return
+    # Sorted so concurrent sections inserting overlapping chunks take row locks in the same order.
+    rows = [by_id[cid] for cid in sorted(by_id)]
+    stmt = pg_insert(ChunkORM.__table__).values(rows)
+    stmt = stmt.on_conflict_do_nothing(index_elements=["id"])
+    db.execute(stmt)
 
 def attach_chunks_to_node(db: Session, node_id: UUID, chunk_ids: List[str]) -> None:
     if not chunk_ids:
         return
-    chunk_ids = list(set(chunk_ids))  # de-dupe input list
-    existing = {
-        (nid, cid)
-        for (nid, cid) in db.query(NodeChunkORM.node_id, NodeChunkORM.chunk_id)
-            .filter(NodeChunkORM.node_id == node_id,
-                    NodeChunkORM.chunk_id.in_(chunk_ids)).all()
-    }
-    for cid in chunk_ids:
-        if (node_id, cid) not in existing:
-            db.add(NodeChunkORM(node_id=node_id, chunk_id=cid))
-    db.flush()
+    db.flush()  # nodes added through the ORM must exist before their links
+    rows = [{"node_id": node_id, "chunk_id": cid} for cid in sorted(set(chunk_ids))]
+    stmt = pg_insert(NodeChunkORM.__table__).values(rows)
+    db.execute(stmt.on_conflict_do_nothing(index_elements=["node_id", "chunk_id"]))
 
 
 def get_node_chunks(db: Session, node_id: UUID) -> List[ChunkORM]:
@@ -63,41 +47,73 @@ def get_node_chunks(db: Session, node_id: UUID) -> List[ChunkORM]:
 # ---- Questions ----
 def upsert_questions(db: Session, texts: List[str], source: str) -> List[UUID]:
     """
-    Dedup by normalized text. Returns list of question IDs.
+    Dedup by normalized text (questions.text_key). Returns the question ID of every
+    non-blank text, in input order; one INSERT ... ON CONFLICT ... RETURNING statement.
     """
-    norm = [t.strip().lower() for t in texts]
-    existing = db.query(QuestionORM).filter(func.lower(QuestionORM.text).in_(norm)).all()
-    existing_map = {q.text.lower(): q for q in existing}
-
-    ids = []
-    for t in texts:
-        key = t.strip().lower()
-        if key in existing_map:
-            q = existing_map[key]
-            ids.append(q.id)
-        else:
-            q = QuestionORM(text=t.strip(), source=source, status=QuestionStatus.PROPOSED)
-            db.add(q)
-            db.flush()
-            ids.append(q.id)
-    return ids
+    keys = [question_text_key(t) for t in texts]
+    rows = {}
+    for t, key in zip(texts, keys):
+        if key and key not in rows:
+            rows[key] = {
+                "id": uuid4(),
+                "text": t.strip(),
+                "text_key": key,
+                "source": source,
+                "status": QuestionStatus.PROPOSED,
+            }
+    if not rows:
+        return []
+
+    table = QuestionORM.__table__
+    # Sorted so concurrent sections upserting overlapping questions lock rows in the same order.
+    stmt = pg_insert(table).values([rows[key] for key in sorted(rows)])
+    # A no-op update instead of DO NOTHING, so RETURNING also yields the ids of existing questions.
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.text_key],
+        set_={"text_key": stmt.excluded.text_key},
+    ).returning(table.c.id, table.c.text_key)
+    id_by_key = {key: qid for qid, key in db.execute(stmt).all()}
+    return [id_by_key[key] for key in keys if key]
+
+def get_question_ids(db: Session, texts: List[str]) -> dict:
+    """Normalized text -> question ID for those of `texts` that exist."""
+    keys = {question_text_key(t) for t in texts} - {""}
+    if not keys:
+        return {}
+    rows = db.query(QuestionORM.text_key, QuestionORM.id).filter(QuestionORM.text_key.in_(keys)).all()
+    return {key: qid for key, qid in rows}
 
 def attach_questions_to_node(db: Session, node_id: UUID, question_ids: List[UUID]) -> None:
     if not question_ids:
         return
-    existing = {
-        (nid, qid) for (nid, qid) in db.query(NodeQuestionORM.node_id, NodeQuestionORM.question_id)
-                                       .filter(NodeQuestionORM.node_id == node_id,
-                                               NodeQuestionORM.question_id.in_(question_ids)).all()
-    }
-    for qid in question_ids:
-        if (node_id, qid) not in existing:
-            db.add(NodeQuestionORM(node_id=node_id, question_id=qid))
+    db.flush()  # nodes added through the ORM must exist before their links
+    question_ids = sorted(set(question_ids))
+    rows = [{"node_id": node_id, "question_id": qid} for qid in question_ids]
+    stmt = pg_insert(NodeQuestionORM.__table__).values(rows)
+    db.execute(stmt.on_conflict_do_nothing(index_elements=["node_id", "question_id"]))
     # status bump to ASSIGNED
     db.query(QuestionORM).filter(QuestionORM.id.in_(question_ids),
                                  QuestionORM.status == QuestionStatus.PROPOSED)\
                          .update({QuestionORM.status: QuestionStatus.ASSIGNED}, synchronize_session=False)
-    db.flush()
+
+def attach_evidence_to_node(
+    db: Session,
+    node_id: UUID,
+    *,
+    chunks: Iterable[dict] = (),
+    questions: List[str] = (),
+    question_source: str = "expansion",
+) -> List[UUID]:
+    """
+    Node-level batch: upsert and attach chunks and questions in at most five
+    statements, however many chunks and questions there are. Returns the question IDs.
+    """
+    chunks = list(chunks)
+    upsert_chunks(db, chunks)
+    attach_chunks_to_node(db, node_id, [c["id"] for c in chunks])
+    question_ids = upsert_questions(db, list(questions), source=question_source)
+    attach_questions_to_node(db, node_id, question_ids)
+    return question_ids
 
 def get_node_questions(db: Session, node_id: UUID) -> List[QuestionORM]:
     q = (db.query(QuestionORM)
@@ -0,0 +1,102 @@
+"""Retrieval memoization for a single answer run.
+
+The stages of a run (root retrieval, node enrichment, follow-up questions,
+deepening) often search the same or near-identical strings with different
+`top_k`. While a run is active (`run_retrieval_cache()`), `search_chunks` and
+`search_chunks_many` keep the largest-k result per (normalized query, scope,
+retrieval options) and serve smaller-k requests by slicing it. An entry whose
+search returned fewer raw hits than it fetched holds every match, so it also
+answers larger k. With MMR or small-to-big the sliced list comes from a larger
+candidate pool, so it can differ slightly from a fresh search at that k. Sections processed concurrently
+share the run's cache, so its bookkeeping is guarded by a lock.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from app.models.research_tree import ResearchScope
+from app.utils.query_cache import normalize_query
+
+
+@dataclass
+class RetrievalCache:
+    # key -> (k searched, every match returned, text hits, caption hits)
+    entries: dict[tuple, tuple[int, bool, list, list]] = field(default_factory=dict)
+    # Queries the pipeline asked for (what would have been searched without the cache).
+    requested: int = 0
+    # Queries actually searched, including warm-up.
+    executed: int = 0
+    warmed: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @staticmethod
+    def key(query: str, scope: ResearchScope | None, **options) -> tuple:
+        filters = scope.search_filters() if scope else None
+        scope_key = (
+            tuple(sorted((filters or {}).items())),
+            scope.routing_top_n() if scope else None,
+        )
+        return (normalize_query(query), scope_key, tuple(sorted(options.items())))
+
+    def lookup(self, key: tuple, top_k: int) -> list | None:
+        with self._lock:
+            self.requested += 1
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        cached_k, exhausted, text_docs, caption_docs = entry
+        if cached_k >= top_k or exhausted:
+            return text_docs[:top_k] + caption_docs[:top_k]
+        return None
+
+    def covers(self, key: tuple, top_k: int) -> bool:
+        """Whether `lookup(key, top_k)` would be served without searching (not counted as a request)."""
+        with self._lock:
+            entry = self.entries.get(key)
+        return entry is not None and (entry[0] >= top_k or entry[1])
+
+    def store(
+        self,
+        key: tuple,
+        top_k: int,
+        text_docs: list,
+        caption_docs: list = (),
+        *,
+        exhausted: bool = False,
+        warm: bool = False,
+    ) -> None:
+        """Keep the result of a search at `top_k`; `exhausted` means it returned fewer raw hits than it fetched."""
+        with self._lock:
+            self.executed += 1
+            if warm:
+                self.warmed += 1
+            cached = self.entries.get(key)
+            if cached is None or top_k >= cached[0] or exhausted:
+                self.entries[key] = (top_k, exhausted, list(text_docs), list(caption_docs))
+
+    def stats(self) -> dict:
+        return {
+            "searches_requested": self.requested,
+            "searches_executed": self.executed,
+            "served_from_cache": self.requested - (self.executed - self.warmed),
+            "warmed": self.warmed,
+        }
+
+
+_active: ContextVar[RetrievalCache | None] = ContextVar("retrieval_cache", default=None)
+
+
+def active_retrieval_cache() -> RetrievalCache | None:
+    return _active.get()
+
+
+@contextmanager
+def run_retrieval_cache():
+    """Memoize retrieval for the duration of the `with` block (one answer run)."""
+    cache = RetrievalCache()
+    token = _active.set(cache)
+    try:
+        yield cache
+    finally:
+        _active.reset(token)
@@ -0,0 +1,289 @@
+"""Live answer-run events, served by `GET /agent/answer_runs/{session_id}/events`.
+
+Events are dicts with a "type" and the "session_id":
+- "run": status or stage of the answer run changed (published by `update_answer_run`),
+- "section": a section was written, or dropped by the alignment gate (content None),
+- "token": a slice of section text while `write_section` generates it; "offset"
+  is where "text" starts in the section, so a restarted generation overwrites
+  instead of appending.
+
+`publish` hands events to the subscribers of this process and also sends them
+with Postgres NOTIFY on RUN_EVENTS_CHANNEL, since answer runs execute in the
+answer worker. Each API process LISTENs on the channel (one thread, started by
+the first subscriber) and fans the events out to its own subscribers.
+NOTIFY payloads are limited to 8000 bytes: a section event whose content does
+not fit is sent without it and the listener reads the content back from
+research_nodes.
+
+Events are best effort; a subscriber that falls behind loses events, and
+clients fetch the answer run itself once it has finished.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+from uuid import uuid4
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import text
+
+from app.db.db import DATABASE_URL, SessionLocal, engine
+from app.db.models.research_node_orm import ResearchNodeORM
+
+
+logger = logging.getLogger(__name__)
+
+RUN_EVENTS_CHANNEL = "answer_run_events"
+RUN_EVENTS_NOTIFY = os.getenv("RUN_EVENTS_NOTIFY", "true").lower() not in {"0", "false", "no"}
+# Postgres rejects NOTIFY payloads of 8000 bytes and more.
+NOTIFY_MAX_BYTES = 7900
+TOKEN_FLUSH_SECONDS = float(os.getenv("RUN_EVENTS_TOKEN_FLUSH_SECONDS", "0.25"))
+TOKEN_FLUSH_CHARS = 2000
+SUBSCRIBER_QUEUE_SIZE = 1000
+LISTEN_POLL_SECONDS = 5.0
+LISTEN_READY_SECONDS = 5.0
+
+# Tags our NOTIFY payloads, so the listener skips events this process already delivered.
+_ORIGIN = uuid4().hex
+
+
+@dataclass(eq=False)
+class _Subscriber:
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+
+
+@dataclass(frozen=True)
+class _RunStream:
+    session_id: str
+    stream_tokens: bool
+
+
+_subscribers: dict[str, set[_Subscriber]] = {}
+_lock = threading.Lock()
+_listener: threading.Thread | None = None
+# Set while the listener's LISTEN is active; events sent before that never reach this process.
+_listening = threading.Event()
+_current: ContextVar[_RunStream | None] = ContextVar("run_events_stream", default=None)
+
+
+@contextmanager
+def run_event_stream(session_id: str, *, stream_tokens: bool = False) -> Iterator[None]:
+    """Attribute events published by the pipeline (sections, tokens) to `session_id`."""
+    reset = _current.set(_RunStream(str(session_id), stream_tokens))
+    try:
+        yield
+    finally:
+        _current.reset(reset)
+
+
+def current_session_id() -> str | None:
+    run = _current.get()
+    return run.session_id if run else None
+
+
+def _put(queue: asyncio.Queue, event: dict[str, Any]) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.debug("Dropping %s event for a slow subscriber", event.get("type"))
+
+
+def _deliver(event: dict[str, Any]) -> None:
+    with _lock:
+        subscribers = list(_subscribers.get(event["session_id"], ()))
+    for subscriber in subscribers:
+        try:
+            subscriber.loop.call_soon_threadsafe(_put, subscriber.queue, event)
+        except RuntimeError:
+            # The subscriber's event loop is gone; its subscription ends with it.
+            pass
+
+
+def _notify_payload(event: dict[str, Any]) -> str | None:
+    payload = json.dumps({**event, "origin": _ORIGIN}, default=str)
+    if len(payload.encode("utf-8")) < NOTIFY_MAX_BYTES:
+        return payload
+    if event.get("content"):
+        payload = json.dumps({**event, "content": None, "content_ref": True, "origin": _ORIGIN}, default=str)
+        if len(payload.encode("utf-8")) < NOTIFY_MAX_BYTES:
+            return payload
+    logger.warning("%s event for %s is too large for NOTIFY; not sent", event["type"], event["session_id"])
+    return None
+
+
+def _notify(event: dict[str, Any]) -> None:
+    payload = _notify_payload(event)
+    if payload is None:
+        return
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": RUN_EVENTS_CHANNEL, "payload": payload})
+
+
+def publish(session_id: str, event_type: str, **data: Any) -> None:
+    """Send an event to the subscribers of `session_id` in every process; never raises."""
+    event = {"type": event_type, "session_id": str(session_id), **data}
+    _deliver(event)
+    if not RUN_EVENTS_NOTIFY:
+        return
+    try:
+        _notify(event)
+    except Exception:
+        logger.warning("Could not NOTIFY %s event for %s", event_type, session_id, exc_info=True)
+
+
+def publish_section(node) -> None:
+    """Announce a written (or dropped) section of the current run."""
+    session_id = current_session_id()
+    if session_id is None:
+        return
+    publish(
+        session_id,
+        "section",
+        node_id=str(node.id),
+        title=node.title,
+        display_rank=node.display_rank,
+        level=node.level,
+        content=node.content,
+    )
+
+
+class SectionTokenStream:
+    """Publishes a section's text as it is generated, in TOKEN_FLUSH_SECONDS slices."""
+
+    def __init__(self, session_id: str, node_id: str):
+        self.session_id = session_id
+        self.node_id = node_id
+        self._start = 0
+        self._buffer = ""
+        self._flushed_at = time.monotonic()
+
+    def __call__(self, delta: str, offset: int) -> None:
+        if offset != self._start + len(self._buffer):
+            # The generation restarted (retry); continue from where it now is.
+            self._start, self._buffer = offset, ""
+        self._buffer += delta
+        if len(self._buffer) >= TOKEN_FLUSH_CHARS or time.monotonic() - self._flushed_at >= TOKEN_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        while self._buffer:
+            piece, self._buffer = self._buffer[:TOKEN_FLUSH_CHARS], self._buffer[TOKEN_FLUSH_CHARS:]
+            publish(self.session_id, "token", node_id=self.node_id, offset=self._start, text=piece)
+            self._start += len(piece)
+        self._flushed_at = time.monotonic()
+
+
+def section_token_stream(node) -> SectionTokenStream | None:
+    """Token publisher for `node` when the current run streams tokens, else None."""
+    run = _current.get()
+    if run is None or not run.stream_tokens:
+        return None
+    return SectionTokenStream(run.session_id, str(node.id))
+
+
+def _node_content(node_id: str | None) -> str | None:
+    if not node_id:
+        return None
+    with SessionLocal() as db:
+        node = db.query(ResearchNodeORM).filter(ResearchNodeORM.id == node_id).first()
+        return node.content if node else None
+
+
+def _has_subscribers(session_id: str) -> bool:
+    with _lock:
+        return bool(_subscribers.get(session_id))
+
+
+def _receive(payload: str) -> None:
+    event = json.loads(payload)
+    if event.pop("origin", None) == _ORIGIN or not _has_subscribers(event.get("session_id")):
+        return
+    if event.pop("content_ref", False):
+        event["content"] = _node_content(event.get("node_id"))
+    _deliver(event)
+
+
+def _listen() -> None:
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {RUN_EVENTS_CHANNEL}")
+        _listening.set()
+        logger.info("Listening for answer-run events on %s", RUN_EVENTS_CHANNEL)
+        while True:
+            if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    _receive(notify.payload)
+                except Exception:
+                    logger.exception("Malformed answer-run event on %s", RUN_EVENTS_CHANNEL)
+    finally:
+        _listening.clear()
+        conn.close()
+
+
+def _listen_forever() -> None:
+    delay = 1.0
+    while True:
+        started = time.monotonic()
+        try:
+            _listen()
+        except Exception:
+            logger.warning("Answer-run event listener failed; reconnecting in %.0fs", delay, exc_info=True)
+        if time.monotonic() - started > 60:
+            delay = 1.0
+        time.sleep(delay)
+        delay = min(delay * 2, 30.0)
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if not RUN_EVENTS_NOTIFY:
+        return
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen_forever, name="run-events-listener", daemon=True)
+            _listener.start()
+
+
+def wait_for_listener(timeout: float = LISTEN_READY_SECONDS) -> bool:
+    """Block until the cross-process listener is LISTENing (or `timeout` passed); True when it is.
+
+    Subscribers read their snapshot after this, so no event falls between the two.
+    """
+    if not RUN_EVENTS_NOTIFY:
+        return True
+    return _listening.wait(timeout)
+
+
+@contextmanager
+def subscription(session_id: str) -> Iterator[asyncio.Queue]:
+    """Queue of the events of `session_id`; enter from the event loop that consumes it."""
+    subscriber = _Subscriber(asyncio.get_running_loop())
+    with _lock:
+        _subscribers.setdefault(str(session_id), set()).add(subscriber)
+    _ensure_listener()
+    try:
+        yield subscriber.queue
+    finally:
+        with _lock:
+            subscribers = _subscribers.get(str(session_id))
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    _subscribers.pop(str(session_id), None)
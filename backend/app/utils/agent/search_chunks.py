@@ -1,20 +1,232 @@
 from typing import List
-from app.utils.vectorstore import get_vectorstore
+from app.utils.agent.retrieval_cache import active_retrieval_cache
+from app.utils.document_routing import route_documents, routed_filters
+from app.utils.mmr import MMR_FETCH_FACTOR, mmr_rerank
+from app.utils.vectorstore import (
+    CAPTION_INDEX,
+    FINE_CHUNK_SIZE,
+    GRANULARITIES,
+    SMALL_TO_BIG_CANDIDATE_FACTOR,
+    collapse_to_parents,
+    get_vectorstore,
+)
 from app.models.research_tree import ResearchScope
 
+
+def _search_filters(scope: ResearchScope | None, granularity: str) -> dict | None:
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}; expected one of {', '.join(GRANULARITIES)}")
+    filters = scope.search_filters() if scope else None
+    if granularity == "small_to_big":
+        filters = {**(filters or {}), "chunk_size": FINE_CHUNK_SIZE}
+    return filters
+
+
+def _pool_k(top_k: int, mmr_lambda: float | None) -> int:
+    """Hits kept after collapsing; MMR then picks `top_k` of them."""
+    return top_k * MMR_FETCH_FACTOR if mmr_lambda is not None else top_k
+
+
+def _candidate_k(top_k: int, granularity: str, mmr_lambda: float | None) -> int:
+    pool_k = _pool_k(top_k, mmr_lambda)
+    return pool_k * SMALL_TO_BIG_CANDIDATE_FACTOR if granularity == "small_to_big" else pool_k
+
+
 def search_chunks(
     query: str,
     top_k: int = 100,
     return_docs: bool = False,
     scope: ResearchScope | None = None,
+    search_mode: str = "knn",
+    fusion: str = "rrf",
+    granularity: str = "mixed",
+    mmr_lambda: float | None = None,
 ) -> List[str]:
+    """Search chunks for `query`; `mmr_lambda` (0..1) diversifies the `top_k` hits with MMR.
+
+    In "all" scope with `scope.route_documents` set, the best-matching documents
+    are picked first and only their chunks are searched. Inside an answer run
+    results are memoized (see `app.utils.agent.retrieval_cache`).
+    """
+    options = {"search_mode": search_mode, "fusion": fusion, "granularity": granularity, "mmr_lambda": mmr_lambda}
+    cache = active_retrieval_cache()
+    key = cache.key(query, scope, include_captions=False, **options) if cache else None
+    results = cache.lookup(key, top_k) if cache else None
+    if results is None:
+        results, exhausted = _search_docs(query, top_k, scope, **options)
+        if cache:
+            cache.store(key, top_k, results, exhausted=exhausted)
+
+    if return_docs:
+        return results  # Return full Document objects
+    return [r.page_content for r in results]
+
+
+def _search_docs(
+    query: str,
+    top_k: int,
+    scope: ResearchScope | None,
+    *,
+    search_mode: str,
+    fusion: str,
+    granularity: str,
+    mmr_lambda: float | None,
+) -> tuple[list, bool]:
+    """Documents for `query` and whether the search returned every match (fewer raw hits than fetched)."""
     vs = get_vectorstore()
-    results = vs.similarity_search(
+    route_top_n = scope.routing_top_n() if scope else None
+    needs_vector = mmr_lambda is not None or route_top_n
+    query_vector = vs.embed_queries([query])[0] if needs_vector else None
+    filters = _search_filters(scope, granularity)
+    if route_top_n:
+        sources = route_documents([query], [query_vector], route_top_n, mode=search_mode, fusion=fusion)
+        filters = routed_filters(filters, sources)
+    fetch_k = _candidate_k(top_k, granularity, mmr_lambda)
+    hits = vs.similarity_search_with_score(
         query,
-        k=top_k,
-        filters=scope.search_filters() if scope else None,
+        k=fetch_k,
+        filters=filters,
+        mode=search_mode,
+        fusion=fusion,
+        query_vector=query_vector,
     )
+    exhausted = len(hits) < fetch_k
+    if granularity == "small_to_big":
+        parents = vs.get_documents([doc.metadata.get("parent_id") for doc, _score in hits])
+        hits = collapse_to_parents(hits, parents, _pool_k(top_k, mmr_lambda))
+    if mmr_lambda is not None:
+        hits = mmr_rerank(hits, [query_vector], k=top_k, lambda_mult=mmr_lambda)
+    return [doc for doc, _score in hits], exhausted
+
+
+def search_chunks_many(
+    queries: List[str],
+    top_k: int = 100,
+    return_docs: bool = False,
+    scope: ResearchScope | None = None,
+    include_captions: bool = False,
+    search_mode: str = "knn",
+    fusion: str = "rrf",
+    granularity: str = "mixed",
+    mmr_lambda: float | None = None,
+) -> List[list]:
+    """Batched variant of `search_chunks`: one result list per non-empty query, in order.
+
+    With `granularity="small_to_big"` the parents of all queries are fetched in a
+    single extra request and each query's hits are collapsed onto them. Captions
+    have no chunk sizes, so they are then searched in a separate request.
+    With document routing, the union of every query's routed documents scopes
+    the whole batch, and the query embeddings are reused for all requests.
+    Inside an answer run only the queries missing from the run cache are searched.
+    """
+    queries = [query for query in queries if query and query.strip()]
+    options = {"search_mode": search_mode, "fusion": fusion, "granularity": granularity, "mmr_lambda": mmr_lambda}
+    cache = active_retrieval_cache()
+    if cache is None:
+        batches = _search_many_batches(queries, top_k, scope, include_captions, **options)
+        results = [[doc for doc, _score in batch.all_hits] for batch in batches]
+    else:
+        keys = [cache.key(query, scope, include_captions=include_captions, **options) for query in queries]
+        results = [cache.lookup(key, top_k) for key in keys]
+        missing = [position for position, docs in enumerate(results) if docs is None]
+        if missing:
+            batches = _search_many_batches([queries[i] for i in missing], top_k, scope, include_captions, **options)
+            for position, batch in zip(missing, batches):
+                text_docs = [doc for doc, _score in batch.text_hits]
+                caption_docs = [doc for doc, _score in batch.caption_hits]
+                cache.store(keys[position], top_k, text_docs, caption_docs, exhausted=batch.exhausted)
+                results[position] = text_docs + caption_docs
 
     if return_docs:
-        return results  # Return full Document objects
-    return [r.page_content for r in results]
+        return results
+    return [[doc.page_content for doc in docs] for docs in results]
+
+
+def warm_search_cache(
+    queries: List[str],
+    top_k: int,
+    scope: ResearchScope | None = None,
+    search_mode: str = "knn",
+    fusion: str = "rrf",
+    granularity: str = "mixed",
+    mmr_lambda: float | None = None,
+) -> int:
+    """Search the uncached `queries` of the active run in one batch; returns how many were searched."""
+    cache = active_retrieval_cache()
+    if cache is None:
+        return 0
+    options = {"search_mode": search_mode, "fusion": fusion, "granularity": granularity, "mmr_lambda": mmr_lambda}
+    pending: dict[tuple, str] = {}
+    for query in queries:
+        if not query or not query.strip():
+            continue
+        key = cache.key(query, scope, include_captions=False, **options)
+        if not cache.covers(key, top_k):
+            pending.setdefault(key, query)
+    if not pending:
+        return 0
+    batches = _search_many_batches(list(pending.values()), top_k, scope, False, **options)
+    for key, batch in zip(pending, batches):
+        cache.store(key, top_k, [doc for doc, _score in batch.text_hits], exhausted=batch.exhausted, warm=True)
+    return len(pending)
+
+
+def _search_many_batches(
+    queries: List[str],
+    top_k: int,
+    scope: ResearchScope | None,
+    include_captions: bool,
+    *,
+    search_mode: str,
+    fusion: str,
+    granularity: str,
+    mmr_lambda: float | None,
+) -> list:
+    vs = get_vectorstore()
+    small_to_big = granularity == "small_to_big"
+    pool_k = _pool_k(top_k, mmr_lambda)
+    route_top_n = scope.routing_top_n() if scope and queries else None
+    query_vectors = vs.embed_queries(queries) if route_top_n else None
+    sources = (
+        route_documents(queries, query_vectors, route_top_n, mode=search_mode, fusion=fusion)
+        if route_top_n
+        else []
+    )
+    fetch_k = _candidate_k(top_k, granularity, mmr_lambda)
+    batches = vs.search_chunks_many(
+        queries,
+        top_k=fetch_k,
+        filters=routed_filters(_search_filters(scope, granularity), sources),
+        caption_index=CAPTION_INDEX if include_captions and not small_to_big else None,
+        mode=search_mode,
+        fusion=fusion,
+        query_vectors=query_vectors,
+    )
+
+    for batch in batches:
+        batch.exhausted = len(batch.text_hits) < fetch_k and len(batch.caption_hits) < fetch_k
+
+    if small_to_big:
+        parents = vs.get_documents(
+            [doc.metadata.get("parent_id") for batch in batches for doc, _score in batch.text_hits]
+        )
+        for batch in batches:
+            batch.text_hits = collapse_to_parents(batch.text_hits, parents, pool_k)
+        if include_captions:
+            caption_batches = get_vectorstore(CAPTION_INDEX).search_chunks_many(
+                queries,
+                top_k=pool_k,
+                filters=routed_filters(_search_filters(scope, "mixed"), sources),
+                mode=search_mode,
+                fusion=fusion,
+                query_vectors=[batch.query_vector for batch in batches],
+            )
+            for batch, caption_batch in zip(batches, caption_batches):
+                batch.caption_hits = caption_batch.text_hits
+                batch.exhausted = batch.exhausted and len(caption_batch.text_hits) < pool_k
+
+    if mmr_lambda is not None:
+        for batch in batches:
+            batch.text_hits = mmr_rerank(batch.text_hits, [batch.query_vector], k=top_k, lambda_mult=mmr_lambda)
+            batch.caption_hits = batch.caption_hits[:top_k]
+    return batches
@@ -2,9 +2,12 @@ from typing import List
 
 from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 
+from app.utils.agent.context_packing import pack_context
+from app.utils.agent.planning import CONTEXT_TOKENS_PER_CHUNK
+from app.utils.llm_gateway import complete
+
 
 class SubquestionList(BaseModel):
     questions: List[str]
@@ -33,14 +36,19 @@ def generate_subquestions_from_chunks(
     *,
     target_count: int = 6,
     context_chunk_limit: int = 12,
+    context_token_budget: int | None = None,
 ) -> List[str]:
-    llm = ChatOpenAI(model=model_name, temperature=0)
     capped_target_count = max(1, target_count)
-    context = "\n\n".join(chunks[:context_chunk_limit])
+    packed = pack_context(
+        chunks,
+        context_token_budget or context_chunk_limit * CONTEXT_TOKENS_PER_CHUNK,
+        model=model_name,
+    )
+    context = packed.text
     parser = PydanticOutputParser(pydantic_object=SubquestionList)
     min_count = _compute_min_subquestion_count(
         capped_target_count,
-        available_chunks=len(chunks),
+        available_chunks=packed.pieces,
         context_chunk_limit=context_chunk_limit,
     )
 
@@ -70,16 +78,17 @@ def generate_subquestions_from_chunks(
         partial_variables={"format_instructions": parser.get_format_instructions()},
     )
 
-    chain = prompt | llm | parser
-
     try:
-        result = chain.invoke(
-            {
-                "query": user_query,
-                "context": context,
-                "min_count": min_count,
-                "target_count": capped_target_count,
-            }
+        result = complete(
+            prompt.format(
+                query=user_query,
+                context=context,
+                min_count=min_count,
+                target_count=capped_target_count,
+            ),
+            model=model_name,
+            parser=parser,
+            name="subquestions",
         )
         deduped = list(dict.fromkeys(q.strip() for q in result.questions if q and q.strip()))
         return deduped[:capped_target_count]
@@ -1,8 +1,9 @@
 # app/utils/agent/title_from_cluster.py
-from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+from app.utils.llm_gateway import complete
+
+TITLE_MODEL = "gpt-4o-mini"
 
 _PROMPT = PromptTemplate.from_template(
 """
@@ -22,5 +23,4 @@ def title_from_cluster(cluster: list[str]) -> str:
     if not cluster:
         return "Untitled Section"
     joined = "\n".join(f"- {q}" for q in cluster)
-    resp = llm.invoke(_PROMPT.format(questions=joined))
-    return resp.content.strip()
+    return complete(_PROMPT.format(questions=joined), model=TITLE_MODEL, name="cluster title")
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import re
 from textwrap import dedent
@@ -5,19 +6,26 @@ from typing import List
 
 from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
 from app.db.db import SessionLocal
 from app.models.research_tree import ResearchNode, ResearchTree
+from app.utils.agent.context_packing import PackedContext, pack_context
+from app.utils.agent.planning import CONTEXT_TOKENS_PER_CHUNK
 from app.utils.agent.repo import get_node_chunks, get_node_questions, mark_questions_consumed
-from app.utils.vectorstore import get_caption_store, get_vectorstore
+from app.utils.agent.run_events import section_token_stream
+from app.utils.llm_gateway import acomplete, complete, stream_complete
+from app.utils.mmr import DEFAULT_MMR_LAMBDA, mmr_rerank, mmr_select
+from app.utils.vectorstore import CAPTION_INDEX, get_vectorstore
 
 
 logger = logging.getLogger(__name__)
 LLM_TIMEOUT_SECONDS = 120
-llm = ChatOpenAI(model="gpt-4o", temperature=0, timeout=LLM_TIMEOUT_SECONDS)
-alignment_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, timeout=90)
+WRITER_MODEL = "gpt-4o"
+ALIGNMENT_MODEL = "gpt-4o-mini"
+ALIGNMENT_TIMEOUT_SECONDS = 90
+# MMR ranks this many times the chunk limit as candidates; the token budget decides how many fit.
+CONTEXT_CANDIDATE_FACTOR = 2
 
 _STYLE_GUIDANCE = {
     "scientific_article": (
@@ -45,18 +53,88 @@ class SectionAlignmentVerdict(BaseModel):
     reason: str = Field(default="", description="Short reason for the verdict.")
 
 
-def get_context_for_questions(questions: List[str], top_k: int = 5, context_limit: int = 12) -> str:
+def get_context_for_questions(
+    questions: List[str],
+    top_k: int = 5,
+    context_limit: int = 12,
+    mmr_lambda: float | None = DEFAULT_MMR_LAMBDA,
+) -> str:
+    """Distinct hits for `questions`, diversified with MMR unless `mmr_lambda` is None."""
     vectorstore = get_vectorstore()
-    caption_store = get_caption_store()
-    chunks = []
+    hits = []
+    query_vectors = []
+
+    for batch in vectorstore.search_chunks_many(questions, top_k=top_k, caption_index=CAPTION_INDEX):
+        hits.extend(batch.all_hits)
+        if batch.query_vector is not None:
+            query_vectors.append(batch.query_vector)
+
+    unique_hits = list({doc.page_content: (doc, score) for doc, score in hits}.values())
+    if query_vectors and mmr_lambda is not None:
+        unique_hits = mmr_rerank(unique_hits, query_vectors, k=context_limit, lambda_mult=mmr_lambda)
+    return "\n\n".join(doc.page_content for doc, _score in unique_hits[:context_limit])
+
+
+def select_context_chunks(
+    chunks: list,
+    queries: list[str],
+    limit: int,
+    *,
+    lambda_mult: float | None = DEFAULT_MMR_LAMBDA,
+) -> list:
+    """Pick `limit` chunks by MMR against `queries` so near-duplicates don't fill the context.
+
+    Chunks are returned unchanged when they all fit or `lambda_mult` is None. Stored
+    vectors are fetched in one request; chunks without one (e.g. captions) follow
+    the diversified ones.
+    """
+    queries = [query for query in queries if query and query.strip()]
+    if len(chunks) <= limit or not queries or lambda_mult is None:
+        return chunks[:limit]
+
+    vectorstore = get_vectorstore()
+    try:
+        stored = vectorstore.get_documents([chunk.id for chunk in chunks])
+        query_vectors = vectorstore.embed_queries(queries)
+    except Exception:
+        logger.warning("MMR context selection failed; using retrieval order", exc_info=True)
+        return chunks[:limit]
+
+    with_vectors = [index for index, chunk in enumerate(chunks) if getattr(stored.get(chunk.id), "vector", None)]
+    order = mmr_select(
+        query_vectors,
+        [stored[chunks[index].id].vector for index in with_vectors],
+        k=limit,
+        lambda_mult=lambda_mult,
+    )
+    picked = [with_vectors[index] for index in order]
+    has_vector = set(with_vectors)
+    rest = [index for index in range(len(chunks)) if index not in has_vector]
+    return [chunks[index] for index in picked + rest][:limit]
 
-    for question in questions:
-        text_hits = vectorstore.similarity_search(question, k=top_k)
-        cap_hits = caption_store.similarity_search(question, k=top_k)
-        chunks.extend(text_hits + cap_hits)
 
-    unique_texts = list({doc.page_content for doc in chunks})
-    return "\n\n".join(unique_texts[:context_limit])
+def pack_node_context(
+    chunks: list,
+    queries: list[str],
+    *,
+    context_chunk_limit: int,
+    context_token_budget: int | None,
+    mmr_lambda: float | None = None,
+    model: str = WRITER_MODEL,
+) -> PackedContext:
+    """Chunks packed into `context_token_budget` tokens (default: the chunk limit's worth).
+
+    With `mmr_lambda` (the plan's `retrieval_mmr_lambda`) the chunks are MMR-ranked
+    first; without it they keep their stored order.
+    """
+    budget = context_token_budget or context_chunk_limit * CONTEXT_TOKENS_PER_CHUNK
+    ranked = select_context_chunks(
+        chunks,
+        queries,
+        context_chunk_limit * CONTEXT_CANDIDATE_FACTOR,
+        lambda_mult=mmr_lambda,
+    )
+    return pack_context([chunk.text for chunk in ranked], budget, model=model)
 
 
 def _normalize_output_style(output_style: str | None) -> str:
@@ -106,9 +184,15 @@ def is_section_aligned_with_query(
     *,
     root_query: str,
     context_chunk_limit: int = 8,
+    context_token_budget: int | None = None,
 ) -> tuple[bool, str]:
     questions = list(node.questions or [])
-    context = "\n\n".join(c.text for c in (node.chunks or [])[:context_chunk_limit])
+    # Retrieval order is the ranking here; no extra vector round trip for a yes/no check.
+    context = pack_context(
+        [c.text for c in node.chunks or []],
+        context_token_budget or context_chunk_limit * CONTEXT_TOKENS_PER_CHUNK,
+        model=ALIGNMENT_MODEL,
+    ).text
 
     parser = PydanticOutputParser(pydantic_object=SectionAlignmentVerdict)
     prompt = PromptTemplate(
@@ -139,14 +223,17 @@ def is_section_aligned_with_query(
     )
 
     try:
-        chain = prompt | alignment_llm | parser
-        verdict = chain.invoke(
-            {
-                "root_query": root_query,
-                "section_title": node.title,
-                "section_questions": "\n".join(f"- {q}" for q in questions) if questions else "- (none)",
-                "context": context or "(no evidence loaded)",
-            }
+        verdict = complete(
+            prompt.format(
+                root_query=root_query,
+                section_title=node.title,
+                section_questions="\n".join(f"- {q}" for q in questions) if questions else "- (none)",
+                context=context or "(no evidence loaded)",
+            ),
+            model=ALIGNMENT_MODEL,
+            timeout=ALIGNMENT_TIMEOUT_SECONDS,
+            parser=parser,
+            name="section alignment",
         )
         return bool(verdict.aligned), verdict.reason.strip() or "model verdict"
     except Exception:
@@ -161,13 +248,22 @@ def write_section(
     output_style: str = "scientific_article",
     context_chunk_limit: int = 12,
     length_hint: str = "2-4 compact paragraphs",
+    context_token_budget: int | None = None,
+    mmr_lambda: float | None = None,
 ):
     db = SessionLocal()
     try:
         q_objs = get_node_questions(db, node.id)
         questions = [q.text for q in q_objs]
         chunks = get_node_chunks(db, node.id)
-        context = "\n\n".join(c.text for c in chunks[:context_chunk_limit])
+        packed = pack_node_context(
+            chunks,
+            [node.title, *questions],
+            context_chunk_limit=context_chunk_limit,
+            context_token_budget=context_token_budget,
+            mmr_lambda=mmr_lambda,
+        )
+        context = packed.text
         style_instruction = _style_instruction(output_style)
 
         goals = (node.goals or "").strip()
@@ -203,16 +299,31 @@ def write_section(
         ).strip()
 
         logger.info(
-            "Writing section '%s' style=%s with %s questions, %s chunks, context_limit=%s context_chars=%s",
+            "Writing section '%s' style=%s with %s questions, %s chunks, context=%s/%s tokens "
+            "from %s chunks (%s truncated, %s duplicates)",
             node.title,
             _normalize_output_style(output_style),
             len(questions),
             len(chunks),
-            context_chunk_limit,
-            len(context),
+            packed.tokens,
+            packed.budget,
+            packed.pieces,
+            packed.truncated,
+            packed.duplicates,
         )
         try:
-            node.content = llm.invoke(prompt).content.strip()
+            tokens = section_token_stream(node)
+            if tokens is None:
+                node.content = complete(prompt, model=WRITER_MODEL, timeout=LLM_TIMEOUT_SECONDS, name="section")
+            else:
+                node.content = stream_complete(
+                    prompt,
+                    on_delta=tokens,
+                    model=WRITER_MODEL,
+                    timeout=LLM_TIMEOUT_SECONDS,
+                    name="section",
+                )
+                tokens.flush()
             node.mark_final()
             logger.info("Finished section '%s' content_len=%s", node.title, len(node.content))
         except Exception:
@@ -226,23 +337,31 @@ def write_section(
     return node
 
 
-def write_summary(
+def _summary_prompt(
     node: ResearchNode,
     *,
-    output_style: str = "scientific_article",
-    context_chunk_limit: int = 12,
-) -> str:
+    output_style: str,
+    context_chunk_limit: int,
+    context_token_budget: int | None = None,
+    mmr_lambda: float | None = None,
+) -> str | None:
     db = SessionLocal()
     try:
         chunks = get_node_chunks(db, node.id)
-        context = "\n\n".join(c.text for c in chunks[:context_chunk_limit])
+        context = pack_node_context(
+            chunks,
+            [node.title],
+            context_chunk_limit=context_chunk_limit,
+            context_token_budget=context_token_budget,
+            mmr_lambda=mmr_lambda,
+        ).text
     finally:
         db.close()
 
     if not context.strip():
-        return f"(No summary available for: {node.title})"
+        return None
 
-    prompt = dedent(
+    return dedent(
         f"""
         You are a scientific assistant.
         Based on the CONTEXT, write a compact section summary for "{node.title}".
@@ -255,9 +374,30 @@ def write_summary(
         Preserve ambiguity where the evidence is linguistically uncertain.
         """
     ).strip()
-    logger.info("Writing summary for '%s' context_chars=%s", node.title, len(context))
+
+
+async def awrite_summary(
+    node: ResearchNode,
+    *,
+    output_style: str = "scientific_article",
+    context_chunk_limit: int = 12,
+    context_token_budget: int | None = None,
+    mmr_lambda: float | None = None,
+) -> str:
+    prompt = await asyncio.to_thread(
+        _summary_prompt,
+        node,
+        output_style=output_style,
+        context_chunk_limit=context_chunk_limit,
+        context_token_budget=context_token_budget,
+        mmr_lambda=mmr_lambda,
+    )
+    if prompt is None:
+        return f"(No summary available for: {node.title})"
+
+    logger.info("Writing summary for '%s' prompt_chars=%s", node.title, len(prompt))
     try:
-        result = llm.invoke(prompt).content.strip()
+        result = await acomplete(prompt, model=WRITER_MODEL, timeout=LLM_TIMEOUT_SECONDS, name="summary")
         logger.info("Finished summary for '%s' len=%s", node.title, len(result))
         return result
     except Exception:
@@ -265,23 +405,59 @@ def write_summary(
         raise
 
 
-def write_conclusion(
+def write_summary(
     node: ResearchNode,
     *,
     output_style: str = "scientific_article",
     context_chunk_limit: int = 12,
+    context_token_budget: int | None = None,
+    mmr_lambda: float | None = None,
 ) -> str:
+    prompt = _summary_prompt(
+        node,
+        output_style=output_style,
+        context_chunk_limit=context_chunk_limit,
+        context_token_budget=context_token_budget,
+        mmr_lambda=mmr_lambda,
+    )
+    if prompt is None:
+        return f"(No summary available for: {node.title})"
+
+    logger.info("Writing summary for '%s' prompt_chars=%s", node.title, len(prompt))
+    try:
+        result = complete(prompt, model=WRITER_MODEL, timeout=LLM_TIMEOUT_SECONDS, name="summary")
+        logger.info("Finished summary for '%s' len=%s", node.title, len(result))
+        return result
+    except Exception:
+        logger.exception("Summary generation failed for '%s'", node.title)
+        raise
+
+
+def _conclusion_prompt(
+    node: ResearchNode,
+    *,
+    output_style: str,
+    context_chunk_limit: int,
+    context_token_budget: int | None = None,
+    mmr_lambda: float | None = None,
+) -> str | None:
     db = SessionLocal()
     try:
         chunks = get_node_chunks(db, node.id)
-        context = "\n\n".join(c.text for c in chunks[:context_chunk_limit])
+        context = pack_node_context(
+            chunks,
+            [node.title],
+            context_chunk_limit=context_chunk_limit,
+            context_token_budget=context_token_budget,
+            mmr_lambda=mmr_lambda,
+        ).text
     finally:
         db.close()
 
     if not context.strip():
-        return f"(No conclusion available for: {node.title})"
+        return None
 
-    prompt = dedent(
+    return dedent(
         f"""
         You are a scientific assistant.
         Based on the CONTEXT, write a concluding paragraph for the section titled "{node.title}".
@@ -294,9 +470,30 @@ def write_conclusion(
         Preserve ambiguity where the evidence is linguistically uncertain.
         """
     ).strip()
-    logger.info("Writing conclusion for '%s' context_chars=%s", node.title, len(context))
+
+
+async def awrite_conclusion(
+    node: ResearchNode,
+    *,
+    output_style: str = "scientific_article",
+    context_chunk_limit: int = 12,
+    context_token_budget: int | None = None,
+    mmr_lambda: float | None = None,
+) -> str:
+    prompt = await asyncio.to_thread(
+        _conclusion_prompt,
+        node,
+        output_style=output_style,
+        context_chunk_limit=context_chunk_limit,
+        context_token_budget=context_token_budget,
+        mmr_lambda=mmr_lambda,
+    )
+    if prompt is None:
+        return f"(No conclusion available for: {node.title})"
+
+    logger.info("Writing conclusion for '%s' prompt_chars=%s", node.title, len(prompt))
     try:
-        result = llm.invoke(prompt).content.strip()
+        result = await acomplete(prompt, model=WRITER_MODEL, timeout=LLM_TIMEOUT_SECONDS, name="conclusion")
         logger.info("Finished conclusion for '%s' len=%s", node.title, len(result))
         return result
     except Exception:
@@ -304,8 +501,35 @@ def write_conclusion(
         raise
 
 
-def write_executive_summary(tree: ResearchTree) -> str:
-    llm_local = ChatOpenAI(model="gpt-4o", temperature=0)
+def write_conclusion(
+    node: ResearchNode,
+    *,
+    output_style: str = "scientific_article",
+    context_chunk_limit: int = 12,
+    context_token_budget: int | None = None,
+    mmr_lambda: float | None = None,
+) -> str:
+    prompt = _conclusion_prompt(
+        node,
+        output_style=output_style,
+        context_chunk_limit=context_chunk_limit,
+        context_token_budget=context_token_budget,
+        mmr_lambda=mmr_lambda,
+    )
+    if prompt is None:
+        return f"(No conclusion available for: {node.title})"
+
+    logger.info("Writing conclusion for '%s' prompt_chars=%s", node.title, len(prompt))
+    try:
+        result = complete(prompt, model=WRITER_MODEL, timeout=LLM_TIMEOUT_SECONDS, name="conclusion")
+        logger.info("Finished conclusion for '%s' len=%s", node.title, len(result))
+        return result
+    except Exception:
+        logger.exception("Conclusion generation failed for '%s'", node.title)
+        raise
+
+
+def _executive_summary_prompt(tree: ResearchTree) -> str:
     sections = []
     for node in tree.root_node.subnodes:
         if node.content:
@@ -313,7 +537,13 @@ def write_executive_summary(tree: ResearchTree) -> str:
     context = "\n".join(sections[: tree.plan.summary_context_sections])
     sentence_hint = "6-10 sentences" if tree.plan.query_complexity >= 4 else "4-7 sentences"
 
-    prompt = dedent(
+    logger.info(
+        "Writing executive summary title=%r excerpt_count=%s context_chars=%s",
+        tree.root_node.title,
+        len(sections[: tree.plan.summary_context_sections]),
+        len(context),
+    )
+    return dedent(
         f"""
         You are a scientific writer. Draft an Executive Summary of the article below.
         Output style requirement: {_style_instruction(tree.plan.output_style)}
@@ -328,14 +558,11 @@ def write_executive_summary(tree: ResearchTree) -> str:
         {context}
         """
     ).strip()
-    logger.info(
-        "Writing executive summary title=%r excerpt_count=%s context_chars=%s",
-        tree.root_node.title,
-        len(sections[: tree.plan.summary_context_sections]),
-        len(context),
-    )
+
+
+async def awrite_executive_summary(tree: ResearchTree) -> str:
     try:
-        result = llm_local.invoke(prompt).content.strip()
+        result = await acomplete(_executive_summary_prompt(tree), model=WRITER_MODEL, name="executive summary")
         logger.info("Finished executive summary len=%s", len(result))
         return result
     except Exception:
@@ -343,8 +570,17 @@ def write_executive_summary(tree: ResearchTree) -> str:
         raise
 
 
-def write_overall_conclusion(tree: ResearchTree) -> str:
-    llm_local = ChatOpenAI(model="gpt-4o", temperature=0)
+def write_executive_summary(tree: ResearchTree) -> str:
+    try:
+        result = complete(_executive_summary_prompt(tree), model=WRITER_MODEL, name="executive summary")
+        logger.info("Finished executive summary len=%s", len(result))
+        return result
+    except Exception:
+        logger.exception("Executive summary generation failed for title=%r", tree.root_node.title)
+        raise
+
+
+def _overall_conclusion_prompt(tree: ResearchTree) -> str:
     bullets = []
     for node in tree.root_node.subnodes:
         if node.summary:
@@ -356,7 +592,13 @@ def write_overall_conclusion(tree: ResearchTree) -> str:
     context = "\n".join(bullets[: max(tree.plan.summary_context_sections, 6)])
     paragraph_hint = "2 paragraphs" if tree.plan.query_complexity >= 4 else "1 focused paragraph"
 
-    prompt = dedent(
+    logger.info(
+        "Writing overall conclusion title=%r finding_count=%s context_chars=%s",
+        tree.root_node.title,
+        len(bullets[: max(tree.plan.summary_context_sections, 6)]),
+        len(context),
+    )
+    return dedent(
         f"""
         You are a scientific writer. Using the following findings, write an Overall Conclusion.
         Output style requirement: {_style_instruction(tree.plan.output_style)}
@@ -372,14 +614,21 @@ def write_overall_conclusion(tree: ResearchTree) -> str:
         {context}
         """
     ).strip()
-    logger.info(
-        "Writing overall conclusion title=%r finding_count=%s context_chars=%s",
-        tree.root_node.title,
-        len(bullets[: max(tree.plan.summary_context_sections, 6)]),
-        len(context),
-    )
+
+
+async def awrite_overall_conclusion(tree: ResearchTree) -> str:
+    try:
+        result = await acomplete(_overall_conclusion_prompt(tree), model=WRITER_MODEL, name="overall conclusion")
+        logger.info("Finished overall conclusion len=%s", len(result))
+        return result
+    except Exception:
+        logger.exception("Overall conclusion generation failed for title=%r", tree.root_node.title)
+        raise
+
+
+def write_overall_conclusion(tree: ResearchTree) -> str:
     try:
-        result = llm_local.invoke(prompt).content.strip()
+        result = complete(_overall_conclusion_prompt(tree), model=WRITER_MODEL, name="overall conclusion")
         logger.info("Finished overall conclusion len=%s", len(result))
         return result
     except Exception:
@@ -0,0 +1,159 @@
+"""Export indexed chunks and captions page by page.
+
+Elasticsearch exports open a point in time (PIT) over the index and page
+through it with `search_after` on `_shard_doc`, so every page is a cheap
+continuation over one consistent snapshot and memory stays at one page no
+matter how many rows match. With VECTOR_STORE_BACKEND=local the matching ids
+are snapshotted first and fetched a page at a time.
+
+Rows come out in index order, not `chunk_index` order; sort client-side if needed.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from collections.abc import Iterator, Sequence
+
+from app.utils.search_index import build_filter_clauses, es, search_routing, use_local_store
+
+
+logger = logging.getLogger(__name__)
+
+EXPORTABLE_INDICES = ("pdf_chunks", "captions")
+EXPORT_BATCH_SIZE = int(os.getenv("CHUNK_EXPORT_BATCH_SIZE", "500"))
+EXPORT_MAX_BATCH_SIZE = 5000
+# How long the PIT stays open between two pages; renewed by every page.
+EXPORT_KEEP_ALIVE = os.getenv("CHUNK_EXPORT_KEEP_ALIVE", "2m")
+
+
+def _source_filter(fields: Sequence[str] | None, include_vectors: bool) -> dict | bool:
+    if fields:
+        includes = [field for field in fields if field != "vector"]
+        if include_vectors:
+            includes.append("vector")
+        return {"includes": includes}
+    return True if include_vectors else {"excludes": ["vector"]}
+
+
+def _row(doc_id: str, source: dict, fields: Sequence[str] | None, include_vectors: bool) -> dict:
+    if fields:
+        keep = [*fields, "vector"] if include_vectors else fields
+        source = {field: source[field] for field in keep if field in source}
+    else:
+        source = dict(source)
+    if not include_vectors:
+        source.pop("vector", None)
+    source.pop("id", None)
+    return {"id": doc_id, **source}
+
+
+def count_chunks(index_name: str, filters: dict[str, object] | None) -> int:
+    if use_local_store():
+        from app.utils.local_vectorstore import get_local_index
+
+        return len(get_local_index(index_name).matching_ids(filters))
+
+    response = es.count(
+        index=index_name,
+        query={"bool": {"filter": build_filter_clauses(filters)}},
+        routing=search_routing(index_name, filters),
+    )
+    return int(response["count"])
+
+
+def _local_batches(
+    index_name: str,
+    filters: dict[str, object] | None,
+    fields: Sequence[str] | None,
+    include_vectors: bool,
+    batch_size: int,
+) -> Iterator[list[dict]]:
+    from app.utils.local_vectorstore import get_local_index
+
+    index = get_local_index(index_name)
+    ids = index.matching_ids(filters)
+    for start in range(0, len(ids), batch_size):
+        page = ids[start:start + batch_size]
+        # Unlike a PIT, rows deleted or replaced after the id snapshot are skipped or returned as updated.
+        documents = index.get_documents(page)
+        rows = []
+        for doc_id in page:
+            document = documents.get(doc_id)
+            if document is None:
+                continue
+            source = {**document.metadata, "text": document.page_content, "vector": document.vector}
+            rows.append(_row(doc_id, source, fields, include_vectors))
+        yield rows
+
+
+def iter_chunk_batches(
+    index_name: str,
+    filters: dict[str, object] | None,
+    *,
+    fields: Sequence[str] | None = None,
+    include_vectors: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[list[dict]]:
+    """Yield pages of `{"id": ..., **source}` dicts for every row of `index_name` matching `filters`.
+
+    `fields` limits the source fields (all when empty); `vector` is only included
+    with `include_vectors`. The PIT is closed when the generator is exhausted or closed.
+    """
+    if index_name not in EXPORTABLE_INDICES:
+        raise ValueError(f"Unsupported index: {index_name}")
+    batch_size = max(1, min(batch_size, EXPORT_MAX_BATCH_SIZE))
+    if use_local_store():
+        yield from _local_batches(index_name, filters, fields, include_vectors, batch_size)
+        return
+
+    pit_id = es.open_point_in_time(
+        index=index_name,
+        keep_alive=EXPORT_KEEP_ALIVE,
+        routing=search_routing(index_name, filters),
+    )["id"]
+    try:
+        search_after = None
+        while True:
+            response = es.search(
+                pit={"id": pit_id, "keep_alive": EXPORT_KEEP_ALIVE},
+                query={"bool": {"filter": build_filter_clauses(filters)}},
+                source=_source_filter(fields, include_vectors),
+                sort=[{"_shard_doc": "asc"}],
+                search_after=search_after,
+                size=batch_size,
+                track_total_hits=False,
+            )
+            pit_id = response.get("pit_id", pit_id)
+            hits = response["hits"]["hits"]
+            if not hits:
+                return
+            yield [_row(hit["_id"], hit.get("_source") or {}, fields, include_vectors) for hit in hits]
+            if len(hits) < batch_size:
+                return
+            search_after = hits[-1]["sort"]
+    finally:
+        try:
+            es.close_point_in_time(id=pit_id)
+        except Exception:
+            logger.warning("Could not close export point in time on %s; it expires after %s", index_name, EXPORT_KEEP_ALIVE)
+
+
+def iter_ndjson(
+    index_name: str,
+    filters: dict[str, object] | None,
+    *,
+    fields: Sequence[str] | None = None,
+    include_vectors: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """NDJSON encoding of `iter_chunk_batches`, one chunk per line, one yielded block per page."""
+    for rows in iter_chunk_batches(
+        index_name,
+        filters,
+        fields=fields,
+        include_vectors=include_vectors,
+        batch_size=batch_size,
+    ):
+        if rows:
+            yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows).encode("utf-8")
@@ -0,0 +1,67 @@
+"""Two-stage retrieval for the "all documents" scope.
+
+A flat kNN over every chunk in the library gets slower and noisier as the
+library grows. The worker stores two small rows per PDF in the `documents`
+index (the centroid of its chunk vectors and the embedding of its opening
+text; pdf_worker app/utils/document_vectors.py). Routing searches those rows
+first and then restricts the chunk search to the best-matching PDFs, which
+Elasticsearch answers with a filtered (usually exact) kNN over a few thousand
+vectors instead of an approximate search over all of them.
+"""
+import logging
+import os
+
+from app.utils.vectorstore import get_vectorstore
+
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_INDEX = "documents"
+# Each PDF has a "centroid" and a "summary" row in DOCUMENT_INDEX.
+ROWS_PER_DOCUMENT = 2
+# Documents searched per query when a request does not choose; 0 disables routing.
+DEFAULT_ROUTE_DOCUMENTS = int(os.getenv("DOCUMENT_ROUTING_TOP_N", "0"))
+
+
+def route_documents(
+    queries: list[str],
+    query_vectors: list[list[float]],
+    top_n: int,
+    *,
+    filters: dict[str, object] | None = None,
+    mode: str = "knn",
+    fusion: str = "rrf",
+) -> list[str]:
+    """`source_pdf` of the best `top_n` documents for each query, unioned in rank order.
+
+    A document's score is the better of its centroid and summary rows. Returns
+    an empty list when routing is unavailable (index missing or empty), so
+    callers fall back to searching the whole library.
+    """
+    try:
+        batches = get_vectorstore(DOCUMENT_INDEX).search_chunks_many(
+            queries,
+            top_k=top_n * ROWS_PER_DOCUMENT,
+            filters=filters,
+            mode=mode,
+            fusion=fusion,
+            query_vectors=query_vectors,
+        )
+    except Exception:
+        logger.warning("Document routing failed; searching all chunks", exc_info=True)
+        return []
+
+    routed: dict[str, None] = {}
+    for batch in batches:
+        # Hits are best-first, so the first row seen for a document carries its best score.
+        ranked = dict.fromkeys(doc.metadata.get("source_pdf") for doc, _score in batch.text_hits)
+        ranked.pop(None, None)
+        routed.update(dict.fromkeys(list(ranked)[:top_n]))
+    return list(routed)
+
+
+def routed_filters(filters: dict[str, object] | None, sources: list[str]) -> dict[str, object] | None:
+    """Restrict `filters` to the routed PDFs; unchanged when routing found nothing."""
+    if not sources:
+        return filters
+    return {**(filters or {}), "source_pdf": sources}
@@ -5,6 +5,8 @@ from sqlalchemy.orm import Session
 from app.db.models.document_orm import Document
 from app.db.models.project_orm import Project
 from app.models.research_tree import ResearchScope
+from app.utils.document_routing import DEFAULT_ROUTE_DOCUMENTS
+from app.utils.search_index import scope_fields_backfilled
 
 
 def _display_filename(filename: str) -> str:
@@ -18,6 +20,7 @@ def resolve_research_scope(
     *,
     document_id: UUID | str | None = None,
     project_id: UUID | str | None = None,
+    route_documents: int | None = None,
 ) -> ResearchScope:
     if document_id and project_id:
         raise ValueError("Choose document_id or project_id, not both")
@@ -40,19 +43,25 @@ def resolve_research_scope(
         if project is None:
             raise LookupError("Project not found")
 
-        documents = (
-            db.query(Document)
-            .filter(Document.project_id == project.id)
-            .order_by(Document.created_at.asc())
-            .all()
-        )
+        documents = db.query(Document.id).filter(Document.project_id == project.id)
+        if scope_fields_backfilled():
+            filenames, document_count = [], documents.count()
+        else:
+            # Needed for the source_pdf fallback filter (see ResearchScope.search_filters).
+            filenames = [filename for (filename,) in documents.with_entities(Document.filename).all()]
+            document_count = len(filenames)
         return ResearchScope(
             mode="project",
             project_id=str(project.id),
-            filenames=[document.filename for document in documents],
+            filenames=filenames,
             label=project.name,
-            document_count=len(documents),
+            document_count=document_count,
         )
 
     document_count = db.query(Document).count()
-    return ResearchScope(mode="all", label="All indexed documents", document_count=document_count)
+    return ResearchScope(
+        mode="all",
+        label="All indexed documents",
+        document_count=document_count,
+        route_documents=DEFAULT_ROUTE_DOCUMENTS if route_documents is None else route_documents,
+    )
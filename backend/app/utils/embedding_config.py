@@ -0,0 +1,159 @@
+"""Embedding model / vector index configuration shared with pdf_worker through `.env`.
+
+EMBEDDING_MODEL       OpenAI embedding model (default text-embedding-3-small)
+EMBEDDING_DIMS        output dimensions; text-embedding-3 models can return shortened vectors
+ES_VECTOR_INDEX_TYPE  dense_vector index_options.type (hnsw, int8_hnsw, int4_hnsw, bbq_hnsw, *_flat)
+ES_HNSW_M / ES_HNSW_EF_CONSTRUCTION  HNSW graph parameters
+
+pdf_worker reads the same variables in its own copy, pdf_worker/app/utils/embedding_config.py;
+keep the two in sync.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from langchain_openai import OpenAIEmbeddings
+
+from app.utils import run_metrics
+
+
+logger = logging.getLogger(__name__)
+
+NATIVE_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+# Models that accept the `dimensions` request parameter.
+SHORTENABLE_MODELS = {"text-embedding-3-small", "text-embedding-3-large"}
+
+# Minimum Elasticsearch version per dense_vector index type.
+INDEX_TYPE_MIN_VERSION = {
+    "hnsw": (8, 0),
+    "flat": (8, 13),
+    "int8_hnsw": (8, 12),
+    "int8_flat": (8, 13),
+    "int4_hnsw": (8, 15),
+    "int4_flat": (8, 15),
+    "bbq_hnsw": (8, 16),
+    "bbq_flat": (8, 16),
+}
+
+
+@dataclass(frozen=True)
+class EmbeddingConfig:
+    model: str = "text-embedding-3-small"
+    dims: int = 1536
+    index_type: str = "int8_hnsw"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 100
+
+    @property
+    def request_dims(self) -> Optional[int]:
+        """`dimensions` to send to the API, or None when the model's native size is wanted."""
+        if self.dims == NATIVE_DIMS.get(self.model):
+            return None
+        return self.dims
+
+    def vector_mapping(self) -> dict:
+        index_options = {"type": self.index_type}
+        if self.index_type.endswith("hnsw"):
+            index_options.update({"m": self.hnsw_m, "ef_construction": self.hnsw_ef_construction})
+        return {
+            "type": "dense_vector",
+            "dims": self.dims,
+            "index": True,
+            "similarity": "cosine",
+            "index_options": index_options,
+        }
+
+
+def load_embedding_config() -> EmbeddingConfig:
+    model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    config = EmbeddingConfig(
+        model=model,
+        dims=int(os.getenv("EMBEDDING_DIMS", NATIVE_DIMS.get(model, 1536))),
+        index_type=os.getenv("ES_VECTOR_INDEX_TYPE", "int8_hnsw"),
+        hnsw_m=int(os.getenv("ES_HNSW_M", "16")),
+        hnsw_ef_construction=int(os.getenv("ES_HNSW_EF_CONSTRUCTION", "100")),
+    )
+    if config.index_type not in INDEX_TYPE_MIN_VERSION:
+        raise ValueError(f"Unsupported ES_VECTOR_INDEX_TYPE {config.index_type!r}")
+    native = NATIVE_DIMS.get(config.model)
+    if config.request_dims is not None and config.model not in SHORTENABLE_MODELS:
+        raise ValueError(f"{config.model} does not support EMBEDDING_DIMS={config.dims}")
+    if native is not None and config.dims > native:
+        raise ValueError(f"EMBEDDING_DIMS={config.dims} exceeds {native} for {config.model}")
+    if config.index_type.startswith("int4") and config.dims % 2:
+        raise ValueError("int4 quantization needs an even EMBEDDING_DIMS")
+    if config.index_type.startswith("bbq") and config.dims < 64:
+        raise ValueError("bbq quantization needs EMBEDDING_DIMS >= 64")
+    return config
+
+
+EMBEDDING_CONFIG = load_embedding_config()
+
+
+class MeteredOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings that records each request in the active run's metrics (`embed_query` goes through here too)."""
+
+    def embed_documents(self, texts: list[str], *args, **kwargs) -> list[list[float]]:
+        if run_metrics.active_run_metrics() is None:
+            return super().embed_documents(texts, *args, **kwargs)
+        started = time.perf_counter()
+        vectors = super().embed_documents(texts, *args, **kwargs)
+        run_metrics.record(
+            "embedding",
+            ms=(time.perf_counter() - started) * 1000,
+            input_tokens=sum(run_metrics.count_tokens(text, self.model) for text in texts),
+            bytes=sum(len(text.encode("utf-8")) for text in texts),
+            model=self.model,
+        )
+        return vectors
+
+
+def build_embeddings(config: EmbeddingConfig = EMBEDDING_CONFIG) -> OpenAIEmbeddings:
+    kwargs = {"model": config.model, "openai_api_key": os.getenv("OPENAI_API_KEY")}
+    if config.request_dims is not None:
+        kwargs["dimensions"] = config.request_dims
+    return MeteredOpenAIEmbeddings(**kwargs)
+
+
+def parse_es_version(number: str) -> tuple:
+    parts = []
+    for part in number.split("-")[0].split(".")[:2]:
+        parts.append(int(part) if part.isdigit() else 0)
+    return tuple(parts)
+
+
+def validate_against_cluster(es, index_names: Iterable[str], config: EmbeddingConfig = EMBEDDING_CONFIG) -> None:
+    """Fail fast when the cluster cannot serve `config` or an index was built for other dims."""
+    version = parse_es_version(es.info()["version"]["number"])
+    required = INDEX_TYPE_MIN_VERSION[config.index_type]
+    if version < required:
+        raise RuntimeError(
+            f"ES_VECTOR_INDEX_TYPE={config.index_type} needs Elasticsearch "
+            f"{'.'.join(map(str, required))}+, cluster runs {'.'.join(map(str, version))}"
+        )
+
+    for index_name in index_names:
+        if not es.indices.exists(index=index_name):
+            continue
+        for concrete, body in es.indices.get_mapping(index=index_name).items():
+            vector = body.get("mappings", {}).get("properties", {}).get("vector") or {}
+            live_dims = vector.get("dims")
+            if live_dims is not None and int(live_dims) != config.dims:
+                raise RuntimeError(
+                    f"{concrete} stores {live_dims}-dim vectors but EMBEDDING_DIMS={config.dims}; "
+                    f"reindex first (pdf_worker: python -m app.reindex {index_name} --dims {config.dims} --truncate-vectors)"
+                )
+            live_type = (vector.get("index_options") or {}).get("type")
+            if live_type and live_type != config.index_type:
+                logger.warning(
+                    "%s uses %s while ES_VECTOR_INDEX_TYPE=%s; run app.reindex to switch",
+                    concrete,
+                    live_type,
+                    config.index_type,
+                )
@@ -0,0 +1,303 @@
+"""Adaptive kNN `num_candidates` and sampled recall measurement.
+
+A fixed `num_candidates = max(25, k * 5)` is too small for narrow filters over a
+big index (filtered HNSW search visits few matching nodes per candidate) and
+larger than needed for unfiltered searches. The candidate count is instead
+chosen per search from:
+
+- the estimated number of chunks matching the filters, from per-field chunk
+  counts (document_id, project_id, source_pdf, chunk_size) cached for
+  KNN_COUNT_CACHE_SECONDS. When the candidates would cover most matching chunks
+  anyway, all of them are requested, so Elasticsearch answers exactly;
+- a per-scope-mode multiplier that the recall sampler nudges towards
+  KNN_TARGET_RECALL.
+
+The sampler re-runs a fraction (KNN_RECALL_SAMPLE_RATE) of kNN searches as exact
+`script_score` searches on a background thread and keeps recall and latency per
+scope mode ("all", "project", "document", "routed"); see `recall_report()`.
+"""
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.search_index import build_filter_clauses, search_routing
+
+
+logger = logging.getLogger(__name__)
+
+KNN_TARGET_RECALL = float(os.getenv("KNN_TARGET_RECALL", "0.95"))
+KNN_RECALL_SAMPLE_RATE = float(os.getenv("KNN_RECALL_SAMPLE_RATE", "0.02"))
+KNN_COUNT_CACHE_SECONDS = float(os.getenv("KNN_COUNT_CACHE_SECONDS", "300"))
+
+DEFAULT_CANDIDATE_FACTOR = 5.0
+MIN_CANDIDATE_FACTOR = 1.5
+MAX_CANDIDATE_FACTOR = 40.0
+MIN_NUM_CANDIDATES = 25
+# Elasticsearch rejects num_candidates above 10000.
+MAX_NUM_CANDIDATES = 10_000
+# Request every matching chunk once the candidates would cover this fraction of them.
+EXACT_COVERAGE = 0.5
+# Samples kept per scope mode for the report; the multiplier moves once per MIN_SAMPLES_TO_ADJUST samples.
+SAMPLE_WINDOW = 200
+MIN_SAMPLES_TO_ADJUST = 20
+
+COUNTED_FIELDS = ("document_id", "project_id", "source_pdf", "chunk_size")
+COUNT_PAGE_SIZE = 1000
+
+
+def scope_mode(filters: dict[str, object] | None) -> str:
+    """Scope mode a filter dict corresponds to (see `ResearchScope.search_filters`)."""
+    filters = filters or {}
+    if filters.get("document_id"):
+        return "document"
+    if isinstance(filters.get("source_pdf"), (list, tuple, set)) and len(filters["source_pdf"]) > 1:
+        return "routed"
+    if filters.get("source_pdf"):
+        return "document"
+    if filters.get("project_id"):
+        return "project"
+    return "all"
+
+
+class ChunkCountCache:
+    """Total and per-value chunk counts of one index, refreshed at most every `ttl` seconds."""
+
+    def __init__(self, es, index_name: str, *, ttl: float = KNN_COUNT_CACHE_SECONDS):
+        self.es = es
+        self.index_name = index_name
+        self.ttl = ttl
+        self.total = 0
+        self.counts: dict[str, dict] = {}
+        self._loaded_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _field_counts(self, field: str) -> dict:
+        # Composite pages keep each response well under search.max_buckets on large libraries.
+        counts: dict = {}
+        after = None
+        while True:
+            composite = {"size": COUNT_PAGE_SIZE, "sources": [{field: {"terms": {"field": field}}}]}
+            if after:
+                composite["after"] = after
+            response = self.es.search(index=self.index_name, size=0, aggs={"values": {"composite": composite}})
+            aggregation = response["aggregations"]["values"]
+            for bucket in aggregation["buckets"]:
+                counts[bucket["key"][field]] = int(bucket["doc_count"])
+            after = aggregation.get("after_key")
+            if not aggregation["buckets"] or not after:
+                return counts
+
+    def _refresh(self) -> None:
+        total = int(self.es.count(index=self.index_name)["count"])
+        counts = {field: self._field_counts(field) for field in COUNTED_FIELDS}
+        self.total, self.counts = total, counts
+
+    def _ensure_fresh(self) -> None:
+        if time.monotonic() - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if time.monotonic() - self._loaded_at < self.ttl:
+                return
+            try:
+                self._refresh()
+            except Exception:
+                logger.warning("Could not load chunk counts for %s", self.index_name, exc_info=True)
+            # Retry only after the TTL, also on failure, so searches never wait on a broken aggregation.
+            self._loaded_at = time.monotonic()
+
+    def estimate_matching(self, filters: dict[str, object] | None) -> int | None:
+        """Estimated chunks matching `filters`, assuming independent fields; None when unknown."""
+        self._ensure_fresh()
+        if not self.total:
+            return None
+        estimate = float(self.total)
+        for field, value in (filters or {}).items():
+            counts = self.counts.get(field)
+            if value is None or counts is None:
+                continue
+            values = [value] if isinstance(value, (str, int, float)) else list(value)
+            if any(item not in counts for item in values):
+                # Not aggregated yet (e.g. a document ingested since the last refresh).
+                continue
+            estimate *= sum(counts[item] for item in values) / self.total
+        return max(0, int(math.ceil(estimate)))
+
+
+class RecallSampler:
+    """Per-scope-mode kNN latency and sampled recall against exact search."""
+
+    def __init__(self, *, sample_rate: float = KNN_RECALL_SAMPLE_RATE, target_recall: float = KNN_TARGET_RECALL):
+        self.sample_rate = sample_rate
+        self.target_recall = target_recall
+        self.factors: dict[str, float] = {}
+        self._latencies: dict[str, deque] = {}
+        self._recalls: dict[str, deque] = {}
+        self._exact_latencies: dict[str, deque] = {}
+        self._since_adjust: dict[str, int] = {}
+        self._pending = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="knn-recall")
+
+    def factor(self, mode: str) -> float:
+        return self.factors.get(mode, DEFAULT_CANDIDATE_FACTOR)
+
+    def record(
+        self,
+        es,
+        index_name: str,
+        *,
+        vector: list[float],
+        k: int,
+        filters: dict[str, object] | None,
+        found_ids: list[str],
+        latency_ms: float,
+    ) -> None:
+        """Record a kNN search and, for a sampled fraction, compare it with exact search off-thread."""
+        mode = scope_mode(filters)
+        with self._lock:
+            self._latencies.setdefault(mode, deque(maxlen=SAMPLE_WINDOW)).append(latency_ms)
+            # One exact search at a time; samples arriving meanwhile are dropped rather than queued.
+            if self._pending or self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return
+            self._pending = True
+        self._executor.submit(self._sample, es, index_name, mode, vector, k, filters, list(found_ids))
+
+    def _sample(self, es, index_name, mode, vector, k, filters, found_ids) -> None:
+        try:
+            self._compare(es, index_name, mode, vector, k, filters, found_ids)
+        finally:
+            with self._lock:
+                self._pending = False
+
+    def _compare(self, es, index_name, mode, vector, k, filters, found_ids) -> None:
+        try:
+            clauses = build_filter_clauses(filters)
+            started = time.perf_counter()
+            response = es.search(
+                index=index_name,
+                size=k,
+                source=False,
+                routing=search_routing(index_name, filters, es),
+                query={
+                    "script_score": {
+                        "query": {"bool": {"filter": clauses}} if clauses else {"match_all": {}},
+                        "script": {
+                            "source": "cosineSimilarity(params.query_vector, 'vector') + 1.0",
+                            "params": {"query_vector": vector},
+                        },
+                    }
+                },
+            )
+            exact_ms = (time.perf_counter() - started) * 1000.0
+        except Exception:
+            logger.warning("Exact kNN recall sample failed on %s", index_name, exc_info=True)
+            return
+
+        expected = {hit["_id"] for hit in response["hits"]["hits"]}
+        if not expected:
+            return
+        recall = len(expected.intersection(found_ids)) / len(expected)
+        with self._lock:
+            recalls = self._recalls.setdefault(mode, deque(maxlen=SAMPLE_WINDOW))
+            recalls.append(recall)
+            self._exact_latencies.setdefault(mode, deque(maxlen=SAMPLE_WINDOW)).append(exact_ms)
+            self._since_adjust[mode] = self._since_adjust.get(mode, 0) + 1
+            if self._since_adjust[mode] >= MIN_SAMPLES_TO_ADJUST:
+                # Judge each adjustment only on samples taken with the current factor.
+                self._adjust(mode, _mean(list(recalls)[-MIN_SAMPLES_TO_ADJUST:]))
+                self._since_adjust[mode] = 0
+
+    def _adjust(self, mode: str, recall: float) -> None:
+        factor = self.factor(mode)
+        if recall < self.target_recall:
+            factor *= 1.25
+        elif recall >= min(1.0, self.target_recall + 0.03):
+            factor *= 0.9
+        self.factors[mode] = min(MAX_CANDIDATE_FACTOR, max(MIN_CANDIDATE_FACTOR, factor))
+
+    def report(self) -> dict:
+        with self._lock:
+            modes = sorted(set(self._latencies) | set(self._recalls))
+            return {
+                "target_recall": self.target_recall,
+                "sample_rate": self.sample_rate,
+                "modes": {
+                    mode: {
+                        "searches": len(self._latencies.get(mode, ())),
+                        "p50_ms": _percentile(self._latencies.get(mode), 0.5),
+                        "p95_ms": _percentile(self._latencies.get(mode), 0.95),
+                        "recall_samples": len(self._recalls.get(mode, ())),
+                        "estimated_recall": _mean(self._recalls.get(mode)),
+                        "exact_p50_ms": _percentile(self._exact_latencies.get(mode), 0.5),
+                        "candidate_factor": self.factor(mode),
+                    }
+                    for mode in modes
+                },
+            }
+
+
+def _mean(values) -> float | None:
+    return sum(values) / len(values) if values else None
+
+
+def _percentile(values, fraction: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+_count_caches: dict[str, ChunkCountCache] = {}
+_count_caches_lock = threading.Lock()
+RECALL_SAMPLER = RecallSampler()
+
+
+def get_count_cache(es, index_name: str) -> ChunkCountCache:
+    with _count_caches_lock:
+        if index_name not in _count_caches:
+            _count_caches[index_name] = ChunkCountCache(es, index_name)
+        return _count_caches[index_name]
+
+
+def choose_num_candidates(
+    k: int,
+    *,
+    matching: int | None,
+    total: int,
+    factor: float = DEFAULT_CANDIDATE_FACTOR,
+) -> int:
+    """`num_candidates` for a kNN search returning `k` hits among ~`matching` of `total` chunks.
+
+    Filtered HNSW search has to explore more of the graph to find `k` matching
+    neighbours, so narrow filters get more candidates (damped by a square root,
+    at most 4x). When that would cover most matching chunks, all are requested.
+    """
+    base = max(MIN_NUM_CANDIDATES, k * factor)
+    if matching is None or not total:
+        return int(min(MAX_NUM_CANDIDATES, base))
+    if matching <= k:
+        return max(k, 1)
+    selectivity = matching / total
+    candidates = base * min(4.0, 1.0 / math.sqrt(selectivity))
+    if candidates >= EXACT_COVERAGE * matching:
+        candidates = matching
+    return int(min(MAX_NUM_CANDIDATES, max(k, candidates)))
+
+
+def num_candidates_for(es, index_name: str, k: int, filters: dict[str, object] | None) -> int:
+    counts = get_count_cache(es, index_name)
+    return choose_num_candidates(
+        k,
+        matching=counts.estimate_matching(filters),
+        total=counts.total,
+        factor=RECALL_SAMPLER.factor(scope_mode(filters)),
+    )
+
+
+def recall_report() -> dict:
+    return RECALL_SAMPLER.report()
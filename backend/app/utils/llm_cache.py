@@ -0,0 +1,210 @@
+"""Persistent cache of deterministic LLM responses (table `llm_response_cache`).
+
+The gateway consults it for `temperature=0` calls unless the call passes
+`cache=False`. Keys hash the model, temperature, call name, prompt template
+version, parser schema and the rendered prompt, so bumping a call site's
+`version` retires its old entries. Entries expire after LLM_CACHE_TTL_SECONDS;
+every LLM_CACHE_PRUNE_EVERY stores, expired rows and the least recently used
+rows beyond LLM_CACHE_MAX_ENTRIES are deleted.
+
+Within `run_llm_cache_stats()` (one answer run) hits, misses and the tokens the
+hits would have cost are counted; `run_llm_cache_stats(enabled=False)` makes the
+run bypass the cache entirely.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.db.db import SessionLocal
+from app.db.models.llm_response_cache_orm import LLMResponseCache
+
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() not in {"0", "false", "no"}
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_PRUNE_EVERY = int(os.getenv("LLM_CACHE_PRUNE_EVERY", "200"))
+
+_stores = 0
+_stores_lock = threading.Lock()
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    input_tokens: int
+    output_tokens: int
+
+
+@dataclass
+class LLMCacheStats:
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    tokens_saved: int = 0
+    enabled: bool = True
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, outcome: str, tokens: int = 0) -> None:
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+                self.tokens_saved += tokens
+            elif outcome == "miss":
+                self.misses += 1
+            else:
+                self.bypassed += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+_active: ContextVar[LLMCacheStats | None] = ContextVar("llm_cache_stats", default=None)
+
+
+@contextmanager
+def run_llm_cache_stats(enabled: bool = True):
+    """Count LLM cache outcomes for the duration of the `with` block (one answer run)."""
+    stats = LLMCacheStats(enabled=enabled)
+    token = _active.set(stats)
+    try:
+        yield stats
+    finally:
+        _active.reset(token)
+
+
+def cache_enabled() -> bool:
+    stats = _active.get()
+    return LLM_CACHE_ENABLED and (stats is None or stats.enabled)
+
+
+def record(outcome: str, tokens: int = 0) -> None:
+    stats = _active.get()
+    if stats is not None:
+        stats.record(outcome, tokens)
+
+
+def _parser_schema(parser) -> str | None:
+    if parser is None:
+        return None
+    model = getattr(parser, "pydantic_object", None)
+    if model is None:
+        return type(parser).__name__
+    schema = model.model_json_schema() if hasattr(model, "model_json_schema") else model.schema()
+    return json.dumps(schema, sort_keys=True)
+
+
+def cache_key(*, model: str, temperature: float, name: str, version: str, prompt: str, parser=None) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "name": name,
+            "version": version,
+            "schema": _parser_schema(parser),
+            "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def lookup(key: str) -> CachedResponse | None:
+    """Cached response for `key`, or None when absent, expired or the cache is unreachable."""
+    db = SessionLocal()
+    try:
+        row = db.get(LLMResponseCache, key)
+        if row is None:
+            return None
+        now = datetime.utcnow()
+        if row.created_at < now - timedelta(seconds=LLM_CACHE_TTL_SECONDS):
+            return None
+        row.hit_count += 1
+        row.last_used_at = now
+        cached = CachedResponse(row.response, row.input_tokens, row.output_tokens)
+        db.commit()
+        return cached
+    except Exception:
+        db.rollback()
+        logger.warning("LLM cache lookup failed; calling the model", exc_info=True)
+        return None
+    finally:
+        db.close()
+
+
+def store(
+    key: str,
+    *,
+    model: str,
+    name: str,
+    version: str,
+    response: str,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+) -> None:
+    global _stores
+    now = datetime.utcnow()
+    values = {
+        "key": key,
+        "model": model,
+        "name": name,
+        "version": version,
+        "response": response,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "hit_count": 0,
+        "created_at": now,
+        "last_used_at": now,
+    }
+    db = SessionLocal()
+    try:
+        stmt = pg_insert(LLMResponseCache.__table__).values(values)
+        # An expired entry is refreshed in place.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={field: stmt.excluded[field] for field in values if field != "key"},
+        )
+        db.execute(stmt)
+        with _stores_lock:
+            _stores += 1
+            prune_now = _stores % max(1, LLM_CACHE_PRUNE_EVERY) == 0
+        if prune_now:
+            prune(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.warning("LLM cache store failed for %s", name, exc_info=True)
+    finally:
+        db.close()
+
+
+def prune(db) -> int:
+    """Delete expired entries and the least recently used ones beyond LLM_CACHE_MAX_ENTRIES."""
+    cutoff = datetime.utcnow() - timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+    removed = db.execute(delete(LLMResponseCache).where(LLMResponseCache.created_at < cutoff)).rowcount or 0
+    excess = (db.scalar(select(func.count()).select_from(LLMResponseCache)) or 0) - LLM_CACHE_MAX_ENTRIES
+    if excess > 0:
+        oldest = (
+            select(LLMResponseCache.key)
+            .order_by(LLMResponseCache.last_used_at.asc())
+            .limit(excess)
+        )
+        removed += db.execute(delete(LLMResponseCache).where(LLMResponseCache.key.in_(oldest))).rowcount or 0
+    if removed:
+        logger.info("Pruned %s LLM cache entries", removed)
+    return removed
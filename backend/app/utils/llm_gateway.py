@@ -0,0 +1,337 @@
+"""Single entry point for chat-model calls.
+
+`acomplete` is the primary, async API; `complete` is the blocking facade for
+sync routes and worker threads. Both apply the same policy:
+- one cached `ChatOpenAI` client per model/temperature/timeout (per event loop
+  for async calls, since async HTTP clients are bound to their loop),
+- a timeout per call (LLM_TIMEOUT_SECONDS unless the caller passes one),
+- LLM_MAX_RETRIES retries with exponential backoff on rate limits, timeouts,
+  connection and 5xx errors (the client's own retries are disabled),
+- the process-wide LLM_CONCURRENCY cap, shared by sync and async callers,
+- structured output: pass a `PydanticOutputParser` to get the parsed object,
+- the persistent response cache for `temperature=0` calls (`app.utils.llm_cache`);
+  pass `cache=False` to bypass it and bump `version` when a prompt template changes,
+- per-run accounting of calls, tokens, latency and cost (`app.utils.run_metrics`).
+
+`gather` awaits independent calls together from sync code on a background
+event loop, e.g. `gather(awrite_summary(...), awrite_conclusion(...))`.
+`stream_complete` is `complete` for plain text that also hands the text to a
+callback while the model generates it (live section tokens).
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable
+
+import openai
+from langchain_core.messages import AIMessageChunk
+from langchain_core.output_parsers import BaseOutputParser
+from langchain_openai import ChatOpenAI
+
+from app.utils import llm_cache, run_metrics
+from app.utils.tokens import count_tokens
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o"
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1.0"))
+LLM_CONCURRENCY = max(1, int(os.getenv("LLM_CONCURRENCY", "6")))
+
+_RETRYABLE = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+_SLOT_POLL_SECONDS = 0.02
+
+_llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+_clients: dict[tuple, ChatOpenAI] = {}
+_clients_lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def set_llm_concurrency(limit: int) -> None:
+    """Resize the LLM cap; only safe while no call holds a slot (startup, benchmarks)."""
+    global LLM_CONCURRENCY, _llm_slots
+    LLM_CONCURRENCY = max(1, int(limit))
+    _llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+
+
+@contextmanager
+def llm_slot():
+    """Hold one of the LLM_CONCURRENCY slots (blocking)."""
+    slots = _llm_slots
+    with slots:
+        yield
+
+
+@asynccontextmanager
+async def allm_slot():
+    """Hold one of the LLM_CONCURRENCY slots without blocking the event loop."""
+    slots = _llm_slots
+    # Same semaphore as the sync path, so threads and coroutines share one cap.
+    while not slots.acquire(blocking=False):
+        await asyncio.sleep(_SLOT_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def _client(model: str, temperature: float, timeout: float, *, loop: asyncio.AbstractEventLoop | None = None) -> ChatOpenAI:
+    key = (id(loop) if loop else None, model, temperature, timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ChatOpenAI(model=model, temperature=temperature, timeout=timeout, max_retries=0)
+            _clients[key] = client
+        return client
+
+
+def _backoff(attempt: int) -> float:
+    return LLM_RETRY_BASE_SECONDS * (2 ** attempt) * (0.5 + random.random())
+
+
+def _output(text: str, parser: BaseOutputParser | None) -> Any:
+    return parser.parse(text) if parser is not None else text.strip()
+
+
+def _usage(message: Any) -> tuple[int, int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return int(usage.get("input_tokens") or 0), int(usage.get("output_tokens") or 0)
+
+
+def _meter(prompt: str, message: Any, *, model: str, started: float) -> None:
+    input_tokens, output_tokens = _usage(message)
+    if not input_tokens:
+        input_tokens = count_tokens(prompt, model)
+        output_tokens = count_tokens(message.content, model)
+    run_metrics.record(
+        "llm",
+        ms=(time.perf_counter() - started) * 1000,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        bytes=len(prompt.encode("utf-8")) + len(message.content.encode("utf-8")),
+        model=model,
+    )
+
+
+def _meter_hit(cached: llm_cache.CachedResponse, *, model: str, started: float) -> None:
+    run_metrics.record(
+        "llm",
+        ms=(time.perf_counter() - started) * 1000,
+        input_tokens=cached.input_tokens,
+        output_tokens=cached.output_tokens,
+        bytes=len(cached.response.encode("utf-8")),
+        model=model,
+        cached=True,
+    )
+
+
+def _cache_key(prompt: str, *, model: str, temperature: float, name: str, version: str, parser, cache: bool) -> str | None:
+    if not cache or temperature != 0 or not llm_cache.cache_enabled():
+        llm_cache.record("bypass")
+        return None
+    return llm_cache.cache_key(model=model, temperature=temperature, name=name, version=version, prompt=prompt, parser=parser)
+
+
+def _from_cache(cached: llm_cache.CachedResponse | None, parser: BaseOutputParser | None, name: str) -> tuple[bool, Any]:
+    if cached is None:
+        llm_cache.record("miss")
+        return False, None
+    try:
+        result = _output(cached.response, parser)
+    except Exception:
+        logger.warning("%s: cached response no longer parses; calling the model", name)
+        llm_cache.record("miss")
+        return False, None
+    llm_cache.record("hit", cached.input_tokens + cached.output_tokens)
+    return True, result
+
+
+def _store(key: str, message: Any, *, model: str, name: str, version: str) -> None:
+    input_tokens, output_tokens = _usage(message)
+    llm_cache.store(
+        key,
+        model=model,
+        name=name,
+        version=version,
+        response=message.content,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+    )
+
+
+async def acomplete(
+    prompt: str,
+    *,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.0,
+    timeout: float | None = None,
+    parser: BaseOutputParser | None = None,
+    name: str = "llm",
+    version: str = "1",
+    cache: bool = True,
+) -> Any:
+    """Stripped completion text for `prompt`, or `parser`'s object when a parser is given."""
+    key = _cache_key(prompt, model=model, temperature=temperature, name=name, version=version, parser=parser, cache=cache)
+    if key:
+        started = time.perf_counter()
+        cached = await asyncio.to_thread(llm_cache.lookup, key)
+        hit, result = _from_cache(cached, parser, name)
+        if hit:
+            _meter_hit(cached, model=model, started=started)
+            return result
+
+    client = _client(model, temperature, timeout or LLM_TIMEOUT_SECONDS, loop=asyncio.get_running_loop())
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with allm_slot():
+                started = time.perf_counter()
+                message = await client.ainvoke(prompt)
+            _meter(prompt, message, model=model, started=started)
+            result = _output(message.content, parser)
+            if key:
+                await asyncio.to_thread(_store, key, message, model=model, name=name, version=version)
+            return result
+        except _RETRYABLE as exc:
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            logger.warning("%s: %s, retrying in %.1fs (%s/%s)", name, type(exc).__name__, delay, attempt + 1, LLM_MAX_RETRIES)
+            await asyncio.sleep(delay)
+
+
+def complete(
+    prompt: str,
+    *,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.0,
+    timeout: float | None = None,
+    parser: BaseOutputParser | None = None,
+    name: str = "llm",
+    version: str = "1",
+    cache: bool = True,
+) -> Any:
+    """Blocking `acomplete`, for sync code paths and worker threads."""
+    key = _cache_key(prompt, model=model, temperature=temperature, name=name, version=version, parser=parser, cache=cache)
+    if key:
+        started = time.perf_counter()
+        cached = llm_cache.lookup(key)
+        hit, result = _from_cache(cached, parser, name)
+        if hit:
+            _meter_hit(cached, model=model, started=started)
+            return result
+
+    client = _client(model, temperature, timeout or LLM_TIMEOUT_SECONDS)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            with llm_slot():
+                started = time.perf_counter()
+                message = client.invoke(prompt)
+            _meter(prompt, message, model=model, started=started)
+            result = _output(message.content, parser)
+            if key:
+                _store(key, message, model=model, name=name, version=version)
+            return result
+        except _RETRYABLE as exc:
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            logger.warning("%s: %s, retrying in %.1fs (%s/%s)", name, type(exc).__name__, delay, attempt + 1, LLM_MAX_RETRIES)
+            time.sleep(delay)
+
+
+def stream_complete(
+    prompt: str,
+    *,
+    on_delta: Callable[[str, int], None],
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.0,
+    timeout: float | None = None,
+    name: str = "llm",
+    version: str = "1",
+    cache: bool = True,
+) -> str:
+    """Blocking `complete` that calls `on_delta(text, offset)` as the text is generated.
+
+    A cache hit is handed over in one piece; a retried call starts again at offset 0.
+    """
+    key = _cache_key(prompt, model=model, temperature=temperature, name=name, version=version, parser=None, cache=cache)
+    if key:
+        started = time.perf_counter()
+        cached = llm_cache.lookup(key)
+        hit, result = _from_cache(cached, None, name)
+        if hit:
+            _meter_hit(cached, model=model, started=started)
+            on_delta(result, 0)
+            return result
+
+    client = _client(model, temperature, timeout or LLM_TIMEOUT_SECONDS)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            with llm_slot():
+                started = time.perf_counter()
+                message = AIMessageChunk(content="")
+                offset = 0
+                for chunk in client.stream(prompt, stream_usage=True):
+                    if chunk.content:
+                        on_delta(chunk.content, offset)
+                        offset += len(chunk.content)
+                    message = message + chunk
+            _meter(prompt, message, model=model, started=started)
+            result = _output(message.content, None)
+            if key:
+                _store(key, message, model=model, name=name, version=version)
+            return result
+        except _RETRYABLE as exc:
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            logger.warning("%s: %s, retrying in %.1fs (%s/%s)", name, type(exc).__name__, delay, attempt + 1, LLM_MAX_RETRIES)
+            time.sleep(delay)
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-gateway", daemon=True).start()
+        return _loop
+
+
+async def _in_context(awaitable: Awaitable, context: contextvars.Context) -> Any:
+    return await asyncio.get_running_loop().create_task(awaitable, context=context)
+
+
+def run_sync(awaitable: Awaitable) -> Any:
+    """Run a coroutine on the gateway's background loop and wait for its result.
+
+    The coroutine sees the caller's context variables (per-run stats and caches).
+    """
+    loop = _background_loop()
+    if threading.current_thread().name == "llm-gateway":
+        raise RuntimeError("run_sync called from the LLM gateway loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(_in_context(awaitable, contextvars.copy_context()), loop).result()
+
+
+async def _gather(awaitables: tuple[Awaitable, ...]) -> list:
+    return list(await asyncio.gather(*awaitables))
+
+
+def gather(*awaitables: Awaitable) -> list:
+    """Await independent LLM coroutines together from sync code; results in argument order."""
+    return run_sync(_gather(awaitables))
@@ -0,0 +1,583 @@
+"""In-process vector store used when VECTOR_STORE_BACKEND=local.
+
+Reads the per-index directories that pdf_worker writes (see pdf_worker
+app/utils/local_store.py for the file layout) and serves the same interface as
+`SimpleElasticsearchVectorStore`: kNN over memory-mapped float32/int8 matrices
+by brute force, optional hnswlib ANN for large indices, an in-memory BM25 for
+hybrid search, and `build_filter_predicate` for the same filter semantics as the
+Elasticsearch `term`/`terms` clauses. Scores follow Elasticsearch's cosine
+scoring, `(1 + cos) / 2`, so thresholds carry over between backends.
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+from app.utils.embedding_config import build_embeddings
+from app.utils.search_index import build_filter_predicate
+from app.utils.vectorstore import (
+    DEFAULT_BM25_WEIGHT,
+    MultiQueryHits,
+    StoredDocument,
+    _non_empty_queries,
+    _validate_search_mode,
+    reciprocal_rank_fusion,
+    weighted_score_fusion,
+)
+
+try:
+    import hnswlib
+except ImportError:  # optional; brute force is used without it
+    hnswlib = None
+
+
+logger = logging.getLogger(__name__)
+
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "/data/vectors")
+# "hnsw" enables the hnswlib index once an index has LOCAL_VECTOR_ANN_MIN_ROWS rows.
+LOCAL_VECTOR_ANN = os.getenv("LOCAL_VECTOR_ANN", "none").lower()
+LOCAL_VECTOR_ANN_MIN_ROWS = int(os.getenv("LOCAL_VECTOR_ANN_MIN_ROWS", "20000"))
+# Filters matching a smaller share of the rows are scanned by brute force: a filtered
+# HNSW walk visits mostly rejected nodes and may not find enough matches at all.
+LOCAL_VECTOR_ANN_MIN_FRACTION = float(os.getenv("LOCAL_VECTOR_ANN_MIN_FRACTION", "0.1"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+_SCAN_BLOCK_ROWS = 65536
+_COMPACT_MIN_ROWS = 1000
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall((text or "").lower())
+
+
+class LocalVectorIndex:
+    """One index directory: incremental loading, search and backend-side mutations."""
+
+    def __init__(self, index_name: str, *, root: str = LOCAL_VECTOR_DIR):
+        self.index_name = index_name
+        self.path = os.path.join(root, index_name)
+        self._lock = threading.RLock()
+        self._reset(generation=None)
+
+    def _reset(self, generation: int | None) -> None:
+        self._generation = generation
+        self._manifest_stamp = None
+        self._rows_loaded = 0
+        self._rows_offset = 0
+        self._ops_offset = 0
+        self.ids: list[str] = []
+        self.texts: list[str] = []
+        self.metadata: list[dict] = []
+        self.active = np.zeros(0, dtype=bool)
+        self._latest: dict[str, int] = {}
+        self._matrix = None
+        self._scales = None
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._lengths: list[int] = []
+        self._mask_cache: dict[str, np.ndarray] = {}
+        self._ann = None
+        self._ann_rows = 0
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _data_file(self, name: str, generation: int) -> str:
+        stem, ext = os.path.splitext(name)
+        return self._file(f"{stem}-{generation}{ext}")
+
+    def _read_manifest(self) -> dict | None:
+        try:
+            with open(self._file("manifest.json"), encoding="utf-8") as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    # -- loading -----------------------------------------------------------
+
+    def refresh(self) -> None:
+        """Pick up rows and ops committed since the last call; cheap when nothing changed."""
+        with self._lock:
+            try:
+                stamp = os.stat(self._file("manifest.json")).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if stamp == self._manifest_stamp:
+                return
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            if manifest["generation"] != self._generation:
+                self._reset(manifest["generation"])
+            try:
+                self._load_rows(manifest)
+                self._load_ops(manifest)
+            except FileNotFoundError:
+                # Compacted between reading the manifest and opening its files; load the new generation.
+                self._reset(None)
+                self.refresh()
+                return
+            self._map_vectors(manifest)
+            self._manifest_stamp = stamp
+            self._mask_cache.clear()
+
+    def _load_rows(self, manifest: dict) -> None:
+        if manifest["rows_bytes"] <= self._rows_offset:
+            return
+        with open(self._data_file("rows.jsonl", manifest["generation"]), "rb") as handle:
+            handle.seek(self._rows_offset)
+            payload = handle.read(manifest["rows_bytes"] - self._rows_offset)
+        self._rows_offset = manifest["rows_bytes"]
+
+        lines = payload.decode("utf-8").splitlines()
+        active = np.ones(len(lines), dtype=bool)
+        self.active = np.concatenate([self.active, active])
+        for line in lines:
+            row = self._rows_loaded
+            record = json.loads(line)
+            previous = self._latest.get(record["id"])
+            if previous is not None:
+                self.active[previous] = False
+            self._latest[record["id"]] = row
+            self.ids.append(record["id"])
+            self.texts.append(record.get("text") or "")
+            self.metadata.append(record.get("metadata") or {})
+            tokens = Counter(_tokenize(self.texts[-1]))
+            self._lengths.append(sum(tokens.values()))
+            for term, count in tokens.items():
+                self._postings.setdefault(term, []).append((row, count))
+            self._rows_loaded += 1
+
+    def _load_ops(self, manifest: dict) -> None:
+        if manifest["ops_bytes"] <= self._ops_offset:
+            return
+        with open(self._data_file("ops.jsonl", manifest["generation"]), "rb") as handle:
+            handle.seek(self._ops_offset)
+            payload = handle.read(manifest["ops_bytes"] - self._ops_offset)
+        self._ops_offset = manifest["ops_bytes"]
+        for line in payload.decode("utf-8").splitlines():
+            self._apply_op(json.loads(line))
+
+    def _apply_op(self, op: dict) -> None:
+        rows = [row for row in op.get("rows", []) if row < self._rows_loaded]
+        if op["op"] == "delete":
+            self.active[rows] = False
+        elif op["op"] == "set":
+            for row in rows:
+                self.metadata[row].update(op.get("fields") or {})
+
+    def _map_vectors(self, manifest: dict) -> None:
+        rows, dims = manifest["rows"], manifest["dims"]
+        if rows == 0:
+            self._matrix = np.zeros((0, dims), dtype=np.float32)
+            self._scales = None
+            return
+        dtype = np.int8 if manifest["dtype"] == "int8" else np.float32
+        self._matrix = np.memmap(
+            self._data_file("vectors.bin", manifest["generation"]),
+            dtype=dtype,
+            mode="r",
+            shape=(rows, dims),
+        )
+        self._scales = None
+        if manifest["dtype"] == "int8":
+            self._scales = np.memmap(
+                self._data_file("scales.bin", manifest["generation"]),
+                dtype=np.float32,
+                mode="r",
+                shape=(rows,),
+            ) / 127.0
+
+    # -- search ------------------------------------------------------------
+
+    def _mask(self, filters: dict[str, object] | None) -> np.ndarray:
+        key = json.dumps(filters or {}, sort_keys=True, default=str)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            predicate = build_filter_predicate(filters)
+            mask = self.active.copy()
+            if predicate is not None:
+                for row in np.flatnonzero(mask):
+                    mask[row] = predicate(self.metadata[row])
+            self._mask_cache[key] = mask
+        return mask
+
+    def _dot(self, rows: np.ndarray, vector: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), _SCAN_BLOCK_ROWS):
+            block = rows[start:start + _SCAN_BLOCK_ROWS]
+            values = np.asarray(self._matrix[block], dtype=np.float32) @ vector
+            if self._scales is not None:
+                values *= self._scales[block]
+            scores[start:start + len(block)] = values
+        return scores
+
+    def knn(
+        self,
+        vector: list[float],
+        k: int,
+        filters: dict[str, object] | None = None,
+        *,
+        num_candidates: int | None = None,
+    ) -> list[tuple[int, float]]:
+        """Top-k (row, Elasticsearch-style cosine score) among rows matching `filters`."""
+        self.refresh()
+        with self._lock:
+            mask = self._mask(filters)
+            allowed = np.flatnonzero(mask)
+            if not len(allowed) or k <= 0:
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+
+            candidates = allowed
+            use_ann = (
+                len(allowed) >= LOCAL_VECTOR_ANN_MIN_ROWS
+                and len(allowed) >= LOCAL_VECTOR_ANN_MIN_FRACTION * len(mask)
+            )
+            ann = self._ann_index() if use_ann else None
+            if ann is not None:
+                wanted = min(len(allowed), max(k, num_candidates or k * 5))
+                ann.set_ef(max(wanted, 50))
+                try:
+                    labels, _ = ann.knn_query(query, k=wanted, num_threads=1, filter=lambda label: bool(mask[label]))
+                    candidates = np.asarray(labels[0], dtype=np.int64)
+                except RuntimeError:
+                    # hnswlib raises when the filtered walk finds fewer than `wanted` matches.
+                    logger.debug("Local store %s: filtered HNSW query came up short; scanning", self.index_name)
+
+            scores = self._dot(candidates, query)
+            top = min(k, len(candidates))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            # int8 rounding can push cosine slightly past 1.
+            return [(int(candidates[i]), (1.0 + min(1.0, float(scores[i]))) / 2.0) for i in best]
+
+    def bm25(self, query: str, k: int, filters: dict[str, object] | None = None) -> list[tuple[int, float]]:
+        """Top-k (row, BM25 score) among rows matching `filters`; statistics cover all live rows."""
+        self.refresh()
+        with self._lock:
+            mask = self._mask(filters)
+            live = int(self.active.sum())
+            if not live or k <= 0:
+                return []
+            lengths = np.asarray(self._lengths, dtype=np.float32)
+            average_length = float(lengths[self.active].mean()) or 1.0
+            scores = np.zeros(self._rows_loaded, dtype=np.float32)
+            for term in set(_tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                rows = np.fromiter((row for row, _ in postings), dtype=np.int64, count=len(postings))
+                counts = np.fromiter((count for _, count in postings), dtype=np.float32, count=len(postings))
+                live_rows = self.active[rows]
+                rows, counts = rows[live_rows], counts[live_rows]
+                frequency = len(rows)
+                if not frequency:
+                    continue
+                idf = math.log(1.0 + (live - frequency + 0.5) / (frequency + 0.5))
+                norm = counts + BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[rows] / average_length)
+                np.add.at(scores, rows, idf * counts * (BM25_K1 + 1.0) / norm)
+
+            scores[~mask] = 0.0
+            matched = np.flatnonzero(scores > 0)
+            if not len(matched):
+                return []
+            top = min(k, len(matched))
+            best = matched[np.argpartition(-scores[matched], top - 1)[:top]]
+            best = best[np.argsort(-scores[best])]
+            return [(int(row), float(scores[row])) for row in best]
+
+    def _ann_index(self):
+        if LOCAL_VECTOR_ANN != "hnsw" or hnswlib is None or self._matrix is None:
+            return None
+        rows, dims = self._matrix.shape
+        if self._ann is None:
+            self._ann = hnswlib.Index(space="ip", dim=dims)
+            path = self._data_file("hnsw.bin", self._generation)
+            if os.path.exists(path):
+                self._ann.load_index(path, max_elements=rows)
+                self._ann_rows = self._ann.get_current_count()
+            else:
+                self._ann.init_index(max_elements=max(rows, 1), ef_construction=200, M=16)
+        if self._ann_rows < rows:
+            self._ann.resize_index(rows)
+            new_rows = np.arange(self._ann_rows, rows)
+            for start in range(0, len(new_rows), _SCAN_BLOCK_ROWS):
+                block = new_rows[start:start + _SCAN_BLOCK_ROWS]
+                vectors = np.asarray(self._matrix[block], dtype=np.float32)
+                if self._scales is not None:
+                    vectors *= self._scales[block][:, None]
+                self._ann.add_items(vectors, block)
+            self._ann_rows = rows
+            self._ann.save_index(self._data_file("hnsw.bin", self._generation))
+            logger.info("Local store %s: HNSW index now covers %s rows", self.index_name, rows)
+        return self._ann
+
+    def get_documents(self, ids: list[str]) -> dict[str, StoredDocument]:
+        self.refresh()
+        with self._lock:
+            documents = {}
+            for doc_id in ids:
+                row = self._latest.get(doc_id)
+                if row is not None and self.active[row]:
+                    documents[doc_id] = self.document(row, 0.0)[0]
+            return documents
+
+    def matching_ids(self, filters: dict[str, object] | None = None) -> list[str]:
+        """Ids of the live rows matching `filters`, in row order."""
+        self.refresh()
+        with self._lock:
+            return [self.ids[row] for row in np.flatnonzero(self._mask(filters))]
+
+    def scan(self, filters: dict[str, object] | None = None):
+        """Yield (ids, texts, float32 vectors) blocks of the live rows matching `filters`.
+
+        Holds the index lock until the generator is exhausted or closed.
+        """
+        self.refresh()
+        with self._lock:
+            rows = np.flatnonzero(self._mask(filters))
+            for start in range(0, len(rows), _SCAN_BLOCK_ROWS):
+                block = rows[start:start + _SCAN_BLOCK_ROWS]
+                vectors = np.asarray(self._matrix[block], dtype=np.float32)
+                if self._scales is not None:
+                    vectors *= self._scales[block][:, None]
+                yield [self.ids[row] for row in block], [self.texts[row] for row in block], vectors
+
+    def document(self, row: int, score: float) -> tuple[StoredDocument, float]:
+        metadata = dict(self.metadata[row])
+        metadata.setdefault("id", self.ids[row])
+        vector = np.asarray(self._matrix[row], dtype=np.float32)
+        if self._scales is not None:
+            vector = vector * self._scales[row]
+        return StoredDocument(page_content=self.texts[row], metadata=metadata, vector=vector.tolist()), score
+
+    # -- mutations (backend side) -------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        with open(self._file(".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        tmp = self._file("manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, self._file("manifest.json"))
+
+    def _append_op(self, op: dict) -> int:
+        if not os.path.isdir(self.path):
+            return 0
+        with self._locked():
+            self.refresh()
+            manifest = self._read_manifest()
+            if manifest is None:
+                return 0
+            with self._lock:
+                mask = self._mask(op.pop("filters"))
+                rows = [int(row) for row in np.flatnonzero(mask)]
+            if not rows:
+                return 0
+            line = (json.dumps({**op, "rows": rows}) + "\n").encode("utf-8")
+            ops_path = self._data_file("ops.jsonl", manifest["generation"])
+            with open(ops_path, "ab") as handle:
+                handle.truncate(manifest["ops_bytes"])
+                handle.write(line)
+                handle.flush()
+                os.fsync(handle.fileno())
+            manifest["ops_bytes"] += len(line)
+            self._write_manifest(manifest)
+        self.refresh()
+        return len(rows)
+
+    def delete_where(self, filters: dict[str, object] | None) -> int:
+        deleted = self._append_op({"op": "delete", "filters": filters})
+        if deleted and self._rows_loaded >= _COMPACT_MIN_ROWS and self.active.mean() < 0.5:
+            self.compact()
+        return deleted
+
+    def update_where(self, filters: dict[str, object] | None, fields: dict) -> int:
+        return self._append_op({"op": "set", "filters": filters, "fields": fields})
+
+    def compact(self) -> None:
+        """Rewrite live rows into the next generation and drop the old files."""
+        with self._locked():
+            self.refresh()
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            with self._lock:
+                live = np.flatnonzero(self.active)
+                generation = manifest["generation"] + 1
+                vectors = np.asarray(self._matrix[live])
+                with open(self._data_file("vectors.bin", generation), "wb") as handle:
+                    handle.write(vectors.tobytes())
+                if self._scales is not None:
+                    scales = (np.asarray(self._scales[live]) * 127.0).astype(np.float32)
+                    with open(self._data_file("scales.bin", generation), "wb") as handle:
+                        handle.write(scales.tobytes())
+                lines = "".join(
+                    json.dumps({"id": self.ids[row], "text": self.texts[row], "metadata": self.metadata[row]}) + "\n"
+                    for row in live
+                ).encode("utf-8")
+                with open(self._data_file("rows.jsonl", generation), "wb") as handle:
+                    handle.write(lines)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                open(self._data_file("ops.jsonl", generation), "wb").close()
+
+            previous = manifest["generation"]
+            self._write_manifest(
+                {**manifest, "generation": generation, "rows": len(live), "rows_bytes": len(lines), "ops_bytes": 0}
+            )
+            for name in ("vectors.bin", "scales.bin", "rows.jsonl", "ops.jsonl", "hnsw.bin"):
+                try:
+                    os.remove(self._data_file(name, previous))
+                except FileNotFoundError:
+                    pass
+        logger.info("Compacted local store %s to %s rows (generation %s)", self.index_name, len(live), generation)
+        self.refresh()
+
+
+_INDICES: dict[str, LocalVectorIndex] = {}
+_INDICES_LOCK = threading.Lock()
+
+
+def get_local_index(index_name: str) -> LocalVectorIndex:
+    with _INDICES_LOCK:
+        if index_name not in _INDICES:
+            _INDICES[index_name] = LocalVectorIndex(index_name)
+        return _INDICES[index_name]
+
+
+class LocalVectorStore:
+    """Drop-in replacement for `SimpleElasticsearchVectorStore` backed by `LocalVectorIndex`."""
+
+    def __init__(self, *, index_name: str):
+        self.index_name = index_name
+        self.index = get_local_index(index_name)
+        self._embeddings = None
+
+    @property
+    def embeddings(self) -> OpenAIEmbeddings:
+        if self._embeddings is None:
+            self._embeddings = build_embeddings()
+        return self._embeddings
+
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Embed all queries with a single embeddings API call."""
+        if not queries:
+            return []
+        return self.embeddings.embed_documents(list(queries))
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 5,
+        *,
+        filters: dict[str, object] | None = None,
+        mode: str = "knn",
+        fusion: str = "rrf",
+        bm25_weight: float = DEFAULT_BM25_WEIGHT,
+    ) -> list[StoredDocument]:
+        return [
+            doc
+            for doc, _score in self.similarity_search_with_score(
+                query=query,
+                k=k,
+                filters=filters,
+                mode=mode,
+                fusion=fusion,
+                bm25_weight=bm25_weight,
+            )
+        ]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 5,
+        *,
+        filters: dict[str, object] | None = None,
+        mode: str = "knn",
+        fusion: str = "rrf",
+        bm25_weight: float = DEFAULT_BM25_WEIGHT,
+        query_vector: list[float] | None = None,
+    ) -> list[tuple[StoredDocument, float]]:
+        _validate_search_mode(mode, fusion)
+        vector = query_vector if query_vector is not None else self.embeddings.embed_query(query)
+        return self._search(self.index, query, vector, k, filters, mode=mode, fusion=fusion, bm25_weight=bm25_weight)
+
+    def get_documents(self, ids: list[str]) -> dict[str, StoredDocument]:
+        return self.index.get_documents([doc_id for doc_id in ids if doc_id])
+
+    def search_chunks_many(
+        self,
+        queries: list[str],
+        top_k: int = 5,
+        *,
+        filters: dict[str, object] | None = None,
+        caption_index: str | None = None,
+        mode: str = "knn",
+        fusion: str = "rrf",
+        bm25_weight: float = DEFAULT_BM25_WEIGHT,
+        query_vectors: list[list[float]] | None = None,
+    ) -> list[MultiQueryHits]:
+        """Same contract as the Elasticsearch store: one embedding call, results in query order."""
+        _validate_search_mode(mode, fusion)
+        queries, vectors = _non_empty_queries(queries, query_vectors)
+        if not queries:
+            return []
+
+        caption = get_local_index(caption_index) if caption_index else None
+        results = []
+        for query, vector in zip(queries, vectors or self.embed_queries(queries)):
+            options = {"mode": mode, "fusion": fusion, "bm25_weight": bm25_weight}
+            hits = MultiQueryHits(query=query, query_vector=vector)
+            hits.text_hits = self._search(self.index, query, vector, top_k, filters, **options)
+            if caption is not None:
+                hits.caption_hits = self._search(caption, query, vector, top_k, filters, **options)
+            results.append(hits)
+        return results
+
+    def _search(
+        self,
+        index: LocalVectorIndex,
+        query: str,
+        vector: list[float],
+        k: int,
+        filters: dict[str, object] | None,
+        *,
+        mode: str,
+        fusion: str,
+        bm25_weight: float,
+    ) -> list[tuple[StoredDocument, float]]:
+        num_candidates = max(25, k * 5)
+        if mode == "knn":
+            return [index.document(row, score) for row, score in index.knn(vector, k, filters, num_candidates=num_candidates)]
+
+        window = k * 2
+        rankings = [
+            [index.document(row, score) for row, score in index.bm25(query, window, filters)],
+            [index.document(row, score) for row, score in index.knn(vector, window, filters, num_candidates=max(25, window * 5))],
+        ]
+        if fusion == "weighted":
+            return weighted_score_fusion(rankings, [bm25_weight, max(0.0, 1.0 - bm25_weight)], k=k)
+        return reciprocal_rank_fusion(rankings, k=k)
@@ -0,0 +1,81 @@
+"""Maximal marginal relevance (MMR) diversification of retrieved evidence.
+
+Overlapping chunk windows and passages repeated across editions make the top
+kNN hits near-duplicates of each other. MMR picks, one at a time, the hit that
+maximises `lambda * relevance - (1 - lambda) * max_similarity_to_picked`, with
+both terms computed as cosine similarities in one NumPy matrix product.
+"""
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+
+
+DEFAULT_MMR_LAMBDA = 0.7
+# Candidates fetched per requested hit when MMR is enabled.
+MMR_FETCH_FACTOR = 3
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def mmr_select(
+    query_vectors: Sequence[Sequence[float]] | np.ndarray,
+    doc_vectors: Sequence[Sequence[float]] | np.ndarray,
+    *,
+    k: int,
+    lambda_mult: float = DEFAULT_MMR_LAMBDA,
+) -> list[int]:
+    """Return the indices of up to `k` rows of `doc_vectors` in MMR order.
+
+    With several query vectors a document's relevance is its best similarity to
+    any of them, so evidence for every question stays eligible.
+    """
+    docs = np.asarray(doc_vectors, dtype=np.float32)
+    if docs.ndim != 2 or not len(docs) or k <= 0:
+        return []
+    queries = np.asarray(query_vectors, dtype=np.float32).reshape(-1, docs.shape[1])
+
+    docs = _normalize_rows(docs)
+    relevance = (docs @ _normalize_rows(queries).T).max(axis=1)
+    similarity = docs @ docs.T
+
+    selected: list[int] = []
+    redundancy = np.full(len(docs), -np.inf, dtype=np.float32)
+    available = np.ones(len(docs), dtype=bool)
+    for _ in range(min(k, len(docs))):
+        if selected:
+            scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+    return selected
+
+
+def mmr_rerank(
+    hits: list[tuple[object, float]],
+    query_vectors: Sequence[Sequence[float]] | np.ndarray,
+    *,
+    k: int,
+    lambda_mult: float = DEFAULT_MMR_LAMBDA,
+) -> list[tuple[object, float]]:
+    """Diversify `(StoredDocument, score)` hits; hits without a vector keep their rank after the rest."""
+    with_vectors = [index for index, (doc, _score) in enumerate(hits) if getattr(doc, "vector", None) is not None]
+    if not with_vectors:
+        return hits[:k]
+    order = mmr_select(
+        query_vectors,
+        [hits[index][0].vector for index in with_vectors],
+        k=k,
+        lambda_mult=lambda_mult,
+    )
+    picked = [with_vectors[index] for index in order]
+    has_vector = set(with_vectors)
+    without_vectors = [index for index in range(len(hits)) if index not in has_vector]
+    return [hits[index] for index in picked + without_vectors][:k]
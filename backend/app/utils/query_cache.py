@@ -0,0 +1,237 @@
+"""In-process response cache for `/query`, keyed by query text or embedding and scope.
+
+Users often send near-identical questions ("what is X", "explain X") to the
+same project. A lookup first tries the normalized query text, then the cached
+query embedding with the highest cosine similarity (at least
+QUERY_CACHE_SIMILARITY) among entries with the same scope and search options.
+The exact lookup saves the embedding call and both searches. The semantic
+lookup still needs the embedding, but saves both searches.
+
+Entries are dropped when a document in their scope is added, re-indexed,
+deleted or moved (`invalidate_documents`), after QUERY_CACHE_TTL_SECONDS, or
+least-recently-used beyond QUERY_CACHE_MAX_ENTRIES. When the change is applied
+by asynchronous Elasticsearch tasks, the affected scopes are not cached until
+the tasks have finished, and are invalidated again then. The backend runs as a single
+uvicorn process, so a process-local cache sees every invalidation.
+"""
+import copy
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+
+from app.models.research_tree import ResearchScope
+from app.utils.search_index import wait_for_tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+QUERY_CACHE_SIMILARITY = float(os.getenv("QUERY_CACHE_SIMILARITY", "0.92"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+# Longest wait for the update_by_query tasks of a document move before caching resumes anyway.
+QUERY_CACHE_SYNC_WAIT_SECONDS = float(os.getenv("QUERY_CACHE_SYNC_WAIT_SECONDS", "900"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of `query`."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+def scope_cache_key(scope: ResearchScope) -> str:
+    if scope.mode == "document" and scope.document_id:
+        return f"document:{scope.document_id}"
+    if scope.mode == "project" and scope.project_id:
+        return f"project:{scope.project_id}"
+    return "all"
+
+
+@dataclass
+class _Entry:
+    bucket: tuple
+    normalized: str
+    vector: np.ndarray
+    response: dict
+    embed_ms: float
+    search_ms: float
+    created_at: float
+
+
+class QueryResponseCache:
+    def __init__(
+        self,
+        *,
+        similarity: float = QUERY_CACHE_SIMILARITY,
+        ttl: float = QUERY_CACHE_TTL_SECONDS,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+    ):
+        self.similarity = similarity
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "invalidated": 0}
+        self._saved_ms = 0.0
+        # Bumped by every invalidation; a response computed across one is not stored.
+        self.generation = 0
+        # Scope keys with pending index updates (count per key); their responses are not stored.
+        self._held: Counter[str] = Counter()
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.created_at > self.ttl
+
+    def _hit(self, key: tuple, kind: str, lookup_started: float, similarity: float) -> tuple[dict, dict]:
+        entry = self._entries[key]
+        self._entries.move_to_end(key)
+        self._stats[f"{kind}_hits"] += 1
+        # A semantic hit has already paid for the query embedding.
+        avoided_ms = entry.search_ms + (entry.embed_ms if kind == "exact" else 0.0)
+        self._saved_ms += max(0.0, avoided_ms - (time.perf_counter() - lookup_started) * 1000.0)
+        return copy.deepcopy(entry.response), {"hit": kind, "similarity": similarity}
+
+    def lookup_exact(self, bucket: tuple, normalized: str) -> tuple[dict, dict] | None:
+        """Cached response for the same normalized text, plus cache info; counts a lookup."""
+        started = time.perf_counter()
+        with self._lock:
+            self._stats["lookups"] += 1
+            key = (bucket, normalized)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                del self._entries[key]
+                return None
+            return self._hit(key, "exact", started, 1.0)
+
+    def lookup_similar(self, bucket: tuple, vector: list[float]) -> tuple[dict, dict] | None:
+        """Cached response whose query embedding is closest to `vector`, if similar enough."""
+        started = time.perf_counter()
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry.bucket == bucket and not self._expired(entry)]
+            if not keys:
+                return None
+            query = _unit(vector)
+            scores = np.stack([self._entries[key].vector for key in keys]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                return None
+            return self._hit(keys[best], "semantic", started, float(scores[best]))
+
+    def store(
+        self,
+        bucket: tuple,
+        normalized: str,
+        vector: list[float],
+        response: dict,
+        *,
+        embed_ms: float,
+        search_ms: float,
+        generation: int,
+    ) -> None:
+        with self._lock:
+            if generation != self.generation or self._held[bucket[0]]:
+                return
+            key = (bucket, normalized)
+            self._entries[key] = _Entry(
+                bucket=bucket,
+                normalized=normalized,
+                vector=_unit(vector),
+                response=copy.deepcopy(response),
+                embed_ms=embed_ms,
+                search_ms=search_ms,
+                created_at=time.monotonic(),
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_scopes(self, scope_keys: set[str]) -> int:
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.bucket[0] in scope_keys]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidated"] += len(stale)
+            self.generation += 1
+            return len(stale)
+
+    def hold_scopes(self, scope_keys: set[str]) -> None:
+        with self._lock:
+            self._held.update(scope_keys)
+
+    def release_scopes(self, scope_keys: set[str]) -> None:
+        with self._lock:
+            self._held.subtract(scope_keys)
+            self._held = +self._held
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats["invalidated"] += len(self._entries)
+            self._entries.clear()
+            self.generation += 1
+
+    def report(self) -> dict:
+        with self._lock:
+            hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+            lookups = self._stats["lookups"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": hits / lookups if lookups else None,
+                "saved_ms": self._saved_ms,
+                "similarity_threshold": self.similarity,
+            }
+
+
+def _unit(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    return array / max(float(np.linalg.norm(array)), 1e-12)
+
+
+QUERY_CACHE = QueryResponseCache()
+
+
+def invalidate_documents(
+    *,
+    document_ids: list[str | None] = (),
+    project_ids: list[str | None] = (),
+    pending_tasks: Iterable[str | None] = (),
+) -> int:
+    """Drop cached responses whose scope contains any of these documents (and every "all" scope).
+
+    `pending_tasks` are Elasticsearch task ids still applying the change (e.g. the
+    scope sync of a moved document). Until they finish, responses for these scopes
+    are not cached; then the scopes are invalidated once more.
+    """
+    keys = {"all"}
+    keys.update(f"document:{document_id}" for document_id in document_ids if document_id)
+    keys.update(f"project:{project_id}" for project_id in project_ids if project_id)
+    task_ids = [task_id for task_id in pending_tasks if task_id]
+    if task_ids:
+        QUERY_CACHE.hold_scopes(keys)
+        threading.Thread(
+            target=_invalidate_after_tasks,
+            args=(keys, task_ids),
+            name="query-cache-sync",
+            daemon=True,
+        ).start()
+    return QUERY_CACHE.invalidate_scopes(keys)
+
+
+def _invalidate_after_tasks(keys: set[str], task_ids: list[str]) -> None:
+    try:
+        if not wait_for_tasks(task_ids, timeout=QUERY_CACHE_SYNC_WAIT_SECONDS):
+            logger.warning("Scope sync tasks %s still running; caching %s again", task_ids, sorted(keys))
+    finally:
+        QUERY_CACHE.invalidate_scopes(keys)
+        QUERY_CACHE.release_scopes(keys)
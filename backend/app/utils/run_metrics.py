@@ -0,0 +1,265 @@
+"""Per-answer-run accounting of LLM, embedding, Elasticsearch and database calls.
+
+Inside `run_metrics()` every instrumented call is attributed to the current
+stage: the pipeline's sequential stages are switched with `begin_stage` (the
+progress strings of the answer run), concurrent work such as one section uses
+`with stage(...)`. Stage names live in a context variable, so section threads
+(which run in a copy of the caller's context) record into their own section.
+
+Per stage and call kind, calls, latency, input/output tokens, payload bytes and
+an estimated cost are kept. LLM tokens come from the provider's usage metadata
+when present and are counted with tiktoken otherwise; embedding tokens are
+always counted with tiktoken. Prices per million tokens default to
+`DEFAULT_PRICES` and can be overridden with MODEL_PRICES_JSON
+(`{"model": [input, output]}`).
+
+Hooks: the gateway records LLM calls, `embedding_config.build_embeddings`
+returns metered embeddings, `instrument_es` wraps an Elasticsearch client's
+transport and `instrument_engine` listens to SQLAlchemy cursor events.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+
+CALL_KINDS = ("llm", "embedding", "es", "db")
+UNSTAGED = "Other"
+
+# USD per million (input, output) tokens.
+DEFAULT_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+MODEL_PRICES = {**DEFAULT_PRICES, **{model: tuple(prices) for model, prices in json.loads(os.getenv("MODEL_PRICES_JSON", "{}")).items()}}
+
+
+def estimate_cost(model: str | None, input_tokens: int, output_tokens: int) -> float:
+    prices = MODEL_PRICES.get(model or "")
+    if prices is None:
+        return 0.0
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    ms: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    bytes: int = 0
+    cost_usd: float = 0.0
+    cached: int = 0
+
+    def add(self, other: "CallStats") -> None:
+        for name, value in asdict(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["ms"] = round(self.ms, 1)
+        data["cost_usd"] = round(self.cost_usd, 6)
+        return data
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    wall_ms: float = 0.0
+    kinds: dict[str, CallStats] = field(default_factory=lambda: {kind: CallStats() for kind in CALL_KINDS})
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "wall_ms": round(self.wall_ms, 1),
+            **{kind: stats.to_dict() for kind, stats in self.kinds.items() if stats.calls},
+            "cost_usd": round(sum(stats.cost_usd for stats in self.kinds.values()), 6),
+        }
+
+
+class RunMetrics:
+    def __init__(self) -> None:
+        self.stages: dict[str, StageMetrics] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._sequential: tuple[str, float] | None = None
+
+    def _stage(self, name: str) -> StageMetrics:
+        stage_metrics = self.stages.get(name)
+        if stage_metrics is None:
+            stage_metrics = self.stages[name] = StageMetrics(name)
+        return stage_metrics
+
+    def record(self, stage_name: str, kind: str, stats: CallStats) -> None:
+        with self._lock:
+            self._stage(stage_name).kinds[kind].add(stats)
+
+    def add_wall(self, stage_name: str, ms: float) -> None:
+        with self._lock:
+            self._stage(stage_name).wall_ms += ms
+
+    def begin_sequential(self, name: str) -> None:
+        self.end_sequential()
+        self._sequential = (name, time.perf_counter())
+        with self._lock:
+            self._stage(name)
+
+    def end_sequential(self) -> None:
+        if self._sequential is not None:
+            name, started = self._sequential
+            self.add_wall(name, (time.perf_counter() - started) * 1000)
+            self._sequential = None
+
+    def to_dict(self) -> dict:
+        """Snapshot; the running sequential stage reports its wall time so far."""
+        sequential = self._sequential
+        with self._lock:
+            stages = [stage_metrics.to_dict() for stage_metrics in self.stages.values()]
+            if sequential is not None:
+                for entry in stages:
+                    if entry["stage"] == sequential[0]:
+                        entry["wall_ms"] = round(entry["wall_ms"] + (time.perf_counter() - sequential[1]) * 1000, 1)
+            totals = {kind: CallStats() for kind in CALL_KINDS}
+            for stage_metrics in self.stages.values():
+                for kind, stats in stage_metrics.kinds.items():
+                    totals[kind].add(stats)
+        return {
+            "wall_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "stages": stages,
+            "totals": {kind: stats.to_dict() for kind, stats in totals.items()},
+            "cost_usd": round(sum(stats.cost_usd for stats in totals.values()), 6),
+        }
+
+
+_run: ContextVar[RunMetrics | None] = ContextVar("run_metrics", default=None)
+_stage_name: ContextVar[str | None] = ContextVar("run_metrics_stage", default=None)
+
+
+def active_run_metrics() -> RunMetrics | None:
+    return _run.get()
+
+
+@contextmanager
+def run_metrics():
+    """Collect metrics for the `with` block; re-entering while a run is active yields that run."""
+    current = _run.get()
+    if current is not None:
+        yield current
+        return
+    metrics = RunMetrics()
+    run_token = _run.set(metrics)
+    stage_token = _stage_name.set(None)
+    try:
+        yield metrics
+    finally:
+        metrics.end_sequential()
+        _stage_name.reset(stage_token)
+        _run.reset(run_token)
+
+
+def begin_stage(name: str) -> None:
+    """Start the next sequential stage of the active run; the previous one ends here."""
+    metrics = _run.get()
+    if metrics is None:
+        return
+    metrics.begin_sequential(name)
+    _stage_name.set(name)
+
+
+@contextmanager
+def stage(name: str):
+    """Attribute calls in the block (and threads started from it) to `name`."""
+    metrics = _run.get()
+    if metrics is None:
+        yield
+        return
+    token = _stage_name.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_wall(name, (time.perf_counter() - started) * 1000)
+        _stage_name.reset(token)
+
+
+def record(
+    kind: str,
+    *,
+    ms: float,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    bytes: int = 0,
+    model: str | None = None,
+    cached: bool = False,
+) -> None:
+    metrics = _run.get()
+    if metrics is None:
+        return
+    stats = CallStats(
+        calls=1,
+        ms=ms,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        bytes=bytes,
+        cost_usd=0.0 if cached else estimate_cost(model, input_tokens, output_tokens),
+        cached=int(cached),
+    )
+    metrics.record(_stage_name.get() or UNSTAGED, kind, stats)
+
+
+def _payload_bytes(body) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    if isinstance(body, (list, tuple)):
+        return sum(_payload_bytes(item) + 1 for item in body)
+    return len(json.dumps(body, default=str))
+
+
+def instrument_es(client) -> None:
+    """Record every request sent through `client` (and its `.options()` copies, which share the transport)."""
+    transport = client.transport
+    if getattr(transport, "_run_metrics_instrumented", False):
+        return
+    perform_request = transport.perform_request
+
+    def metered_perform_request(method, target, *args, **kwargs):
+        if _run.get() is None:
+            return perform_request(method, target, *args, **kwargs)
+        started = time.perf_counter()
+        response = perform_request(method, target, *args, **kwargs)
+        headers = getattr(getattr(response, "meta", None), "headers", None) or {}
+        record(
+            "es",
+            ms=(time.perf_counter() - started) * 1000,
+            bytes=_payload_bytes(kwargs.get("body")) + int(headers.get("content-length") or 0),
+        )
+        return response
+
+    transport.perform_request = metered_perform_request
+    transport._run_metrics_instrumented = True
+
+
+def instrument_engine(engine) -> None:
+    """Record every statement executed on `engine`."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _run.get() is not None and context is not None:
+            context._run_metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_run_metrics_started", None)
+        if started is not None:
+            record("db", ms=(time.perf_counter() - started) * 1000, bytes=len(statement))
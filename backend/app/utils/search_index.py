@@ -1,9 +1,126 @@
-from collections.abc import Iterable
+import logging
+import os
+import time
+from collections.abc import Callable, Iterable
 
 from elasticsearch import Elasticsearch
 
+from app.utils.run_metrics import instrument_es
+
+
+logger = logging.getLogger(__name__)
 
 es = Elasticsearch("http://elasticsearch:9200")
+instrument_es(es)
+
+SEARCH_INDICES = ("pdf_chunks", "captions", "documents")
+
+# "elasticsearch" (default) or "local" for the in-process store in app.utils.local_vectorstore.
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "elasticsearch").lower()
+
+
+def use_local_store() -> bool:
+    return VECTOR_STORE_BACKEND == "local"
+
+# updated_at (epoch ms) marks the row as changed for pdf_worker's app.reindex catch-up pass.
+_SYNC_SCOPE_SCRIPT = (
+    "ctx._source.document_id = params.document_id; "
+    "ctx._source.project_id = params.project_id; "
+    "ctx._source.updated_at = params.updated_at;"
+)
+# Batched variant: params.scopes maps source_pdf -> {document_id, project_id}; unchanged rows are no-ops.
+_SYNC_SCOPE_MAP_SCRIPT = (
+    "def scope = params.scopes[ctx._source.source_pdf]; "
+    "if (scope == null || (ctx._source.document_id == scope.document_id "
+    "&& ctx._source.project_id == scope.project_id)) { ctx.op = 'noop'; return; } "
+    "ctx._source.document_id = scope.document_id; "
+    "ctx._source.project_id = scope.project_id; "
+    "ctx._source.updated_at = params.updated_at;"
+)
+SCOPE_SYNC_BATCH_SIZE = int(os.getenv("SCOPE_SYNC_BATCH_SIZE", "200"))
+SCOPE_SYNC_TASK_TIMEOUT_SECONDS = float(os.getenv("SCOPE_SYNC_TASK_TIMEOUT_SECONDS", "3600"))
+
+
+# Indices created with a custom routing field (pdf_worker ES_ROUTING_FIELD / app.reindex --routing-field)
+# record it in their mapping's _meta. Searches whose filters pin that field to a few values are
+# sent only to those values' shards instead of fanning out to every shard.
+ROUTING_MAX_VALUES = int(os.getenv("ES_ROUTING_MAX_VALUES", "8"))
+ROUTING_FIELD_CACHE_SECONDS = 300.0
+_routing_fields: dict[str, tuple[float, str | None]] = {}
+
+
+# Chunks and captions indexed before document_id/project_id were denormalized lack them until
+# POST /internal/search/sync_scope_fields has run; scoped searches filter on source_pdf meanwhile.
+SCOPED_INDICES = ("pdf_chunks", "captions")
+SCOPE_FIELDS_CHECK_SECONDS = 300.0
+_scope_fields_state = {"backfilled": False, "checked_at": None}
+
+
+def scope_fields_backfilled() -> bool:
+    """Whether every chunk and caption carries document_id (checked at most every SCOPE_FIELDS_CHECK_SECONDS).
+
+    Once true it stays true for the process: new rows are always written with the ids.
+    """
+    if _scope_fields_state["backfilled"] or use_local_store():
+        return True
+    checked_at = _scope_fields_state["checked_at"]
+    if checked_at is not None and time.monotonic() - checked_at < SCOPE_FIELDS_CHECK_SECONDS:
+        return False
+    try:
+        missing = es.count(
+            index=list(SCOPED_INDICES),
+            query={"bool": {"must_not": [{"exists": {"field": "document_id"}}]}},
+            ignore_unavailable=True,
+        )["count"]
+        _scope_fields_state["backfilled"] = missing == 0
+        if missing:
+            logger.warning(
+                "%s indexed rows lack document_id; scoped searches filter on source_pdf until "
+                "POST /internal/search/sync_scope_fields has run",
+                missing,
+            )
+    except Exception:
+        logger.warning("Could not check the scope fields of %s", ", ".join(SCOPED_INDICES), exc_info=True)
+    _scope_fields_state["checked_at"] = time.monotonic()
+    return _scope_fields_state["backfilled"]
+
+
+def index_routing_field(index_name: str, client: Elasticsearch | None = None) -> str | None:
+    """Routing field of `index_name` (cached); None for default `_id` routing or when unknown."""
+    cached = _routing_fields.get(index_name)
+    if cached and time.monotonic() - cached[0] < ROUTING_FIELD_CACHE_SECONDS:
+        return cached[1]
+    field = None
+    try:
+        mappings = (client or es).indices.get_mapping(index=index_name)
+        fields = {(item.get("mappings", {}).get("_meta") or {}).get("routing_field") for item in mappings.values()}
+        # During a reindex the alias briefly covers two indices; only route when they agree.
+        field = fields.pop() if len(fields) == 1 else None
+    except Exception:
+        logger.warning("Could not read the routing field of %s; searching all shards", index_name, exc_info=True)
+    _routing_fields[index_name] = (time.monotonic(), field)
+    return field
+
+
+def search_routing(
+    index_name: str,
+    filters: dict[str, object] | None,
+    client: Elasticsearch | None = None,
+) -> str | None:
+    """`routing` for a search of `index_name` with `filters`, or None to search every shard."""
+    if not filters:
+        return None
+    field = index_routing_field(index_name, client)
+    value = filters.get(field) if field else None
+    if isinstance(value, str):
+        values = [value] if value else []
+    elif isinstance(value, Iterable):
+        values = sorted({str(item) for item in value if item})
+    else:
+        values = []
+    if not values or len(values) > ROUTING_MAX_VALUES:
+        return None
+    return ",".join(values)
 
 
 def build_filter_clauses(filters: dict[str, object] | None) -> list[dict]:
@@ -20,6 +137,10 @@ def build_filter_clauses(filters: dict[str, object] | None) -> list[dict]:
                 clauses.append({"term": {field: value}})
             continue
 
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            clauses.append({"term": {field: value}})
+            continue
+
         if isinstance(value, Iterable):
             values = [item for item in value if item]
             if not values:
@@ -32,11 +153,47 @@ def build_filter_clauses(filters: dict[str, object] | None) -> list[dict]:
     return clauses
 
 
+def build_filter_predicate(filters: dict[str, object] | None) -> Callable[[dict], bool] | None:
+    """Python equivalent of `build_filter_clauses` for stored metadata dicts.
+
+    Same semantics as the `term`/`terms` clauses: every field must match, a list
+    value matches any of its items, and a list-valued field (e.g. `pages`) matches
+    when any of its elements does. Returns None when nothing filters.
+    """
+    conditions: list[tuple[str, set]] = []
+    for clause in build_filter_clauses(filters):
+        if "term" in clause:
+            field, value = next(iter(clause["term"].items()))
+            conditions.append((field, {value}))
+        else:
+            field, values = next(iter(clause["terms"].items()))
+            conditions.append((field, set(values)))
+    if not conditions:
+        return None
+
+    def predicate(metadata: dict) -> bool:
+        for field, allowed in conditions:
+            value = metadata.get(field)
+            if isinstance(value, list):
+                if allowed.isdisjoint(value):
+                    return False
+            elif value not in allowed:
+                return False
+        return True
+
+    return predicate
+
+
 def delete_by_filters(index_name: str, filters: dict[str, object] | None) -> int:
     clauses = build_filter_clauses(filters)
     if not clauses:
         return 0
 
+    if use_local_store():
+        from app.utils.local_vectorstore import get_local_index
+
+        return get_local_index(index_name).delete_where(filters)
+
     response = es.delete_by_query(
         index=index_name,
         query={"bool": {"filter": clauses}},
@@ -45,3 +202,134 @@ def delete_by_filters(index_name: str, filters: dict[str, object] | None) -> int
         wait_for_completion=True,
     )
     return int(response.get("deleted", 0))
+
+
+def wait_for_tasks(task_ids: Iterable[str | None], *, timeout: float, poll_seconds: float = 2.0) -> bool:
+    """Poll Elasticsearch tasks until all completed or `timeout` passed; True when all completed."""
+    pending = [task_id for task_id in task_ids if task_id]
+    deadline = time.monotonic() + timeout
+    while pending:
+        still_running = []
+        for task_id in pending:
+            try:
+                if not es.tasks.get(task_id=task_id).get("completed"):
+                    still_running.append(task_id)
+            except Exception:
+                logger.warning("Could not read the status of task %s", task_id, exc_info=True)
+                still_running.append(task_id)
+        pending = still_running
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(poll_seconds)
+    return not pending
+
+
+def sync_document_scope_fields(
+    filename: str,
+    *,
+    document_id: str,
+    project_id: str | None,
+    index_names: Iterable[str] = SEARCH_INDICES,
+) -> dict[str, str | None]:
+    """Start async `update_by_query` tasks that stamp document/project ids on a document's hits.
+
+    Only entries whose ids are stale are rewritten, so re-running this is cheap.
+    Returns the Elasticsearch task id per index.
+    """
+    stale_project = (
+        {"bool": {"must_not": [{"term": {"project_id": project_id}}]}}
+        if project_id
+        else {"exists": {"field": "project_id"}}
+    )
+    query = {
+        "bool": {
+            "filter": [{"term": {"source_pdf": filename}}],
+            "should": [
+                {"bool": {"must_not": [{"term": {"document_id": document_id}}]}},
+                stale_project,
+            ],
+            "minimum_should_match": 1,
+        }
+    }
+
+    tasks: dict[str, str | None] = {}
+    if use_local_store():
+        from app.utils.local_vectorstore import get_local_index
+
+        for index_name in index_names:
+            get_local_index(index_name).update_where(
+                {"source_pdf": filename},
+                {"document_id": document_id, "project_id": project_id},
+            )
+            tasks[index_name] = None
+        return tasks
+
+    for index_name in index_names:
+        response = es.update_by_query(
+            index=index_name,
+            query=query,
+            script={
+                "source": _SYNC_SCOPE_SCRIPT,
+                "lang": "painless",
+                "params": {
+                    "document_id": document_id,
+                    "project_id": project_id,
+                    "updated_at": int(time.time() * 1000),
+                },
+            },
+            conflicts="proceed",
+            refresh=True,
+            wait_for_completion=False,
+        )
+        tasks[index_name] = response.get("task")
+    return tasks
+
+
+def sync_scope_fields_batched(
+    scopes: Iterable[tuple[str, str, str | None]],
+    *,
+    index_names: Iterable[str] = SEARCH_INDICES,
+    batch_size: int = SCOPE_SYNC_BATCH_SIZE,
+) -> dict[str, int]:
+    """Stamp document/project ids on every `(filename, document_id, project_id)` in `scopes`.
+
+    Runs one `update_by_query` per index and batch of documents, one at a time, so a
+    library-wide backfill never queues more than a single task on the cluster.
+    Returns the number of batches run per index.
+    """
+    scopes = list(scopes)
+    batches = [scopes[start : start + max(1, batch_size)] for start in range(0, len(scopes), max(1, batch_size))]
+    runs: dict[str, int] = {}
+    if use_local_store():
+        for filename, document_id, project_id in scopes:
+            sync_document_scope_fields(filename, document_id=document_id, project_id=project_id, index_names=index_names)
+        return {index_name: len(batches) for index_name in index_names}
+
+    for index_name in index_names:
+        runs[index_name] = 0
+        for batch in batches:
+            response = es.update_by_query(
+                index=index_name,
+                query={"bool": {"filter": [{"terms": {"source_pdf": [filename for filename, _, _ in batch]}}]}},
+                script={
+                    "source": _SYNC_SCOPE_MAP_SCRIPT,
+                    "lang": "painless",
+                    "params": {
+                        "scopes": {
+                            filename: {"document_id": document_id, "project_id": project_id}
+                            for filename, document_id, project_id in batch
+                        },
+                        "updated_at": int(time.time() * 1000),
+                    },
+                },
+                conflicts="proceed",
+                refresh=True,
+                wait_for_completion=False,
+                ignore_unavailable=True,
+            )
+            if not wait_for_tasks([response.get("task")], timeout=SCOPE_SYNC_TASK_TIMEOUT_SECONDS):
+                raise RuntimeError(f"Scope sync of {index_name} did not finish within {SCOPE_SYNC_TASK_TIMEOUT_SECONDS:.0f}s")
+            runs[index_name] += 1
+    # Re-check on the next scoped search instead of waiting out SCOPE_FIELDS_CHECK_SECONDS.
+    _scope_fields_state["checked_at"] = None
+    return runs
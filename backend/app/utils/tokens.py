@@ -0,0 +1,49 @@
+"""Token counting with one cached tiktoken encoder per model.
+
+tiktoken is optional: without it counts fall back to ~4 characters per token.
+"""
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=16)
+def encoding_for(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    if not text:
+        return 0
+    encoding = encoding_for(model)
+    if encoding is None:
+        return max(1, -(-len(text) // CHARS_PER_TOKEN))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """Longest prefix of `text` within `max_tokens`, cut back to a word boundary."""
+    if max_tokens <= 0:
+        return ""
+    encoding = encoding_for(model)
+    if encoding is None:
+        head = text[: max_tokens * CHARS_PER_TOKEN]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        head = encoding.decode(tokens[:max_tokens])
+    if len(head) < len(text) and " " in head:
+        head = head.rsplit(" ", 1)[0]
+    return head.rstrip()
@@ -0,0 +1,458 @@
+"""Per-project topic maps: k-means clusters over a project's chunk vectors.
+
+Without a map, outline generation rediscovers a project's structure on every
+run from a small root retrieval sample. `build_topic_map` clusters every coarse
+(TOPIC_MAP_CHUNK_SIZE) chunk of a project once, using spherical mini-batch
+k-means over a disk-backed float32 matrix. It labels the clusters and stores
+them in `project_topics` with a hash of the project's document set. A
+project-scoped answer run ranks the stored topics against its query. The
+closest topics seed the outline prompt and part of the root evidence
+(`project_topic_seeds`).
+
+Maps are built off the request path. `TOPIC_MAP_SCHEDULER.schedule()` is called
+whenever a project's document set changes. The build starts after
+TOPIC_MAP_DEBOUNCE_SECONDS without further changes, so a batch upload triggers
+one build. Maps can also be built by hand with
+`python -m app.utils.topic_map [--project ID ...]`.
+"""
+import argparse
+import hashlib
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Iterable, List
+from uuid import UUID
+
+import numpy as np
+from langchain.output_parsers import PydanticOutputParser
+from langchain.prompts import PromptTemplate
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.db.db import SessionLocal
+from app.db.models.document_orm import Document
+from app.db.models.project_orm import Project
+from app.db.models.project_topic_orm import ProjectTopic
+from app.models.research_tree import ResearchScope
+from app.utils.chunk_export import iter_chunk_batches
+from app.utils.llm_gateway import complete
+from app.utils.search_index import scope_fields_backfilled, use_local_store
+from app.utils.vectorstore import TEXT_INDEX, StoredDocument, get_vectorstore
+
+
+logger = logging.getLogger(__name__)
+
+TOPIC_MAP_CHUNK_SIZE = int(os.getenv("TOPIC_MAP_CHUNK_SIZE", "1600"))
+TOPIC_MAP_MIN_CHUNKS = int(os.getenv("TOPIC_MAP_MIN_CHUNKS", "40"))
+TOPIC_MAP_MAX_TOPICS = int(os.getenv("TOPIC_MAP_MAX_TOPICS", "24"))
+TOPIC_MAP_DEBOUNCE_SECONDS = float(os.getenv("TOPIC_MAP_DEBOUNCE_SECONDS", "60"))
+TOPIC_MAP_LABEL_MODEL = os.getenv("TOPIC_MAP_LABEL_MODEL", "gpt-4o-mini")
+
+PAGE_SIZE = 1000
+KMEANS_BATCH_SIZE = 1024
+KMEANS_INIT_SAMPLE = 10_000
+# Independent seedings per build; a single mini-batch run can keep two centers in one cluster.
+KMEANS_INITS = 3
+# Mini-batch steps cover about this many passes over the data, within the step bounds.
+KMEANS_EPOCHS = 3
+KMEANS_MIN_STEPS = 20
+KMEANS_MAX_STEPS = 300
+ASSIGN_BLOCK_ROWS = 65536
+# Clusters smaller than this are dropped rather than stored as topics.
+MIN_TOPIC_CHUNKS = 3
+REPRESENTATIVE_CHUNKS = 5
+KEYWORDS_PER_TOPIC = 8
+# Chunks per topic (closest to the centroid first) used for keywords.
+KEYWORD_SAMPLE_CHUNKS = 500
+LABEL_EXCERPT_CHARS = 300
+
+_KEYWORD_TOKEN = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+
+
+def document_signature(db: Session, project_id) -> str:
+    """Hash of the project's document set; a stored map is current while this matches."""
+    filenames = sorted(
+        filename
+        for (filename,) in db.query(Document.filename).filter(Document.project_id == project_id).all()
+    )
+    return hashlib.sha1("\n".join(filenames).encode("utf-8")).hexdigest()
+
+
+def _chunk_blocks(filters: dict[str, object]) -> Iterable[tuple[list[str], list[str], np.ndarray]]:
+    if use_local_store():
+        from app.utils.local_vectorstore import get_local_index
+
+        yield from get_local_index(TEXT_INDEX).scan(filters)
+        return
+
+    for rows in iter_chunk_batches(TEXT_INDEX, filters, fields=["text"], include_vectors=True, batch_size=PAGE_SIZE):
+        rows = [row for row in rows if row.get("vector")]
+        if rows:
+            yield (
+                [row["id"] for row in rows],
+                [row.get("text") or "" for row in rows],
+                np.asarray([row["vector"] for row in rows], dtype=np.float32),
+            )
+
+
+def load_chunk_vectors(
+    filters: dict[str, object],
+    directory: str,
+) -> tuple[list[str], list[str], np.ndarray | None]:
+    """Ids, texts and a read-only memmap of the unit-length vectors of every matching chunk."""
+    path = os.path.join(directory, "vectors.f32")
+    ids, texts, dims = [], [], None
+    with open(path, "wb") as handle:
+        for block_ids, block_texts, vectors in _chunk_blocks(filters):
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            handle.write(vectors.astype(np.float32, copy=False).tobytes())
+            ids.extend(block_ids)
+            texts.extend(block_texts)
+            dims = vectors.shape[1]
+    if not ids:
+        return [], [], None
+    return ids, texts, np.memmap(path, dtype=np.float32, mode="r", shape=(len(ids), dims))
+
+
+def choose_topic_count(chunk_count: int) -> int:
+    """About sqrt(n / 4) topics, at least 2 and at most TOPIC_MAP_MAX_TOPICS."""
+    count = int(round(math.sqrt(chunk_count / 4)))
+    return max(2, min(TOPIC_MAP_MAX_TOPICS, count, chunk_count // MIN_TOPIC_CHUNKS))
+
+
+def _kmeans_plus_plus(sample: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """Greedy k-means++ seeding: of 2 + log(k) sampled candidates, keep the one that lowers the cost most."""
+    trials = 2 + int(math.log(k))
+    centers = [sample[rng.integers(len(sample))]]
+    distance = np.maximum(1.0 - sample @ centers[0], 0.0)
+    for _ in range(1, k):
+        weights = distance ** 2
+        if weights.sum() <= 0:
+            # Fewer distinct vectors than k.
+            break
+        candidates = rng.choice(len(sample), size=trials, p=weights / weights.sum())
+        distances = np.minimum(distance, np.maximum(1.0 - sample[candidates] @ sample.T, 0.0))
+        best = int(np.argmin((distances ** 2).sum(axis=1)))
+        centers.append(sample[candidates[best]])
+        distance = distances[best]
+    return np.stack(centers).astype(np.float32)
+
+
+def _member_sums(rows: np.ndarray, nearest: np.ndarray, k: int) -> np.ndarray:
+    """Per-center sums of `rows`, as one matrix product with the one-hot assignment."""
+    return np.eye(k, dtype=np.float32)[nearest].T @ rows
+
+
+def minibatch_kmeans(
+    vectors: np.ndarray,
+    k: int,
+    *,
+    batch_size: int = KMEANS_BATCH_SIZE,
+    n_init: int = KMEANS_INITS,
+    seed: int = 0,
+) -> np.ndarray:
+    """Unit-length centers of spherical mini-batch k-means (Sculley 2010) over unit `vectors`.
+
+    `vectors` may be a memmap; each step reads one sorted random batch of rows.
+    Runs `n_init` seedings and keeps the centers closest to the seeding sample.
+    """
+    rng = np.random.default_rng(seed)
+    rows = len(vectors)
+    sample = np.asarray(vectors[np.sort(rng.choice(rows, size=min(rows, KMEANS_INIT_SAMPLE), replace=False))])
+    steps = max(KMEANS_MIN_STEPS, min(KMEANS_MAX_STEPS, math.ceil(KMEANS_EPOCHS * rows / batch_size)))
+    best, best_score = None, -np.inf
+    for _ in range(max(1, n_init)):
+        centers = _kmeans_plus_plus(sample, k, rng)
+        seen = np.zeros(len(centers), dtype=np.float64)
+        for _ in range(steps):
+            batch = np.asarray(vectors[np.sort(rng.choice(rows, size=min(batch_size, rows), replace=False))])
+            nearest = np.argmax(batch @ centers.T, axis=1)
+            sizes = np.bincount(nearest, minlength=len(centers))
+            sums = _member_sums(batch, nearest, len(centers))
+            seen += sizes
+            # Per-center learning rate 1/count, applied to the batch mean of its members.
+            rate = (sizes / np.maximum(seen, 1.0)).astype(np.float32)[:, None]
+            means = sums / np.maximum(sizes, 1)[:, None]
+            centers += rate * (means - centers) * (sizes > 0)[:, None]
+            centers /= np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+        score = float((sample @ centers.T).max(axis=1).mean())
+        if score > best_score:
+            best, best_score = centers, score
+    return best
+
+
+def assign_topics(vectors: np.ndarray, centers: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Nearest center and its cosine similarity per row, plus the exact unit-length cluster means."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    similarities = np.empty(len(vectors), dtype=np.float32)
+    sums = np.zeros_like(centers)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS])
+        scores = block @ centers.T
+        nearest = np.argmax(scores, axis=1)
+        labels[start:start + len(block)] = nearest
+        similarities[start:start + len(block)] = scores[np.arange(len(block)), nearest]
+        sums += _member_sums(block, nearest, len(centers))
+    means = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return labels, similarities, means
+
+
+def topic_keywords(texts_by_topic: list[list[str]], limit: int = KEYWORDS_PER_TOPIC) -> list[list[str]]:
+    """Most distinctive words per topic by class-based TF-IDF (frequent in the topic, rare elsewhere)."""
+    counts = [
+        Counter(token for text in texts for token in _KEYWORD_TOKEN.findall(text.lower()))
+        for texts in texts_by_topic
+    ]
+    overall = Counter()
+    for topic_counts in counts:
+        overall.update(topic_counts)
+    average_words = sum(overall.values()) / max(1, len(counts))
+    keywords = []
+    for topic_counts in counts:
+        words = sum(topic_counts.values()) or 1
+        scores = {
+            term: (count / words) * math.log(1.0 + average_words / overall[term])
+            for term, count in topic_counts.items()
+        }
+        keywords.append(sorted(scores, key=scores.get, reverse=True)[:limit])
+    return keywords
+
+
+class TopicLabels(BaseModel):
+    labels: List[str]
+
+
+def label_topics(keywords: list[list[str]], excerpts: list[list[str]]) -> list[str]:
+    """One short label per topic from one LLM call; keyword labels if that fails."""
+    fallback = [", ".join(words[:3]).title() or f"Topic {position + 1}" for position, words in enumerate(keywords)]
+    parser = PydanticOutputParser(pydantic_object=TopicLabels)
+    prompt = PromptTemplate(
+        template="""
+            You are given clusters of passages from one document collection.
+            For each cluster, write ONE concise topic label (max ~6 words, noun phrase, title case).
+            Return exactly {count} labels, in the order of the clusters.
+
+            {clusters}
+
+            {format_instructions}
+            """,
+        input_variables=["count", "clusters"],
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
+    clusters = "\n\n".join(
+        f"CLUSTER {position + 1}\nKeywords: {', '.join(words)}\nExcerpts:\n"
+        + "\n".join(f"- {excerpt[:LABEL_EXCERPT_CHARS]}" for excerpt in topic_excerpts)
+        for position, (words, topic_excerpts) in enumerate(zip(keywords, excerpts))
+    )
+    try:
+        labels = complete(
+            prompt.format(count=len(keywords), clusters=clusters),
+            model=TOPIC_MAP_LABEL_MODEL,
+            parser=parser,
+            name="topic labels",
+        ).labels
+    except Exception:
+        logger.warning("Topic labelling failed; using keyword labels", exc_info=True)
+        return fallback
+    if len(labels) != len(keywords):
+        logger.warning("Topic labelling returned %s labels for %s topics", len(labels), len(keywords))
+        return fallback
+    return [label.strip() or default for label, default in zip(labels, fallback)]
+
+
+def build_topic_map(db: Session, project_id, *, seed: int = 0) -> list[ProjectTopic]:
+    """Cluster the project's chunks and replace its stored topics; returns the new topics."""
+    project_id = UUID(str(project_id))
+    signature = document_signature(db, project_id)
+    if scope_fields_backfilled():
+        filters = {"project_id": str(project_id), "chunk_size": TOPIC_MAP_CHUNK_SIZE}
+    else:
+        # Chunks indexed before the scope fields were backfilled only carry source_pdf.
+        filenames = [
+            filename for (filename,) in db.query(Document.filename).filter(Document.project_id == project_id).all()
+        ]
+        # An empty filename list would not filter at all; a project without documents has no chunks.
+        filters = {"source_pdf": filenames, "chunk_size": TOPIC_MAP_CHUNK_SIZE} if filenames else None
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="topic-map-") as directory:
+        ids, texts, vectors = load_chunk_vectors(filters, directory) if filters else ([], [], None)
+        clusters = []
+        if vectors is not None and len(ids) >= TOPIC_MAP_MIN_CHUNKS:
+            centers = minibatch_kmeans(vectors, choose_topic_count(len(ids)), seed=seed)
+            labels, similarities, centroids = assign_topics(vectors, centers)
+            for topic in range(len(centers)):
+                members = np.flatnonzero(labels == topic)
+                if len(members) >= MIN_TOPIC_CHUNKS:
+                    # Closest to the centroid first.
+                    clusters.append((members[np.argsort(-similarities[members])], centroids[topic]))
+        del vectors
+
+    clusters.sort(key=lambda cluster: len(cluster[0]), reverse=True)
+    keywords = topic_keywords([[texts[i] for i in members[:KEYWORD_SAMPLE_CHUNKS]] for members, _ in clusters])
+    names = label_topics(keywords, [[texts[i] for i in members[:2]] for members, _ in clusters]) if clusters else []
+
+    topics = [
+        ProjectTopic(
+            project_id=project_id,
+            topic_index=position,
+            label=name,
+            keywords=words,
+            chunk_count=int(len(members)),
+            centroid=[float(value) for value in centroid],
+            representative_chunk_ids=[ids[i] for i in members[:REPRESENTATIVE_CHUNKS]],
+            document_signature=signature,
+        )
+        for position, ((members, centroid), words, name) in enumerate(zip(clusters, keywords, names))
+    ]
+    db.query(ProjectTopic).filter(ProjectTopic.project_id == project_id).delete(synchronize_session=False)
+    db.add_all(topics)
+    db.commit()
+    logger.info(
+        "Topic map for project %s: %s topics from %s chunks in %.1fs",
+        project_id,
+        len(topics),
+        len(ids),
+        time.perf_counter() - started,
+    )
+    return topics
+
+
+def get_topic_map(db: Session, project_id) -> list[ProjectTopic]:
+    """The project's stored topics, or [] when none exist or the document set changed since."""
+    project_id = UUID(str(project_id))
+    topics = (
+        db.query(ProjectTopic)
+        .filter(ProjectTopic.project_id == project_id)
+        .order_by(ProjectTopic.topic_index.asc())
+        .all()
+    )
+    if not topics or topics[0].document_signature != document_signature(db, project_id):
+        return []
+    return topics
+
+
+def rank_topics(
+    topics: list[ProjectTopic],
+    query_vector: list[float],
+    limit: int,
+) -> list[tuple[ProjectTopic, float]]:
+    """Topics by cosine similarity of their centroid to `query_vector`, best first."""
+    if not topics or limit <= 0:
+        return []
+    query = np.asarray(query_vector, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+    scores = np.asarray([topic.centroid for topic in topics], dtype=np.float32) @ query
+    order = np.argsort(-scores)[:limit]
+    return [(topics[i], float(scores[i])) for i in order]
+
+
+def project_topic_seeds(
+    db: Session,
+    scope: ResearchScope,
+    query: str,
+    *,
+    topic_limit: int,
+    chunk_limit: int,
+) -> tuple[list[tuple[ProjectTopic, float]], list[StoredDocument]]:
+    """Closest topics of a project-scoped run and up to `chunk_limit` of their representative chunks.
+
+    Chunks are taken round-robin over the ranked topics, so each close topic is
+    represented before any topic contributes a second chunk.
+    """
+    if scope.mode != "project" or not scope.project_id:
+        return [], []
+    try:
+        topics = get_topic_map(db, scope.project_id)
+        if not topics:
+            return [], []
+        vectorstore = get_vectorstore()
+        ranked = rank_topics(topics, vectorstore.embed_queries([query])[0], topic_limit)
+        chunk_ids: list[str] = []
+        for depth in range(REPRESENTATIVE_CHUNKS):
+            for topic, _score in ranked:
+                if len(chunk_ids) < chunk_limit and depth < len(topic.representative_chunk_ids):
+                    chunk_ids.append(topic.representative_chunk_ids[depth])
+        documents = vectorstore.get_documents(chunk_ids) if chunk_ids else {}
+    except Exception:
+        db.rollback()
+        logger.warning("Topic map lookup failed for project %s; running without it", scope.project_id, exc_info=True)
+        return [], []
+    return ranked, [documents[chunk_id] for chunk_id in chunk_ids if chunk_id in documents]
+
+
+class TopicMapScheduler:
+    """Debounced background builds: one daemon thread, one build at a time."""
+
+    def __init__(self, *, debounce: float = TOPIC_MAP_DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self._due: dict[str, float] = {}
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def schedule(self, project_ids: Iterable[str | None], *, delay: float | None = None) -> None:
+        """(Re)build the maps of `project_ids` once they have been quiet for `delay` seconds."""
+        due = time.monotonic() + (self.debounce if delay is None else delay)
+        with self._condition:
+            for project_id in project_ids:
+                if project_id:
+                    self._due[str(project_id)] = due
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="topic-map", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def pending(self) -> list[str]:
+        with self._condition:
+            return sorted(self._due)
+
+    def _next_project(self) -> str:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                ready = [project_id for project_id, due in self._due.items() if due <= now]
+                if ready:
+                    project_id = min(ready, key=self._due.get)
+                    del self._due[project_id]
+                    return project_id
+                self._condition.wait(min(self._due.values()) - now if self._due else None)
+
+    def _run(self) -> None:
+        while True:
+            project_id = self._next_project()
+            try:
+                with SessionLocal() as db:
+                    if db.get(Project, project_id) is not None:
+                        build_topic_map(db, project_id)
+            except Exception:
+                logger.warning("Topic map build failed for project %s", project_id, exc_info=True)
+
+
+TOPIC_MAP_SCHEDULER = TopicMapScheduler()
+
+
+def schedule_topic_maps(project_ids: Iterable[str | None]) -> None:
+    TOPIC_MAP_SCHEDULER.schedule(project_ids)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Build per-project topic maps from indexed chunks")
+    parser.add_argument("--project", action="append", help="Project id (repeatable); default: all projects")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        project_ids = args.project or [str(project_id) for (project_id,) in db.query(Project.id).all()]
+        for project_id in project_ids:
+            topics = build_topic_map(db, project_id)
+            print(f"{project_id}: {len(topics)} topics")
+            for topic in topics:
+                print(f"  [{topic.chunk_count:>5}] {topic.label} ({', '.join(topic.keywords[:5])})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,51 @@
+import time
 from dataclasses import dataclass, field
-import os
 
 from elasticsearch import Elasticsearch
 from langchain_openai import OpenAIEmbeddings
 
-from app.utils.search_index import build_filter_clauses
+from app.utils.embedding_config import build_embeddings
+from app.utils.knn_tuning import RECALL_SAMPLER, num_candidates_for
+from app.utils.run_metrics import instrument_es
+from app.utils.search_index import build_filter_clauses, index_routing_field, search_routing, use_local_store
+
+
+TEXT_INDEX = "pdf_chunks"
+CAPTION_INDEX = "captions"
+
+SEARCH_MODES = ("knn", "hybrid")
+FUSION_METHODS = ("rrf", "weighted")
+RRF_RANK_CONSTANT = 60
+DEFAULT_BM25_WEIGHT = 0.3
+
+# "small_to_big" searches the fine chunks only and returns their parent (largest) chunks.
+GRANULARITIES = ("mixed", "small_to_big")
+FINE_CHUNK_SIZE = 400
+SMALL_TO_BIG_CANDIDATE_FACTOR = 3
+# A parent whose text is mostly already covered by higher-ranked evidence is dropped.
+MIN_UNCOVERED_FRACTION = 0.25
 
 
 @dataclass
 class StoredDocument:
     page_content: str
     metadata: dict = field(default_factory=dict)
+    # Stored embedding, kept out of `metadata` so it never leaks into chunk dicts.
+    vector: list[float] | None = field(default=None, repr=False)
+
+
+@dataclass
+class MultiQueryHits:
+    query: str
+    text_hits: list[tuple[StoredDocument, float]] = field(default_factory=list)
+    caption_hits: list[tuple[StoredDocument, float]] = field(default_factory=list)
+    query_vector: list[float] | None = field(default=None, repr=False)
+    # Set by callers that know the fetch size: fewer raw hits came back than were asked for.
+    exhausted: bool = False
+
+    @property
+    def all_hits(self) -> list[tuple[StoredDocument, float]]:
+        return self.text_hits + self.caption_hits
 
 
 class SimpleElasticsearchVectorStore:
@@ -19,25 +54,42 @@ class SimpleElasticsearchVectorStore:
         self.vector_query_field = vector_query_field
         self.query_field = query_field
         self.es = Elasticsearch("http://elasticsearch:9200")
+        instrument_es(self.es)
         self._embeddings = None
 
     @property
     def embeddings(self) -> OpenAIEmbeddings:
         if self._embeddings is None:
-            self._embeddings = OpenAIEmbeddings(
-                model="text-embedding-3-small",
-                openai_api_key=os.getenv("OPENAI_API_KEY"),
-            )
+            self._embeddings = build_embeddings()
         return self._embeddings
 
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Embed all queries with a single embeddings API call."""
+        if not queries:
+            return []
+        return self.embeddings.embed_documents(list(queries))
+
     def similarity_search(
         self,
         query: str,
         k: int = 5,
         *,
         filters: dict[str, object] | None = None,
+        mode: str = "knn",
+        fusion: str = "rrf",
+        bm25_weight: float = DEFAULT_BM25_WEIGHT,
     ) -> list[StoredDocument]:
-        return [doc for doc, _score in self.similarity_search_with_score(query=query, k=k, filters=filters)]
+        return [
+            doc
+            for doc, _score in self.similarity_search_with_score(
+                query=query,
+                k=k,
+                filters=filters,
+                mode=mode,
+                fusion=fusion,
+                bm25_weight=bm25_weight,
+            )
+        ]
 
     def similarity_search_with_score(
         self,
@@ -45,37 +97,372 @@ class SimpleElasticsearchVectorStore:
         k: int = 5,
         *,
         filters: dict[str, object] | None = None,
+        mode: str = "knn",
+        fusion: str = "rrf",
+        bm25_weight: float = DEFAULT_BM25_WEIGHT,
+        query_vector: list[float] | None = None,
+    ) -> list[tuple[StoredDocument, float]]:
+        """Search by vector (`mode="knn"`) or by BM25 + vector (`mode="hybrid"`).
+
+        Hybrid search always costs one Elasticsearch request: the BM25 and kNN
+        legs go out in one `msearch`; `fusion="rrf"` fuses the rankings with
+        reciprocal rank fusion, `fusion="weighted"` min-max normalizes each leg's
+        scores and mixes them with `bm25_weight`. Scope filters apply to both legs.
+        Pass `query_vector` when the caller already embedded `query`.
+        """
+        _validate_search_mode(mode, fusion)
+        vector = query_vector if query_vector is not None else self.embeddings.embed_query(query)
+        bodies = self._search_bodies(query, vector, k, filters, mode=mode)
+        if len(bodies) == 1:
+            body = bodies[0]
+            started = time.perf_counter()
+            response = self.es.search(
+                index=self.index_name,
+                size=body["size"],
+                knn=body["knn"],
+                query=body.get("query"),
+                source=True,
+                routing=search_routing(self.index_name, filters, self.es),
+            )
+            hits = self._parse_hits(response)
+            if mode == "knn":
+                self._record_knn(vector, k, filters, hits, (time.perf_counter() - started) * 1000.0)
+            return hits
+
+        responses = self._msearch([(self.index_name, body) for body in bodies], filters=filters)
+        return self._combine_responses(responses, k, mode=mode, fusion=fusion, bm25_weight=bm25_weight)
+
+    def search_chunks_many(
+        self,
+        queries: list[str],
+        top_k: int = 5,
+        *,
+        filters: dict[str, object] | None = None,
+        caption_index: str | None = None,
+        mode: str = "knn",
+        fusion: str = "rrf",
+        bm25_weight: float = DEFAULT_BM25_WEIGHT,
+        query_vectors: list[list[float]] | None = None,
+    ) -> list[MultiQueryHits]:
+        """Run one search per query using one embedding call and one `msearch`.
+
+        When `caption_index` is given, every query is also searched against that
+        index in the same `msearch` request. Results keep the order of `queries`.
+        Pass `query_vectors` (aligned with `queries`) to skip the embedding call.
+        """
+        _validate_search_mode(mode, fusion)
+        queries, vectors = _non_empty_queries(queries, query_vectors)
+        if not queries:
+            return []
+
+        vectors = vectors or self.embed_queries(queries)
+        indices = [self.index_name] + ([caption_index] if caption_index else [])
+        searches: list[tuple[str, dict]] = []
+        layout: list[tuple[int, str, int]] = []
+        for position, (query, vector) in enumerate(zip(queries, vectors)):
+            bodies = self._search_bodies(query, vector, top_k, filters, mode=mode)
+            for index in indices:
+                layout.append((position, index, len(bodies)))
+                searches.extend((index, body) for body in bodies)
+
+        started = time.perf_counter()
+        responses = self._msearch(searches, filters=filters)
+        # Per-search share of the msearch round trip, for the per-scope latency report.
+        latency_ms = (time.perf_counter() - started) * 1000.0 / len(searches)
+        results = [MultiQueryHits(query=query, query_vector=vector) for query, vector in zip(queries, vectors)]
+        cursor = 0
+        for position, index, body_count in layout:
+            hits = self._combine_responses(
+                responses[cursor:cursor + body_count],
+                top_k,
+                mode=mode,
+                fusion=fusion,
+                bm25_weight=bm25_weight,
+            )
+            cursor += body_count
+            if index == self.index_name:
+                results[position].text_hits = hits
+                if mode == "knn":
+                    self._record_knn(vectors[position], top_k, filters, hits, latency_ms)
+            else:
+                results[position].caption_hits = hits
+        return results
+
+    def get_documents(self, ids: list[str]) -> dict[str, StoredDocument]:
+        """Fetch documents by id in one `mget`; missing ids are left out.
+
+        An `mget` without routing only looks on the `_id` shard, so indices with
+        a custom routing field are read with an `ids` search instead.
+        """
+        ids = list(dict.fromkeys(doc_id for doc_id in ids if doc_id))
+        if not ids:
+            return {}
+        if index_routing_field(self.index_name, self.es):
+            response = self.es.search(index=self.index_name, size=len(ids), query={"ids": {"values": ids}})
+            items = [{**hit, "found": True} for hit in response.get("hits", {}).get("hits", [])]
+        else:
+            items = self.es.mget(index=self.index_name, ids=ids).get("docs", [])
+        documents: dict[str, StoredDocument] = {}
+        for item in items:
+            if not item.get("found"):
+                continue
+            source = dict(item.get("_source") or {})
+            vector = source.pop(self.vector_query_field, None)
+            text = source.pop(self.query_field, "")
+            source.setdefault("id", item.get("_id"))
+            documents[item["_id"]] = StoredDocument(page_content=text, metadata=source, vector=vector)
+        return documents
+
+    def _search_bodies(
+        self,
+        query: str,
+        vector: list[float],
+        k: int,
+        filters: dict[str, object] | None,
+        *,
+        mode: str,
+    ) -> list[dict]:
+        if mode == "knn":
+            return [{"size": k, "knn": self._knn_clause(vector, k, filters)}]
+
+        # Both fusions combine the two legs client-side, each leg fetching a wider window.
+        window = k * 2
+        return [
+            {"size": window, "query": self._bm25_clause(query, filters)},
+            {"size": window, "knn": self._knn_clause(vector, window, filters)},
+        ]
+
+    def _msearch(
+        self,
+        searches: list[tuple[str, dict]],
+        *,
+        filters: dict[str, object] | None = None,
+    ) -> list[dict]:
+        payload: list[dict] = []
+        for index, body in searches:
+            header = {"index": index}
+            routing = search_routing(index, filters, self.es)
+            if routing:
+                header["routing"] = routing
+            payload.append(header)
+            payload.append({**body, "_source": True})
+
+        response = self.es.msearch(searches=payload)
+        responses = response.get("responses", [])
+        if len(responses) != len(searches):
+            raise RuntimeError(f"msearch returned {len(responses)} responses for {len(searches)} searches")
+        for (index, _body), item in zip(searches, responses):
+            if "error" in item:
+                raise RuntimeError(f"msearch failed on index {index}: {item['error']}")
+        return responses
+
+    def _combine_responses(
+        self,
+        responses: list[dict],
+        k: int,
+        *,
+        mode: str,
+        fusion: str,
+        bm25_weight: float = DEFAULT_BM25_WEIGHT,
     ) -> list[tuple[StoredDocument, float]]:
-        vector = self.embeddings.embed_query(query)
+        if mode == "hybrid":
+            rankings = [self._parse_hits(response) for response in responses]
+            if fusion == "weighted":
+                return weighted_score_fusion(rankings, [bm25_weight, max(0.0, 1.0 - bm25_weight)], k=k)
+            return reciprocal_rank_fusion(rankings, k=k)
+        return self._parse_hits(responses[0])[:k]
+
+    def _bm25_clause(
+        self,
+        query: str,
+        filters: dict[str, object] | None,
+    ) -> dict:
+        clause: dict = {"must": [{"match": {self.query_field: query}}]}
+        clauses = build_filter_clauses(filters)
+        if clauses:
+            clause["filter"] = clauses
+        return {"bool": clause}
+
+    def _knn_clause(
+        self,
+        vector: list[float],
+        k: int,
+        filters: dict[str, object] | None,
+    ) -> dict:
         knn = {
             "field": self.vector_query_field,
             "query_vector": vector,
             "k": k,
-            "num_candidates": max(25, k * 5),
+            "num_candidates": num_candidates_for(self.es, self.index_name, k, filters),
         }
         clauses = build_filter_clauses(filters)
         if clauses:
             knn["filter"] = {"bool": {"filter": clauses}}
-        response = self.es.search(
-            index=self.index_name,
-            size=k,
-            knn=knn,
-            source=True,
+        return knn
+
+    def _record_knn(
+        self,
+        vector: list[float],
+        k: int,
+        filters: dict[str, object] | None,
+        hits: list[tuple[StoredDocument, float]],
+        latency_ms: float,
+    ) -> None:
+        RECALL_SAMPLER.record(
+            self.es,
+            self.index_name,
+            vector=vector,
+            k=k,
+            filters=filters,
+            found_ids=[str(doc.metadata.get("id")) for doc, _score in hits],
+            latency_ms=latency_ms,
         )
 
+    def _parse_hits(self, response: dict) -> list[tuple[StoredDocument, float]]:
         hits = response.get("hits", {}).get("hits", [])
         results: list[tuple[StoredDocument, float]] = []
         for hit in hits:
             source = dict(hit.get("_source") or {})
+            vector = source.pop(self.vector_query_field, None)
             text = source.pop(self.query_field, "")
             source.setdefault("id", hit.get("_id"))
-            results.append((StoredDocument(page_content=text, metadata=source), float(hit.get("_score", 0.0))))
+            document = StoredDocument(page_content=text, metadata=source, vector=vector)
+            results.append((document, float(hit.get("_score", 0.0))))
         return results
 
 
-def get_vectorstore(index_name: str = "pdf_chunks") -> SimpleElasticsearchVectorStore:
+def reciprocal_rank_fusion(
+    rankings: list[list[tuple[StoredDocument, float]]],
+    *,
+    k: int,
+    rank_constant: int = RRF_RANK_CONSTANT,
+) -> list[tuple[StoredDocument, float]]:
+    """Fuse ranked hit lists by document id; the returned score is the RRF score."""
+    fused: dict[str, float] = {}
+    documents: dict[str, StoredDocument] = {}
+    for ranking in rankings:
+        for rank, (doc, _score) in enumerate(ranking, start=1):
+            doc_id = str(doc.metadata.get("id"))
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (rank_constant + rank)
+            documents.setdefault(doc_id, doc)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(documents[doc_id], score) for doc_id, score in ordered]
+
+
+def weighted_score_fusion(
+    rankings: list[list[tuple[StoredDocument, float]]],
+    weights: list[float],
+    *,
+    k: int,
+) -> list[tuple[StoredDocument, float]]:
+    """Fuse hit lists by document id on min-max normalized scores mixed with `weights`.
+
+    BM25 scores are unbounded while kNN scores lie in 0..1, so each list is scaled
+    to 0..1 first; a document missing from a list gets 0 for it.
+    """
+    fused: dict[str, float] = {}
+    documents: dict[str, StoredDocument] = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        scores = [score for _doc, score in ranking]
+        low, high = min(scores), max(scores)
+        for doc, score in ranking:
+            doc_id = str(doc.metadata.get("id"))
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+            documents.setdefault(doc_id, doc)
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(documents[doc_id], score) for doc_id, score in ordered]
+
+
+def collapse_to_parents(
+    hits: list[tuple[StoredDocument, float]],
+    parents: dict[str, StoredDocument],
+    k: int,
+) -> list[tuple[StoredDocument, float]]:
+    """Replace ranked fine-chunk hits by their parent chunks, deduplicated and non-overlapping.
+
+    A parent keeps the score of its best child and lists all matched children in
+    `matched_chunk_ids`. Spans already covered by higher-ranked evidence from the
+    same PDF are trimmed off using `char_start`/`char_end`; a parent with less
+    than `MIN_UNCOVERED_FRACTION` left is dropped. Hits without a known parent
+    (documents ingested before parents were recorded) are kept as they are.
+    """
+    selected: list[tuple[StoredDocument, float]] = []
+    by_key: dict[str, StoredDocument] = {}
+    covered: dict[str, list[tuple[int, int]]] = {}
+    for doc, score in hits:
+        child_id = str(doc.metadata.get("id"))
+        parent = parents.get(doc.metadata.get("parent_id") or "")
+        evidence = parent or doc
+        key = str(evidence.metadata.get("id"))
+        if key in by_key:
+            by_key[key].metadata["matched_chunk_ids"].append(child_id)
+            continue
+        if len(selected) >= k:
+            continue
+
+        trimmed = _trim_covered(evidence, covered)
+        if trimmed is None:
+            continue
+        trimmed.metadata["matched_chunk_ids"] = [child_id]
+        by_key[key] = trimmed
+        selected.append((trimmed, score))
+    return selected
+
+
+def _trim_covered(doc: StoredDocument, covered: dict[str, list[tuple[int, int]]]) -> StoredDocument | None:
+    start, end = doc.metadata.get("char_start"), doc.metadata.get("char_end")
+    source = str(doc.metadata.get("source_pdf"))
+    if start is None or end is None or end <= start:
+        return StoredDocument(page_content=doc.page_content, metadata=dict(doc.metadata), vector=doc.vector)
+
+    # Longest stretch of [start, end) not covered by evidence selected earlier.
+    free_start, best = start, (start, start)
+    for covered_start, covered_end in sorted(covered.get(source, [])) + [(end, end)]:
+        if covered_end <= free_start:
+            continue
+        gap_end = min(max(covered_start, free_start), end)
+        if gap_end - free_start > best[1] - best[0]:
+            best = (free_start, gap_end)
+        free_start = max(free_start, covered_end)
+        if free_start >= end:
+            break
+
+    if best[1] - best[0] < MIN_UNCOVERED_FRACTION * (end - start):
+        return None
+    covered.setdefault(source, []).append(best)
+    metadata = {**doc.metadata, "char_start": best[0], "char_end": best[1]}
+    text = doc.page_content[best[0] - start:best[1] - start]
+    return StoredDocument(page_content=text, metadata=metadata, vector=doc.vector)
+
+
+def _non_empty_queries(
+    queries: list[str],
+    query_vectors: list[list[float]] | None,
+) -> tuple[list[str], list[list[float]] | None]:
+    if query_vectors is None:
+        return [query for query in queries if query and query.strip()], None
+    pairs = [(query, vector) for query, vector in zip(queries, query_vectors) if query and query.strip()]
+    return [query for query, _vector in pairs], [vector for _query, vector in pairs]
+
+
+def _validate_search_mode(mode: str, fusion: str) -> None:
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}; expected one of {', '.join(SEARCH_MODES)}")
+    if fusion not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method {fusion!r}; expected one of {', '.join(FUSION_METHODS)}")
+
+
+def get_vectorstore(index_name: str = TEXT_INDEX) -> SimpleElasticsearchVectorStore:
+    """Store for `index_name` on the backend selected by VECTOR_STORE_BACKEND."""
+    if use_local_store():
+        from app.utils.local_vectorstore import LocalVectorStore
+
+        return LocalVectorStore(index_name=index_name)
     return SimpleElasticsearchVectorStore(index_name=index_name)
 
 
 def get_caption_store() -> SimpleElasticsearchVectorStore:
-    return get_vectorstore(index_name="captions")
+    return get_vectorstore(index_name=CAPTION_INDEX)
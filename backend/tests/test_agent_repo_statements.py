@@ -0,0 +1,76 @@
+"""`attach_evidence_to_node` must issue the same statements for 5 and for 500 chunks.
+
+A recording session stands in for Postgres: every `execute` and every
+`query(...).update(...)` counts as one statement.
+"""
+from uuid import uuid4
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.dialects import postgresql
+
+from app.utils.agent.repo import attach_evidence_to_node
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class _Query:
+    def __init__(self, session):
+        self._session = session
+
+    def filter(self, *criteria):
+        return self
+
+    def update(self, values, synchronize_session=None):
+        self._session.statements.append(("update", values))
+        return 0
+
+
+class RecordingSession:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt, *args, **kwargs):
+        self.statements.append(stmt)
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        # The question upsert RETURNs (id, text_key) for every row it was given.
+        keys = [value for name, value in sorted(params.items()) if name.startswith("text_key")]
+        return _Result([(uuid4(), key) for key in keys])
+
+    def flush(self):
+        pass
+
+    def query(self, *entities):
+        return _Query(self)
+
+
+def _statements_for(chunk_count: int, question_count: int = 6) -> int:
+    db = RecordingSession()
+    chunks = [
+        {"id": f"chunk-{index}", "text": f"Chunk {index}.", "page": index, "source": "a.pdf"}
+        for index in range(chunk_count)
+    ]
+    questions = [f"Question {index}?" for index in range(question_count)]
+    question_ids = attach_evidence_to_node(db, uuid4(), chunks=chunks, questions=questions, question_source="test")
+    assert len(question_ids) == question_count
+    return len(db.statements)
+
+
+def test_statement_count_does_not_depend_on_chunk_count():
+    few, many = _statements_for(5), _statements_for(500)
+    assert few == many
+    assert many <= 5
+
+
+def test_duplicate_questions_share_one_row():
+    db = RecordingSession()
+    question_ids = attach_evidence_to_node(db, uuid4(), questions=["What is X?", "  what is   x? "])
+    assert question_ids[0] == question_ids[1]
@@ -8,6 +8,7 @@ from app.utils.cleaning.clean_text_pipeline import clean_document_text
 from app.utils.embedding import embed_chunks
 from app.utils.es import ensure_all_indices, save_chunks_to_es
 from app.utils.image_extraction import process_images_and_captions
+from app.utils.local_store import save_chunks_local, use_local_store
 from app.utils.metadata import get_doc_info
 from app.utils.pdf_pipeline import process_pdf
 from app.utils.pdf_reader import download_from_minio, read_pdf_from_minio
@@ -20,7 +21,8 @@ app = FastAPI(root_path="/pdfworker")
 
 @app.on_event("startup")
 def _startup():
-    ensure_all_indices()
+    if not use_local_store():
+        ensure_all_indices()
     start_worker_thread()
 
 
@@ -88,8 +90,18 @@ def process_clean_embed_chunks(filename: str):
         cleaned_pages = clean_document_text(local_path)
         chunks = chunk_text(cleaned_pages, chunk_sizes=[800, 1600])
         embedded = embed_chunks(chunks)
-        save_chunks_to_es(filename, embedded, book_id=filename.split("_", 1)[0], source_pdf=filename)
+        save_chunks = save_chunks_local if use_local_store() else save_chunks_to_es
+        result = save_chunks(filename, embedded, book_id=filename.split("_", 1)[0], source_pdf=filename)
+        if result.get("fail"):
+            # e.g. pdf_chunks routed by document_id: this endpoint has no document id to route by.
+            raise HTTPException(
+                status_code=422,
+                detail=f"{result['fail']} of {result['items']} chunks were not indexed; "
+                "indices routed by document_id need the document's processing job (upload through the backend)",
+            )
         return embedded
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
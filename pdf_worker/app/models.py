@@ -66,3 +66,7 @@ class TextChunkEmbedding(BaseModel):
     text: str
     pages: List[int]
     embedding: List[float]
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
+    parent_chunk_size: Optional[int] = None
+    parent_chunk_index: Optional[int] = None
@@ -0,0 +1,519 @@
+"""Online reindex of `pdf_chunks` / `captions` into a new versioned index behind the alias.
+
+Examples (inside the pdf_worker container):
+    python -m app.reindex pdf_chunks --m 32 --ef-construction 200
+    python -m app.reindex captions --index-type hnsw --requests-per-second 200
+    python -m app.reindex pdf_chunks --shards 4 --routing-field document_id
+    python -m app.reindex pdf_chunks --status
+    python -m app.reindex pdf_chunks --rollback
+
+Steps: create `{alias}_v{n+1}` with the new vector settings, copy documents with a
+throttled `_reindex` task and run kNN smoke queries against the new index. A catch-up
+pass then copies the rows whose `updated_at` (stamped by every writer) is newer than
+the start of the previous pass, and rows deleted meanwhile are dropped. Only then is
+a write block put on the old index for a last, short catch-up of the same kind; the
+document counts must match, the alias is swapped in a single atomic `update_aliases`
+call and the block is lifted. All passes copy with external versioning, so a row is
+only overwritten by a newer version. Writes to the alias fail while the block is on
+(ingest jobs then fail and can be retried). The previous version is kept so
+`--rollback` can point the alias back at it.
+
+The shard layout (`--shards`, `--routing-field`, `--routing-partition-size`) is
+kept from the current index unless given. A routing field is refused while any row
+lacks it: such a row would be routed elsewhere and never found by searches routed
+by the value it gets later. Run `POST /backend/internal/search/sync_scope_fields`
+first, so that every row has a `document_id`.
+"""
+import argparse
+import copy
+import logging
+import sys
+import time
+from typing import Optional
+
+from elasticsearch import helpers
+
+from app.utils.es import (
+    CAPTIONS,
+    DOCUMENTS,
+    PDF_CHUNKS,
+    ROUTED_INDICES,
+    ROUTING_FIELDS,
+    IndexLayout,
+    _mapping_for,
+    alias_targets,
+    es,
+    index_version,
+    list_index_versions,
+    versioned_index_name,
+)
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shortens text-embedding-3 vectors (which are trained to be truncatable) and re-normalizes them.
+_TRUNCATE_VECTOR_SCRIPT = """
+if (ctx._source.vector != null) {
+  def source = ctx._source.vector;
+  List out = new ArrayList();
+  double norm = 0;
+  for (int i = 0; i < params.dims; i++) {
+    double value = source[i];
+    out.add(value);
+    norm += value * value;
+  }
+  norm = Math.sqrt(norm);
+  if (norm > 0) {
+    for (int i = 0; i < out.size(); i++) {
+      out.set(i, out.get(i) / norm);
+    }
+  }
+  ctx._source.vector = out;
+}
+"""
+
+# Routes each copied row by the target layout's routing field (every row has it; see _require_routing_field).
+_ROUTING_SCRIPT = """
+def routing = ctx._source[params.routing_field];
+ctx._routing = routing == null ? null : routing.toString();
+"""
+
+
+def build_target_mapping(
+    base_mapping: dict,
+    *,
+    dims: Optional[int] = None,
+    index_type: Optional[str] = None,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+) -> dict:
+    mapping = copy.deepcopy(base_mapping)
+    vector = mapping["properties"]["vector"]
+    if dims is not None:
+        vector["dims"] = dims
+    options = dict(vector.get("index_options") or {})
+    if index_type is not None:
+        options["type"] = index_type
+    if m is not None:
+        options["m"] = m
+    if ef_construction is not None:
+        options["ef_construction"] = ef_construction
+    if options.get("type") == "flat" or options.get("type", "").endswith("_flat"):
+        options.pop("m", None)
+        options.pop("ef_construction", None)
+    vector["index_options"] = options
+    return mapping
+
+
+def _current_index(alias: str) -> tuple[str, bool]:
+    """Return (index currently serving `alias`, whether it is a legacy concrete index)."""
+    targets = alias_targets(alias)
+    if len(targets) > 1:
+        raise SystemExit(f"Alias {alias} points at several indices {targets}; fix it by hand first")
+    if targets:
+        return targets[0], False
+    if es.indices.exists(index=alias):
+        return alias, True
+    raise SystemExit(f"Neither alias nor index {alias} exists")
+
+
+def _live_mapping(index_name: str) -> dict:
+    mapping = es.indices.get_mapping(index=index_name)
+    return dict(next(iter(mapping.values()))["mappings"])
+
+
+def _require_change_stamps(index_name: str) -> None:
+    if "updated_at" not in _live_mapping(index_name).get("properties", {}):
+        raise SystemExit(
+            f"{index_name} has no updated_at field yet; restart pdf_worker (and backend) on the current "
+            "version so every writer stamps it, then re-run the reindex"
+        )
+
+
+def _require_routing_field(index_name: str, field: str) -> None:
+    missing = es.count(
+        index=index_name,
+        query={"bool": {"must_not": [{"exists": {"field": field}}]}},
+    )["count"]
+    if missing:
+        hint = " Run POST /backend/internal/search/sync_scope_fields first." if field == "document_id" else ""
+        raise SystemExit(f"{missing} rows of {index_name} have no {field}; cannot route by it.{hint}")
+
+
+def _current_dims(index_name: str) -> int:
+    return int(_live_mapping(index_name)["properties"]["vector"]["dims"])
+
+
+def _current_replicas(index_name: str) -> int:
+    settings = es.indices.get_settings(index=index_name)
+    return int(next(iter(settings.values()))["settings"]["index"].get("number_of_replicas", 1))
+
+
+def _current_layout(index_name: str) -> IndexLayout:
+    settings = es.indices.get_settings(index=index_name)
+    index_settings = next(iter(settings.values()))["settings"]["index"]
+    return IndexLayout(
+        shards=int(index_settings.get("number_of_shards", 1)),
+        routing_field=(_live_mapping(index_name).get("_meta") or {}).get("routing_field"),
+        routing_partition_size=int(index_settings.get("routing_partition_size", 1)),
+    )
+
+
+def target_layout(current: IndexLayout, args: argparse.Namespace) -> IndexLayout:
+    """Layout of the new index: the current one with the options given on the command line."""
+    routing_field = current.routing_field
+    if args.routing_field is not None:
+        routing_field = None if args.routing_field == "none" else args.routing_field
+    partition_size = args.routing_partition_size
+    if partition_size is None:
+        partition_size = current.routing_partition_size if routing_field else 1
+    return IndexLayout(
+        shards=args.shards or current.shards,
+        routing_field=routing_field,
+        routing_partition_size=partition_size,
+    ).validate()
+
+
+def _wait_for_task(task_id: str, *, poll_seconds: float = 5.0) -> dict:
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        status = task.get("task", {}).get("status", {})
+        logger.info(
+            "reindex progress: created=%s updated=%s total=%s",
+            status.get("created"),
+            status.get("updated"),
+            status.get("total"),
+        )
+        if task.get("completed"):
+            if task.get("error"):
+                raise SystemExit(f"Reindex task failed: {task['error']}")
+            failures = task.get("response", {}).get("failures") or []
+            if failures:
+                raise SystemExit(f"Reindex finished with {len(failures)} failures, first: {failures[0]}")
+            return task.get("response", {})
+        time.sleep(poll_seconds)
+
+
+# Catch-up passes start this far before the previous pass, so clock skew between writers is covered.
+CATCH_UP_MARGIN_MS = 60_000
+
+
+def _copy(
+    source: str,
+    dest: str,
+    *,
+    requests_per_second: float,
+    script: Optional[dict],
+    changed_since: Optional[int] = None,
+    discard_routing: bool = False,
+) -> dict:
+    """Copy `source` into `dest`; with `changed_since` (epoch ms) only rows updated from then on."""
+    dest_spec = {"index": dest}
+    if discard_routing:
+        dest_spec["routing"] = "discard"
+    # Keep the source versions, so the catch-up pass only overwrites documents updated since the first one.
+    dest_spec["version_type"] = "external"
+    source_spec = {"index": source}
+    if changed_since is not None:
+        source_spec["query"] = {"range": {"updated_at": {"gte": changed_since - CATCH_UP_MARGIN_MS}}}
+    kwargs = {
+        "source": source_spec,
+        "dest": dest_spec,
+        "conflicts": "proceed",
+        "slices": "auto",
+        "requests_per_second": requests_per_second,
+        "wait_for_completion": False,
+    }
+    if script:
+        kwargs["script"] = script
+    task_id = es.reindex(**kwargs)["task"]
+    logger.info(
+        "Started %s reindex %s -> %s (task %s)",
+        "bulk" if changed_since is None else "catch-up",
+        source,
+        dest,
+        task_id,
+    )
+    return _wait_for_task(task_id)
+
+
+def _truncate(vector: list, dims: int) -> list:
+    head = [float(value) for value in vector[:dims]]
+    norm = sum(value * value for value in head) ** 0.5
+    return [value / norm for value in head] if norm else head
+
+
+def drop_deleted(source: str, dest: str, *, batch_size: int = 1000) -> int:
+    """Delete the documents of `dest` that no longer exist in `source`; return how many."""
+    dropped = 0
+    batch: list = []
+
+    def flush() -> int:
+        # ids queries reach every shard, so custom routing does not matter here.
+        found = es.search(index=source, query={"ids": {"values": batch}}, size=len(batch), source=False)
+        present = {hit["_id"] for hit in found.get("hits", {}).get("hits", [])}
+        missing = [doc_id for doc_id in batch if doc_id not in present]
+        if missing:
+            es.delete_by_query(index=dest, query={"ids": {"values": missing}}, conflicts="proceed", refresh=True)
+        return len(missing)
+
+    for hit in helpers.scan(es, index=dest, query={"query": {"match_all": {}}}, _source=False):
+        batch.append(hit["_id"])
+        if len(batch) >= batch_size:
+            dropped += flush()
+            batch = []
+    if batch:
+        dropped += flush()
+    return dropped
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _counts(old_index: str, new_index: str) -> tuple[int, int]:
+    es.indices.refresh(index=new_index)
+    es.indices.refresh(index=old_index)
+    return es.count(index=old_index)["count"], es.count(index=new_index)["count"]
+
+
+def _drop_deleted_if_needed(old_index: str, new_index: str) -> tuple[int, int]:
+    """Drop rows deleted from `old_index` since they were copied; return the (old, new) counts."""
+    old_count, new_count = _counts(old_index, new_index)
+    if new_count > old_count:
+        dropped = drop_deleted(old_index, new_index)
+        logger.info("Dropped %s documents deleted from %s during the copy", dropped, old_index)
+        old_count, new_count = _counts(old_index, new_index)
+    return old_count, new_count
+
+
+def set_write_block(index_name: str, blocked: bool) -> None:
+    es.indices.put_settings(index=index_name, settings={"index.blocks.write": True if blocked else None})
+    logger.info("Write block on %s %s", index_name, "set" if blocked else "lifted")
+
+
+def smoke_queries(source: str, dest: str, *, sample_size: int, dims: int, k: int = 10) -> float:
+    """Query `dest` with vectors of documents sampled from `source`; return the self-hit rate."""
+    response = es.search(
+        index=source,
+        size=sample_size,
+        query={"function_score": {"random_score": {}, "query": {"exists": {"field": "vector"}}}},
+        source=["vector"],
+    )
+    samples = response.get("hits", {}).get("hits", [])
+    if not samples:
+        return 1.0
+
+    found = 0
+    for hit in samples:
+        vector = _truncate(hit["_source"]["vector"], dims)
+        result = es.search(
+            index=dest,
+            size=k,
+            knn={"field": "vector", "query_vector": vector, "k": k, "num_candidates": max(50, k * 5)},
+            source=False,
+        )
+        if any(item["_id"] == hit["_id"] for item in result.get("hits", {}).get("hits", [])):
+            found += 1
+    return found / len(samples)
+
+
+def swap_alias(alias: str, *, old_index: str, new_index: str, legacy: bool) -> None:
+    if legacy:
+        # A concrete index cannot share its name with an alias; this removes it in the same atomic call.
+        actions = [{"remove_index": {"index": old_index}}]
+    else:
+        actions = [{"remove": {"index": old_index, "alias": alias}}]
+    actions.append({"add": {"index": new_index, "alias": alias, "is_write_index": True}})
+    es.indices.update_aliases(actions=actions)
+    logger.info("Alias %s now points at %s (was %s)", alias, new_index, old_index)
+
+
+def reindex(args: argparse.Namespace) -> None:
+    alias = args.alias
+    old_index, legacy = _current_index(alias)
+    if legacy and not args.migrate_legacy:
+        raise SystemExit(
+            f"{alias} is a concrete index. Re-run with --migrate-legacy to move it behind an alias; "
+            "the legacy index is dropped during the swap, so no rollback target is kept for this first move."
+        )
+
+    _require_change_stamps(old_index)
+    old_dims = _current_dims(old_index)
+    dims = args.dims or old_dims
+    if dims > old_dims:
+        raise SystemExit(f"Cannot grow vectors from {old_dims} to {dims} dims without re-embedding")
+    script_sources, script_params = [], {}
+    if dims < old_dims:
+        if not args.truncate_vectors:
+            raise SystemExit("Changing dims needs --truncate-vectors (text-embedding-3 vectors only)")
+        script_sources.append(_TRUNCATE_VECTOR_SCRIPT)
+        script_params["dims"] = dims
+
+    current_layout = _current_layout(old_index)
+    try:
+        layout = target_layout(current_layout, args)
+    except ValueError as exc:
+        raise SystemExit(str(exc)) from exc
+    if alias not in ROUTED_INDICES and layout.routing_field:
+        raise SystemExit(f"{alias} does not support custom routing")
+    if layout.routing_field:
+        _require_routing_field(old_index, layout.routing_field)
+        script_sources.append(_ROUTING_SCRIPT)
+        script_params["routing_field"] = layout.routing_field
+    script = (
+        {"source": "\n".join(script_sources), "lang": "painless", "params": script_params}
+        if script_sources
+        else None
+    )
+    discard_routing = bool(current_layout.routing_field) and not layout.routing_field
+
+    versions = list_index_versions(alias)
+    next_version = (versions[-1][0] if versions else 0) + 1
+    new_index = versioned_index_name(alias, next_version)
+    # Start from the live mapping so fields added since the index was created carry over.
+    base_mapping = _live_mapping(old_index)
+    for field, spec in _mapping_for(alias)["properties"].items():
+        base_mapping.setdefault("properties", {}).setdefault(field, spec)
+    mapping = layout.apply(
+        build_target_mapping(
+            base_mapping,
+            dims=dims,
+            index_type=args.index_type,
+            m=args.m,
+            ef_construction=args.ef_construction,
+        )
+    )
+    logger.info("Building %s from %s with vector mapping %s", new_index, old_index, mapping["properties"]["vector"])
+    logger.info("Shard layout %s (was %s)", layout, current_layout)
+    if args.dry_run:
+        return
+
+    settings = {"number_of_replicas": 0, "refresh_interval": "-1", **layout.settings()}
+    es.indices.create(index=new_index, mappings=mapping, settings=settings)
+
+    copy_options = {
+        "requests_per_second": args.requests_per_second,
+        "script": script,
+        "discard_routing": discard_routing,
+    }
+    replicas = _current_replicas(old_index) if args.replicas is None else args.replicas
+    try:
+        bulk_started = _now_ms()
+        _copy(old_index, new_index, **copy_options)
+        es.indices.refresh(index=new_index)
+        hit_rate = smoke_queries(old_index, new_index, sample_size=args.smoke_queries, dims=dims)
+        logger.info("Smoke queries self-hit rate: %.2f", hit_rate)
+        if hit_rate < args.min_smoke_hit_rate:
+            raise SystemExit(
+                f"Smoke hit rate {hit_rate:.2f} below {args.min_smoke_hit_rate:.2f}; alias left unchanged"
+            )
+
+        # Writes are still accepted here; this pass picks up what changed during the bulk copy.
+        catch_up_started = _now_ms()
+        _copy(old_index, new_index, changed_since=bulk_started, **copy_options)
+        _drop_deleted_if_needed(old_index, new_index)
+
+        # From here on the old index takes no writes, so the last catch-up sees its final state.
+        # It only covers the few seconds since the previous pass.
+        set_write_block(old_index, True)
+        swapped = False
+        try:
+            _copy(
+                old_index,
+                new_index,
+                changed_since=catch_up_started,
+                **{**copy_options, "requests_per_second": -1},
+            )
+            old_count, new_count = _drop_deleted_if_needed(old_index, new_index)
+            logger.info("Document counts: %s=%s %s=%s", old_index, old_count, new_index, new_count)
+            if new_count != old_count:
+                raise SystemExit(f"{new_index} has {new_count} docs, expected {old_count}; alias left unchanged")
+
+            # Only the index that goes live gets its serving settings back.
+            es.indices.put_settings(
+                index=new_index,
+                settings={"number_of_replicas": replicas, "refresh_interval": None},
+            )
+            swap_alias(alias, old_index=old_index, new_index=new_index, legacy=legacy)
+            swapped = True
+        finally:
+            # A swapped legacy index no longer exists.
+            if not (swapped and legacy):
+                set_write_block(old_index, False)
+    except BaseException:
+        logger.error("%s was not swapped in; delete it once inspected: DELETE /%s", new_index, new_index)
+        raise
+
+    if not legacy:
+        logger.info("Kept %s for rollback: python -m app.reindex %s --rollback", old_index, alias)
+
+
+def rollback(alias: str) -> None:
+    current, legacy = _current_index(alias)
+    if legacy:
+        raise SystemExit(f"{alias} is still a legacy concrete index; nothing to roll back")
+    current_version = index_version(alias, current)
+    previous = [name for version, name in list_index_versions(alias) if current_version and version < current_version]
+    if not previous:
+        raise SystemExit(f"No older version of {alias} to roll back to")
+    swap_alias(alias, old_index=current, new_index=previous[-1], legacy=False)
+
+
+def status(alias: str) -> None:
+    targets = alias_targets(alias)
+    for version, name in list_index_versions(alias):
+        count = es.count(index=name)["count"]
+        marker = "*" if name in targets else " "
+        layout = _current_layout(name)
+        print(
+            f"{marker} v{version:<3} {name:<24} docs={count} dims={_current_dims(name)} "
+            f"shards={layout.shards} routing={layout.routing_field or '_id'}"
+            + (f"/{layout.routing_partition_size}" if layout.routing_partition_size > 1 else "")
+        )
+    if not targets and es.indices.exists(index=alias):
+        print(f"  {alias} is a legacy concrete index (docs={es.count(index=alias)['count']})")
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("alias", choices=[PDF_CHUNKS, CAPTIONS, DOCUMENTS])
+    parser.add_argument("--status", action="store_true", help="List versions and exit")
+    parser.add_argument("--rollback", action="store_true", help="Point the alias back at the previous version")
+    parser.add_argument("--dims", type=int, default=None)
+    parser.add_argument("--truncate-vectors", action="store_true")
+    parser.add_argument("--index-type", default=None, help="dense_vector index_options.type, e.g. hnsw, int8_hnsw")
+    parser.add_argument("--m", type=int, default=None)
+    parser.add_argument("--ef-construction", type=int, default=None)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument(
+        "--routing-field",
+        choices=list(ROUTING_FIELDS) + ["none"],
+        default=None,
+        help="Route rows by this field (none = default _id routing); default: keep the current layout",
+    )
+    parser.add_argument("--routing-partition-size", type=int, default=None)
+    parser.add_argument(
+        "--replicas",
+        type=int,
+        default=None,
+        help="Replicas of the new index once it goes live; default: those of the current index",
+    )
+    parser.add_argument("--requests-per-second", type=float, default=500.0)
+    parser.add_argument("--smoke-queries", type=int, default=20)
+    parser.add_argument("--min-smoke-hit-rate", type=float, default=0.8)
+    parser.add_argument("--migrate-legacy", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        status(args.alias)
+    elif args.rollback:
+        rollback(args.alias)
+    else:
+        reindex(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,200 @@
+"""Per-document routing vectors for two-stage "all documents" retrieval.
+
+When a PDF finishes ingesting, two rows describing it are written to the
+`documents` index (same vector field and dims as the chunk indices):
+    centroid  mean of the L2-normalized vectors of all its chunks
+    summary   embedding of the document's opening text (title page, abstract,
+              introduction), a cheap extractive stand-in for an LLM summary
+The backend searches these rows first and then runs the chunk kNN over the
+best-matching documents only (backend app/utils/document_routing.py).
+
+Backfill documents ingested before the index existed (Elasticsearch backend):
+    python -m app.utils.document_vectors [--source-pdf name.pdf ...]
+"""
+import argparse
+import logging
+import os
+from typing import Iterable, List, Optional
+
+import numpy as np
+from elasticsearch import helpers
+
+from app.utils.embedding import embedding_model
+from app.utils.es import DOCUMENTS, DOCUMENTS_MAPPING, PDF_CHUNKS, ensure_index, es, updated_at_now
+from app.utils.local_store import LocalVectorWriter, use_local_store
+
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CHARS = int(os.getenv("DOCUMENT_SUMMARY_CHARS", "4000"))
+
+
+class CentroidAccumulator:
+    """Running mean of normalized chunk vectors, fed batch by batch while a PDF is embedded."""
+
+    def __init__(self):
+        self.total: Optional[np.ndarray] = None
+        self.count = 0
+
+    def add(self, vectors: Iterable) -> None:
+        rows = [vector for vector in vectors if isinstance(vector, list) and vector]
+        if not rows:
+            return
+        matrix = np.asarray(rows, dtype=np.float64)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        batch_total = matrix.sum(axis=0)
+        self.total = batch_total if self.total is None else self.total + batch_total
+        self.count += len(rows)
+
+    @property
+    def centroid(self) -> Optional[List[float]]:
+        if self.total is None or not self.count:
+            return None
+        return (self.total / self.count).tolist()
+
+
+def summary_text(chunks: Iterable[dict], limit: int = SUMMARY_CHARS) -> str:
+    """Opening text of the document, taken from its largest chunks in reading order."""
+    chunks = list(chunks)
+    if not chunks:
+        return ""
+    largest = max(int(chunk.get("chunk_size", 0)) for chunk in chunks)
+    opening = sorted(
+        (chunk for chunk in chunks if int(chunk.get("chunk_size", 0)) == largest),
+        key=lambda chunk: int(chunk.get("chunk_index", 0)),
+    )
+    parts, length = [], 0
+    for chunk in opening:
+        if length >= limit:
+            break
+        text = (chunk.get("text") or "")[: limit - length]
+        parts.append(text)
+        length += len(text)
+    return "\n".join(parts).strip()
+
+
+def save_document_vectors(
+    filename: str,
+    *,
+    centroid: Optional[List[float]],
+    summary: str,
+    chunk_count: int,
+    book_id: Optional[str] = None,
+    source_pdf: Optional[str] = None,
+    document_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+) -> int:
+    """Write the centroid and summary rows for `filename`; returns the number of rows indexed.
+
+    Row ids are `{filename}_centroid` / `{filename}_summary`, so re-ingesting a
+    PDF overwrites its previous rows.
+    """
+    vectors = {"centroid": centroid}
+    if summary:
+        vectors["summary"] = embedding_model.embed_documents([summary])[0]
+
+    rows = []
+    for kind, vector in vectors.items():
+        if vector is None:
+            continue
+        doc_id = f"{filename}_{kind}"
+        rows.append(
+            {
+                "id": doc_id,
+                "text": summary,
+                "vector": vector,
+                "metadata": {
+                    "id": doc_id,
+                    "book_id": book_id,
+                    "document_id": document_id,
+                    "project_id": project_id,
+                    "source_pdf": source_pdf or filename,
+                    "filename": filename,
+                    "kind": kind,
+                    "chunk_count": chunk_count,
+                },
+            }
+        )
+    if not rows:
+        return 0
+
+    if use_local_store():
+        return LocalVectorWriter(DOCUMENTS).upsert(rows)
+
+    ensure_index(DOCUMENTS, DOCUMENTS_MAPPING)
+    updated_at = updated_at_now()
+    success_count, _errors = helpers.bulk(
+        es,
+        (
+            {
+                "_index": DOCUMENTS,
+                "_id": row["id"],
+                "_source": {**row["metadata"], "text": row["text"], "vector": row["vector"], "updated_at": updated_at},
+            }
+            for row in rows
+        ),
+        raise_on_error=False,
+    )
+    return success_count
+
+
+def _indexed_sources() -> Iterable[str]:
+    after = None
+    while True:
+        composite = {"size": 500, "sources": [{"source_pdf": {"terms": {"field": "source_pdf"}}}]}
+        if after:
+            composite["after"] = after
+        response = es.search(index=PDF_CHUNKS, size=0, aggs={"sources": {"composite": composite}})
+        aggregation = response["aggregations"]["sources"]
+        for bucket in aggregation["buckets"]:
+            yield bucket["key"]["source_pdf"]
+        after = aggregation.get("after_key")
+        if not aggregation["buckets"] or not after:
+            return
+
+
+def backfill(source_pdfs: Optional[List[str]] = None) -> int:
+    """Compute routing rows from chunks already in `pdf_chunks`; returns documents written."""
+    written = 0
+    for source_pdf in source_pdfs or _indexed_sources():
+        accumulator = CentroidAccumulator()
+        chunks, first = [], {}
+        for hit in helpers.scan(
+            es,
+            index=PDF_CHUNKS,
+            query={"query": {"term": {"source_pdf": source_pdf}}},
+            _source=["vector", "text", "chunk_size", "chunk_index", "filename", "book_id", "document_id", "project_id"],
+        ):
+            source = hit["_source"]
+            accumulator.add([source.pop("vector", None)])
+            chunks.append(source)
+            first = first or source
+        if not accumulator.count:
+            continue
+        save_document_vectors(
+            first.get("filename") or source_pdf,
+            centroid=accumulator.centroid,
+            summary=summary_text(chunks),
+            chunk_count=accumulator.count,
+            book_id=first.get("book_id"),
+            source_pdf=source_pdf,
+            document_id=first.get("document_id"),
+            project_id=first.get("project_id"),
+        )
+        written += 1
+        logger.info("Backfilled routing vectors for %s (%s chunks)", source_pdf, accumulator.count)
+    return written
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Backfill per-document routing vectors from pdf_chunks")
+    parser.add_argument("--source-pdf", action="append", default=None, help="Only these PDFs (repeatable)")
+    args = parser.parse_args()
+    if use_local_store():
+        raise SystemExit("Backfill reads pdf_chunks from Elasticsearch; re-ingest documents on the local backend")
+    logger.info("Wrote routing vectors for %s documents", backfill(args.source_pdf))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,28 @@
-from typing import List
+from typing import List, Optional
 from elasticsearch import helpers
 # from langchain.embeddings import OpenAIEmbeddings
-from langchain_openai import OpenAIEmbeddings
 from app.models import ImageMetadata  # Adjust import as needed
-import os
 from urllib.parse import quote
-from app.utils.es import es, ensure_index, CAPTIONS, CAPTIONS_MAPPING
+from app.utils.embedding_config import build_embeddings
+from app.utils.es import es, ensure_index, index_routing_field, routing_value, updated_at_now, CAPTIONS, CAPTIONS_MAPPING
+from app.utils.local_store import LocalVectorWriter, use_local_store
 
 # Initialize embedding model
-embedding_model = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+embedding_model = build_embeddings()
 
 
-def embed_and_store_captions(records: List[ImageMetadata], index_name: str = CAPTIONS):
+def embed_and_store_captions(
+    records: List[ImageMetadata],
+    index_name: str = CAPTIONS,
+    *,
+    document_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+):
     """
     Embed caption texts from ImageMetadata list and index them in Elasticsearch.
     """
-    ensure_index(index_name, CAPTIONS_MAPPING)
+    if not use_local_store():
+        ensure_index(index_name, CAPTIONS_MAPPING)
     # Filter records that have a caption
     valid_records = [r for r in records if r.caption and r.caption.strip()]
     if not valid_records:
@@ -28,6 +32,8 @@ def embed_and_store_captions(records: List[ImageMetadata], index_name: str = CAP
     texts = [r.caption for r in valid_records]
     embeddings = embedding_model.embed_documents(texts)
 
+    routing_field = None if use_local_store() else index_routing_field(index_name)
+    updated_at = updated_at_now()
     payloads = []
     for record, embedding in zip(valid_records, embeddings):
         doc_id = f"{record.book_id}_{record.page_number}_{record.xref}_{record.filename}"
@@ -40,6 +46,8 @@ def embed_and_store_captions(records: List[ImageMetadata], index_name: str = CAP
             "_id": doc_id,
             "_source": {
                 "book_id": record.book_id,
+                "document_id": document_id,
+                "project_id": project_id,
                 "page_number": record.page_number,
                 "text": record.caption,
                 # "embedding": embedding,
@@ -47,8 +55,30 @@ def embed_and_store_captions(records: List[ImageMetadata], index_name: str = CAP
                 "source_pdf": record.source_pdf,
                 "xref": record.xref,
                 "filename": record.filename,
+                "updated_at": updated_at,
             }
         })
+        if routing_field:
+            routing = routing_value(routing_field, payloads[-1]["_source"])
+            if routing is None:
+                print(f"Skipping caption {doc_id}: '{index_name}' is routed by {routing_field}, which is empty")
+                payloads.pop()
+                continue
+            payloads[-1]["routing"] = routing
 
-    helpers.bulk(es, payloads)
+    if use_local_store():
+        LocalVectorWriter(index_name).upsert([
+            {
+                "id": payload["_id"],
+                "text": payload["_source"]["text"],
+                "vector": payload["_source"]["vector"],
+                "metadata": {
+                    "id": payload["_id"],
+                    **{key: value for key, value in payload["_source"].items() if key not in {"text", "vector"}},
+                },
+            }
+            for payload in payloads
+        ])
+    else:
+        helpers.bulk(es, payloads)
     print(f"✅ Embedded and indexed {len(payloads)} captions into '{index_name}'")
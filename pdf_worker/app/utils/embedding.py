@@ -1,23 +1,20 @@
-from langchain_openai  import OpenAIEmbeddings  # or `from langchain_openai import OpenAIEmbeddings`
 from app.models import TextChunkEmbedding
-import os
 from dotenv import load_dotenv
 import logging
 import tiktoken
 from typing import List, Callable
 
+from app.utils.embedding_config import EMBEDDING_CONFIG, build_embeddings
 
-MODEL = "text-embedding-3-small"
+
+MODEL = EMBEDDING_CONFIG.model
 TOKEN_LIMIT = 300_000
 TARGET_BATCH_TOKENS = 250_000  # stay below limit
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-embedding_model = OpenAIEmbeddings(
-    model=MODEL,
-    openai_api_key=os.getenv("OPENAI_API_KEY")
-)
+embedding_model = build_embeddings()
 
 # Initialize tokenizer for your embedding model
 encoding = tiktoken.encoding_for_model(MODEL)
@@ -67,7 +64,11 @@ def _process_batch(batch: List[dict], save_fn):
             chunk_index=chunk["chunk_index"],
             text=chunk["text"],
             pages=chunk["pages"],
-            embedding=vector
+            embedding=vector,
+            char_start=chunk.get("char_start"),
+            char_end=chunk.get("char_end"),
+            parent_chunk_size=chunk.get("parent_chunk_size"),
+            parent_chunk_index=chunk.get("parent_chunk_index"),
         ))
 
     save_fn(results)
@@ -89,6 +90,10 @@ def embed_chunks(chunks: List[dict]) -> List[TextChunkEmbedding]:
             chunk_index=chunk["chunk_index"],
             text=chunk["text"],
             pages=chunk["pages"],
-            embedding=vector
+            embedding=vector,
+            char_start=chunk.get("char_start"),
+            char_end=chunk.get("char_end"),
+            parent_chunk_size=chunk.get("parent_chunk_size"),
+            parent_chunk_index=chunk.get("parent_chunk_index"),
         ))
     return results
\ No newline at end of file
@@ -1,30 +1,37 @@
+import copy
 import logging
+import os
+import time
+from dataclasses import dataclass
 from typing import Iterable, Optional, List
 from elasticsearch import Elasticsearch, helpers
 
+from app.utils.embedding_config import EMBEDDING_CONFIG, validate_against_cluster
+
 es = Elasticsearch("http://elasticsearch:9200")
 logger = logging.getLogger(__name__)
 
 PDF_CHUNKS = "pdf_chunks"
 CAPTIONS = "captions"
+DOCUMENTS = "documents"
 
 PDF_CHUNKS_MAPPING = {
     "properties": {
         "id": {"type": "keyword"},
         "book_id": {"type": "keyword"},
+        "document_id": {"type": "keyword"},
+        "project_id": {"type": "keyword"},
         "source_pdf": {"type": "keyword"},
         "filename": {"type": "keyword"},
         "chunk_size": {"type": "integer"},
         "chunk_index": {"type": "integer"},
+        "char_start": {"type": "integer"},
+        "char_end": {"type": "integer"},
+        "parent_id": {"type": "keyword"},
         "pages": {"type": "integer"},
         "text": {"type": "text"},
-        "vector": {
-            "type": "dense_vector",
-            "dims": 1536,
-            "index": True,
-            "similarity": "cosine",
-            "index_options": {"type": "int8_hnsw", "m": 16, "ef_construction": 100},
-        },
+        "vector": EMBEDDING_CONFIG.vector_mapping(),
+        "updated_at": {"type": "date", "format": "epoch_millis"},
     }
 }
 
@@ -32,38 +39,193 @@ CAPTIONS_MAPPING = {
     "properties": {
         "id": {"type": "keyword"},
         "book_id": {"type": "keyword"},
+        "document_id": {"type": "keyword"},
+        "project_id": {"type": "keyword"},
         "source_pdf": {"type": "keyword"},
         "filename": {"type": "keyword"},
         "page_number": {"type": "integer"},
         "xref": {"type": "integer"},
         "text": {"type": "text"},
-        "vector": {
-            "type": "dense_vector",
-            "dims": 1536,
-            "index": True,
-            "similarity": "cosine",
-            "index_options": {"type": "int8_hnsw", "m": 16, "ef_construction": 100},
-        },
+        "vector": EMBEDDING_CONFIG.vector_mapping(),
+        "updated_at": {"type": "date", "format": "epoch_millis"},
+    }
+}
+
+# Two rows per document (kind "centroid" and "summary") used to route "all documents"
+# searches to the most relevant PDFs before the chunk kNN; see app.utils.document_vectors.
+DOCUMENTS_MAPPING = {
+    "properties": {
+        "id": {"type": "keyword"},
+        "book_id": {"type": "keyword"},
+        "document_id": {"type": "keyword"},
+        "project_id": {"type": "keyword"},
+        "source_pdf": {"type": "keyword"},
+        "filename": {"type": "keyword"},
+        "kind": {"type": "keyword"},
+        "chunk_count": {"type": "integer"},
+        "text": {"type": "text"},
+        "vector": EMBEDDING_CONFIG.vector_mapping(),
+        "updated_at": {"type": "date", "format": "epoch_millis"},
     }
 }
 
+# Fields added after the first indices were created; ensure_index adds them to
+# existing indices so filters and collapsing never hit a dynamically mapped field.
+SCOPE_FIELDS = ("document_id", "project_id")
+SMALL_TO_BIG_FIELDS = ("char_start", "char_end", "parent_id")
+# Every writer (and the backend's scope sync) stamps rows with `updated_at` (epoch ms),
+# so app.reindex can catch up on the rows changed since its bulk copy.
+CHANGE_FIELDS = ("updated_at",)
+
+# Shard layout of new pdf_chunks/captions indices (app.reindex --shards/--routing-field changes it later):
+#   ES_NUMBER_OF_SHARDS        primary shards (Elasticsearch default: 1)
+#   ES_ROUTING_FIELD           route every row by this field so a search pinned to one value
+#                              (e.g. a single document) only touches its shard(s); empty = _id routing
+#   ES_ROUTING_PARTITION_SIZE  spread each routing value over this many shards (< shard count)
+# The routing field is recorded in the index mapping's _meta, where writers and the backend read it.
+ROUTING_FIELDS = ("document_id", "source_pdf", "book_id")
+ROUTED_INDICES = (PDF_CHUNKS, CAPTIONS)
+ROUTING_FIELD_CACHE_SECONDS = 60.0
+
+
+@dataclass(frozen=True)
+class IndexLayout:
+    shards: Optional[int] = None
+    routing_field: Optional[str] = None
+    routing_partition_size: int = 1
+
+    def validate(self) -> "IndexLayout":
+        if self.routing_field and self.routing_field not in ROUTING_FIELDS:
+            raise ValueError(f"Unsupported routing field {self.routing_field!r}; expected one of {', '.join(ROUTING_FIELDS)}")
+        if self.routing_partition_size > 1:
+            if not self.routing_field:
+                raise ValueError("A routing partition size needs a routing field")
+            if (self.shards or 1) <= self.routing_partition_size:
+                raise ValueError("The routing partition size must be smaller than the shard count")
+        return self
+
+    def settings(self) -> dict:
+        settings = {}
+        if self.shards:
+            settings["number_of_shards"] = self.shards
+        if self.routing_partition_size > 1:
+            settings["routing_partition_size"] = self.routing_partition_size
+        return settings
+
+    def apply(self, mapping: dict) -> dict:
+        """`mapping` with this layout's `_routing` requirement and `_meta.routing_field`."""
+        mapping = copy.deepcopy(mapping)
+        mapping.pop("_routing", None)
+        meta = dict(mapping.pop("_meta", None) or {})
+        meta.pop("routing_field", None)
+        if self.routing_field:
+            mapping["_routing"] = {"required": True}
+            meta["routing_field"] = self.routing_field
+        if meta:
+            mapping["_meta"] = meta
+        return mapping
+
+
+def updated_at_now() -> int:
+    """Value of the `updated_at` field for rows written now."""
+    return int(time.time() * 1000)
+
+
+def index_layout_from_env() -> IndexLayout:
+    shards = os.getenv("ES_NUMBER_OF_SHARDS")
+    return IndexLayout(
+        shards=int(shards) if shards else None,
+        routing_field=os.getenv("ES_ROUTING_FIELD") or None,
+        routing_partition_size=int(os.getenv("ES_ROUTING_PARTITION_SIZE", "1")),
+    ).validate()
+
+
+INDEX_LAYOUT = index_layout_from_env()
+_routing_fields: dict = {}
+
+
+def index_routing_field(index: str) -> Optional[str]:
+    """Routing field recorded in the live mapping of `index` (cached briefly); None for _id routing."""
+    cached = _routing_fields.get(index)
+    if cached and time.monotonic() - cached[0] < ROUTING_FIELD_CACHE_SECONDS:
+        return cached[1]
+    mappings = es.indices.get_mapping(index=index)
+    fields = {(item.get("mappings", {}).get("_meta") or {}).get("routing_field") for item in mappings.values()}
+    if len(fields) > 1:
+        raise RuntimeError(f"Indices behind {index} disagree on the routing field: {sorted(map(str, fields))}")
+    field = fields.pop() if fields else None
+    _routing_fields[index] = (time.monotonic(), field)
+    return field
+
+
+def routing_value(field: Optional[str], source: dict) -> Optional[str]:
+    value = source.get(field) if field else None
+    return str(value) if value else None
+
+
 def _mapping_for(index: str) -> dict:
+    if index == DOCUMENTS:
+        return DOCUMENTS_MAPPING
     return PDF_CHUNKS_MAPPING if index == PDF_CHUNKS else CAPTIONS_MAPPING
 
+def versioned_index_name(alias: str, version: int) -> str:
+    return f"{alias}_v{version}"
+
+def index_version(alias: str, index_name: str) -> Optional[int]:
+    prefix = f"{alias}_v"
+    if not index_name.startswith(prefix) or not index_name[len(prefix):].isdigit():
+        return None
+    return int(index_name[len(prefix):])
+
+def alias_targets(alias: str) -> List[str]:
+    """Concrete indices behind `alias`; empty when it is missing or a legacy concrete index."""
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias).keys())
+
+def list_index_versions(alias: str) -> List[tuple]:
+    """All `{alias}_v{n}` indices as (version, index_name), oldest first."""
+    indices = es.indices.get(index=f"{alias}_v*", allow_no_indices=True, ignore_unavailable=True)
+    versions = []
+    for index_name in indices:
+        version = index_version(alias, index_name)
+        if version is not None:
+            versions.append((version, index_name))
+    return sorted(versions)
+
 def ensure_index(name: str, mapping: dict):
+    """Ensure `name` is searchable; new deployments get `{name}_v1` behind a `name` alias.
+
+    Clients only ever read and write through the alias, so `app.reindex` can
+    build a new version and swap the alias without downtime.
+    """
     if not es.indices.exists(index=name):
-        es.indices.create(index=name, mappings=mapping)
+        layout = INDEX_LAYOUT if name in ROUTED_INDICES else IndexLayout()
+        es.indices.create(
+            index=versioned_index_name(name, 1),
+            mappings=layout.apply(mapping),
+            settings=layout.settings() or None,
+            aliases={name: {"is_write_index": True}},
+        )
+        return
+    added = [field for field in SCOPE_FIELDS + SMALL_TO_BIG_FIELDS + CHANGE_FIELDS if field in mapping["properties"]]
+    es.indices.put_mapping(
+        index=name,
+        properties={field: mapping["properties"][field] for field in added},
+    )
 
 def ensure_all_indices():
+    validate_against_cluster(es, [PDF_CHUNKS, CAPTIONS, DOCUMENTS])
     ensure_index(PDF_CHUNKS, PDF_CHUNKS_MAPPING)
     ensure_index(CAPTIONS, CAPTIONS_MAPPING)
+    ensure_index(DOCUMENTS, DOCUMENTS_MAPPING)
 
 def _vector_dims_from_mapping(mapping: dict) -> int:
     try:
         return int(mapping["properties"]["vector"]["dims"])
     except Exception:
-        logger.warning("Couldn't read dims from mapping; defaulting to 1536")
-        return 1536
+        logger.warning("Couldn't read dims from mapping; defaulting to %s", EMBEDDING_CONFIG.dims)
+        return EMBEDDING_CONFIG.dims
 
 def _coerce_pages(pages) -> List[int]:
     if pages is None:
@@ -75,12 +237,22 @@ def _coerce_pages(pages) -> List[int]:
     except Exception:
         return []
 
+def parent_chunk_id(filename: str, chunk) -> Optional[str]:
+    """Doc id of the large chunk containing `chunk` (same scheme as the chunk ids), if any."""
+    size = getattr(chunk, "parent_chunk_size", None)
+    index = getattr(chunk, "parent_chunk_index", None)
+    if size is None or index is None:
+        return None
+    return f"{filename}_{size}_{index}"
+
 def save_chunks_to_es(
     filename: str,
     chunks: Iterable,
     *,
     book_id: Optional[str] = None,
     source_pdf: Optional[str] = None,
+    document_id: Optional[str] = None,
+    project_id: Optional[str] = None,
     index: str = PDF_CHUNKS,
     batch_size: int = 500,
     request_timeout: int = 60,
@@ -90,19 +262,24 @@ def save_chunks_to_es(
     Idempotently bulk-index chunks into `index` (default: pdf_chunks).
 
     - Stable doc_id: {filename}_{chunk_size}_{chunk_index}
-    - Writes id/book_id/source_pdf/text/vector/etc. into _source
+    - Writes id/book_id/document_id/project_id/source_pdf/text/vector/etc. into _source
+    - Writes char_start/char_end/parent_id so small-to-big retrieval can collapse onto parents
     - Validates vector length against the index mapping
+    - Routes each chunk by the index's routing field, if it has one (see IndexLayout)
     """
     mapping = _mapping_for(index)
     ensure_index(index, mapping)
 
     expected_dims = _vector_dims_from_mapping(mapping)
+    routing_field = index_routing_field(index)
+    updated_at = updated_at_now()
     total = 0
     successes = 0
     failures = 0
+    skipped = 0
 
     def _actions():
-        nonlocal total
+        nonlocal total, skipped
         for ch in chunks:
             total += 1
             vec = getattr(ch, "embedding", None)
@@ -116,25 +293,41 @@ def save_chunks_to_es(
                     getattr(ch, "chunk_size", "?"),
                     filename,
                 )
+                skipped += 1
                 continue
 
             doc_id = f"{filename}_{getattr(ch, 'chunk_size', 'NA')}_{getattr(ch, 'chunk_index', 'NA')}"
-            yield {
+            source = {
+                "id": doc_id,
+                "book_id": book_id,
+                "document_id": document_id,
+                "project_id": project_id,
+                "source_pdf": source_pdf or filename,
+                "filename": filename,
+                "chunk_size": int(getattr(ch, "chunk_size", 0)),
+                "chunk_index": int(getattr(ch, "chunk_index", 0)),
+                "pages": _coerce_pages(getattr(ch, "pages", [])),
+                "char_start": getattr(ch, "char_start", None),
+                "char_end": getattr(ch, "char_end", None),
+                "parent_id": parent_chunk_id(filename, ch),
+                "text": getattr(ch, "text", "") or "",
+                "vector": vec,
+                "updated_at": updated_at,
+            }
+            action = {
                 "_op_type": "index",      # overwrite-on-retry; use "create" to forbid overwrites
                 "_index": index,
                 "_id": doc_id,
-                "_source": {
-                    "id": doc_id,
-                    "book_id": book_id,
-                    "source_pdf": source_pdf or filename,
-                    "filename": filename,
-                    "chunk_size": int(getattr(ch, "chunk_size", 0)),
-                    "chunk_index": int(getattr(ch, "chunk_index", 0)),
-                    "pages": _coerce_pages(getattr(ch, "pages", [])),
-                    "text": getattr(ch, "text", "") or "",
-                    "vector": vec,
-                },
+                "_source": source,
             }
+            if routing_field:
+                routing = routing_value(routing_field, source)
+                if routing is None:
+                    logger.error("Skipping chunk %s: index %s is routed by %s, which is empty", doc_id, index, routing_field)
+                    skipped += 1
+                    continue
+                action["routing"] = routing
+            yield action
 
     try:
         success_count, errors = helpers.bulk(
@@ -146,7 +339,7 @@ def save_chunks_to_es(
             stats_only=False,
         )
         successes = success_count
-        failures = len(errors) if isinstance(errors, list) else 0
+        failures = (len(errors) if isinstance(errors, list) else 0) + skipped
 
         if refresh:
             es.indices.refresh(index=index)
@@ -154,4 +347,4 @@ def save_chunks_to_es(
         return {"items": total, "success": successes, "fail": failures}
     except Exception as e:
         logger.exception("Bulk indexing failed for %s (%d chunks): %s", filename, total, e)
-        return {"items": total, "success": successes, "fail": max(failures, 1), "error": str(e)}
+        return {"items": total, "success": successes, "fail": max(failures + skipped, 1), "error": str(e)}
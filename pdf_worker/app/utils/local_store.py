@@ -0,0 +1,207 @@
+"""Writer for the on-disk vector store used when VECTOR_STORE_BACKEND=local.
+
+Small single-project deployments can run without Elasticsearch: the worker
+appends embedded chunks/captions to a directory per index under
+LOCAL_VECTOR_DIR (a volume shared with the backend), and the backend searches
+it in-process (backend app/utils/local_vectorstore.py, which reads the same format).
+
+Layout of `{LOCAL_VECTOR_DIR}/{index}/` (`<g>` = manifest generation):
+    manifest.json     dims, dtype, committed row count and byte lengths, generation
+    vectors-<g>.bin   rows x dims, L2-normalized float32 or int8 (append-only)
+    scales-<g>.bin    one float32 per row, int8 only (vector = int8 * scale / 127)
+    rows-<g>.jsonl    one {"id", "text", "metadata"} line per vector row
+    ops-<g>.jsonl     later deletes / field updates written by the backend
+Writers hold an flock on `.lock`; readers only trust what manifest.json commits,
+so a crashed append is invisible and truncated by the next writer. Re-indexing an
+id appends a new row that supersedes the old one. The backend compacts into the
+next generation once most rows are superseded or deleted.
+"""
+import fcntl
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from app.utils.embedding_config import EMBEDDING_CONFIG
+from app.utils.es import parent_chunk_id
+
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "elasticsearch").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "/data/vectors")
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32").lower()
+
+FORMAT_VERSION = 1
+
+
+def use_local_store() -> bool:
+    return VECTOR_STORE_BACKEND == "local"
+
+
+def _empty_manifest(dims: int, dtype: str) -> dict:
+    if dtype not in {"float32", "int8"}:
+        raise ValueError(f"Unsupported LOCAL_VECTOR_DTYPE {dtype!r}")
+    return {
+        "format": FORMAT_VERSION,
+        "dims": dims,
+        "dtype": dtype,
+        "rows": 0,
+        "rows_bytes": 0,
+        "ops_bytes": 0,
+        "generation": 0,
+    }
+
+
+class LocalVectorWriter:
+    def __init__(self, index_name: str, *, root: str = LOCAL_VECTOR_DIR):
+        self.index_name = index_name
+        self.path = os.path.join(root, index_name)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _data_file(self, name: str, manifest: dict) -> str:
+        stem, ext = os.path.splitext(name)
+        return self._file(f"{stem}-{manifest['generation']}{ext}")
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self._file("manifest.json"), encoding="utf-8") as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return _empty_manifest(EMBEDDING_CONFIG.dims, LOCAL_VECTOR_DTYPE)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        tmp = self._file("manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, self._file("manifest.json"))
+
+    def _append(self, name: str, manifest: dict, payload: bytes) -> None:
+        with open(self._data_file(name, manifest), "ab") as handle:
+            handle.write(payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _truncate_uncommitted(self, manifest: dict) -> None:
+        width = 4 if manifest["dtype"] == "float32" else 1
+        expected = {
+            "vectors.bin": manifest["rows"] * manifest["dims"] * width,
+            "rows.jsonl": manifest["rows_bytes"],
+        }
+        if manifest["dtype"] == "int8":
+            expected["scales.bin"] = manifest["rows"] * 4
+        for name, size in expected.items():
+            path = self._data_file(name, manifest)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                logger.warning("Truncating uncommitted bytes from %s/%s", self.index_name, name)
+                with open(path, "r+b") as handle:
+                    handle.truncate(size)
+
+    def upsert(self, rows: List[dict]) -> int:
+        """Append rows shaped like {"id", "text", "metadata", "vector"}; returns rows written."""
+        if not rows:
+            return 0
+        with self._locked():
+            manifest = self._read_manifest()
+            self._truncate_uncommitted(manifest)
+            dims = manifest["dims"]
+
+            kept = [row for row in rows if isinstance(row.get("vector"), list) and len(row["vector"]) == dims]
+            if len(kept) != len(rows):
+                logger.error("Skipping %s rows with bad vector dims (expected %s)", len(rows) - len(kept), dims)
+            if not kept:
+                return 0
+
+            matrix = np.asarray([row["vector"] for row in kept], dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            if manifest["dtype"] == "int8":
+                scales = np.abs(matrix).max(axis=1).astype(np.float32)
+                scales[scales == 0] = 1.0
+                quantized = np.round(matrix / scales[:, None] * 127).astype(np.int8)
+                self._append("scales.bin", manifest, scales.tobytes())
+                self._append("vectors.bin", manifest, quantized.tobytes())
+            else:
+                self._append("vectors.bin", manifest, matrix.tobytes())
+
+            lines = "".join(
+                json.dumps({"id": row["id"], "text": row.get("text") or "", "metadata": row.get("metadata") or {}})
+                + "\n"
+                for row in kept
+            ).encode("utf-8")
+            self._append("rows.jsonl", manifest, lines)
+
+            manifest["rows"] += len(kept)
+            manifest["rows_bytes"] += len(lines)
+            self._write_manifest(manifest)
+            return len(kept)
+
+
+def _coerce_pages(pages) -> List[int]:
+    if pages is None:
+        return []
+    if isinstance(pages, list):
+        return [int(p) for p in pages]
+    try:
+        return [int(pages)]
+    except Exception:
+        return []
+
+
+def save_chunks_local(
+    filename: str,
+    chunks: Iterable,
+    *,
+    book_id: Optional[str] = None,
+    source_pdf: Optional[str] = None,
+    document_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    index: str = "pdf_chunks",
+    **_es_options,
+) -> dict:
+    """Local counterpart of `save_chunks_to_es`, with the same ids and `_source` fields."""
+    rows = []
+    total = 0
+    for ch in chunks:
+        total += 1
+        doc_id = f"{filename}_{getattr(ch, 'chunk_size', 'NA')}_{getattr(ch, 'chunk_index', 'NA')}"
+        rows.append(
+            {
+                "id": doc_id,
+                "text": getattr(ch, "text", "") or "",
+                "vector": getattr(ch, "embedding", None),
+                "metadata": {
+                    "id": doc_id,
+                    "book_id": book_id,
+                    "document_id": document_id,
+                    "project_id": project_id,
+                    "source_pdf": source_pdf or filename,
+                    "filename": filename,
+                    "chunk_size": int(getattr(ch, "chunk_size", 0)),
+                    "chunk_index": int(getattr(ch, "chunk_index", 0)),
+                    "pages": _coerce_pages(getattr(ch, "pages", [])),
+                    "char_start": getattr(ch, "char_start", None),
+                    "char_end": getattr(ch, "char_end", None),
+                    "parent_id": parent_chunk_id(filename, ch),
+                },
+            }
+        )
+    written = LocalVectorWriter(index).upsert(rows)
+    logger.info("Local store: indexed %s/%s chunks into %s", written, total, index)
+    return {"items": total, "success": written, "fail": total - written}
@@ -5,10 +5,12 @@ import fitz
 
 from app.models import ImageMetadata
 from app.utils.cleaning.clean_text_pipeline import clean_document_text
+from app.utils.document_vectors import CentroidAccumulator, save_document_vectors, summary_text
 from app.utils.embed_captions import embed_and_store_captions
 from app.utils.embedding import embed_chunks_streaming
 from app.utils.es import save_chunks_to_es
 from app.utils.image_extraction import process_images_and_captions
+from app.utils.local_store import save_chunks_local, use_local_store
 from app.utils.text_chunker import chunk_text
 
 
@@ -21,6 +23,8 @@ def process_pdf(
     book_id: str,
     source_pdf: str,
     *,
+    document_id: str | None = None,
+    project_id: str | None = None,
     return_image_records: bool = False,
 ):
     logger.info("Starting full processing for %s", source_pdf)
@@ -53,22 +57,47 @@ def process_pdf(
     chunks = chunk_text(cleaned_pages, chunk_sizes=[400, 1600])
     logger.info("Total chunks created: %s", len(chunks))
 
-    embed_chunks_streaming(
-        chunks,
-        save_fn=lambda batch: save_chunks_to_es(
+    save_chunks = save_chunks_local if use_local_store() else save_chunks_to_es
+    centroid = CentroidAccumulator()
+
+    def _save_batch(batch):
+        centroid.add(chunk.embedding for chunk in batch)
+        result = save_chunks(
             source_pdf,
             batch,
             book_id=book_id,
             source_pdf=source_pdf,
-        ),
-    )
+            document_id=document_id,
+            project_id=project_id,
+        )
+        # A partly indexed document must fail its job instead of completing with missing chunks.
+        if result.get("fail"):
+            raise RuntimeError(
+                f"Indexing {source_pdf}: {result['fail']} of {result['items']} chunks failed"
+                + (f" ({result['error']})" if result.get("error") else "")
+            )
+        return result
+
+    embed_chunks_streaming(chunks, save_fn=_save_batch)
 
-    embed_and_store_captions(image_records)
+    embed_and_store_captions(image_records, document_id=document_id, project_id=project_id)
+
+    document_rows = save_document_vectors(
+        source_pdf,
+        centroid=centroid.centroid,
+        summary=summary_text(chunks),
+        chunk_count=centroid.count,
+        book_id=book_id,
+        source_pdf=source_pdf,
+        document_id=document_id,
+        project_id=project_id,
+    )
 
     stats = {
         "pages": len(cleaned_pages),
         "chunks_indexed": len(chunks),
         "captions_indexed": len([r for r in image_records if r.caption and r.caption.strip()]),
+        "document_vectors_indexed": document_rows,
     }
     logger.info("Finished processing %s", source_pdf)
 
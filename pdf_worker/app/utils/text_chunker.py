@@ -1,5 +1,6 @@
+from bisect import bisect_right
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 
 def normalize_page_text(page: str) -> str:
@@ -33,9 +34,48 @@ def map_chunk_to_pages(start: int, end: int, page_offsets: List[Dict]) -> List[i
     return [p["page"] for p in page_offsets if p["end"] >= start and p["start"] <= end]
 
 
+def find_parent_chunk(start: int, end: int, parents: List[Dict], parent_starts: List[int]) -> Optional[Dict]:
+    """
+    Returns the parent chunk containing [start, end), or the one overlapping it most.
+    `parents` must be sorted by char_start, with `parent_starts` their start offsets.
+    """
+    best, best_overlap = None, 0
+    # Parents starting after `end` cannot overlap; walk back over the ones that can.
+    for parent in reversed(parents[:bisect_right(parent_starts, end)]):
+        overlap = min(end, parent["char_end"]) - max(start, parent["char_start"])
+        if parent["char_start"] <= start and end <= parent["char_end"]:
+            return parent
+        if overlap > best_overlap:
+            best, best_overlap = parent, overlap
+        if parent["char_end"] < start:
+            break
+    return best
+
+
+def assign_parent_chunks(chunks: List[Dict]) -> None:
+    """
+    Links every chunk to the chunk of the largest size that contains it (small-to-big retrieval).
+    Chunks of the largest size are their own roots and get no parent.
+    """
+    if not chunks:
+        return
+    largest = max(c["chunk_size"] for c in chunks)
+    parents = sorted((c for c in chunks if c["chunk_size"] == largest), key=lambda c: c["char_start"])
+    parent_starts = [p["char_start"] for p in parents]
+    for chunk in chunks:
+        if chunk["chunk_size"] == largest:
+            continue
+        parent = find_parent_chunk(chunk["char_start"], chunk["char_end"], parents, parent_starts)
+        if parent is not None:
+            chunk["parent_chunk_size"] = parent["chunk_size"]
+            chunk["parent_chunk_index"] = parent["chunk_index"]
+
+
 def chunk_text(cleaned_pages: List[str], chunk_sizes: List[int]) -> List[Dict]:
     """
     Splits cleaned PDF text into multi-size overlapping chunks with page tracking.
+    Each chunk records its character span in the joined text and, below the
+    largest size, the largest chunk that contains it.
     """
     # Step 1: Normalize
     normalized_pages = [normalize_page_text(page) for page in cleaned_pages]
@@ -60,7 +100,8 @@ def chunk_text(cleaned_pages: List[str], chunk_sizes: List[int]) -> List[Dict]:
                 # fallback to brute match
                 start = full_text.index(chunk_text)
             end = start + len(chunk_text)
-            cursor = end
+            # Chunks overlap, so the next one can start inside this one.
+            cursor = start + 1
 
             pages = map_chunk_to_pages(start, end, page_offsets)
 
@@ -68,7 +109,10 @@ def chunk_text(cleaned_pages: List[str], chunk_sizes: List[int]) -> List[Dict]:
                 "chunk_size": size,
                 "chunk_index": i,
                 "text": chunk_text,
-                "pages": pages
+                "pages": pages,
+                "char_start": start,
+                "char_end": end,
             })
 
+    assign_parent_chunks(all_chunks)
     return all_chunks
@@ -62,6 +62,8 @@ def _process_job(job: dict[str, Any]) -> None:
         local_path,
         book_id,
         filename,
+        document_id=job.get("document_id"),
+        project_id=job.get("project_id"),
         return_image_records=True,
     )
 